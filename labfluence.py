@@ -22,6 +22,12 @@ Main labfluence module for starting labfluence with Tkinter GUI.
 
 from __future__ import print_function
 
+# Startup tracing must be enabled before the modules to be traced are imported:
+import startuptrace
+from startuptrace import tracer
+if startuptrace.requested():
+    startuptrace.enable()
+
 # Other standard lib modules:
 import socket
 import argparse
@@ -37,19 +43,49 @@ except ImportError:
     print("readline module not available...")
     readline = None
 
-from __init__ import init_logging
+with tracer.phase("Import model and tkui modules"):
+    from __init__ import init_logging
+
+    ### MODEL IMPORT ###
+    from model.confighandler import ExpConfigHandler
+    from model.experimentmanager import ExperimentManager
+    from model.server import ConfluenceXmlRpcServer
+
+    ### TEST DOUBLES IMPORT ###
+    from model.model_testdoubles.fake_confighandler import FakeConfighandler
+    from model.model_testdoubles.fake_server import FakeConfluenceServer
+
+    ### GUI IMPORTS ###
+    from tkui.labfluence_tkapp import LabfluenceApp
 
-### MODEL IMPORT ###
-from model.confighandler import ExpConfigHandler
-from model.experimentmanager import ExperimentManager
-from model.server import ConfluenceXmlRpcServer
 
-### TEST DOUBLES IMPORT ###
-from model.model_testdoubles.fake_confighandler import FakeConfighandler
-from model.model_testdoubles.fake_server import FakeConfluenceServer
+def finish_background_login(app, server, loginthread):
+    """
+    Polls (from the tk main loop) until the background login has completed.
+    The 'wiki_server_status' callbacks are then invoked (in the main thread), ending the read-only mode.
+    If no valid token or credentials were found, the user is prompted to log in (in the main thread).
+    """
+    if loginthread.is_alive():
+        app.tkroot.after(100, finish_background_login, app, server, loginthread)
+        return
+    server.Confighandler.invokeEntryChangeCallback('wiki_server_status')
+    if server.LoginPromptRequired:
+        logger.info("Background login found no valid credentials, prompting user...")
+        server.autologin()
 
-### GUI IMPORTS ###
-from tkui.labfluence_tkapp import LabfluenceApp
+
+def first_window_shown(app, argsns):
+    """
+    Invoked once the main window has been drawn (when tk first becomes idle).
+    Prints the startup trace if requested, and exits if --exit-after-startup is set.
+    """
+    tracer.mark("First window shown")
+    if argsns.profile_startup or tracer.Enabled:
+        print(tracer.report())
+    # Imports done after startup are not traced:
+    tracer.removeImportHook()
+    if argsns.exit_after_startup:
+        app.tkroot.destroy()
 
 
 
@@ -111,6 +147,11 @@ if __name__ == '__main__':
                         Can be used to switch between different configs. In practice mostly used for development testing.")
     parser.add_argument('--testing', action='store_true', help="Start labfluence in testing environment. Will set pathscheme\
                         to default testing pathscheme and set loglevel of a range of loggers to DEBUG.")
+    parser.add_argument('--profile-startup', action='store_true', help="Trace import times and init phase times, \
+                        and print a report when the main window has been shown. \
+                        (Can also be enabled by setting the LABFLUENCE_PROFILE_STARTUP environment variable.)")
+    parser.add_argument('--exit-after-startup', action='store_true', help="Exit as soon as the main window has been shown. \
+                        Used to benchmark time-to-first-window.")
 
     argsns = parser.parse_args() # produces a namespace, not a dict.
 
@@ -124,6 +165,7 @@ if __name__ == '__main__':
     ####################################################################################
     # Set up confighandler, etc (depending on whether testing mode is requested...) ####
     ####################################################################################
+    tracer.begin("Init confighandler and server")
     if argsns.testing:
         # These should be enabled with --debug <modules>.
         #logging.getLogger("tkui.views.expjournalframe").setLevel(logging.DEBUG)
@@ -159,21 +201,36 @@ if __name__ == '__main__':
         try:
             logger.debug("Confighandler instantiated, Initiating server... >>>>>>")
             # setting autologin=False during init should defer login attempt...
-            server = ConfluenceXmlRpcServer(autologin=False, confighandler=confighandler)
+            if confighandler.get('wiki_server_api') == 'rest':
+                # The REST client requires the requests module, so it is only imported when used.
+                from model.server.confluence_rest_client import ConfluenceRestClient
+                server = ConfluenceRestClient(autologin=False, confighandler=confighandler)
+            else:
+                server = ConfluenceXmlRpcServer(autologin=False, confighandler=confighandler)
             server._autologin = True
         except socket.error as e:
             logger.error( "Socket error during server init ('%s'). This should not happen; autologin is shielded by try-clause.", e)
             server = None
 
     confighandler.Singletons['server'] = server
+    tracer.end()
     logger.debug(" >>>>>> Server instantiated, initiating ExperimentManager... >>>>>> ")
-    manager = ExperimentManager(confighandler=confighandler, autoinit=('localexps', ))
-    confighandler.Singletons['experimentmanager'] = manager
+    with tracer.phase("Init ExperimentManager (parse local experiments)"):
+        manager = ExperimentManager(confighandler=confighandler, autoinit=('localexps', ))
+        confighandler.Singletons['experimentmanager'] = manager
     logger.debug(" >>>>>> ExperimentManager instantiated, starting LabfluenceApp... >>>>>>")
 
-    app = LabfluenceApp(confighandler=confighandler)
+    with tracer.phase("Init LabfluenceApp"):
+        app = LabfluenceApp(confighandler=confighandler)
     logger.debug(" >>>>>> LabfluenceApp instantiated, connecting with server >>>>>>")
-    server.autologin()
+    with tracer.phase("Server login"):
+        if hasattr(server, 'autologinAsync'):
+            # The stored token is validated in the background while the app comes up in read-only mode:
+            # The login thread does not invoke the server status callbacks, finish_background_login does:
+            loginthread = server.autologinAsync(notify=False)
+            app.tkroot.after(100, finish_background_login, app, server, loginthread)
+        elif server is not None:
+            server.autologin()
 
 
     # How to maximize / set window size:
@@ -188,15 +245,17 @@ if __name__ == '__main__':
         logger.info( "em.ActiveExperiments: %s", em.ActiveExperiments )
         logger.info( "em.RecentExperiments: %s", em.RecentExperiments )
 
-    exps = app.ActiveExperiments
-    logger.info("GUI init (almost) finished...")
-    if exps:
-        logger.info("Showing exp: %s", exps[0])
-        notebook, expid, experiment = app.show_notebook(exps[0])
-        #notebook.tab(1, state="enabled")
-        #notebook.select(2)
-    else:
-        logger.info("No active experiments(?) - app.ActiveExperiments = %s", exps)
+    with tracer.phase("Show active experiment"):
+        exps = app.ActiveExperiments
+        logger.info("GUI init (almost) finished...")
+        if exps:
+            logger.info("Showing exp: %s", exps[0])
+            notebook, expid, experiment = app.show_notebook(exps[0])
+            #notebook.tab(1, state="enabled")
+            #notebook.select(2)
+        else:
+            logger.info("No active experiments(?) - app.ActiveExperiments = %s", exps)
+    app.tkroot.after_idle(first_window_shown, app, argsns)
 
     if readline:
         readline.parse_and_bind("tab: complete")
@@ -20,12 +20,28 @@
 This module provides a command-line interface to various features, including:
 * Fetching a page struct or page content (xhtml) from server.
 
+Commands that take several page ids or files (getpagestruct, getpagexhtml,
+getattachments, addattachments) can process these concurrently with --jobs N.
+Use --order completed to output results as soon as they are available, rather than in input order.
+Errors are reported per item (to stderr), and the exit code is non-zero if any item failed.
+
+Use --outputformat ndjson to stream results as newline-delimited json, one object per line,
+written as soon as each item is done. Results are not collected in memory, so this can be
+used to pipe arbitrarily large exports into other tools.
+A page that failed is written as {"pageId": <pageId>, "error": <error message>}, so consumers
+can tell which pages failed (getpagestruct, getpagexhtml and getattachments).
+
+If a labfluence daemon (labfluence_daemon.py) is running for the same pathscheme,
+commands are executed by the daemon, which keeps a logged-in server and warm caches.
+Otherwise (or with --no-daemon) commands are executed in-process.
 
 """
 
 import os
+import sys
 import socket
 import argparse
+from multiprocessing.pool import ThreadPool
 #import xmlrpclib
 #from xmlrpclib import DateTime
 # Using costum xmlrpclib with DateTime class that doesn't chocke when asked for comparison with e.g. None.
@@ -64,6 +80,7 @@ from model.confighandler import ExpConfigHandler
 #model.server.xmlrpclib.DateTime = xmlrpclib.DateTime
 
 from model.server import ConfluenceXmlRpcServer
+from model.server.ratelimit import priority, BULK
 from model.page import WikiPage
 
 from model.utils import attachmentTupFromFilepath
@@ -75,6 +92,10 @@ from model.model_testdoubles.fake_server import FakeConfluenceServer
 
 confighandler = None
 
+# Arguments that are file paths; when executed by labfluence_daemon, relative paths
+# are resolved against the working directory of the client (not the daemon):
+PATH_ARGUMENTS = ('files', )
+
 
 
 def getPage(pageId):
@@ -113,6 +134,40 @@ def getPageXhtml(pageId):
 #    return att_info
 
 
+def json_default(obj):
+    """
+    Serializes objects not natively supported by json, e.g. the datetime
+    objects returned by xmlrpclib when use_datetime is True.
+    """
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if hasattr(obj, 'value'):   # xmlrpclib.DateTime
+        return obj.value
+    if hasattr(obj, 'data'):    # xmlrpclib.Binary
+        return obj.data
+    return str(obj)
+
+
+def outputrecord(record):
+    """
+    Writes a single record to stdout as one line of json and flushes,
+    so the record is available to downstream readers immediately.
+    """
+    import json
+    sys.stdout.write(json.dumps(record, default=json_default) + "\n")
+    sys.stdout.flush()
+
+
+def error_record(pageId, error):
+    """ Returns the record written in place of the result for a page that failed (with streaming output). """
+    return {'pageId': pageId, 'error': str(error)}
+
+
+def is_streaming(outputfmt):
+    """ Returns True if outputfmt is a streaming (one record per line) format. """
+    return outputfmt.lower() == 'ndjson'
+
+
 def outputres(res, outputfmt):
     """
     Outputs the res using the specified output format.
@@ -121,11 +176,15 @@ def outputres(res, outputfmt):
     - pretty
     - yaml
     - json
+    - ndjson - newline-delimited json; if res is a list, each element is written on its own line.
     - pickle - hard to read, but can serialize almost anything...
     """
     logger.debug("Generating output for result of length %s with outputfmt %s", len(res), outputfmt)
     outputfmt = outputfmt.lower()
-    if outputfmt == 'print':
+    if outputfmt == 'ndjson':
+        for record in (res if isinstance(res, list) else [res]):
+            outputrecord(record)
+    elif outputfmt == 'print':
         print res
     elif outputfmt == 'pretty':
         import pprint
@@ -146,6 +205,66 @@ def outputres(res, outputfmt):
 
 
 
+class ItemFailed(Exception):
+    """ Raised by per-item functions when an item did not produce a result. """
+    pass
+
+
+def run_items(func, items, args):
+    """
+    Generator; invokes func(item) for each item in items, yielding (item, result, error) tuples.
+    If args.jobs > 1, items are processed concurrently using a pool of args.jobs threads.
+    Tuples are yielded in input order, or, if args.order is 'completed', as soon as each item completes.
+    Errors are reported to stderr as they occur and recorded in args.failures.
+    Server requests made for the items have BULK priority, i.e. they yield to interactive use of the server.
+    """
+    jobs = getattr(args, 'jobs', 1) or 1
+    items = list(items)
+    if not hasattr(args, 'failures'):
+        args.failures = list()
+    def call(item):
+        try:
+            with priority(BULK):
+                result = func(item)
+            if result is None:
+                raise ItemFailed("no result")
+            return item, result, None
+        except Exception as e:  # pylint: disable=W0703
+            logger.debug("Error processing item %s with %s: %r", item, getattr(func, '__name__', func), e)
+            return item, None, e
+    if jobs > 1 and len(items) > 1:
+        pool = ThreadPool(min(jobs, len(items)))
+        mapfunc = pool.imap_unordered if getattr(args, 'order', 'input') == 'completed' else pool.imap
+        results = mapfunc(call, items)
+    else:
+        pool = None
+        results = (call(item) for item in items)
+    try:
+        for item, result, error in results:
+            if error is not None:
+                args.failures.append((item, error))
+                print >> sys.stderr, "Error: {} failed for {}: {}".format(args.command, item, error)
+            yield item, result, error
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def report_failures(args, nitems):
+    """
+    Prints a summary of failed items to stderr.
+    Returns the exit code: 0 if all items succeeded, otherwise 1.
+    """
+    failures = getattr(args, 'failures', None)
+    if not failures:
+        return 0
+    print >> sys.stderr, "{} of {} items failed: {}".format(
+        len(failures), nitems, ", ".join(str(item) for item, _ in failures))
+    return 1
+
+
+
 ##################################################################
 ## Functions that simply use the args namespace from argparse:  ##
 ##################################################################
@@ -155,28 +274,24 @@ def getpagestruct(args):
     """
     Returns a page struct obtained using pageId <pageId>.
     """
-    ret = list()
-    for pageId in args.pageid:
-        page = getPage(pageId)
-        ret.append(page.Struct)
-    outputres(ret, args.outputformat)
-    return ret
+    if is_streaming(args.outputformat):
+        for pageId, struct, error in run_items(getPageStruct, args.pageid, args):
+            outputrecord(struct if error is None else error_record(pageId, error))
+    else:
+        outputres([struct for pageId, struct, error in run_items(getPageStruct, args.pageid, args)
+                   if error is None], args.outputformat)
+    return report_failures(args, len(args.pageid))
 
 def getpagexhtml(args):
     """
     Returns xhtml content of a page obtained using pageId <pageId>.
     """
-    ret = list()
-    for pageId in args.pageid:
-        page = getPage(pageId)
-        if page.Struct:
-            xhtml = page.Struct.get('content')
-            logger.debug("Page with pageId '%s' obtained, returning xhtml of length: %s", pageId, len(xhtml) if xhtml else '<none>')
+    for pageId, xhtml, error in run_items(getPageXhtml, args.pageid, args):
+        if is_streaming(args.outputformat):
+            outputrecord({'pageId': pageId, 'content': xhtml} if error is None else error_record(pageId, error))
+        elif error is None:
             outputres( xhtml, args.outputformat )
-            ret.append(xhtml)
-        else:
-            logger.info("getPage(%s) returned page with no struct. Page is: %s", pageId, page)
-    return ret
+    return report_failures(args, len(args.pageid))
 
 
 def getserverinfo(args):
@@ -209,28 +324,44 @@ def addattachment(args):
                 args.pageid, type(args.pageid), args.files)
     page = getPage(args.pageid)
     # NOTE: If pageid is int, some methods may work, while others will fail...
-    attinfos = list()
-    for fp in args.files:
+    def addfile(fp):
         attachmentInfo, attachmentData = attachmentTupFromFilepath(fp)
-        att_info = page.addAttachment(attachmentInfo, attachmentData)
-        attinfos.append(att_info)
+        return page.addAttachment(attachmentInfo, attachmentData)
+    attinfos = (att_info for fp, att_info, error in run_items(addfile, args.files, args) if error is None)
+    if is_streaming(args.outputformat):
+        for att_info in attinfos:
+            outputrecord(att_info)
+        return report_failures(args, len(args.files))
     print "Attachments added:\n- "
     print "\n- ".join(str(info) for info in attinfos)
-    return attinfos
+    return report_failures(args, len(args.files))
 
 
 def getattachments(args):
     """
-    Adds attachments to a page.
+    Returns a list of attachments of one or more pages.
     args should be a namespace object created by argparse.
-    Should have attributes 'pageid' and 'files'.
+    Should have attribute 'pageid' (list of pageids).
+    If a single pageid is given, the output is the list of attachment structs for that page,
+    otherwise the output is a dict of pageId : list of attachment structs, with None for pages that failed.
+    With ndjson output, each attachment struct is written on its own line, and a failed page
+    is written as {'pageId': <pageId>, 'error': <error message>}.
     """
     logger.info("Pageid is: %s (type: %s)", args.pageid, type(args.pageid))
-    page = getPage(args.pageid)
     # NOTE: If pageid is int, some methods may work, while others will fail...
-    att_structs = page.getAttachments()
-    outputres( att_structs, args.outputformat )
-    return att_structs
+    getpageattachments = lambda pageId: getPage(pageId).getAttachments()
+    if is_streaming(args.outputformat):
+        for pageId, att_structs, error in run_items(getpageattachments, args.pageid, args):
+            if error is not None:
+                outputrecord(error_record(pageId, error))
+            for att_struct in att_structs or ():
+                outputrecord(att_struct)
+        return report_failures(args, len(args.pageid))
+    ret = {pageId: att_structs for pageId, att_structs, error in run_items(getpageattachments, args.pageid, args)}
+    if len(args.pageid) == 1:
+        ret = ret.values()[0] or []
+    outputres( ret, args.outputformat )
+    return report_failures(args, len(args.pageid))
 
 
 def get_parser():
@@ -240,7 +371,8 @@ def get_parser():
     # Creating sub-parsers for each command:
     subparsers = parser.add_subparsers(title='subcommands',
                                        description='valid subcommands',
-                                       help='sub-command help')
+                                       help='sub-command help',
+                                       dest='command')
 
     ##################################
     ### Basic command line options ###
@@ -266,7 +398,16 @@ def get_parser():
                         to default testing pathscheme and set loglevel of a range of loggers to DEBUG.")
     parser.add_argument('--outputformat', metavar="<FORMAT>", default="pretty",
                         help="How to format the output (if applicable). E.g. YAML, JSON, PRETTY, etc. \
+                             Use NDJSON to stream one json object per line as soon as each item is done. \
                              Use NONE to supress normal output. Default is to do pretty print.")
+    parser.add_argument('--jobs', '-j', metavar="<N>", type=int, default=1,
+                        help="Number of items (pages/files) to process concurrently, for commands that \
+                             take several page ids or files. Default is 1 (process items one after another).")
+    parser.add_argument('--order', choices=('input', 'completed'), default='input',
+                        help="Order in which results are output when using --jobs: 'input' (default) outputs \
+                             results in the same order as the input items, 'completed' outputs results as they complete.")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="Do not use a running labfluence daemon, always execute the command in-process.")
 
 
     ######################################
@@ -309,25 +450,78 @@ Use "addattachments --help" to see help information for this command.')
     # getattachments command:
     addattachmentsparser = subparsers.add_parser('getattachments',
                                                  help='Returns a list of attachments of a page.')
-    addattachmentsparser.add_argument('pageid', type=int,
-                                      help='PageId of the page that you want to obtain the list of attachments from.')
+    addattachmentsparser.add_argument('pageid', type=int, nargs='+',
+                                      help='PageId(s) of the page(s) that you want to obtain the list of attachments from.')
     addattachmentsparser.set_defaults(func=getattachments)
 
+    return parser
+
 
 def parse_args(argv=None):
 
-    return get_parser().parse_args()
+    return get_parser().parse_args(argv)
 
 
 
-def main():
+def setup_confighandler(argsns):
+    """
+    Sets up the (module-global) confighandler and its server singleton,
+    depending on whether testing mode is requested. Returns the confighandler.
+    """
+    global confighandler    # pylint: disable=W0603
+    ####################################################################################
+    # Set up confighandler, etc (depending on whether testing mode is requested...) ####
+    ####################################################################################
+    if argsns.testing:
+        logging.getLogger("model.model_testdoubles.fake_confighandler").setLevel(logging.DEBUG)
+        logging.getLogger("model.model_testdoubles.fake_server").setLevel(logging.DEBUG)
+        logging.getLogger(__name__).setLevel(logging.DEBUG)
+        pathscheme = argsns.pathscheme or 'test1'
+        logger.info( "Enabling testing environment...:" )
+        confighandler = FakeConfighandler(pathscheme=pathscheme)
+        # set basedir for exp:
+        confighandler.ConfigPaths['exp'] = os.path.join('tests', 'test_data', 'test_filestructure', 'labfluence_data_testsetup', '.labfluence.yml')
+        confserver = FakeConfluenceServer(confighandler=confighandler)
+    else:
+        pathscheme = argsns.pathscheme or 'default1'
+        confighandler = ExpConfigHandler(pathscheme=pathscheme)
+        try:
+            confserver = ConfluenceXmlRpcServer(autologin=True, confighandler=confighandler)
+        except socket.error:
+            print "This should not happen; autologin is shielded by try-clause. Perhaps network issues?"
+            exit(1)
+
+    confighandler.Singletons['server'] = confserver
+    return confighandler
+
+
+def execute(argsns):
+    """
+    Executes the command function specified by argsns.
+    Returns the exit code.
+    """
+    # Test if default func is defined after parsing:
+    func = getattr(argsns, 'func', None)
+    if func:
+        logger.debug("Executing function %s with argsns %s", func, argsns)
+        ret = func(argsns)
+    else:
+        logger.error("No func specified...?")
+        ret = 2
+    # Functions processing several items return an exit code; other functions return their result.
+    return ret if isinstance(ret, int) else 0
+
+
+def main(argv=None):
 
     ##############################
     ###### Parse arguments: ######
     ##############################
 
     #argsns = parser.parse_args() # produces a namespace, not a dict.
-    argsns = parse_args()
+    if argv is None:
+        argv = sys.argv[1:]
+    argsns = parse_args(argv)
 
     #######################################
     ### Set up standard logging system ####
@@ -374,38 +568,18 @@ def main():
     #    logging.getLogger('').addHandler(fh)  #  logging.root == logging.getLogger('')
 
 
-    ####################################################################################
-    # Set up confighandler, etc (depending on whether testing mode is requested...) ####
-    ####################################################################################
-    if argsns.testing:
-        logging.getLogger("model.model_testdoubles.fake_confighandler").setLevel(logging.DEBUG)
-        logging.getLogger("model.model_testdoubles.fake_server").setLevel(logging.DEBUG)
-        logging.getLogger(__name__).setLevel(logging.DEBUG)
-        pathscheme = argsns.pathscheme or 'test1'
-        logger.info( "Enabling testing environment...:" )
-        confighandler = FakeConfighandler(pathscheme=pathscheme)
-        # set basedir for exp:
-        confighandler.ConfigPaths['exp'] = os.path.join('tests', 'test_data', 'test_filestructure', 'labfluence_data_testsetup', '.labfluence.yml')
-        confserver = FakeConfluenceServer(confighandler=confighandler)
-    else:
-        pathscheme = argsns.pathscheme or 'default1'
-        confighandler = ExpConfigHandler(pathscheme=pathscheme)
-        try:
-            confserver = ConfluenceXmlRpcServer(autologin=True, confighandler=confighandler)
-        except socket.error:
-            print "This should not happen; autologin is shielded by try-clause. Perhaps network issues?"
-            exit(1)
-
-    confighandler.Singletons['server'] = confserver
-
+    ##################################################
+    # Use a running labfluence daemon, if available ##
+    ##################################################
+    if not (argsns.no_daemon or argsns.testing):
+        from labfluence_daemon import run_in_daemon, get_socketpath
+        exitcode = run_in_daemon(argv, get_socketpath(argsns.pathscheme))
+        if exitcode is not None:
+            return exitcode
+        logger.debug("No labfluence daemon running, executing command in-process.")
 
-    # Test if default func is defined after parsing:
-    func = getattr(argsns, 'func', None)
-    if func:
-        logger.debug("Executing function %s with argsns %s", func, argsns)
-        ret = func(argsns)
-    else:
-        logger.error("No func specified...?")
+    setup_confighandler(argsns)
+    return execute(argsns)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
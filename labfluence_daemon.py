@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable=C0103,W0212,W0603
+
+"""
+Labfluence daemon: serves labfluence_cmd commands over a local UNIX socket.
+
+Every labfluence_cmd invocation normally reads all configs, logs in to the server
+and rebuilds its caches before doing a single request. The daemon does this once
+and keeps a logged-in server, an ExperimentManager and their caches warm between commands.
+
+Start the daemon with:
+    python labfluence_daemon.py [--pathscheme <scheme>]
+and stop it with:
+    python labfluence_daemon.py --stop
+
+labfluence_cmd automatically uses a running daemon (for the same pathscheme),
+and falls back to in-process execution if no daemon is running (or with --no-daemon).
+Note that the daemon reads the configs when started; restart it after changing the config.
+
+The socket is created in a private per-user directory ($XDG_RUNTIME_DIR, or labfluence-<uid>
+in the temp directory, created with mode 0700). The daemon refuses to use a socket directory
+that is owned by another user or accessible by others, and the client only connects to
+sockets owned by the current user, so other users cannot intercept or fake commands.
+
+Protocol: The client sends a single json line, {"argv": [...], "cwd": <client's working directory>}
+(or {"command": "shutdown"}). File arguments (see labfluence_cmd.PATH_ARGUMENTS) given as relative
+paths are resolved against the client's working directory, not the daemon's.
+The daemon replies with json lines: {"out": text} and {"err": text} as output is produced,
+and finally {"exitcode": code}.
+"""
+
+import os
+import sys
+import json
+import errno
+import socket
+import tempfile
+import argparse
+import threading
+import traceback
+import SocketServer
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def get_socketdir():
+    """
+    Returns the per-user directory for daemon sockets:
+    $XDG_RUNTIME_DIR if set, otherwise labfluence-<uid> in the temp directory.
+    The directory is not created; see make_socketdir.
+    """
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.environ['XDG_RUNTIME_DIR']
+    try:
+        user = str(os.getuid())
+    except AttributeError:
+        user = os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), "labfluence-{}".format(user))
+
+
+def get_socketpath(pathscheme=None):
+    """
+    Returns the path of the daemon socket for the given pathscheme.
+    The path can be overridden with the LABFLUENCE_SOCKET environment variable.
+    """
+    if os.environ.get('LABFLUENCE_SOCKET'):
+        return os.environ['LABFLUENCE_SOCKET']
+    return os.path.join(get_socketdir(), "labfluence-{}.sock".format(pathscheme or 'default1'))
+
+
+def is_owned(path):
+    """ Returns True if path is owned by the current user (always True where uids are not available). """
+    if not hasattr(os, 'getuid'):
+        return True
+    return os.stat(path).st_uid == os.getuid()
+
+
+def make_socketdir(socketdir):
+    """
+    Creates socketdir with mode 0700 if it does not exist.
+    Raises RuntimeError if socketdir is owned by another user or is accessible by other users.
+    """
+    try:
+        os.mkdir(socketdir, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    if not is_owned(socketdir):
+        raise RuntimeError("Socket directory {} is owned by another user.".format(socketdir))
+    mode = os.stat(socketdir).st_mode & 0o777
+    if hasattr(os, 'getuid') and mode & 0o077:
+        raise RuntimeError("Socket directory {} is accessible by other users (mode {:o}).".format(socketdir, mode))
+
+
+def send_message(wfile, message):
+    """ Writes message to wfile as a single json line. """
+    wfile.write(json.dumps(message) + "\n")
+    wfile.flush()
+
+
+########################
+### Client functions ###
+########################
+
+def connect(socketpath, timeout=None):
+    """
+    Returns a socket connected to the daemon at socketpath,
+    or None if no daemon is listening (or UNIX sockets are not available).
+    Sockets owned by another user are not trusted and are not connected to.
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socketpath):
+        return None
+    if not is_owned(socketpath):
+        logger.warning("Socket %s is owned by another user, not connecting to it.", socketpath)
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socketpath)
+    except socket.error as e:
+        logger.debug("Could not connect to labfluence daemon at %s: %s", socketpath, e)
+        sock.close()
+        return None
+    return sock
+
+
+def request(sock, message, stdout=None, stderr=None):
+    """
+    Sends message to the daemon and writes the output to stdout/stderr as it arrives.
+    Returns the exit code reported by the daemon.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    rfile = sock.makefile('rb')
+    wfile = sock.makefile('wb')
+    try:
+        send_message(wfile, message)
+        for line in rfile:
+            reply = json.loads(line)
+            if 'out' in reply:
+                stdout.write(reply['out'].encode('utf-8'))
+                stdout.flush()
+            elif 'err' in reply:
+                stderr.write(reply['err'].encode('utf-8'))
+            elif 'exitcode' in reply:
+                return reply['exitcode']
+    finally:
+        rfile.close()
+        wfile.close()
+        sock.close()
+    logger.warning("Labfluence daemon closed the connection without reporting an exit code.")
+    return 1
+
+
+def run_in_daemon(argv, socketpath, stdout=None, stderr=None, cwd=None):
+    """
+    Runs labfluence_cmd with argv in the daemon listening at socketpath.
+    Relative file arguments are resolved against cwd (default: the current working directory).
+    Returns the exit code, or None if no daemon is running, in which case
+    the command should be executed in-process.
+    """
+    sock = connect(socketpath)
+    if sock is None:
+        return None
+    logger.debug("Executing %s in labfluence daemon at %s", argv, socketpath)
+    message = {'argv': list(argv), 'cwd': cwd or os.getcwd()}
+    return request(sock, message, stdout=stdout, stderr=stderr)
+
+
+def stop_daemon(socketpath):
+    """ Asks the daemon at socketpath to shut down. Returns False if no daemon is running. """
+    sock = connect(socketpath)
+    if sock is None:
+        return False
+    request(sock, {'command': 'shutdown'})
+    return True
+
+
+########################
+### Daemon (server)  ###
+########################
+
+class SocketStream(object):
+    """
+    File-like object used in place of sys.stdout/sys.stderr while a command is executed,
+    forwarding everything written as {<name>: text} messages to the client.
+    """
+    def __init__(self, wfile, name, lock):
+        self.wfile = wfile
+        self.name = name
+        self.lock = lock    # shared between the streams of a connection, messages must not interleave.
+        self.Closed = False
+
+    def write(self, data):
+        if not data or self.Closed:
+            return
+        if isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        with self.lock:
+            try:
+                send_message(self.wfile, {self.name: data})
+            except socket.error as e:
+                # The client went away (e.g. output piped to head); discard the remaining output.
+                logger.info("Client disconnected, discarding output: %s", e)
+                self.Closed = True
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class DaemonRequestHandler(SocketServer.StreamRequestHandler):
+    """ Handles a single client connection (one command). """
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+        except ValueError as e:
+            logger.warning("Invalid request received: %s", e)
+            return
+        if message.get('command') == 'shutdown':
+            logger.info("Shutdown requested by client.")
+            send_message(self.wfile, {'exitcode': 0})
+            # shutdown() waits for serve_forever to return, so it must be called from another thread:
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        exitcode = self.server.execute(message.get('argv', []), self.wfile, cwd=message.get('cwd'))
+        try:
+            send_message(self.wfile, {'exitcode': exitcode})
+        except socket.error:
+            pass
+
+    def finish(self):
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass    # client disconnected before reading all output.
+
+
+class LabfluenceDaemon(SocketServer.UnixStreamServer):
+    """
+    Serves labfluence_cmd commands, using the (already set up) confighandler with
+    its server and experimentmanager singletons.
+    Commands are executed one at a time, since output is captured by replacing sys.stdout/sys.stderr.
+    """
+
+    def __init__(self, socketpath, confighandler):
+        self.Socketpath = socketpath
+        self.Confighandler = confighandler
+        self.Commandcount = 0
+        make_socketdir(os.path.dirname(os.path.abspath(socketpath)))
+        remove_stale_socket(socketpath)
+        SocketServer.UnixStreamServer.__init__(self, socketpath, DaemonRequestHandler)
+        os.chmod(socketpath, 0o600)
+
+    def execute(self, argv, wfile, cwd=None):
+        """
+        Executes labfluence_cmd with argv, sending output to wfile. Returns the exit code.
+        Relative file arguments are resolved against cwd, the client's working directory.
+        """
+        import labfluence_cmd
+        lock = threading.Lock()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = SocketStream(wfile, 'out', lock), SocketStream(wfile, 'err', lock)
+        try:
+            argsns = labfluence_cmd.parse_args(argv)
+            if cwd:
+                resolve_paths(argsns, cwd, labfluence_cmd.PATH_ARGUMENTS)
+            labfluence_cmd.confighandler = self.Confighandler
+            return labfluence_cmd.execute(argsns)
+        except SystemExit as e:
+            # argparse exits on --help and invalid arguments:
+            return e.code if isinstance(e.code, int) else 2
+        except Exception:   # pylint: disable=W0703
+            logger.exception("Error executing command %s", argv)
+            traceback.print_exc()
+            return 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            self.Commandcount += 1
+            logger.debug("Command %s executed (%s commands served)", argv, self.Commandcount)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.Socketpath)
+        except OSError:
+            pass
+
+
+def resolve_paths(argsns, cwd, names):
+    """
+    Makes the (relative) file paths of the argsns attributes <names> absolute, relative to cwd.
+    Attributes can be a single path or a list of paths; missing attributes are ignored.
+    """
+    resolve = lambda path: os.path.join(cwd, os.path.expanduser(path))
+    for name in names:
+        value = getattr(argsns, name, None)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            setattr(argsns, name, [resolve(path) for path in value])
+        else:
+            setattr(argsns, name, resolve(value))
+
+
+def remove_stale_socket(socketpath):
+    """
+    Removes a socket file left behind by a daemon that is no longer running.
+    Raises RuntimeError if a daemon is already listening on socketpath,
+    or if the socket file is owned by another user.
+    """
+    if not os.path.exists(socketpath):
+        return
+    if not is_owned(socketpath):
+        raise RuntimeError("Socket {} is owned by another user.".format(socketpath))
+    sock = connect(socketpath)
+    if sock is not None:
+        sock.close()
+        raise RuntimeError("A labfluence daemon is already running at {}".format(socketpath))
+    try:
+        os.remove(socketpath)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Labfluence daemon, serves labfluence_cmd commands with warm caches.")
+    parser.add_argument('--pathscheme', help="Pathscheme to use for the confighandler.")
+    parser.add_argument('--socket', help="Path of the UNIX socket to listen on. \
+                        Defaults to a per-pathscheme socket in a private per-user directory.")
+    parser.add_argument('--stop', action='store_true', help="Stop the running daemon.")
+    parser.add_argument('--logtofile', help="Log logging outputs to this file.")
+    parser.add_argument('--loglevel', default=logging.WARNING, help="Logging level to use.")
+    parser.add_argument('--debug', metavar='<MODULES>', nargs='*',
+                        help="Specify modules where you want to display logging.DEBUG messages.")
+    parser.add_argument('--testing', action='store_true', help="Use the testing environment (fake server).")
+    return parser
+
+
+def main(argv=None):
+    argsns = get_parser().parse_args(argv)
+    socketpath = argsns.socket or get_socketpath(argsns.pathscheme or ('test1' if argsns.testing else None))
+    if argsns.stop:
+        if not stop_daemon(socketpath):
+            print "No labfluence daemon running at", socketpath
+            return 1
+        return 0
+
+    from __init__ import init_logging
+    init_logging(argsns, prefix="labfluence_daemon")
+    import labfluence_cmd
+    confighandler = labfluence_cmd.setup_confighandler(argsns)
+    from model.experimentmanager import ExperimentManager
+    try:
+        manager = ExperimentManager(confighandler=confighandler, autoinit=('localexps', ))
+    except (OSError, IOError) as e:
+        logger.warning("Could not load local experiments (%s), experiments will be loaded on demand.", e)
+        manager = ExperimentManager(confighandler=confighandler, autoinit=())
+    confighandler.Singletons['experimentmanager'] = manager
+    daemon = LabfluenceDaemon(socketpath, confighandler)
+    logger.info("Labfluence daemon listening at %s", socketpath)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
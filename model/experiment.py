@@ -99,7 +99,9 @@ logger = logging.getLogger(__name__)
 
 # Labfluence modules and classes:
 from page import WikiPage, WikiPageFactory, make_page_url, make_subentry_anchor
+from pagesections import SectionIndex, get_section_layout, get_experiment_section, get_subentry_header
 from journalassistant import JournalAssistant
+from server.pagesearch import SearchStrategy
 from filemanager import Filemanager
 from utils import increment_idx, idx_generator, asciize
 from decorators.cache_decorator import cached_property
@@ -138,7 +140,8 @@ class Experiment(LabfluenceBase):
             self._wikipage = wikipage
         else:
             # Assume page struct:
-            self._wikipage = WikiPage(wikipage.get('id', wikipage.get('pageId', None)), self.Server, pagestruct=wikipage)
+            self._wikipage = WikiPage(wikipage.get('id', wikipage.get('pageId', None)), self.Server,
+                                      confighandler=confighandler, pagestruct=wikipage)
         # Attaching of wiki pages is done lazily on first call. _autoattachwikipage is not really used.
         self._autoattachwikipage = autoattachwikipage
         # NOTICE: Attaching wiki pages is done lazily using a property (unless makewikipage is not False)
@@ -347,9 +350,9 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         Might be different from one experiment to the next if the experiment's
         exp_series_regex config/property key has been customized.
         """
-        if not getattr(self, '_exp_regex_prog', None):
-            self._exp_regex_prog = re.compile(self.getConfigEntry('exp_series_regex'))
-        return self._exp_regex_prog
+        if getattr(self, '_exp_regex_prog', None):
+            return self._exp_regex_prog
+        return self.RegexRegistry.compile('exp_series_regex', self.getConfigEntry('exp_series_regex'))
     @property
     def Subentries_regex_prog(self):
         """
@@ -358,13 +361,13 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         Might be different from one experiment to the next if the experiment's
         exp_series_regex config/property key has been customized.
         """
-        if not getattr(self, '_subentries_regex_prog', None):
-            regex_str = self.getConfigEntry('exp_subentry_regex') #getExpSubentryRegex()
-            if not regex_str:
-                logger.warning("Warning, no exp_subentry_regex entry found in config, reverting to hard-coded default.")
-                regex_str = r"(?P<date1>[0-9]{8})?[_ ]*(?P<expid>RS[0-9]{3})-?(?P<subentry_idx>[^_ ])[_ ]+(?P<subentry_titledesc>.+?)\s*(\((?P<date2>[0-9]{8})\))?$"
-            self._subentries_regex_prog = re.compile(regex_str)
-        return self._subentries_regex_prog
+        if getattr(self, '_subentries_regex_prog', None):
+            return self._subentries_regex_prog
+        regex_str = self.getConfigEntry('exp_subentry_regex') #getExpSubentryRegex()
+        if not regex_str:
+            logger.warning("Warning, no exp_subentry_regex entry found in config, reverting to hard-coded default.")
+            regex_str = r"(?P<date1>[0-9]{8})?[_ ]*(?P<expid>RS[0-9]{3})-?(?P<subentry_idx>[^_ ])[_ ]+(?P<subentry_titledesc>.+?)\s*(\((?P<date2>[0-9]{8})\))?$"
+        return self.RegexRegistry.compile('exp_subentry_regex', regex_str)
     @Subentries_regex_prog.setter
     def Subentries_regex_prog(self, subentry_regex_prog):
         """
@@ -418,8 +421,12 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         if mode == 'subentry':
             mode = 'view'
             pagetitle = self.Wiki_pagetitle
-            # This will only work if the format has not been changed since the subentry was created on the page:
-            subentryheader = self.getSubentryRepr(subentry_idx='current')
+            # Use the subentry header on the page if the page is loaded; otherwise use the subentry repr,
+            # which only works if the format has not been changed since the subentry was created on the page:
+            index = self._wikipage.getSectionIndex(reload=False) if self._wikipage else None
+            layout = get_section_layout(self.getConfigEntry('wiki_subentry_parse_regex_fmt'))
+            header = get_subentry_header(index, self.Expid, self.getCurrentSubentryIdx(), layout) if index else None
+            subentryheader = header.title if header else self.getSubentryRepr(subentry_idx='current')
             if subentryheader:
                 anchor = make_subentry_anchor(pagetitle, subentryheader)
         url = make_page_url(baseurl, pageId, mode, anchor)
@@ -999,37 +1006,51 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
             if wikipage is None:
                 wikipage = self.WikiPage
             xhtml = wikipage.Content
+            index = wikipage.SectionIndex
+        else:
+            index = SectionIndex(xhtml)
         # GENERATE required regex programs:
         try:
-            expsection_regex_prog = re.compile(self.getConfigEntry('wiki_experiment_section'), flags=re.DOTALL+re.MULTILINE)
+            expsection_regex_prog = self.RegexRegistry.compile('wiki_experiment_section', self.getConfigEntry('wiki_experiment_section'),
+                                                               flags=re.DOTALL+re.MULTILINE)
             logger.debug("wiki_experiment_section regex is: %s", expsection_regex_prog.pattern)
-        except TypeError as e:
-            logger.warning("TypeError: %s while creating regex prog; self.getConfigEntry('wiki_experiment_section')=%s; (If None, then 'wiki_experiment_section' is probably not set in config) - ABORTING...",
+        except (TypeError, AttributeError) as e:
+            logger.warning("%r while creating regex prog; self.getConfigEntry('wiki_experiment_section')=%s; (If None, then 'wiki_experiment_section' is probably not set in config) - ABORTING...",
                            e, self.getConfigEntry('wiki_experiment_section'))
             return
         try:
             subentry_regex_fmt = self.getConfigEntry('wiki_subentry_regex_fmt')
             logger.debug("wiki_subentry_regex_fmt is: '%s'", subentry_regex_fmt)
-            subentry_regex = subentry_regex_fmt.format(expid=self.Expid, subentry_idx=r"(?P<subentry_idx>[a-zA-Z]+)") # alternatively, throw in **self.Props
-            logger.debug("Subentry regex after format substitution: '%s'", subentry_regex)
-            subentry_regex_prog = re.compile(subentry_regex, flags=re.DOTALL+re.MULTILINE)
-        except (TypeError, KeyError) as e:
+            fmt_params = dict(expid=self.Expid, subentry_idx=r"(?P<subentry_idx>[a-zA-Z]+)") # alternatively, throw in **self.Props
+            subentry_regex_prog = self.RegexRegistry.compile('wiki_subentry_regex_fmt', subentry_regex_fmt,
+                                                             flags=re.DOTALL+re.MULTILINE, fmt_params=fmt_params)
+            logger.debug("Subentry regex after format substitution: '%s'", subentry_regex_prog.pattern)
+        except (TypeError, KeyError, AttributeError) as e:
             logger.warning("%r while creating wiki subentry regex prog; self.getConfigEntry('wiki_subentry_regex_fmt')=%s; ABORTING...",
                            e, self.getConfigEntry('wiki_subentry_regex_fmt'))
             return
         # PARSE the wiki xhtml:
-        expsection_match = expsection_regex_prog.match(xhtml) # consider using search instead of match?
-        if not expsection_match:
-            logger.warning("NO MATCH ('%s') for expsubsection_regex '%s' in xhtml of length %s, aborting",
-                           expsection_match, expsection_regex_prog.pattern, len(xhtml))
-            logger.debug("xhtml is: %s", xhtml)
-            return
-        exp_xhtml = expsection_match.groupdict().get('exp_section_body')
-        if not exp_xhtml:
-            logger.warning("Aborting, exp_section_body is empty: %s", exp_xhtml)
-            return
+        layout = get_section_layout(self.getConfigEntry('wiki_subentry_parse_regex_fmt'))
+        expsection = get_experiment_section(index, layout) if index else None
+        if expsection:
+            # Use the section index: only match the subentry regex at the subentry headers in the experimental section.
+            matches = (subentry_regex_prog.match(xhtml, header.start, expsection.end)
+                       for header in index.subHeaders(expsection, level=layout.subentry_level))
+            matches = [match for match in matches if match]
+        else:
+            expsection_match = expsection_regex_prog.match(xhtml) # consider using search instead of match?
+            if not expsection_match:
+                logger.warning("NO MATCH ('%s') for expsubsection_regex '%s' in xhtml of length %s, aborting",
+                               expsection_match, expsection_regex_prog.pattern, len(xhtml))
+                logger.debug("xhtml is: %s", xhtml)
+                return
+            exp_xhtml = expsection_match.groupdict().get('exp_section_body')
+            if not exp_xhtml:
+                logger.warning("Aborting, exp_section_body is empty: %s", exp_xhtml)
+                return
+            matches = subentry_regex_prog.finditer(exp_xhtml)
         wiki_subentries = OrderedDict()
-        for match in subentry_regex_prog.finditer(exp_xhtml):
+        for match in matches:
             gd = match.groupdict()
             logger.debug("Match groupdict: {%s}", ", ".join(u"{} : {}".format(key, value[0:20]+' (....) '+value[-20:] if value and len(value) > 50 else value)
                                                             for key, value in gd.items()))
@@ -1155,19 +1176,24 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         if not subentry:
             logger.info("No subentry set/selected/available, aborting...")
             return None
-        #xhtml = self.WikiPage.getWikiSubentryXhtml(subentry)
-        regex_pat_fmt = self.Confighandler.get('wiki_subentry_parse_regex_fmt')
-        fmt_params = self.makeFormattingParams(subentry_idx=subentry)
-        regex_pat = regex_pat_fmt.format(**fmt_params)
-        if not regex_pat:
-            logger.warning("No regex pattern found in config, aborting...")
-            return
         if not self.WikiPage or not self.WikiPage.Struct:
             logger.info("WikiPage or WikiPage.Struct is None, aborting...")
             logger.info("-- %s is %s", 'self.WikiPage.Struct' if self.WikiPage else self.WikiPage, self.WikiPage.Struct if self.WikiPage else self.WikiPage)
             return
+        index = self.WikiPage.SectionIndex
+        layout = get_section_layout(self.Confighandler.get('wiki_subentry_parse_regex_fmt'))
+        header = get_subentry_header(index, self.Expid, subentry, layout) if index else None
+        if header:
+            return "\n".join((index.Xhtml[header.start:header.bodystart], index.Xhtml[header.bodystart:header.end]))
+        # Subentry not found in the section index (e.g. non-standard page layout), try the configured regex:
+        regex_pat_fmt = self.Confighandler.get('wiki_subentry_parse_regex_fmt')
+        if not regex_pat_fmt:
+            logger.warning("No regex pattern found in config, aborting...")
+            return
+        # makeFormattingParams includes the current datetime, so the formatted pattern is used as key:
+        regex_pat = regex_pat_fmt.format(**self.makeFormattingParams(subentry_idx=subentry))
         content = self.WikiPage.Struct['content']
-        regex_prog = re.compile(regex_pat, flags=re.DOTALL)
+        regex_prog = self.RegexRegistry.compile('wiki_subentry_parse_regex_fmt', regex_pat, flags=re.DOTALL)
         match = regex_prog.search(content)
         if match:
             gd = match.groupdict()
@@ -1213,7 +1239,7 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         if not pageId:
             logger.info("Notice - no pageId found for expid %s (self.Server=%s)...", self.Props.get('expid'), self.Server)
             return pagestruct
-        self.WikiPage = wikipage = WikiPage(pageId, self.Server, pagestruct)
+        self.WikiPage = wikipage = WikiPage(pageId, self.Server, confighandler=self.Confighandler, pagestruct=pagestruct)
         struct = wikipage.Struct
         # Update self.Props for offline access to the title of the wiki page:
         if struct:
@@ -1226,35 +1252,36 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
     def searchForWikiPage(self):
         """
         Argument <extended> is used to control how much search you want to do.
-        Search strategy:
+        Search strategy (the strategies are run concurrently, see server.searchForWikiPage):
         1) Find page on wiki in space with pageTitle matching self.Foldername.
         2) Query manager for CURRENT wiki experiment pages and see if there is one that has matching expid.
-        3) Query exp manager for ALL wiki experiment pages and see if there is one that has matching expid.
         3) Find pages in space with user as contributor and expid in title.
         Hmm... being able to define list with multiple spaceKeys and wiki_exp_root_pageId
         would make it a lot easier for users with wikipages scattered in several spaces...?
         Also, for finding e.g. archived wikipages...
         """
-        # Start by querying manager's cache:
         expid = self.Expid  # uses self.Props
-        if self.Manager:
-            currentwikipagesbyexpid = self.Manager.CurrentWikiExperimentsPagestructsByExpid # cached_property
+        manager = self.Manager
+        def current_experiments():
+            """ Look up the page in the manager's cache of current wiki experiments. """
+            currentwikipagesbyexpid = manager.CurrentWikiExperimentsPagestructsByExpid # cached_property
             if currentwikipagesbyexpid and expid in currentwikipagesbyexpid:
                 return currentwikipagesbyexpid[expid]
-        else:
+        if not manager:
             logger.warning("Experiment %s has no ExperimentManager.", expid)
-        # Query server:
         server = self.Server
         if not server:
             logger.info("self.Server is: %s, ABORTING.", server)
-            return None
+            return current_experiments() if manager else None
         spaceKey = self.Confighandler.get('wiki_exp_root_spaceKey')
         pageTitle = self.Foldername or self.getFoldernameFromFmtAndProps() # No reason to make this more complicated...
         user = self.Confighandler.get('wiki_username') or self.Confighandler.get('username')
         optional = {'creator': (user, ), 'modifier': (user, )}
         required = {'title': (expid, )}
+        # The manager's cache is queried concurrently with the server searches:
+        strategies = [SearchStrategy('current-experiments', current_experiments, True)] if manager else None
         logger.info("Searching for page with title=%s, space=%s on server...", pageTitle, spaceKey)
-        pagestruct = server.searchForWikiPage(spaceKey, pageTitle, required, optional)
+        pagestruct = server.searchForWikiPage(spaceKey, pageTitle, required, optional, strategies=strategies)
         return pagestruct
 
 
@@ -1275,7 +1302,12 @@ props=%s, regex_match=%s, wikipage='%s'", props, regex_match, wikipage)
         current_datetime = datetime.now()
         fmt_params = dict(datetime=current_datetime, date=current_datetime)
         fmt_params.update(self.Props)
-        self.WikiPage = wikipage = pagefactory.new('exp_page', fmt_params=fmt_params)
+        wikipage = pagefactory.new('exp_page', fmt_params=fmt_params)
+        if wikipage is None:
+            # The server is offline and the page has been queued; it is attached (found by title) once it has been created.
+            logger.info("Wiki page for experiment %s could not be created now (server offline?).", self.Expid)
+            return None
+        self.WikiPage = wikipage
         self.Props['wiki_pageId'] = self.WikiPage.Struct['id']
         # Always save/persist props after making a wiki page, otherwise the pageId might be lost.
         self.saveProps()
@@ -26,7 +26,6 @@ handles logic related to managing experiment objects.
 from __future__ import print_function
 from six import string_types
 import os
-import re
 import logging
 from collections import OrderedDict
 try:
@@ -38,6 +37,7 @@ logger = logging.getLogger(__name__)
 # Model classes:
 from experiment import Experiment
 from labfluencebase import LabfluenceBase
+from searchindex import ExperimentSearchIndex
 
 from dirtreeparsing import genPathmatchTupsByPathscheme, getFoldersWithSameProperty
 
@@ -72,6 +72,7 @@ class ExperimentManager(LabfluenceBase):
         self._experiments = list()
         self._localexpdirsparsed = False
         self._regexpats = None  # Cached compiled regular expressions
+        self._searchindex = None
         if autoinit:
             logger.info("Auto-initiating experiments for ExperimentManager...")
             self.mergeLocalExperiments()
@@ -116,7 +117,7 @@ class ExperimentManager(LabfluenceBase):
         return self.Confighandler.get('local_exp_folderscheme', './year_loc/experiment/subentry')
     def _set_regexs(self, regexs):
         """ Compile and set regular expressions cache. """
-        self._regexpats = {schemekey : re.compile(regex) if isinstance(regex, string_types) else regex for schemekey, regex in regexs.items()}
+        self._regexpats = self.RegexRegistry.compileDict('local_exp_folder_regexs', regexs)
     @property
     def Regexs(self):
         """
@@ -125,11 +126,10 @@ class ExperimentManager(LabfluenceBase):
         Otherwise, try to find a default regex in the confighandler.
         If that doesn't work, ... ?
         """
-        if not self._regexpats:
-            regexs = self.Confighandler.get('local_exp_folder_regexs')
-            logger.debug('Loading regex from config: %s', list(regexs.items()))
-            self._set_regexs(regexs)
-        return self._regexpats
+        if self._regexpats:
+            return self._regexpats
+        # Compiled regexes from the config are cached in the regex registry, which is updated if the config entry changes:
+        return self.RegexRegistry.getDict('local_exp_folder_regexs')
     @Regexs.setter
     def Regexs(self, regexs):
         """
@@ -164,6 +164,31 @@ class ExperimentManager(LabfluenceBase):
 
 
 
+    @property
+    def SearchIndex(self):
+        """
+        Search index over experiments, created on first use.
+        The index follows ExperimentsById and is updated incrementally when experiments change.
+        """
+        if self._searchindex is None:
+            self._searchindex = ExperimentSearchIndex()
+            self._searchindex.attachManager(self)
+            if self._experimentsbyid is None:
+                self._searchindex.update(self.ExperimentsById)
+        return self._searchindex
+
+    def searchExperiments(self, query, limit=50, ret='expid'):
+        """
+        Searches experiments by expid, title, subentry titles, dates and attachment names.
+        Query words may be prefixes, and small typos are tolerated.
+        Returns a list of expids (or experiments, if ret='experiment'), best match first.
+        """
+        expids = self.SearchIndex.searchExpids(query, limit=limit)
+        if ret == 'experiment':
+            return [self.ExperimentsById[expid] for expid in expids if expid in self.ExperimentsById]
+        return expids
+
+
     @cached_property(ttl=120) # 2 minutes cache...
     def CurrentWikiExperimentsPagestructsByExpid(self):
         """
@@ -479,7 +504,7 @@ class ExperimentManager(LabfluenceBase):
             logger.warning("ERROR, no exp_series_regex entry found in config (%s), aborting...", regex_str)
             return
         logger.debug("Parsing local folders with regex: %s", regex_str)
-        regex_prog = re.compile(regex_str)
+        regex_prog = self.RegexRegistry.compile('exp_series_regex', regex_str)
         pathmatchtuples = (tup for tup in ((path, regex_prog.match(os.path.basename(path))) for path in exp_paths) if tup[1])
         return pathmatchtuples
 
@@ -612,8 +637,40 @@ class ExperimentManager(LabfluenceBase):
         wiki_pages = self.Server.getChildren(wiki_exp_root_pageid)
         if not wiki_pages:
             logger.info("No wiki pages found for wiki_exp_root_pageid %s, server returned: %s", wiki_exp_root_pageid, wiki_pages)
+        else:
+            # Start fetching the full pages of active and recent experiments, which are usually needed next:
+            self.prefetchWikiPages(wiki_pages)
         return wiki_pages
 
+    def prefetchWikiPages(self, wiki_pages=None, expids=None, block=False):
+        """
+        Fetches the full page structs of the wiki pages for experiments in expids
+        (default: active and recent experiments) concurrently into the page cache,
+        so the experiments' WikiPage objects do not have to request them one at a time.
+        wiki_pages is a list of page summaries, e.g. from getExpRootWikiPages(); pages are matched
+        to expids using exp_series_regex. The wiki_pageId of already loaded experiments is also used.
+        If block is False (default), returns immediately; accessing a page being fetched waits for it.
+        Returns the list of pageIds being fetched.
+        """
+        pagecache = self.PageCache
+        if pagecache is None or not pagecache.Workers:
+            return []
+        if expids is None:
+            expids = self.ActiveExperimentIds + self.RecentExperimentIds
+        expids = set(expids)
+        pageids = list()
+        regex_str = self.getExpSeriesRegex()
+        if wiki_pages and regex_str:
+            regex_prog = self.RegexRegistry.compile('exp_series_regex', regex_str)
+            for page in wiki_pages:
+                match = regex_prog.match(page['title'])
+                if match and match.groupdict().get('expid') in expids:
+                    pageids.append(page['id'])
+        if self._experimentsbyid:
+            pageids.extend(self._experimentsbyid[expid].Props.get('wiki_pageId')
+                           for expid in expids if expid in self._experimentsbyid)
+        return pagecache.prefetch(self.Server, [pageid for pageid in pageids if pageid], block=block)
+
 
     def getCurrentWikiExpsPageMatchTuples(self):
         """
@@ -632,7 +689,7 @@ class ExperimentManager(LabfluenceBase):
         if not regex_str:
             logger.warning("ERROR, no exp_series_regex entry found in config, aborting!")
             return
-        regex_prog = re.compile(regex_str)
+        regex_prog = self.RegexRegistry.compile('exp_series_regex', regex_str)
         pagematchtuples = (tup for tup in ((page, regex_prog.match(page['title'])) for page in wiki_pages) if tup[1])
         return pagematchtuples
 
@@ -793,11 +850,11 @@ class ExperimentManager(LabfluenceBase):
         """
         if expByIdMap is None:
             expByIdMap = self.ExperimentsById
-        regex_str = self.Confighandler.get('expid_regex')
-        if not regex_str:
+        regex_prog = self.RegexRegistry.get('expid_regex')
+        if not regex_prog:
             logger.info("No expid regex in config, aborting.")
-        logger.debug("Regex: %s", regex_str)
-        regex_prog = re.compile(regex_str)
+            return []
+        logger.debug("Regex: %s", regex_prog.pattern)
         return sorted((x for x in (int(match.group(1)) for match in (regex_prog.match(expid) for expid in expByIdMap.keys()))
                        if x is not None))
 
@@ -39,6 +39,7 @@ import re
 import logging
 logger = logging.getLogger(__name__)
 from utils import filehexdigest, attachmentTupFromFilepath
+from outboundqueue import register_operation_handler, is_offline
 
 
 class Filemanager(object):
@@ -324,6 +325,7 @@ class Filemanager(object):
         """
         Upload attachment to wiki page.
         Returns True if succeeded, False if failed and None if no attemt was made to upload due to a local Error.
+        If the server is offline, the upload is added to the outbound queue and the queued operation (dict) is returned.
         # NOTE: CONF-31169 and CONF-30024.
         # - attachment title ignored when adding attachment
         # - RemoteAttachment.java does not have a comment setter.
@@ -347,9 +349,15 @@ class Filemanager(object):
             return None
         if not os.path.isabs(filepath):
             filepath = os.path.normpath(os.path.join(self.Localdirpath, filepath))
+        # If the server is offline, the upload is queued and the queued operation is returned:
+        outboundqueue = self.Experiment.OutboundQueue
+        if outboundqueue is not None and outboundqueue.shouldQueue(wikipage.Server):
+            return outboundqueue.enqueue('attachment', pageId=wikipage.PageId, filepath=filepath)
         # path relative to this experiment, e.g. 'RS123d subentry_titledesc/RS123d_c1-grid1_somedate.jpg'
         attachmentInfo, attachmentData = attachmentTupFromFilepath(filepath)
         attachment = wikipage.addAttachment(attachmentInfo, attachmentData)
+        if attachment is None and outboundqueue is not None and is_offline(wikipage.Server):
+            return outboundqueue.enqueue('attachment', pageId=wikipage.PageId, filepath=filepath)
         #relpath = os.path.relpath(filepath, self.Localdirpath)
         #mimetype = getmimetype(filepath)
         ##attachmentInfo['contentType'] = mimetype
@@ -431,3 +439,25 @@ class Filemanager(object):
         # attachment struct_list might be None or False, so must check before trying to iterate:
         return [ (struct['fileName'], struct['id'], struct) for struct in struct_list \
                     if regex_prog is None or regex_prog.match(struct['fileName']) ]
+
+
+def replay_attachment(server, confighandler, pageId, filepath):
+    """
+    Outbound queue handler for attachment uploads (see Filemanager.uploadAttachment).
+    The upload is obsolete if the file no longer exists, or if the page already has an
+    attachment with the same file name and size.
+    """
+    if not os.path.isfile(filepath):
+        logger.warning("File '%s' no longer exists, cannot upload it as attachment to page %s.", filepath, pageId)
+        return None
+    attachments = server.getAttachments(pageId)
+    if attachments is None and is_offline(server):
+        return False
+    filename, filesize = os.path.basename(filepath), os.path.getsize(filepath)
+    if any(att.get('fileName') == filename and str(att.get('fileSize')) == str(filesize) for att in attachments or []):
+        logger.info("Page %s already has attachment '%s' with size %s, not uploading it again.", pageId, filename, filesize)
+        return None
+    attachmentInfo, attachmentData = attachmentTupFromFilepath(filepath)
+    return bool(server.addAttachment(pageId, attachmentInfo, attachmentData))
+
+register_operation_handler('attachment', replay_attachment)
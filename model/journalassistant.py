@@ -52,7 +52,9 @@ logger = logging.getLogger(__name__)
 #from server import ConfluenceXmlRpcServer
 #from confighandler import ExpConfigHandler
 #from page import WikiPage, WikiPageFactory, TemplateManager
-from page import TemplateManager
+from page import TemplateManager, WikiPage
+from outboundqueue import register_operation_handler, is_offline
+from pagesections import get_section_layout, get_subentry_header, get_new_subentry_position
 #from utils import *  # This will override the logger with the logger defined in utils.
 #from utils import random_string
 
@@ -211,7 +213,26 @@ class JournalAssistant(object):
         insertion_regex = insertion_regex_fmt.format(**subentryprops)
         subentry_idx = subentryprops['subentry_idx']
         versionComment = u"Labfluence JournalAssistant.flush() for subentry {[expid]}{}".format(subentryprops, subentry_idx)
-        res = wikipage.insertAtRegex(new_xhtml, insertion_regex, versionComment=versionComment)
+        # If the server is offline, the journal content is added to the outbound queue (and the queued operation returned):
+        outboundqueue = self.Experiment.OutboundQueue
+        opparams = dict(pageId=wikipage.PageId, xhtml=new_xhtml, expid=subentryprops.get('expid'), subentry_idx=subentry_idx,
+                        insertion_regex=insertion_regex, versionComment=versionComment)
+        if outboundqueue is not None and outboundqueue.shouldQueue(wikipage.Server):
+            return outboundqueue.enqueue('journal-entries', **opparams), new_xhtml
+        if not wikipage.reloadFromServer():
+            if outboundqueue is not None and is_offline(wikipage.Server):
+                return outboundqueue.enqueue('journal-entries', **opparams), new_xhtml
+            logger.info("Could not retrieve updated version from server, aborting...")
+            return False, ""
+        # Journal entries are added at the end of the subentry section. Use the page's section index to find it;
+        # the regex is only used if the subentry is not found in the index (e.g. non-standard page layout).
+        # The page layout used with the index is derived from the configured subentry regex:
+        layout = get_section_layout(self.Confighandler.get('wiki_subentry_parse_regex_fmt'))
+        header = get_subentry_header(wikipage.SectionIndex, subentryprops.get('expid'), subentry_idx, layout)
+        if header:
+            res = wikipage.insertAt(new_xhtml, header.end, versionComment=versionComment)
+        else:
+            res = wikipage.insertAtRegex(new_xhtml, insertion_regex, versionComment=versionComment, updateFromServer=False)
         if not res:
             logger.debug("wikipage.insertAtRegex returned '%s', probably due to failed regex matching of regex_pat '%s', derived from regex_pat_fmt '%s'. self.WikiPage.Struct['content']) is:%s",
                           res, insertion_regex, insertion_regex_fmt, wikipage.Struct if not wikipage.Struct else wikipage.Struct['content'] )
@@ -346,9 +367,18 @@ class JournalAssistant(object):
         regex_pat = regex_pat_fmt.format(**fmtparams)
         logger.debug("Adding the following xhtml to wikipage '%s' using regex pattern '%s': %s", wikipage, regex_pat, subentry_xhtml )
 
-        # Do page substitution:
+        # Do page substitution, at the position found with the page's section index if possible:
         versionComment = "JournalAssistant: Adding new subentry {expid}{subentry_idx}".format(**fmtparams)
-        res = wikipage.insertAtRegex(subentry_xhtml, regex_pat, versionComment=versionComment, updateFromServer=updateFromServer, persistToServer=persistToServer)
+        if updateFromServer and not wikipage.reloadFromServer():
+            logger.info("Could not retrieve updated version from server, aborting...")
+            return False
+        index = wikipage.SectionIndex
+        layout = get_section_layout(self.getConfigEntry('wiki_subentry_parse_regex_fmt'))
+        position = get_new_subentry_position(index, fmtparams.get('expid'), subentry_idx, layout) if index else None
+        if position is not None:
+            res = wikipage.insertAt(subentry_xhtml, position, versionComment=versionComment, persistToServer=persistToServer)
+        else:
+            res = wikipage.insertAtRegex(subentry_xhtml, regex_pat, versionComment=versionComment, updateFromServer=False, persistToServer=persistToServer)
 
         return res
 
@@ -379,3 +409,28 @@ class JournalAssistant(object):
 if __name__ == '__main__':
 
     pass
+
+
+def replay_journal_entries(server, confighandler, pageId, xhtml, expid, subentry_idx, insertion_regex, versionComment):
+    """
+    Outbound queue handler for journal flushes (see JournalAssistant.insertJournalContentOnWikiPage).
+    The journal xhtml is inserted at the end of the subentry section in the current version of the page.
+    If the xhtml is already on the page, the operation is obsolete. If the subentry section is no longer
+    found on the page, the xhtml is appended at the end of the page rather than lost.
+    """
+    wikipage = WikiPage(pageId, server, confighandler=confighandler)
+    if not wikipage.reloadFromServer():
+        return False
+    if xhtml in wikipage.Content:
+        logger.info("Journal xhtml for subentry %s%s is already on page %s.", expid, subentry_idx, pageId)
+        return None
+    layout = get_section_layout(confighandler.get('wiki_subentry_parse_regex_fmt'))
+    header = get_subentry_header(wikipage.SectionIndex, expid, subentry_idx, layout)
+    if header:
+        wikipage.insertAt(xhtml, header.end, persistToServer=False)
+    elif not wikipage.insertAtRegex(xhtml, insertion_regex, updateFromServer=False, persistToServer=False):
+        logger.warning("Subentry %s%s not found on page %s, appending journal xhtml at the end of the page.", expid, subentry_idx, pageId)
+        wikipage.insertAt(xhtml, len(wikipage.Content), persistToServer=False)
+    return bool(wikipage.updatePage(struct_from='cache', versionComment=versionComment))
+
+register_operation_handler('journal-entries', replay_journal_entries)
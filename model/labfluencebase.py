@@ -27,6 +27,10 @@ logger = logging.getLogger(__name__)
 
 from mixin.simplecallbacksystem import SimpleCallbackSystem
 from decorators.cache_decorator import cached_property
+from regexregistry import get_regex_registry
+from pagecache import get_page_cache
+from rendercache import get_render_cache
+from outboundqueue import get_outbound_queue
 
 
 class LabfluenceBase(SimpleCallbackSystem):
@@ -86,6 +90,60 @@ class LabfluenceBase(SimpleCallbackSystem):
             logger.debug("Attribute Error while querying Confighandler for server singleton.")
             self._server = value
 
+    @property
+    def RegexRegistry(self):
+        """
+        Returns the registry with compiled regular expressions for config entries,
+        shared by all objects using the same confighandler.
+        """
+        return get_regex_registry(self.Confighandler)
+
+    @property
+    def PageCache(self):
+        """
+        Returns the cache of page structs shared by all objects using the same confighandler,
+        or None if no confighandler is available.
+        """
+        try:
+            confighandler = self.Confighandler
+        except AttributeError:
+            return None
+        if confighandler is None:
+            return None
+        return get_page_cache(confighandler)
+
+    @property
+    def RenderCache(self):
+        """
+        Returns the cache of rendered page html shared by all objects using the same confighandler,
+        or None if no confighandler is available.
+        """
+        try:
+            confighandler = self.Confighandler
+        except AttributeError:
+            return None
+        if confighandler is None:
+            return None
+        return get_render_cache(confighandler)
+
+    @property
+    def OutboundQueue(self):
+        """
+        Returns the queue of server operations recorded while the server is offline,
+        shared by all objects using the same confighandler, or None if no confighandler is available.
+        """
+        try:
+            confighandler = self.Confighandler
+        except AttributeError:
+            return None
+        if confighandler is None:
+            return None
+        try:
+            return get_outbound_queue(confighandler)
+        except AttributeError:
+            logger.debug("Confighandler %r does not support singletons, no outbound queue available.", type(confighandler))
+            return None
+
     @cached_property(ttl=60) # 1 minute cache...
     def ServerInfo(self):
         """ Remember, the cached_property makes a property, which must be nvoked without '()'!
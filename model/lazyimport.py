@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable=C0103
+"""
+Lazy imports for heavy or optional modules.
+
+    magic = lazy_import('magic')
+    ...
+    if magic:                   # imports the module (once); False if it is not available.
+        magic.Magic(...)        # attribute access also imports the module.
+
+module_available(name) checks whether a module can be found without importing it.
+"""
+
+import sys
+import imp
+import importlib
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def module_available(name):
+    """
+    Returns True if the (top-level) module <name> can be found, without importing it.
+    Note that a module that is found may still fail to import, e.g. if it depends on a missing library.
+    """
+    if name in sys.modules:
+        return sys.modules[name] is not None
+    try:
+        fp, _, _ = imp.find_module(name.split('.')[0])
+    except ImportError:
+        return False
+    if fp:
+        fp.close()
+    return True
+
+
+class LazyModule(object):
+    """
+    Proxy for a module that is imported on first attribute access.
+    The proxy is false in a boolean context if the module cannot be imported.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_error'] = None
+
+    def _load(self):
+        """ Imports and returns the module; raises ImportError if it is not available. """
+        module = self.__dict__['_lazy_module']
+        if module is not None:
+            return module
+        if self.__dict__['_lazy_error'] is not None:
+            raise self.__dict__['_lazy_error']
+        try:
+            module = importlib.import_module(self.__dict__['_lazy_name'])
+        except ImportError as e:
+            logger.debug("Lazy import of module %s failed: %s", self.__dict__['_lazy_name'], e)
+            self.__dict__['_lazy_error'] = e
+            raise
+        self.__dict__['_lazy_module'] = module
+        return module
+
+    @property
+    def Loaded(self):
+        """ Whether the module has been imported. """
+        return self.__dict__['_lazy_module'] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __nonzero__(self):
+        try:
+            self._load()
+        except ImportError:
+            return False
+        return True
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        state = "loaded" if self.Loaded else "not loaded"
+        return "<LazyModule '{}' ({})>".format(self.__dict__['_lazy_name'], state)
+
+
+def lazy_import(name):
+    """
+    Returns the module <name> if it is already imported, otherwise a LazyModule proxy
+    that imports the module on first use.
+    """
+    if sys.modules.get(name) is not None:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -34,6 +34,7 @@ logger = logging.getLogger(__name__)
 
 # Models:
 from page import WikiPage
+from outboundqueue import register_operation_handler, is_offline
 #from utils import attachmentTupFromFilepath
 
 
@@ -146,7 +147,7 @@ class WikiLimsPage(WikiPage):
         return new_xhtml
 
 
-    def addEntries(self, entries, persistToServer=True):
+    def addEntries(self, entries, persistToServer=True, skipExisting=False):
         """
         Entry is dict with keys corresponding to headers of the lims table, i.e.
             key : row-field value of new entry.
@@ -155,13 +156,24 @@ class WikiLimsPage(WikiPage):
         2) Generate html row (string) looking up fields in entry.
         3) Insert new xhtml row string between match headerrow and tablerows.
         4) Persist page if persistToServer is requested.
+        If skipExisting is True, entries with a row identical to an existing table row are not added again.
 
         Note: Will raise KeyError if the entry does not have a key for
         every header in the table.
+
+        If persistToServer is True and the server is offline, the entries are added to the
+        outbound queue and None is returned; they are added when the connection comes back.
         """
+        outboundqueue = self.OutboundQueue if persistToServer else None
+        if outboundqueue is not None and outboundqueue.shouldQueue(self.Server):
+            outboundqueue.enqueue('lims-entries', pageId=self.PageId, entries=entries)
+            return
         # self.Content is a property: probes self.Struct property,
         # which invokes self.reloadFromServer() is self._struct is not boolean True.
         self.reloadFromServer()
+        if outboundqueue is not None and is_offline(self.Server):
+            outboundqueue.enqueue('lims-entries', pageId=self.PageId, entries=entries)
+            return
         xhtml = self.Content
         if not xhtml:
             logger.error("xhtml is '%s', aborting...", xhtml)
@@ -188,8 +200,14 @@ class WikiLimsPage(WikiPage):
                 if all(item == "" for item in entry_vals):
                     logger.info("All elements are empty strings for entries_vals[%s]! -- entries_vals[%s] list is: %s", i, i, entry_vals)
 
-        entries_xhtml = u"\n".join(u"<tr>{}</tr>".format("".join(u"<td><p>{}</p></td>".format(val) for val in entry_vals))
-                                 for entry_vals in entries_vals if any(entry_vals))
+        rows = [u"<tr>{}</tr>".format("".join(u"<td><p>{}</p></td>".format(val) for val in entry_vals))
+                for entry_vals in entries_vals if any(entry_vals)]
+        if skipExisting:
+            rows = [row for row in rows if row not in match.group('tablerows')]
+            if not rows:
+                logger.info("All entries are already in the table, not adding them again.")
+                return False
+        entries_xhtml = u"\n".join(rows)
         insert_index = match.start('tablerows')
         new_xhtml = xhtml[:insert_index] + entries_xhtml + xhtml[insert_index:]
         logger.debug("Inserted entries_xhtml of length %s, new_xhtml page Content has length: %s ", len(entries_xhtml), len(new_xhtml))
@@ -249,3 +267,21 @@ class WikiLimsPage(WikiPage):
             logger.debug("rowxhtml is boolean false, aborting: '%s'", rowxhtml)
             return
         return [cell.strip() for cell in self.TableRowDataRegexProg.findall(rowxhtml)]
+
+
+def replay_lims_entries(server, confighandler, pageId, entries):
+    """
+    Outbound queue handler for lims entries (see WikiLimsPage.addEntries).
+    The entries are inserted in the current version of the page; entries already in the table are skipped.
+    """
+    page = WikiLimsPage(pageId, server, confighandler=confighandler)
+    new_xhtml = page.addEntries(entries, persistToServer=False, skipExisting=True)
+    if new_xhtml is False:
+        return None
+    if not new_xhtml:
+        return False
+    versionComment = u"Entries {} added by Labfluence LimsPage (queued while offline).".format(
+        ", ".join('"{}"'.format(entry.get('Product', "")) for entry in entries))
+    return bool(page.updatePage(struct_from='cache', versionComment=versionComment, minorEdit=False))
+
+register_operation_handler('lims-entries', replay_lims_entries)
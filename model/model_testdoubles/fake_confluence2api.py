@@ -431,13 +431,16 @@ Attempt to log in user '%s' failed - incorrect username/password combination." %
             raise ValueError("""Version of edited page_struct does not match the current version on the server side.
 It is likely that the page has been updated on the server since it was last retrieved by you, the client.""")
         server_page.update(page_struct)
+        server_page['version'] = str(int(server_page['version']) + 1)
+        # Like the confluence2 API, return the updated page:
+        return server_page
 
 
     def convertWikiToStorageFormat(self, token, wikitext):
         pass
 
 
-    def renderContent(self, token, spaceKey=None, pageId=None, content=None):
+    def renderContent(self, token, spaceKey, pageId, content):
         """
         Returns the HTML rendered content for this page. The behaviour depends on which arguments are passed:
         * If only pageId is passed then the current content of the page will be rendered.
@@ -446,8 +449,18 @@ It is likely that the page has been updated on the server since it was last retr
         * Whenever a spaceKey and pageId are passed the spaceKey is ignored.
         * If neither spaceKey nor pageId are passed then an error will be returned.
         takes pageId as string.
+        As in the real API, all arguments are required (use '' for arguments not specified).
+        The fake "rendering" simply wraps the content in a div.
         """
-        pass
+        if pageId:
+            page = self._workdata.get('pages', dict()).get(str(pageId))
+            if page is None:
+                raise Fault(0, "java.lang.Exception: com.atlassian.confluence.rpc.RemoteException: "
+                               "You're not allowed to view that page, or it does not exist.")
+            content = content or page['content']
+        elif not (spaceKey and content):
+            raise Fault(0, "Must specify either pageId or spaceKey and content.")
+        return u'<div class="wiki-content">{}</div>'.format(content)
 
 
 
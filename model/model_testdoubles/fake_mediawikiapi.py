@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,C0301,W0142,W0212,W0613,R0201,R0904
+"""
+A stand-in for the MediaWiki action API (api.php), used to test MediawikiRestClient without a wiki.
+
+    Client  ---->   requests.Session   ---->  FakeMediawikiAdapter  ---->  FakeMediawikiApi (data)
+
+The adapter is mounted on the client's requests.Session and answers requests in-process, but
+otherwise behaves like a HTTP server: responses are gzip-compressed when the request accepts it,
+and are decoded by requests/urllib3 as usual.
+
+Like the real API, results are limited (at most api.MaxLimit results per response for 'max' limits),
+and the client must follow the 'continue' protocol to get the rest.
+Set api.LaggedRequests = n to make the next n requests fail with a 'maxlag' error.
+
+Usage:
+    adapter = FakeMediawikiAdapter()
+    client = MediawikiRestClient(serverparams={'appurl': adapter.AppUrl}, autologin=False)
+    client.Session.mount(adapter.AppUrl, adapter)
+    ...
+    adapter.Api.Callcounts      # requests per action, e.g. Callcounts['query'].
+"""
+
+from __future__ import print_function
+import json
+import gzip
+import urlparse
+from io import BytesIO
+from collections import Counter, OrderedDict
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.response import HTTPResponse
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+TIMESTAMP = "2014-06-{:02d}T12:00:00Z"
+
+
+class ApiError(Exception):
+    """ Raised by FakeMediawikiApi handlers, returned to the client as an API error. """
+    def __init__(self, code, info, status=200):
+        super(ApiError, self).__init__(info)
+        self.Code = code
+        self.Info = info
+        self.Status = status
+
+
+class FakeMediawikiApi(object):
+    """
+    The data and logic of a small wiki: pages with revisions, files (File: pages) with file info,
+    and the files used on each page.
+    """
+
+    def __init__(self, maxlimit=3, maxtitles=50):
+        self.MaxLimit = maxlimit
+        self.MaxTitles = maxtitles
+        self.LaggedRequests = 0
+        self.Callcounts = Counter()
+        self.TitleCounts = list()       # Number of titles in each multi-title query.
+        self.Users = {'fakeuser': 'fakepassword'}
+        self.LoggedIn = None
+        self.Pages = OrderedDict()      # title -> dict(pageid, ns, revisions (oldest first), images)
+        self._nextid = 1
+        self._nextrevid = 100
+        self.addPage('Main Page', 'Welcome to the lab wiki.')
+        self.addPage('Experiments', 'List of experiments.')
+        for i in range(1, 8):
+            title = 'Experiments/RS10{}'.format(i)
+            images = ['File:RS10{}-gel{}.png'.format(i, j) for j in range(i)]
+            for image in images:
+                self.addPage(image, 'Gel image', ns=6, size=1000*i, mime='image/png')
+            for rev in range(i):
+                self.addPage(title, 'Experiment RS10{}, revision {}.'.format(i, rev), images=images)
+
+    def addPage(self, title, content, ns=0, images=None, user='scholer', **fileinfo):
+        """ Adds a page (or a new revision of an existing page) and returns its new revision. """
+        if title not in self.Pages:
+            self.Pages[title] = dict(pageid=self._nextid, ns=ns, title=title, revisions=[], images=[])
+            self._nextid += 1
+            if fileinfo:
+                name = title.split(':', 1)[1]
+                self.Pages[title]['imageinfo'] = dict(fileinfo, url='http://wiki.example.org/images/' + name,
+                                                      timestamp=TIMESTAMP.format(1), user=user, sha1='0'*40)
+        page = self.Pages[title]
+        revision = dict(revid=self._nextrevid, timestamp=TIMESTAMP.format(len(page['revisions']) + 1),
+                        user=user, comment='', content=content)
+        self._nextrevid += 1
+        page['revisions'].append(revision)
+        if images is not None:
+            page['images'] = list(images)
+        return revision
+
+    def normalize(self, title):
+        """ Returns the normalized title (underscores to spaces, first letter upper-case). """
+        title = title.replace('_', ' ').strip()
+        return title[:1].upper() + title[1:]
+
+    def limit(self, value, default=10):
+        """ Returns the result limit for a limit parameter value, e.g. 'max'. """
+        if value == 'max':
+            return self.MaxLimit
+        return int(value or default)
+
+    def pageInfo(self, title):
+        """ Returns the basic (formatversion=2) API representation of the page with title. """
+        if title not in self.Pages:
+            return dict(ns=0, title=title, missing=True)
+        page = self.Pages[title]
+        return dict(pageid=page['pageid'], ns=page['ns'], title=title)
+
+    ### Request handling ###
+
+    def handle(self, params):
+        """ Handles the request with params and returns (status, headers, result). """
+        action = params.get('action')
+        self.Callcounts[action] += 1
+        if self.LaggedRequests > 0:
+            self.LaggedRequests -= 1
+            return 503, {'Retry-After': '0'}, dict(error=dict(code='maxlag', info='Waiting for db: 7 seconds lagged.'))
+        if params.get('format') != 'json':
+            return 200, {}, dict(error=dict(code='badformat', info='Only format=json is supported.'))
+        try:
+            handler = getattr(self, 'action_' + str(action))
+        except AttributeError:
+            return 200, {}, dict(error=dict(code='badvalue', info='Unrecognized value for parameter "action".'))
+        try:
+            return 200, {}, handler(params)
+        except ApiError as e:
+            return e.Status, {}, dict(error=dict(code=e.Code, info=e.Info))
+
+    def action_login(self, params):
+        """ action=login with lgname, lgpassword and lgtoken. """
+        if params.get('lgtoken') != 'logintoken+\\':
+            return dict(login=dict(result='NeedToken'))
+        if self.Users.get(params.get('lgname')) != params.get('lgpassword'):
+            return dict(login=dict(result='Failed', reason='Incorrect username or password entered.'))
+        self.LoggedIn = params['lgname']
+        return dict(login=dict(result='Success', lgusername=params['lgname']))
+
+    def action_edit(self, params):
+        """ action=edit with title, text, token and baserevid or createonly. """
+        if params.get('token') != 'csrftoken+\\':
+            raise ApiError('badtoken', 'Invalid CSRF token.')
+        title = self.normalize(params['title'])
+        exists = title in self.Pages
+        if exists and params.get('createonly'):
+            raise ApiError('articleexists', 'The article you tried to create has been created already.')
+        if exists and params.get('baserevid') and \
+                int(params['baserevid']) != self.Pages[title]['revisions'][-1]['revid']:
+            raise ApiError('editconflict', 'Edit conflict.')
+        revision = self.addPage(title, params.get('text', ''), user=self.LoggedIn or '127.0.0.1')
+        revision['comment'] = params.get('summary', '')
+        return dict(edit=dict(result='Success', pageid=self.Pages[title]['pageid'], title=title,
+                              newrevid=revision['revid']))
+
+    def action_query(self, params):
+        """ action=query with meta, list of titles/pageids or a generator, and page props. """
+        query, cont = dict(), dict()
+        meta = params.get('meta')
+        if meta == 'siteinfo':
+            query['general'] = dict(sitename='Fake lab wiki', generator='MediaWiki 1.23.0',
+                                    base='http://wiki.example.org/wiki/Main_Page')
+        elif meta == 'tokens':
+            tokentype = params.get('type', 'csrf')
+            query['tokens'] = {tokentype + 'token': tokentype + 'token+\\'}
+        titles = self.selectTitles(params, query, cont)
+        if titles is not None:
+            query['pages'] = [self.pageProps(title, params, cont) for title in titles]
+        result = dict(batchcomplete=True) if not cont else {'continue': dict(cont, **{'continue': '||'})}
+        if query:
+            result['query'] = query
+        return result
+
+    def selectTitles(self, params, query, cont):
+        """ Returns the titles of the pages selected by titles, pageids or generator (None if no pages). """
+        if 'titles' in params and 'generator' not in params:
+            titles = params['titles'].split('|')
+            self.TitleCounts.append(len(titles))
+            if len(titles) > self.MaxTitles:
+                raise ApiError('toomanyvalues', 'Too many values supplied for parameter "titles".')
+            normalized = [dict(fromencoded=False, to=self.normalize(title), **{'from': title})
+                          for title in titles if self.normalize(title) != title]
+            if normalized:
+                query['normalized'] = normalized
+            return [self.normalize(title) for title in titles]
+        if 'pageids' in params:
+            ids = set(int(pageid) for pageid in params['pageids'].split('|'))
+            return [title for title, page in self.Pages.items() if page['pageid'] in ids]
+        generator = params.get('generator')
+        if generator == 'allpages':
+            ns = int(params.get('gapnamespace', 0))
+            titles = sorted(title for title, page in self.Pages.items()
+                            if page['ns'] == ns and title.split(':', 1)[-1].startswith(params.get('gapprefix', '')))
+            return self.continued(titles, 'gapcontinue', self.limit(params.get('gaplimit')), params, cont)
+        if generator == 'images':
+            title = self.normalize(params['titles'])
+            images = sorted(self.Pages.get(title, {}).get('images', ()))
+            return self.continued(images, 'gimcontinue', self.limit(params.get('gimlimit')), params, cont)
+        if generator == 'search':
+            words = params['gsrsearch'].lower().split()
+            ns = int(params.get('gsrnamespace', 0))
+            titles = [title for title, page in self.Pages.items() if page['ns'] == ns and
+                      all(word in (title + ' ' + page['revisions'][-1]['content']).lower() for word in words)]
+            offset = int(params.get('gsroffset', 0))
+            limit = min(self.limit(params.get('gsrlimit')), self.MaxLimit)
+            if offset + limit < len(titles):
+                cont['gsroffset'] = offset + limit
+            self._searchindex = dict((title, i+1) for i, title in enumerate(titles))
+            return titles[offset:offset+limit]
+        return None
+
+    def continued(self, titles, contkey, limit, params, cont):
+        """ Returns the titles starting from params[contkey], setting cont[contkey] if there are more. """
+        if contkey in params:
+            titles = [title for title in titles if title >= params[contkey]]
+        if len(titles) > limit:
+            cont[contkey] = titles[limit]
+        return titles[:limit]
+
+    def pageProps(self, title, params, cont):
+        """ Returns the API representation of the page with the props requested with params. """
+        result = self.pageInfo(title)
+        if result.get('missing'):
+            return result
+        page = self.Pages[title]
+        props = params.get('prop', '').split('|')
+        if 'info' in props:
+            result['lastrevid'] = page['revisions'][-1]['revid']
+            if 'url' in params.get('inprop', ''):
+                result['fullurl'] = 'http://wiki.example.org/wiki/' + title.replace(' ', '_')
+        if params.get('generator') == 'search':
+            result['index'] = self._searchindex[title]
+        if 'revisions' in props:
+            rvprop = params.get('rvprop', 'ids|timestamp|flags|comment|user').split('|')
+            if 'rvlimit' in params:
+                # Revision history (newest first), only allowed for a single page:
+                revisions = list(reversed(page['revisions']))
+                start = int(params['rvcontinue'].split('|')[1]) if 'rvcontinue' in params else 0
+                limit = self.limit(params['rvlimit'])
+                if start + limit < len(revisions):
+                    cont['rvcontinue'] = '{}|{}'.format(page['pageid'], start + limit)
+                revisions = revisions[start:start+limit]
+            else:
+                revisions = page['revisions'][-1:]
+            result['revisions'] = [self.revisionProps(revision, rvprop, params) for revision in revisions]
+        if 'imageinfo' in props and 'imageinfo' in page:
+            iiprop = params.get('iiprop', 'timestamp|user').split('|')
+            result['imageinfo'] = [dict((key, value) for key, value in page['imageinfo'].items() if key in iiprop)]
+        return result
+
+    def revisionProps(self, revision, rvprop, params):
+        """ Returns the API representation of revision. """
+        result = dict((key, value) for key, value in revision.items() if key in rvprop and key != 'content')
+        if 'ids' in rvprop:
+            result['revid'] = revision['revid']
+        if 'content' in rvprop:
+            if params.get('rvslots'):
+                result['slots'] = dict(main=dict(contentmodel='wikitext', content=revision['content']))
+            else:
+                result['content'] = revision['content']
+        return result
+
+
+class FakeMediawikiAdapter(HTTPAdapter):
+    """
+    A requests transport adapter answering API requests from a FakeMediawikiApi.
+    Responses are gzip-compressed if the request's Accept-Encoding header includes gzip.
+    """
+
+    AppUrl = 'http://wiki.example.org/w/api.php'
+
+    def __init__(self, api=None, **kwargs):
+        super(FakeMediawikiAdapter, self).__init__(**kwargs)
+        self.Api = api or FakeMediawikiApi()
+        self.Stats = Counter()      # requests, gzipped (responses).
+
+    def send(self, request, **kwargs):
+        """ Returns a requests.Response for the prepared request. """
+        self.Stats['requests'] += 1
+        params = dict(urlparse.parse_qsl(urlparse.urlsplit(request.url).query))
+        if request.body:
+            body = request.body if isinstance(request.body, str) else request.body.encode('utf-8')
+            params.update(urlparse.parse_qsl(body))
+        params = dict((key, value.decode('utf-8')) for key, value in params.items())
+        logger.debug("Fake API request: %s", params)
+        status, headers, result = self.Api.handle(params)
+        body = json.dumps(result)
+        headers = dict(headers, **{'Content-Type': 'application/json; charset=utf-8'})
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                gz.write(body)
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+            self.Stats['gzipped'] += 1
+        resp = HTTPResponse(body=BytesIO(body), headers=headers, status=status,
+                            preload_content=False, decode_content=True)
+        return self.build_response(request, resp)
@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,C0301,W0142,W0212,W0613,R0201,R0904
+"""
+A local confluence stand-in for the REST API: a real HTTP server serving the subset of
+Confluence's /rest/api used by ConfluenceRestClient, with the test data of fake_server.FakeConfluenceServer.
+
+    Client  ---->   requests.Session   ---->  (HTTP)  ---->  FakeRestServer  ---->  FakeConfluenceServer (data)
+
+Like the real API, collections are paginated (at most server.MaxLimit results per response, with
+a '_links.next' link to the next results) and related data is included with the 'expand' parameter,
+e.g. expand=body.storage,version,children.attachment.version.
+Expanded (nested) collections are truncated at MaxLimit results without a 'next' link.
+
+Authentication is HTTP basic auth (fakeuser/fakepassword) or a personal access token
+(Authorization: Bearer fake_personal_token).
+
+Usage:
+    server = start_server(latency=0.05)     # serves on a free port in a background thread.
+    client = ConfluenceRestClient(serverparams={'resturl': server.RestUrl},
+                                  username='fakeuser', password='fakepassword')
+    ...
+    server.Callcounts   # requests per route, e.g. server.Callcounts['getChildren'].
+    server.stop()
+"""
+
+from __future__ import print_function
+import re
+import cgi
+import json
+import time
+import base64
+import urllib
+import urlparse
+import threading
+import xmlrpclib
+from datetime import datetime
+from collections import Counter
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import logging
+logger = logging.getLogger(__name__)
+
+from fake_server import FakeConfluenceServer
+
+
+# method, path regex, handler method name:
+ROUTES = [('GET', r'/rest/api/user/current$', 'currentUser'),
+          ('GET', r'/rest/api/user$', 'getUser'),
+          ('GET', r'/rest/api/space$', 'getSpaces'),
+          ('GET', r'/rest/api/content/search$', 'search'),
+          ('GET', r'/rest/api/content$', 'listContent'),
+          ('POST', r'/rest/api/content$', 'createContent'),
+          ('GET', r'/rest/api/content/(?P<contentId>\w+)$', 'getContent'),
+          ('PUT', r'/rest/api/content/(?P<contentId>\w+)$', 'updateContent'),
+          ('DELETE', r'/rest/api/content/(?P<contentId>\w+)$', 'deleteContent'),
+          ('GET', r'/rest/api/content/(?P<contentId>\w+)/child/(?P<childtype>page|attachment|comment)$', 'getChildren'),
+          ('POST', r'/rest/api/content/(?P<contentId>\w+)/child/attachment$', 'addAttachment'),
+          ('GET', r'/rest/api/content/(?P<contentId>\w+)/descendant/page$', 'getDescendants'),
+          ('PUT', r'/rest/api/content/(?P<contentId>\w+)/move/(?P<position>\w+)/(?P<targetId>\w+)$', 'movePage'),
+          ('POST', r'/rest/api/contentbody/convert/(?P<to>\w+)$', 'convert'),
+          ('GET', r'/download/attachments/(?P<contentId>\w+)/(?P<filename>[^/]+)$', 'download')]
+ROUTES = [(method, re.compile(pattern), name) for method, pattern, name in ROUTES]
+
+CQL_CLAUSE = re.compile(r'(\w+)\s*(~|=|>=)\s*("(?:[^"\\]|\\.)*"|\S+)')
+
+
+class HttpError(Exception):
+    """ Raised by route handlers to respond with an HTTP error. """
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.Status = status
+
+
+def iso(value):
+    """ Returns the timestamps of the test data ("'20130927T18:02:22'" or datetime) in REST API (ISO 8601) format. """
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.strptime(str(value).strip("'"), "%Y%m%dT%H:%M:%S")
+        except ValueError:
+            return None
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000+01:00")
+
+
+def has(expand, name):
+    """ Returns True if name is expanded by expand (list of dotted expansions). """
+    return any(e == name or e.startswith(name + '.') for e in expand)
+
+
+def sub(expand, name):
+    """ Returns the expansions of name's properties, e.g. sub(['body.storage'], 'body') == ['storage']. """
+    return [e[len(name)+1:] for e in expand if e.startswith(name + '.')]
+
+
+class FakeRestRequestHandler(BaseHTTPRequestHandler):
+    """ Parses requests and writes the JSON (or binary) responses of server.route(). """
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def do_PUT(self):
+        self.respond('PUT')
+
+    def do_DELETE(self):
+        self.respond('DELETE')
+
+    def respond(self, method):
+        parsed = urlparse.urlparse(self.path)
+        params = dict((key, values[-1]) for key, values in urlparse.parse_qs(parsed.query).items())
+        status, data = self.server.route(method, parsed.path, params, self.headers, self.rfile)
+        if isinstance(data, bytes) and status == 200 and method == 'GET' and parsed.path.startswith('/download'):
+            body, contenttype = data, 'application/octet-stream'
+        else:
+            body, contenttype = (json.dumps(data) if data is not None else ''), 'application/json'
+        self.send_response(status)
+        self.send_header("Content-Type", contenttype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Log requests with the logging module rather than writing to stderr. """
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class FakeRestServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server serving a fake confluence REST API, see module docstring.
+    Latency and MaxLimit can be changed while the server is running.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, data=None, latency=0, maxlimit=25):
+        HTTPServer.__init__(self, (host, port), FakeRestRequestHandler)
+        self.Data = data if data is not None else FakeConfluenceServer()
+        self.Latency = latency
+        self.MaxLimit = maxlimit
+        self.Users = {'fakeuser': 'fakepassword'}
+        self.Tokens = {'fake_personal_token': 'fakeuser'}
+        self.Callcounts = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def BaseUrl(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def RestUrl(self):
+        """ The url to use as 'resturl' in the client's serverparams. """
+        return self.BaseUrl + "/rest/api"
+
+    @property
+    def Pages(self):
+        return self.Data._workdata['pages']
+
+    def authenticate(self, headers):
+        """ Returns the user authenticated by the Authorization header (or None). """
+        authorization = headers.get('Authorization') or ''
+        scheme, _, credentials = authorization.partition(' ')
+        if scheme == 'Bearer':
+            return self.Tokens.get(credentials)
+        if scheme == 'Basic':
+            username, _, password = base64.b64decode(credentials).partition(':')
+            if self.Users.get(username) == password:
+                return username
+        return None
+
+    def route(self, method, path, params, headers, rfile):
+        """ Routes a request to the handler method; returns (status, data). """
+        for routemethod, regex, name in ROUTES:
+            match = regex.match(path)
+            if match and routemethod == method:
+                break
+        else:
+            return 404, dict(statusCode=404, message="No route for {} {}".format(method, path))
+        with self._lock:
+            self.Callcounts[name] += 1
+        if self.Latency:
+            time.sleep(self.Latency)
+        user = self.authenticate(headers)
+        if user is None and name != 'currentUser':
+            return 401, dict(statusCode=401, message="Not authenticated")
+        length = int(headers.get('Content-Length') or 0)
+        if headers.get('Content-Type', '').startswith('multipart/form-data'):
+            body = cgi.FieldStorage(fp=rfile, headers=headers,
+                                    environ={'REQUEST_METHOD': method, 'CONTENT_TYPE': headers['Content-Type']})
+        else:
+            body = json.loads(rfile.read(length)) if length else None
+        try:
+            with self._lock:
+                return 200, getattr(self, name)(user=user, params=params, body=body, **match.groupdict())
+        except HttpError as e:
+            return e.Status, dict(statusCode=e.Status, message=str(e))
+
+    def paginate(self, items, params, path):
+        """ Returns a collection with the results of items requested by the start/limit params. """
+        start = int(params.get('start', 0))
+        limit = min(int(params.get('limit', self.MaxLimit)), self.MaxLimit)
+        results = items[start:start+limit]
+        links = dict(base=self.BaseUrl, context='')
+        if start + limit < len(items):
+            nextparams = dict(params, start=start+limit, limit=limit)
+            links['next'] = path + '?' + urllib.urlencode(sorted(nextparams.items()))
+        return dict(results=results, start=start, limit=limit, size=len(results), _links=links)
+
+    def nested(self, items):
+        """ Returns an expanded (nested) collection, truncated at MaxLimit results. """
+        results = items[:self.MaxLimit]
+        return dict(results=results, start=0, limit=self.MaxLimit, size=len(results), _links=dict(base=self.BaseUrl))
+
+    def getPage(self, contentId):
+        try:
+            return self.Pages[contentId]
+        except KeyError:
+            raise HttpError(404, "No content with id {}".format(contentId))
+
+    def attachments(self, pageId):
+        return self.Data._workdata.setdefault('attachments', dict()).setdefault(pageId, list())
+
+    def comments(self, pageId):
+        return self.Data._workdata.setdefault('comments', dict()).setdefault(pageId, list())
+
+    def children(self, pageId):
+        return sorted((page for page in self.Pages.values() if page['parentId'] == pageId), key=lambda page: page['title'])
+
+    def pageJson(self, page, expand):
+        """ Returns the REST representation of a page struct, with expansions <expand>. """
+        data = dict(id=page['id'], type='page', status=page.get('contentStatus', 'current'), title=page['title'],
+                    _links=dict(webui='/display/{}/{}'.format(page['space'], urllib.quote_plus(page['title'].encode('utf-8'))),
+                                self=self.RestUrl + '/content/' + page['id']))
+        if has(expand, 'space'):
+            data['space'] = dict(key=page['space'])
+        if has(expand, 'version'):
+            data['version'] = dict(number=int(page['version']), when=iso(page.get('modified')),
+                                   by=dict(username=page.get('modifier')))
+        if has(expand, 'history'):
+            data['history'] = dict(createdDate=iso(page.get('created')), createdBy=dict(username=page.get('creator')))
+        if has(expand, 'body'):
+            data['body'] = dict()
+            if 'storage' in sub(expand, 'body'):
+                data['body']['storage'] = dict(value=page['content'], representation='storage')
+            if 'view' in sub(expand, 'body'):
+                data['body']['view'] = dict(value='<div>{}</div>'.format(page['content']), representation='view')
+        if has(expand, 'ancestors'):
+            ancestors = list()
+            parent = self.Pages.get(page.get('parentId'))
+            while parent is not None:
+                ancestors.insert(0, self.pageJson(parent, sub(expand, 'ancestors')))
+                parent = self.Pages.get(parent.get('parentId'))
+            data['ancestors'] = ancestors
+        if has(expand, 'children'):
+            childexpand = sub(expand, 'children')
+            data['children'] = dict()
+            if has(childexpand, 'page'):
+                data['children']['page'] = self.nested([self.pageJson(child, sub(childexpand, 'page'))
+                                                        for child in self.children(page['id'])])
+            if has(childexpand, 'attachment'):
+                data['children']['attachment'] = self.nested([self.attachmentJson(att, page['id'], sub(childexpand, 'attachment'))
+                                                              for att in self.attachments(page['id'])])
+        return data
+
+    def attachmentJson(self, attachment, pageId, expand):
+        data = dict(id=str(attachment['id']), type='attachment', title=attachment['fileName'],
+                    extensions=dict(mediaType=attachment.get('contentType'), fileSize=int(attachment.get('fileSize') or 0),
+                                    comment=attachment.get('comment', '')),
+                    _links=dict(download='/download/attachments/{}/{}'.format(pageId, urllib.quote(attachment['fileName'].encode('utf-8')))))
+        if has(expand, 'version'):
+            data['version'] = dict(number=1, when=iso(attachment.get('created')), by=dict(username=attachment.get('creator')))
+        if has(expand, 'container'):
+            data['container'] = dict(id=pageId, type='page')
+        return data
+
+    def commentJson(self, comment, pageId, expand):
+        data = dict(id=str(comment['id']), type='comment', title=comment.get('title'), _links=dict())
+        if has(expand, 'body'):
+            data['body'] = dict(storage=dict(value=comment.get('content'), representation='storage'))
+        if has(expand, 'history'):
+            data['history'] = dict(createdDate=iso(comment.get('created')), createdBy=dict(username=comment.get('creator')))
+        if has(expand, 'container'):
+            data['container'] = dict(id=pageId, type='page')
+        if has(expand, 'version'):
+            data['version'] = dict(number=int(comment.get('version', 1)))
+        return data
+
+    @staticmethod
+    def expand(params):
+        return [e for e in params.get('expand', '').split(',') if e]
+
+    def findComment(self, contentId):
+        for pageId, comments in self.Data._workdata.get('comments', {}).items():
+            for comment in comments:
+                if str(comment['id']) == contentId:
+                    return pageId, comment
+        return None, None
+
+    ## Route handlers: ##
+
+    def currentUser(self, user, params, body):
+        if user is None:
+            return dict(type='anonymous')
+        return dict(type='known', username=user, displayName=user)
+
+    def getUser(self, user, params, body):
+        return dict(type='known', username=params.get('username'), displayName=params.get('username'))
+
+    def getSpaces(self, user, params, body):
+        spaces = [dict(key=space['key'], name=space['name'], type=space['type'], _links=dict(webui='/display/' + space['key']))
+                  for space in self.Data._workdata.get('spaces', [])]
+        return self.paginate(spaces, params, '/rest/api/space')
+
+    def listContent(self, user, params, body):
+        pages = [page for page in sorted(self.Pages.values(), key=lambda page: page['title'])
+                 if page['space'] == params.get('spaceKey', page['space'])
+                 and page['title'] == params.get('title', page['title'])]
+        return self.paginate([self.pageJson(page, self.expand(params)) for page in pages], params, '/rest/api/content')
+
+    def getContent(self, user, params, body, contentId):
+        if contentId in self.Pages:
+            return self.pageJson(self.Pages[contentId], self.expand(params))
+        pageId, comment = self.findComment(contentId)
+        if comment is not None:
+            return self.commentJson(comment, pageId, self.expand(params))
+        raise HttpError(404, "No content with id {}".format(contentId))
+
+    def getChildren(self, user, params, body, contentId, childtype):
+        page = self.getPage(contentId)
+        path = '/rest/api/content/{}/child/{}'.format(contentId, childtype)
+        expand = self.expand(params)
+        if childtype == 'page':
+            items = [self.pageJson(child, expand) for child in self.children(contentId)]
+        elif childtype == 'attachment':
+            items = [self.attachmentJson(att, contentId, expand) for att in self.attachments(contentId)
+                     if att['fileName'] == params.get('filename', att['fileName'])]
+        else:
+            items = [self.commentJson(comment, page['id'], expand) for comment in self.comments(contentId)]
+        return self.paginate(items, params, path)
+
+    def getDescendants(self, user, params, body, contentId):
+        self.getPage(contentId)
+        descendants, parents = list(), [contentId]
+        while parents:
+            children = self.children(parents.pop(0))
+            descendants.extend(children)
+            parents.extend(child['id'] for child in children)
+        return self.paginate([self.pageJson(page, self.expand(params)) for page in descendants], params,
+                             '/rest/api/content/{}/descendant/page'.format(contentId))
+
+    def search(self, user, params, body):
+        pages = sorted(self.Pages.values(), key=lambda page: page['title'])
+        for field, op, value in CQL_CLAUSE.findall(params.get('cql', '')):
+            value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\') if value.startswith('"') else value
+            if field == 'text' and op == '~':
+                pages = [page for page in pages if value.lower() in (page['title'] + page['content']).lower()]
+            elif field == 'title' and op == '~':
+                pages = [page for page in pages if value.lower() in page['title'].lower()]
+            elif field == 'space':
+                pages = [page for page in pages if page['space'] == value]
+            elif field == 'contributor':
+                pages = [page for page in pages if value in (page.get('creator'), page.get('modifier'))]
+            elif field == 'type' and value != 'page':
+                pages = []
+        return self.paginate([self.pageJson(page, self.expand(params)) for page in pages], params, '/rest/api/content/search')
+
+    def createContent(self, user, params, body):
+        if body['type'] == 'comment':
+            pageId = body['container']['id']
+            self.getPage(pageId)
+            comment = dict(id=str(int(time.time()*1000000)), pageId=pageId, title="Re: " + self.Pages[pageId]['title'],
+                           content=body['body']['storage']['value'], created=datetime.now(), creator=user)
+            self.comments(pageId).append(comment)
+            return self.commentJson(comment, pageId, ['body', 'history', 'container'])
+        space, title = body['space']['key'], body['title']
+        if any(page['space'] == space and page['title'] == title for page in self.Pages.values()):
+            raise HttpError(400, "A page with this title already exists")
+        pageId = str(max(int(pid) for pid in self.Pages) + 1)
+        now = datetime.now()
+        parentId = body['ancestors'][-1]['id'] if body.get('ancestors') else '0'
+        self.Pages[pageId] = dict(id=pageId, space=space, title=title, parentId=parentId, version='1',
+                                  content=body['body']['storage']['value'], created=now, creator=user,
+                                  modified=now, modifier=user, contentStatus='current', current='true',
+                                  homePage='false', permissions='0')
+        return self.pageJson(self.Pages[pageId], self.expand(params))
+
+    def updateContent(self, user, params, body, contentId):
+        if contentId not in self.Pages:
+            pageId, comment = self.findComment(contentId)
+            if comment is None:
+                raise HttpError(404, "No content with id {}".format(contentId))
+            comment['content'] = body['body']['storage']['value']
+            comment['version'] = body['version']['number']
+            return self.commentJson(comment, pageId, ['body', 'history', 'container'])
+        page = self.Pages[contentId]
+        if body['version']['number'] != int(page['version']) + 1:
+            raise HttpError(409, "Version must be incremented on update. Current version is: {}".format(page['version']))
+        page.update(title=body['title'], content=body['body']['storage']['value'], version=str(body['version']['number']),
+                    modified=datetime.now(), modifier=user)
+        if body.get('ancestors'):
+            page['parentId'] = body['ancestors'][-1]['id']
+        return self.pageJson(page, self.expand(params))
+
+    def deleteContent(self, user, params, body, contentId):
+        if self.Pages.pop(contentId, None) is not None:
+            return None
+        pageId, comment = self.findComment(contentId)
+        if comment is not None:
+            self.comments(pageId).remove(comment)
+            return None
+        for attachments in self.Data._workdata.get('attachments', {}).values():
+            for attachment in attachments:
+                if str(attachment['id']) == contentId:
+                    attachments.remove(attachment)
+                    return None
+        raise HttpError(404, "No content with id {}".format(contentId))
+
+    def addAttachment(self, user, params, body, contentId):
+        self.getPage(contentId)
+        fileitem = body['file']
+        data = fileitem.file.read()
+        attachments = self.attachments(contentId)
+        if any(att['fileName'] == fileitem.filename for att in attachments):
+            raise HttpError(400, "Cannot add a new attachment with same file name as an existing attachment")
+        attachment = dict(id=str(int(time.time()*1000000)), pageId=contentId, fileName=fileitem.filename,
+                          title=fileitem.filename, contentType=fileitem.type, fileSize=str(len(data)),
+                          comment=body.getfirst('comment', ''), created=datetime.now(), creator=user)
+        attachments.append(attachment)
+        self.Data._attachmentsData[fileitem.filename] = xmlrpclib.Binary(data)
+        return dict(results=[self.attachmentJson(attachment, contentId, ['version', 'container'])], size=1)
+
+    def movePage(self, user, params, body, contentId, position, targetId):
+        page, target = self.getPage(contentId), self.getPage(targetId)
+        page['parentId'] = targetId if position == 'append' else target['parentId']
+        return dict(pageId=contentId)
+
+    def convert(self, user, params, body, to):
+        value = body['value'] if to == 'storage' else '<div>{}</div>'.format(body['value'])
+        return dict(value=value, representation=to)
+
+    def download(self, user, params, body, contentId, filename):
+        filename = urllib.unquote(filename)
+        if not any(att['fileName'] == filename for att in self.attachments(contentId)):
+            raise HttpError(404, "No attachment {} on page {}".format(filename, contentId))
+        data = self.Data._attachmentsData.get(filename)
+        if data is None:
+            raise HttpError(404, "No data for attachment {}".format(filename))
+        return getattr(data, 'data', data)
+
+    def start(self):
+        """ Starts serving in a (daemon) background thread. Returns self. """
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeRestServer")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("FakeRestServer serving at %s", self.RestUrl)
+        return self
+
+    def stop(self):
+        """ Stops the background thread and closes the server socket. """
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def start_server(**kwargs):
+    """ Creates a FakeRestServer with kwargs and starts it in a background thread. """
+    return FakeRestServer(**kwargs).start()
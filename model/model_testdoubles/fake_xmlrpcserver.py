@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,C0301,W0142,W0212,W0613
+"""
+A local confluence stand-in: a real XML-RPC HTTP server which serves the
+confluence2 API of fake_confluence2api.FakeConfluence2Api.
+
+This makes it possible to run the real ConfluenceXmlRpcClient (and the real xmlrpclib
+and httplib stack) entirely offline, e.g. for end-to-end benchmarks and soak tests:
+
+    Client  ---->   xmlrpclib.ServerProxy   ---->  (HTTP)  ---->  FakeXmlRpcServer  ---->  FakeConfluence2Api
+
+Network conditions can be simulated with:
+- latency:      Seconds added to every call.
+- jitter:       Random +/- variation of the latency (uniformly distributed).
+- bandwidth:    Bytes per second for reading requests and writing responses (None = unlimited).
+- fault_rate:   Fraction of calls answered with an xmlrpclib.Fault.
+- error_rate:   Fraction of calls answered with HTTP 500 (raises xmlrpclib.ProtocolError in the client).
+Set server.AcceptGzipRequests = False to answer gzip compressed requests with HTTP 415
+(like servers which do not support Content-Encoding: gzip in requests).
+
+Usage:
+    server = start_server(latency=0.05, jitter=0.02)    # serves on a free port in a background thread.
+    client = ConfluenceXmlRpcClient(serverparams={'appurl': server.AppUrl},
+                                    username='fakeuser', password='fakepassword')
+    ...
+    server.Stats        # call counts, injected faults/errors, bytes transferred.
+    server.shutdown(); server.server_close()
+
+Or from the command line (serves until interrupted):
+    python -m model.model_testdoubles.fake_xmlrpcserver --port 8090 --latency 0.1
+"""
+
+from __future__ import print_function
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from xmlrpclib import Fault
+from SocketServer import ThreadingMixIn
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import logging
+logger = logging.getLogger(__name__)
+
+from fake_confluence2api import FakeConfluence2Api
+
+
+class ThrottledFile(object):
+    """
+    Wraps a socket file object, limiting reads and writes to <bandwidth> bytes per second.
+    Bytes transferred are counted in server.Stats[<statskey>].
+    """
+    def __init__(self, fileobj, server, statskey):
+        self._file = fileobj
+        self._server = server
+        self._statskey = statskey
+
+    def _throttle(self, nbytes):
+        self._server.countStat(self._statskey, nbytes)
+        if self._server.Bandwidth and nbytes:
+            time.sleep(float(nbytes) / self._server.Bandwidth)
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._throttle(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self._file.readline(size)
+        self._throttle(len(data))
+        return data
+
+    def write(self, data):
+        self._throttle(len(data))
+        return self._file.write(data)
+
+    def __getattr__(self, attr):
+        return getattr(self._file, attr)
+
+
+class FakeXmlRpcRequestHandler(SimpleXMLRPCRequestHandler):
+    """
+    Request handler which throttles the connection and injects HTTP errors.
+    The confluence XML-RPC API is served at /rpc/xmlrpc (same as a real confluence server).
+    """
+    rpc_paths = ('/rpc/xmlrpc', '/rpc/xmlrpc/')
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.rfile = ThrottledFile(self.rfile, self.server, 'bytes_received')
+        self.wfile = ThrottledFile(self.wfile, self.server, 'bytes_sent')
+
+    def do_POST(self):
+        if self.is_rpc_path_valid() and self.server.inject('error_rate'):
+            # Consume the request before replying, so the client gets a proper response:
+            self.rfile.read(int(self.headers.get('content-length', 0)))
+            self.server.countStat('injected_errors')
+            logger.debug("Injecting HTTP 500 error.")
+            self.send_response(500)
+            self.send_header("Content-length", "0")
+            self.end_headers()
+            return
+        if not self.server.AcceptGzipRequests and 'gzip' in self.headers.get('content-encoding', ''):
+            self.rfile.read(int(self.headers.get('content-length', 0)))
+            self.server.countStat('rejected_gzip_requests')
+            self.send_response(415)
+            self.send_header("Content-length", "0")
+            self.end_headers()
+            return
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def log_message(self, format, *args):
+        """ Log requests with the logging module rather than writing to stderr. """
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class FakeXmlRpcServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    Threaded XML-RPC server serving the confluence2 API of a FakeConfluence2Api object.
+    Calls are dispatched as 'confluence2.<method>', e.g. confluence2.getPage(token, pageId).
+    Latency, jitter, bandwidth, fault_rate and error_rate can be changed while the server is running.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, api=None, latency=0, jitter=0, bandwidth=None,
+                 fault_rate=0, error_rate=0, seed=None):
+        SimpleXMLRPCServer.__init__(self, (host, port), requestHandler=FakeXmlRpcRequestHandler,
+                                    logRequests=False, allow_none=True)
+        self.Api = api if api is not None else FakeConfluence2Api()
+        self.Latency = latency
+        self.Jitter = jitter
+        self.Bandwidth = bandwidth
+        self.Rates = dict(fault_rate=fault_rate, error_rate=error_rate)
+        self.AcceptGzipRequests = True
+        self.Stats = Counter()
+        self.Callcounts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def AppUrl(self):
+        """ The url to use as 'appurl' in the client's serverparams. """
+        host, port = self.server_address[:2]
+        return "http://{}:{}/rpc/xmlrpc".format(host, port)
+
+    def countStat(self, key, n=1):
+        """ Thread-safe increment of self.Stats[key]. """
+        with self._lock:
+            self.Stats[key] += n
+
+    def inject(self, ratekey):
+        """ Returns True if a fault/error should be injected, with probability self.Rates[ratekey]. """
+        rate = self.Rates.get(ratekey)
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def delay(self):
+        """ Returns the simulated latency for a single call. """
+        if not self.Jitter:
+            return self.Latency
+        with self._lock:
+            jitter = self._random.uniform(-self.Jitter, self.Jitter)
+        return max(0, self.Latency + jitter)
+
+    def _dispatch(self, method, params):
+        """ Routes 'confluence2.<method>' calls to the fake API (overrides SimpleXMLRPCDispatcher._dispatch). """
+        with self._lock:
+            self.Callcounts[method] += 1
+            self.Stats['calls'] += 1
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        apiname, _, methodname = method.partition('.')
+        func = getattr(self.Api, methodname, None) if apiname == 'confluence2' else None
+        if methodname.startswith('_') or not callable(func):
+            raise Fault(0, "java.lang.Exception: No such handler: {}".format(method))
+        if self.inject('fault_rate'):
+            self.countStat('injected_faults')
+            raise Fault(0, "java.lang.Exception: com.atlassian.confluence.rpc.RemoteException: "
+                           "Injected fault for {}".format(method))
+        return func(*params)
+
+    def start(self):
+        """ Starts serving in a (daemon) background thread. Returns self. """
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeXmlRpcServer")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("FakeXmlRpcServer serving at %s", self.AppUrl)
+        return self
+
+    def stop(self):
+        """ Stops the background thread and closes the server socket. """
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def start_server(**kwargs):
+    """ Creates a FakeXmlRpcServer with kwargs and starts it in a background thread. """
+    return FakeXmlRpcServer(**kwargs).start()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Local confluence XML-RPC stand-in server with simulated network conditions.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds added to every call.")
+    parser.add_argument('--jitter', type=float, default=0, help="Random +/- variation of the latency, in seconds.")
+    parser.add_argument('--bandwidth', type=int, help="Bytes per second (default: unlimited).")
+    parser.add_argument('--fault-rate', type=float, default=0, help="Fraction of calls answered with xmlrpclib.Fault.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of calls answered with HTTP 500.")
+    parser.add_argument('--seed', type=int, help="Random seed for jitter and fault injection.")
+    return parser
+
+
+def main(argv=None):
+    argsns = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = FakeXmlRpcServer(host=argsns.host, port=argsns.port, latency=argsns.latency, jitter=argsns.jitter,
+                              bandwidth=argsns.bandwidth, fault_rate=argsns.fault_rate,
+                              error_rate=argsns.error_rate, seed=argsns.seed)
+    print("Serving fake confluence XML-RPC API at {} (user: fakeuser, password: fakepassword)".format(server.AppUrl))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Calls:", dict(server.Callcounts))
+        print("Stats:", dict(server.Stats))
+
+
+if __name__ == '__main__':
+    main()
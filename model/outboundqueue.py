@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Durable queue of outbound server operations, used while the server is offline.
+
+When the server is unreachable (server.notok() has been invoked), changes that should be persisted
+to the server (journal flushes, attachment uploads, lims entries, new pages) are recorded in the
+outbound queue instead of failing. The queue is saved to a yaml file, so pending operations survive
+a restart of the application. When the server connection comes back (server.setok() invokes the
+'wiki_server_status' callbacks), the operations are replayed in order in a background thread.
+
+An operation is a dict with keys 'id', 'type', 'params', 'created' and 'attempts'.
+Each operation type has a handler, registered by the module that queues operations of that type:
+
+    register_operation_handler('lims-entries', replay_lims_entries)
+
+The GUI and lims_app share the queue file, so an application may find operations queued by modules
+it has not imported; these modules are listed in HANDLER_MODULES and imported when their handler is needed.
+An operation without a handler is left pending (and replay stops there, to preserve the order).
+
+Handlers are invoked as handler(server, confighandler, **params) and resolve conflicts with changes
+made on the server in the meantime (e.g. by re-inserting content in the current version of the page).
+A handler returns:
+- True if the operation was persisted to the server (the operation is removed from the queue),
+- None if the operation is obsolete, e.g. because it has already been applied (removed from the queue),
+- False if the operation failed. If the server is offline again, replay stops and is continued later.
+  Otherwise the operation is retried later; after <maxattempts> failed attempts it is moved to the
+  Failed list, so a single bad operation does not block the queue.
+Operations are replayed strictly in order, and new operations are queued (rather than sent directly)
+as long as there are pending operations, so the server sees the changes in the order they were made.
+
+The number of pending operations is exposed by invoking the confighandler entry change callbacks
+for 'wiki_outbound_queue_depth' (with the depth passed as new value), e.g. for display in the UI.
+
+Config entries:
+- wiki_outbound_queue_path:         yaml file for the queue (default: labfluence_outbound_queue.yml in the
+                                    user config directory; the queue is not persisted if there is no user config).
+- wiki_outbound_queue_maxattempts:  failed attempts before an operation is given up (default 5).
+"""
+
+import os
+import uuid
+import importlib
+import threading
+from datetime import datetime
+from collections import Counter
+import yaml
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Key for the outbound queue in confighandler.Singletons:
+SINGLETON_KEY = 'outboundqueue'
+QUEUE_FILENAME = 'labfluence_outbound_queue.yml'
+DEPTH_ENTRY = 'wiki_outbound_queue_depth'
+MAX_ATTEMPTS = 5
+
+# operation type : handler
+OPERATION_HANDLERS = dict()
+# operation type : module (in the model package) which registers the handler when imported
+HANDLER_MODULES = {'lims-entries': 'limspage',
+                   'page-create': 'page',
+                   'journal-entries': 'journalassistant',
+                   'attachment': 'filemanager'}
+
+
+def register_operation_handler(optype, handler):
+    """ Registers handler(server, confighandler, **params) for replaying operations of type optype. """
+    OPERATION_HANDLERS[optype] = handler
+
+
+def get_operation_handler(optype):
+    """
+    Returns the handler for operations of type optype, importing the module that registers it
+    (see HANDLER_MODULES) if needed. Returns None if no handler is available.
+    """
+    if optype not in OPERATION_HANDLERS and optype in HANDLER_MODULES:
+        package = __name__.rpartition('.')[0]
+        modulename = ".".join(name for name in (package, HANDLER_MODULES[optype]) if name)
+        try:
+            importlib.import_module(modulename)
+        except ImportError as e:
+            logger.error("Could not import module %s with the handler for operation type '%s': %r", modulename, optype, e)
+    return OPERATION_HANDLERS.get(optype)
+
+
+def is_offline(server):
+    """
+    Returns True if the last request to server failed, or if the server is in read-only mode
+    while a background login is pending (see AbstractClient.autologinAsync).
+    Note that a server that has not been connected yet (_connectionok is None) is not considered offline.
+    """
+    return server is not None and (getattr(server, '_connectionok', None) is False
+                                   or getattr(server, 'LoginPending', False) is True)
+
+
+class OutboundQueue(object):
+    """
+    Persistent, ordered queue of server operations, see module docstring.
+    Use get_outbound_queue(confighandler) to get the queue shared by all users of a confighandler.
+    - path:         yaml file used to persist the queue (None: the queue is only kept in memory).
+    - confighandler: used to invoke the 'wiki_outbound_queue_depth' callbacks and passed to the handlers.
+    """
+
+    def __init__(self, path=None, confighandler=None, maxattempts=MAX_ATTEMPTS):
+        self.Path = path
+        self.Confighandler = confighandler
+        self.MaxAttempts = maxattempts
+        self.Operations = list()    # Pending operations, oldest first.
+        self.Failed = list()        # Operations given up after MaxAttempts failed attempts.
+        self.Stats = Counter()      # queued, replayed, obsolete, failed
+        self._lock = threading.RLock()
+        self._replaylock = threading.Lock()     # Held while replaying.
+        self._replaythread = None
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self.Operations)
+
+    @property
+    def Depth(self):
+        """ Number of pending operations. """
+        return len(self.Operations)
+
+    def load(self):
+        """ Reads pending (and failed) operations from self.Path, if the file exists. """
+        if not self.Path or not os.path.exists(self.Path):
+            return
+        try:
+            with open(self.Path) as fd:
+                data = yaml.safe_load(fd) or {}
+        except (IOError, OSError, yaml.YAMLError) as e:
+            logger.error("Could not read outbound queue from file '%s': %r", self.Path, e)
+            return
+        with self._lock:
+            self.Operations = data.get('operations') or list()
+            self.Failed = data.get('failed') or list()
+        logger.info("%s pending operations loaded from outbound queue file '%s'.", len(self.Operations), self.Path)
+
+    def save(self):
+        """
+        Writes the queue to self.Path. The file is written to a temporary file first and then renamed,
+        so the queue file is never left half-written.
+        """
+        if not self.Path:
+            return
+        with self._lock:
+            data = dict(operations=self.Operations, failed=self.Failed)
+            tmppath = self.Path + '.tmp'
+            try:
+                with open(tmppath, 'w') as fd:
+                    yaml.safe_dump(data, fd, default_flow_style=False)
+                try:
+                    os.rename(tmppath, self.Path)
+                except OSError:
+                    # On Windows, rename does not overwrite existing files.
+                    os.remove(self.Path)
+                    os.rename(tmppath, self.Path)
+            except (IOError, OSError) as e:
+                logger.error("Could not save outbound queue to file '%s': %r", self.Path, e)
+
+    def notifyDepth(self):
+        """ Invokes the confighandler callbacks for 'wiki_outbound_queue_depth' with the current depth. """
+        if self.Confighandler is None:
+            return
+        try:
+            self.Confighandler.invokeEntryChangeCallback(DEPTH_ENTRY, new_configentry_value=self.Depth)
+        except AttributeError:
+            logger.debug("Confighandler %r does not support entry change callbacks.", self.Confighandler)
+
+    def shouldQueue(self, server):
+        """
+        Returns True if changes for server should be queued rather than sent directly, i.e. if
+        the server is offline or if earlier operations are still pending (to preserve the order).
+        """
+        return is_offline(server) or (server is not None and bool(self.Operations))
+
+    def enqueue(self, optype, **params):
+        """
+        Adds an operation of type optype with params to the end of the queue and saves the queue.
+        Returns the operation dict. If the server is online (with earlier operations pending),
+        a replay is started in the background.
+        """
+        if get_operation_handler(optype) is None:
+            logger.warning("No handler registered for operation type '%s'; it will not be possible to replay the operation.", optype)
+        op = dict(id=uuid.uuid4().hex, type=optype, params=params, created=datetime.now(), attempts=0)
+        with self._lock:
+            self.Operations.append(op)
+            self.Stats['queued'] += 1
+            self.save()
+        logger.info("Operation '%s' (%s) added to outbound queue, %s operations pending.", optype, op['id'], self.Depth)
+        self.notifyDepth()
+        self.onServerStatusChange()
+        return op
+
+    def _giveUp(self, op):
+        """ Moves op from the pending operations to the Failed list. """
+        with self._lock:
+            self.Operations.remove(op)
+            self.Failed.append(op)
+            self.Stats['failed'] += 1
+            self.save()
+        self.notifyDepth()
+        logger.error("Giving up outbound operation '%s' (%s) after %s attempts, params: %s",
+                     op['type'], op['id'], op['attempts'], op['params'])
+
+    def replay(self, server=None):
+        """
+        Replays the pending operations in order, until the queue is empty, the server goes
+        offline or an operation fails. Returns the number of operations removed from the queue.
+        Only one replay runs at a time; if a replay is already running, returns 0 immediately.
+        Operations can be queued while a replay is running (the lock is not held during server requests).
+        """
+        if server is None and self.Confighandler is not None:
+            server = self.Confighandler.Singletons.get('server')
+        if server is None or not self._replaylock.acquire(False):
+            return 0
+        done = 0
+        try:
+            while not is_offline(server):
+                with self._lock:
+                    if not self.Operations:
+                        break
+                    op = self.Operations[0]
+                handler = get_operation_handler(op['type'])
+                if handler is None:
+                    # Keep the operation, e.g. for an application that has the handler:
+                    logger.error("No handler registered for outbound operation type '%s', leaving it pending.", op['type'])
+                    break
+                logger.info("Replaying outbound operation '%s' (%s), queued %s.", op['type'], op['id'], op['created'])
+                try:
+                    res = handler(server, self.Confighandler, **op['params'])
+                except Exception as e:     # pylint: disable=W0703
+                    logger.warning("%r while replaying outbound operation '%s' (%s).", e, op['type'], op['id'])
+                    res = False
+                if res is False:
+                    if is_offline(server):
+                        logger.info("Server went offline while replaying outbound operation %s, will retry later.", op['id'])
+                        break
+                    op['attempts'] += 1
+                    if op['attempts'] >= self.MaxAttempts:
+                        self._giveUp(op)
+                        continue
+                    self.save()
+                    break
+                if res is None:
+                    logger.info("Outbound operation '%s' (%s) is obsolete, removed from queue.", op['type'], op['id'])
+                with self._lock:
+                    self.Operations.remove(op)
+                    self.Stats['replayed' if res else 'obsolete'] += 1
+                    self.save()
+                done += 1
+                self.notifyDepth()
+        finally:
+            self._replaylock.release()
+        return done
+
+    def replayAsync(self, server=None):
+        """ Starts replay(server) in a background thread, unless a replay is already running. """
+        with self._lock:
+            if self._replaythread is not None and self._replaythread.is_alive():
+                return self._replaythread
+            self._replaythread = thread = threading.Thread(target=self.replay, args=(server, ), name="OutboundQueueReplay")
+            thread.daemon = True
+            thread.start()
+        return thread
+
+    def onServerStatusChange(self):
+        """
+        Invoked (as 'wiki_server_status' callback) when the server connection status changes.
+        Starts replaying pending operations when the server is online.
+        """
+        if not self.Operations or self.Confighandler is None:
+            return
+        server = self.Confighandler.Singletons.get('server')
+        if server is not None and getattr(server, '_connectionok', None) and not is_offline(server):
+            self.replayAsync(server)
+
+
+def get_outbound_queue(confighandler):
+    """
+    Returns the OutboundQueue for confighandler (registered as a confighandler singleton), creating it if needed.
+    The new queue loads pending operations from its file and replays them when the server is online.
+    """
+    outboundqueue = confighandler.getSingleton(SINGLETON_KEY)
+    if outboundqueue is None:
+        path = confighandler.get('wiki_outbound_queue_path')
+        if not path:
+            userconfig = getattr(confighandler, 'ConfigPaths', {}).get('user')
+            if userconfig and os.path.isfile(userconfig):
+                path = os.path.join(os.path.dirname(userconfig), QUEUE_FILENAME)
+        outboundqueue = OutboundQueue(path, confighandler,
+                                      maxattempts=confighandler.get('wiki_outbound_queue_maxattempts', MAX_ATTEMPTS))
+        confighandler.setSingleton(SINGLETON_KEY, outboundqueue)
+        confighandler.registerEntryChangeCallback('wiki_server_status', outboundqueue.onServerStatusChange)
+    return outboundqueue
@@ -49,6 +49,9 @@ import re
 import logging
 logger = logging.getLogger(__name__)
 from utils import isvalidfilename
+from xhtmlvalidation import find_xhtml_error
+from pagesections import SectionIndex
+from outboundqueue import register_operation_handler, is_offline
 #from confighandler import ExpConfigHandler
 #from server import ConfluenceXmlRpcServer
 #from decorators.cache_decorator import cached_property
@@ -112,6 +115,7 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
         #self.Experiment = experiment # Experiment object, mostly used to get local-dir-aware config items, e.g. string formats and regexs.
         #self.Localdir = localdir     # localdir; only used if no experiment is available.
         self._struct = pagestruct # Cached struct. Might be a page summary(!)
+        self._sectionindex = None # SectionIndex for the current content, see getSectionIndex()
         if pagestruct is None:
             if lazyreload:
                 logger.debug("Delaying server reload, should happen lazily when needed...")
@@ -133,7 +137,7 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
          - PageSummary  : dict, partial.
         """
         if not self._struct:
-            self.reloadFromServer()
+            self.loadStruct()
         return self._struct
     @Struct.setter
     def Struct(self, newstruct):
@@ -153,7 +157,7 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
             return
         if 'content' not in struct: # e.g. created with a pagesummary
             logger.info("struct only has keys %s, no 'content' field. Reloading to obtain complete struct.", struct.keys())
-            self.reloadFromServer()
+            self.loadStruct()
         try:
             return self.Struct['content']
         except (TypeError, KeyError) as e:
@@ -168,9 +172,23 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
             self.Struct['content'] = new_content
 
 
+    def loadStruct(self):
+        """
+        Loads the full page struct from the page cache (e.g. prefetched by the ExperimentManager),
+        or from the server if the page is not in the cache.
+        Returns True if successful, None if no server available and False if server call failed.
+        """
+        pagecache = self.PageCache
+        struct = pagecache.get(self.PageId) if pagecache is not None else None
+        if struct:
+            logger.debug("Page %s loaded from page cache.", self.PageId)
+            self.Struct = struct
+            return True
+        return self.reloadFromServer()
+
     def reloadFromServer(self):
         """
-        Reloads page struct from server.
+        Reloads page struct from server (and updates the page cache).
         Returns True if successful, None if no server available and False if server call failed.
         """
         if self.Server is None:
@@ -186,6 +204,8 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
             logger.warning("Page.reloadFromServer() :: Something went wrong retrieving Page struct from server...!")
             return False
         self.Struct = struct
+        if self.PageCache is not None:
+            self.PageCache.put(struct)
         return True
 
     def getUrl(self, mode='view', anchor=None):
@@ -272,24 +292,19 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
 
     def validate_xhtml(self, xhtml):
         """
-        My own simple xhtml validation implementation...
+        Returns True if xhtml is well-formed, False otherwise.
+        Validation is done with the expat parser and results are cached by content hash,
+        see xhtmlvalidation.py. The location of the first error is logged.
             # http://lxml.de/1.3/validation.html
             # http://www.amnet.net.au/~ghannington/confluence/readme.html
             # https://confluence.atlassian.com/display/DOC/Confluence+Storage+Format
-            # https://confluence.atlassian.com/display/DOC/Feedback+on+Confluence+Storage+Format
             # https://jira.atlassian.com/browse/CONF-24884 - currently, no published DTD, XSD  or similar...
-            # http://www.w3schools.com/xml/xml_dtd.asp
-            # Damn, I cannot figure out even how to ressolve the 'namespace prefix ac not defined issue...
-        """
-        surplus = 0
-        for i, char in enumerate(xhtml):
-            if char == '<':
-                surplus += 1
-            if char == '>':
-                surplus -= 1
-            if surplus > 1:
-                logger.info("xhtml failed at index %s", i)
-                return False
+        """
+        error = find_xhtml_error(xhtml)
+        if error:
+            logger.info("xhtml failed validation at index %s: %s - xhtml near error: %r",
+                        error.offset, error, xhtml[max(0, error.offset-40):error.offset+40])
+            return False
         return True
 
 
@@ -335,6 +350,8 @@ minorEdit      Boolean Is this update a 'minor edit'? (default value: false)
         if page_struct:
             logger.debug("Returned page struct from server with keys: %s", ", ".join("{} (len={})".format(key, len(val) if val and hasattr(val, '__len__') else None) for key, val in page_struct.items()))
             self.Struct = page_struct
+            if self.PageCache is not None:
+                self.PageCache.put(page_struct)
             logger.info("self.Struct updated to version %s", self.Struct['version'])
         else:
             logger.info("Returned non-true page-struct from server: %s", page_struct)
@@ -355,6 +372,8 @@ below        source and target become/remain sibling pages and the source is mov
             logger.info("%s.Server is None or not connected, aborting...", self.__class__)
             return
         ret = self.Server.movePage(self.PageId, targetPageId, position=position)
+        if self.PageCache is not None:
+            self.PageCache.discard(self.PageId)     # The cached struct has the old parentId.
         return ret
 
 
@@ -500,6 +519,49 @@ risk of content loss! ---> (before_insert_index, after_insert_index) is %s | reg
         logger.info("Page.insertAtRegex() :: No match found! Regex='%s', mode=%s", regex, mode)
 
 
+    @property
+    def SectionIndex(self):
+        """
+        Returns a SectionIndex with the headers/sections of the page content (see pagesections.py),
+        lazily reloading the page from the server if it is not retrieved.
+        """
+        return self.getSectionIndex()
+
+    def getSectionIndex(self, reload=True):
+        """
+        Returns a SectionIndex for the current page content. The index is only rebuilt when the content changes.
+        If reload is False, the page is not retrieved from the server; returns None if no content is cached.
+        """
+        if not reload and not (self._struct and 'content' in self._struct):
+            return None
+        content = self.Content
+        if content is None:
+            return None
+        if self._sectionindex is None or self._sectionindex.Xhtml is not content:
+            self._sectionindex = SectionIndex(content)
+            logger.debug("SectionIndex built for page %s, %s headers found in %s chars of content.",
+                         self.PageId, len(self._sectionindex), len(content))
+        return self._sectionindex
+
+    def insertAt(self, xhtml, position, versionComment="labfluence insertAt", minorEdit=True, persistToServer=True):
+        """
+        Inserts xhtml at character offset <position> in the page content, e.g. a position obtained from self.SectionIndex.
+        Like insertAtRegex, the xhtml is separated from the existing content by newlines,
+        and the page is updated on the server if persistToServer is True.
+        Returns self.Struct if the insertion succeeded.
+        """
+        page = self.Content
+        if page is None:
+            logger.info("Page.insertAt() :: No page content, aborting...")
+            return False
+        self.Struct['content'] = "\n".join([page[:position], xhtml, page[position:]])
+        if persistToServer:
+            pageupdateret = self.updatePage(struct_from='cache', versionComment=versionComment, minorEdit=minorEdit)
+            if not pageupdateret:
+                logger.warning("WARNING, updatePage returned boolean '%s', type is: '%s'. It is likely that the page was not updated!!", bool(pageupdateret), type(pageupdateret))
+        return self.Struct
+
+
     #
     #def getWikiSubentryXhtml(self, subentry, regex_pat):
     #    """
@@ -530,17 +592,28 @@ risk of content loss! ---> (before_insert_index, after_insert_index) is %s | reg
     def getRenderedHTML(self, content=None):
         """
         Returns wikipage as rendered html, as it would look in a browser.
-        Returns None if server is None or not connected.
-        """
+        If content is given, it is rendered as if it were the body of this page.
+        Html rendered for the current version of the page is cached in the render cache.
+        Returns None if the html is not cached and server is None or not connected.
+        """
+        rendercache = self.RenderCache
+        version = None
+        if rendercache is not None:
+            if self.Struct and 'version' not in self.Struct:    # e.g. created with a page summary
+                self.loadStruct()
+            version = self.Struct.get('version') if self.Struct else None
+            html = rendercache.get(self.PageId, version, content)
+            if html is not None:
+                logger.debug("Rendered html for page %s version %s found in render cache.", self.PageId, version)
+                return html
         if not self.Server and not self.Server.CachedConnectStatus:
             logger.info("%s (%s) > Server is None or not connected, aborting...", self.__class__.__name__, self)
             return
             # Server might be None or a server instance with attribute _connectionok value of either
             # of 'None' (not tested), False (last connection failed) or True (last connection succeeded).
-        if content:
-            html = self.Server.renderContent(self.PageId, content)
-        else:
-            html = self.Server.renderContent(self.PageId)
+        html = self.Server.renderContent(pageId=self.PageId, content=content)
+        if rendercache is not None and html is not None:
+            rendercache.put(self.PageId, version, html, content)
         return html
 
     def getAttachmentInfo(self, fileName, versionNumber=0):
@@ -876,16 +949,27 @@ class WikiPageFactory(LabfluenceBase):
         contains all required keys for the specified template.
 
         PS: Considering adding a localdirpath variable to provide local-dir-aware config items, e.g. string formats and regexs.
+
+        If the server is offline, the new page is added to the outbound queue and None is returned;
+        the page is created when the connection comes back (unless a page with the same title exists by then).
         """
         if templatetype is None:
             templatetype = self.DefaultTemplateType
         content_template = self.getTemplate(templatetype)
         new_struct = self.makeNewPageStruct(content=content_template, fmt_params=fmt_params, localdirpath=localdirpath)
         logger.info("WikiPageFactory.new() :: new_struct: %s", new_struct)
+        outboundqueue = self.OutboundQueue
+        if outboundqueue is not None and outboundqueue.shouldQueue(self.Server):
+            outboundqueue.enqueue('page-create', struct=new_struct)
+            return None
         saved_struct = self.Server.storePage(new_struct)
         logger.info("WikiPageFactory.new() :: saved_struct: %s", saved_struct)
+        if not saved_struct:
+            if outboundqueue is not None and is_offline(self.Server):
+                outboundqueue.enqueue('page-create', struct=new_struct)
+            return None
         pageId = saved_struct['id']
-        new_page = WikiPage(pageId, self.Server, saved_struct)
+        new_page = WikiPage(pageId, self.Server, confighandler=self.Confighandler, pagestruct=saved_struct)
         return new_page
         #subentry_template_pageId = self.TemplatePagesIds.get('exp_subentry')
         #subentry_template_struct = self.Server.getPage(pageId=subentry_template_pageId)
@@ -894,6 +978,27 @@ class WikiPageFactory(LabfluenceBase):
 
 
 
+def replay_page_create(server, confighandler, struct):
+    """
+    Outbound queue handler for new pages (see WikiPageFactory.new).
+    If a page with the same title has been created in the space in the meantime, the operation is obsolete.
+    """
+    try:
+        existing = server.getPage(spaceKey=struct['space'], pageTitle=struct['title'])
+    except Exception as e:     # pylint: disable=W0703
+        # The server raises a Fault if no page has the given title.
+        logger.debug("%r while looking for page '%s' in space %s.", e, struct['title'], struct['space'])
+        existing = None
+    if existing:
+        logger.info("Page '%s' already exists in space %s, not creating it again.", struct['title'], struct['space'])
+        return None
+    if is_offline(server):
+        return False
+    return bool(server.storePage(struct))
+
+register_operation_handler('page-create', replay_page_create)
+
+
 def make_page_url(baseurl, pageid, mode='view', anchor=None):
     """
     Produce a url to a page using pageid, baseurl (server url).
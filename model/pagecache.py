@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Cache of full page structs (with content), shared by the WikiPage objects using the same confighandler,
+with concurrent prefetching of pages.
+
+ExperimentManager.getExpRootWikiPages() only retrieves page summaries (without content);
+each WikiPage then loads its full struct when first needed. To avoid making these requests
+one at a time, the manager prefetches the pages of active and recent experiments:
+
+    pagecache = get_page_cache(confighandler)
+    pagecache.prefetch(server, pageids)     # returns immediately, pages are fetched by a pool of threads.
+    struct = pagecache.get(pageid)          # waits for the page if it is still being fetched.
+
+WikiPage.loadStruct() uses the cache before making its own request, and WikiPage.reloadFromServer()
+and updatePage() store the retrieved struct in the cache.
+Structs are copied when stored and when returned, so changes to a page's struct (e.g. content
+that has not been persisted) are not seen by others.
+Callbacks registered with addVersionCallback() are invoked with (pageId, version) when a page struct
+is stored, e.g. to invalidate rendered html of older versions (see rendercache module).
+
+Config entries:
+- wiki_page_cache_ttl:      seconds a cached page struct is used (default 120).
+- wiki_prefetch_workers:    number of concurrent requests when prefetching (default 8, 0 disables prefetching).
+"""
+
+import time
+import threading
+from collections import Counter, OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Key for the page cache in confighandler.Singletons:
+SINGLETON_KEY = 'pagecache'
+PAGE_CACHE_TTL = 120
+PREFETCH_WORKERS = 8
+
+
+class PageCache(object):
+    """
+    Thread-safe cache of page structs by pageId, where pages that are being fetched can be waited for.
+    Use get_page_cache(confighandler) to get the cache shared by all users of a confighandler.
+    """
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, workers=PREFETCH_WORKERS):
+        self.TTL = ttl
+        self.Workers = workers
+        self.Entries = dict()       # pageId : (timestamp, struct)
+        self.Pending = dict()       # pageId : threading.Event, set when the page has been fetched (or failed).
+        self.Stats = Counter()      # hits, misses, prefetched, failed
+        self.VersionCallbacks = list()
+        self._lock = threading.Lock()
+
+    def __contains__(self, pageId):
+        with self._lock:
+            return self._getFresh(str(pageId)) is not None
+
+    def _getFresh(self, pageId):
+        """ Returns the cached struct for pageId if it has not expired, else None. Does not copy. """
+        entry = self.Entries.get(pageId)
+        if entry and time.time() - entry[0] < self.TTL:
+            return entry[1]
+        return None
+
+    def get(self, pageId, timeout=None):
+        """
+        Returns a copy of the cached struct for pageId, or None if the page is not cached.
+        If the page is being prefetched, waits for it (at most timeout seconds, if specified).
+        """
+        pageId = str(pageId)
+        with self._lock:
+            event = self.Pending.get(pageId)
+        if event is not None:
+            logger.debug("Waiting for page %s being prefetched...", pageId)
+            event.wait(timeout)
+        with self._lock:
+            struct = self._getFresh(pageId)
+            self.Stats['hits' if struct else 'misses'] += 1
+        return dict(struct) if struct else None
+
+    def put(self, struct):
+        """ Stores (a copy of) the full page struct in the cache. Page summaries (without content) are not stored. """
+        if not struct or 'content' not in struct:
+            return
+        with self._lock:
+            self.Entries[str(struct['id'])] = (time.time(), dict(struct))
+        self._notifyVersion(struct)
+
+    def addVersionCallback(self, callback):
+        """ Registers callback(pageId, version), invoked (without holding the lock) when a page struct is stored. """
+        if callback not in self.VersionCallbacks:
+            self.VersionCallbacks.append(callback)
+
+    def _notifyVersion(self, struct):
+        """ Invokes the version callbacks with the pageId and version of struct. """
+        for callback in self.VersionCallbacks:
+            try:
+                callback(str(struct['id']), struct.get('version'))
+            except Exception as e:     # pylint: disable=W0703
+                logger.warning("%r raised by page cache version callback %s", e, callback)
+
+    def discard(self, pageId):
+        """ Removes pageId from the cache. """
+        with self._lock:
+            self.Entries.pop(str(pageId), None)
+
+    def clear(self):
+        """ Removes all pages from the cache (pages being fetched are not affected). """
+        with self._lock:
+            self.Entries.clear()
+
+    def prefetch(self, server, pageIds, block=False):
+        """
+        Fetches the full structs of the pages in pageIds concurrently (using up to self.Workers threads),
+        skipping pages that are already cached or being fetched.
+        If block is False (default), returns immediately; use get() to wait for a page.
+        Returns the list of pageIds that are being fetched.
+        """
+        with self._lock:
+            pageIds = [pageId for pageId in OrderedDict.fromkeys(str(pageId) for pageId in pageIds)
+                       if pageId not in self.Pending and self._getFresh(pageId) is None]
+            if not pageIds or self.Workers < 1 or server is None:
+                return []
+            for pageId in pageIds:
+                self.Pending[pageId] = threading.Event()
+
+        def fetch(pageId):
+            """ Fetches a single page (in a worker thread). """
+            struct = None
+            try:
+                struct = server.getPage(pageId=pageId)
+            except Exception as e:     # pylint: disable=W0703
+                logger.warning("%r while prefetching page %s", e, pageId)
+            with self._lock:
+                if struct:
+                    self.Entries[pageId] = (time.time(), dict(struct))
+                    self.Stats['prefetched'] += 1
+                else:
+                    self.Stats['failed'] += 1
+                self.Pending.pop(pageId).set()
+            if struct:
+                self._notifyVersion(struct)
+
+        logger.info("Prefetching %s pages using %s threads: %s", len(pageIds), min(self.Workers, len(pageIds)), pageIds)
+        pool = ThreadPool(min(self.Workers, len(pageIds)))
+        pool.map_async(fetch, pageIds, chunksize=1)
+        pool.close()    # The worker threads exit when all pages have been fetched.
+        if block:
+            pool.join()
+        return pageIds
+
+
+def get_page_cache(confighandler):
+    """
+    Returns the PageCache for confighandler (registered as a confighandler singleton), creating it if needed.
+    """
+    pagecache = confighandler.getSingleton(SINGLETON_KEY)
+    if pagecache is None:
+        pagecache = PageCache(ttl=confighandler.get('wiki_page_cache_ttl', PAGE_CACHE_TTL),
+                              workers=confighandler.get('wiki_prefetch_workers', PREFETCH_WORKERS))
+        confighandler.setSingleton(SINGLETON_KEY, pagecache)
+    return pagecache
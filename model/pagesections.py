@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Section index for wiki pages: the headers (<h1> to <h6>) of a page with their character offsets,
+parsed in a single pass over the page xhtml.
+
+A section starts at its header and ends where the next header of the same or a higher level
+(lower number) starts, e.g. an <h4> subentry section ends at the next <h1>-<h4> header:
+
+    <h2>Experimental section</h2>               <- section 'Experimental section' (h2) starts
+    <h4>RS123a First subentry</h4>              <- subentry a (h4) starts; bodystart is after </h4>
+    <h6>Journal, 20140101</h6><p>...</p>        (journal entries for subentry a are inserted here, at end)
+    <h4>RS123b Second subentry</h4>             <- subentry a ends, subentry b starts
+    ...
+    <h2>Results and discussion</h2>             <- subentry b and 'Experimental section' ends
+
+WikiPage.SectionIndex returns the index for the current page content; the index is only rebuilt
+when the content changes, and is shared by all code that needs to find sections on the page.
+Derived data (e.g. the subentry headers of an experiment) is cached in SectionIndex.Cache.
+
+The functions at the bottom of this module interpret the index for experiment pages.
+The layout of experiment pages (the title and level of the experimental section header and the level
+of the subentry headers) is derived from the configured 'wiki_subentry_parse_regex_fmt' regex,
+see get_section_layout(). If the layout cannot be derived from the configured regex, the index is
+not used for experiment pages and the configured regexes are used instead.
+"""
+
+import re
+from collections import namedtuple, OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+
+HEADER_REGEX = re.compile(r'<h([1-6])(?:\s[^>]*)?>(.*?)</h\1\s*>', flags=re.DOTALL)
+TAG_REGEX = re.compile(r'<[^>]*>')
+
+# Finds the experimental section header and the subentry header level in 'wiki_subentry_parse_regex_fmt', e.g.
+# '(?P<exp_section_header><h2>Experimental section</h2>).*?(?P<subentry_header><h4>{expid}{subentry_idx}.+?</h4>)...'
+# The section title must be literal text (no regex special characters):
+EXPSECTION_HEADER_FMT_REGEX = re.compile(r'\(\?P<exp_section_header><h([1-6])>([^<>\\()\[\]{}.*+?|^$]+)</h\1>\)')
+SUBENTRY_HEADER_FMT_REGEX = re.compile(r'\(\?P<subentry_header><h([1-6])>')
+
+
+class SectionLayout(namedtuple('SectionLayout', 'section_title section_level subentry_level')):
+    """
+    Layout of experiment pages:
+    - section_title, section_level: title and level of the header of the experimental section.
+    - subentry_level:               level of the subentry headers inside the experimental section.
+    """
+    __slots__ = ()
+
+
+class Header(namedtuple('Header', 'level title start bodystart end')):
+    """
+    A header on a page:
+    - level:        1 for <h1>, 2 for <h2>, etc.
+    - title:        header text, with tags removed and whitespace stripped.
+    - start:        offset of the header start tag.
+    - bodystart:    offset just after the header end tag.
+    - end:          offset of the end of the section, i.e. the start of the next header of the same
+                    or higher level, or the length of the page.
+    """
+    __slots__ = ()
+
+
+class SectionIndex(object):
+    """
+    Index of the headers/sections on a page. Build with SectionIndex(xhtml).
+    """
+
+    def __init__(self, xhtml):
+        self.Xhtml = xhtml
+        self.Cache = dict()
+        headers = list()
+        open_sections = list()  # list of [level, title, start, bodystart] whose end has not been found yet.
+        for match in HEADER_REGEX.finditer(xhtml):
+            level = int(match.group(1))
+            while open_sections and open_sections[-1][0] >= level:
+                headers.append(Header(*open_sections.pop(), end=match.start()))
+            open_sections.append([level, TAG_REGEX.sub('', match.group(2)).strip(), match.start(), match.end()])
+        while open_sections:
+            headers.append(Header(*open_sections.pop(), end=len(xhtml)))
+        headers.sort(key=lambda header: header.start)
+        self.Headers = headers
+
+    def __len__(self):
+        return len(self.Headers)
+
+    def findHeader(self, level=None, title=None, start=0, end=None):
+        """
+        Returns the first header with the given level and title (if specified) starting within [start, end),
+        or None if no such header is found.
+        """
+        for header in self.iterHeaders(start, end):
+            if (level is None or header.level == level) and (title is None or header.title == title):
+                return header
+        return None
+
+    def iterHeaders(self, start=0, end=None):
+        """ Yields the headers starting within [start, end). """
+        end = len(self.Xhtml) if end is None else end
+        for header in self.Headers:
+            if header.start >= end:
+                break
+            if header.start >= start:
+                yield header
+
+    def subHeaders(self, header, level=None):
+        """ Returns the headers (of the given level) inside the section of header. """
+        return [sub for sub in self.iterHeaders(header.bodystart, header.end)
+                if level is None or sub.level == level]
+
+    def getXhtml(self, header, include_header=True):
+        """ Returns the xhtml of the section for header. """
+        return self.Xhtml[header.start if include_header else header.bodystart:header.end]
+
+
+###################################
+### Experiment page sections:   ###
+###################################
+
+_layouts = dict()   # regex_fmt : SectionLayout (or None)
+
+def get_section_layout(regex_fmt):
+    """
+    Returns the SectionLayout of experiment pages described by regex_fmt, the 'wiki_subentry_parse_regex_fmt'
+    config entry, which has named groups for the experimental section header and the subentry header, e.g.
+        (?P<exp_section_header><h2>Experimental section</h2>).*?(?P<subentry_header><h4>{expid}{subentry_idx}.+?</h4>)
+    Returns None if the layout cannot be derived from regex_fmt (e.g. if the section title is not literal text),
+    in which case the section index should not be used to find experiment sections.
+    """
+    if not regex_fmt:
+        return None
+    if regex_fmt not in _layouts:
+        expsection = EXPSECTION_HEADER_FMT_REGEX.search(regex_fmt)
+        subentry = SUBENTRY_HEADER_FMT_REGEX.search(regex_fmt)
+        if expsection and subentry:
+            _layouts[regex_fmt] = SectionLayout(expsection.group(2).strip(), int(expsection.group(1)), int(subentry.group(1)))
+        else:
+            logger.info("Could not derive the experiment page layout from regex '%s', the section index will not be used.", regex_fmt)
+            _layouts[regex_fmt] = None
+    return _layouts[regex_fmt]
+
+
+def get_experiment_section(index, layout):
+    """ Returns the header of the experimental section (the section with the subentries), or None. """
+    if layout is None:
+        return None
+    key = ('experiment_section', layout)
+    if key not in index.Cache:
+        index.Cache[key] = index.findHeader(level=layout.section_level, title=layout.section_title)
+    return index.Cache[key]
+
+
+def get_subentry_headers(index, expid, layout):
+    """
+    Returns an OrderedDict with subentry_idx: Header for the subentry headers
+    (e.g. '<h4>RS123a Subentry title</h4>') in the experimental section.
+    Returns None if the page does not have an experimental section (or layout is None).
+    """
+    key = ('subentry_headers', expid, layout)
+    if key not in index.Cache:
+        expsection = get_experiment_section(index, layout)
+        if expsection is None:
+            index.Cache[key] = None
+        elif not expid:
+            index.Cache[key] = OrderedDict()
+        else:
+            title_regex = re.compile(r'{}[_-]*(?P<subentry_idx>[a-zA-Z]+)(\s|$)'.format(re.escape(expid)))
+            subentries = OrderedDict()
+            for header in index.subHeaders(expsection, level=layout.subentry_level):
+                match = title_regex.match(header.title)
+                if match:
+                    subentries.setdefault(match.group('subentry_idx'), header)
+            index.Cache[key] = subentries
+    return index.Cache[key]
+
+
+def get_subentry_header(index, expid, subentry_idx, layout):
+    """ Returns the Header for subentry <expid><subentry_idx>, or None if it is not found. """
+    subentries = get_subentry_headers(index, expid, layout)
+    return subentries.get(subentry_idx) if subentries else None
+
+
+def subentry_sortkey(subentry_idx):
+    """ Sort key for subentry indices, 'a' < 'b' < ... < 'z' < 'aa' < 'ab'. """
+    return (len(subentry_idx), subentry_idx)
+
+
+def get_new_subentry_position(index, expid, subentry_idx, layout):
+    """
+    Returns the offset where a new subentry should be inserted:
+    before the first subentry with a higher index, or before the first header of a higher level
+    than the subentry headers (e.g. <h1>-<h3>) after the start of the experimental section
+    (or at the end of the page).
+    Returns None if the page does not have an experimental section (or layout is None).
+    """
+    expsection = get_experiment_section(index, layout)
+    if expsection is None:
+        return None
+    subentries = get_subentry_headers(index, expid, layout)
+    subentry_starts = dict((header.start, idx) for idx, header in subentries.items())
+    newkey = subentry_sortkey(subentry_idx)
+    for header in index.iterHeaders(expsection.bodystart):
+        if header.level < layout.subentry_level:
+            return header.start
+        if header.start in subentry_starts and subentry_sortkey(subentry_starts[header.start]) > newkey:
+            return header.start
+    return len(index.Xhtml)
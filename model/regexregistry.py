@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Registry of compiled regular expressions for regex patterns defined in the config,
+e.g. wiki_experiment_section, wiki_subentry_regex_fmt, exp_series_regex and local_exp_folder_regexs.
+
+Each pattern is compiled once (per config value, flags and format parameters) and shared
+by all objects using the same confighandler:
+
+    registry = get_regex_registry(confighandler)
+    expsection_regex_prog = registry.get('wiki_experiment_section', flags=re.DOTALL+re.MULTILINE)
+    subentry_regex_prog = registry.get('wiki_subentry_regex_fmt', flags=re.DOTALL+re.MULTILINE,
+                                       fmt_params=dict(expid='RS123', subentry_idx=r"(?P<subentry_idx>[a-zA-Z]+)"))
+
+Patterns that are not read directly from the confighandler (e.g. from experiment props or
+the hierarchical config) are compiled with registry.compile(cfgkey, pattern, ...).
+
+Compiled regexes are cached by (cfgkey, pattern, flags, fmt_params), so a changed config value
+will never return a stale regex. Additionally, the registry registers an entry change callback
+for each config key it has compiled, so entries for the old value are dropped (and the key's version
+is incremented) when the confighandler invokes callbacks for a changed entry.
+"""
+
+from six import string_types
+import re
+import threading
+from collections import OrderedDict, Counter
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Key for the registry in confighandler.Singletons:
+SINGLETON_KEY = 'regexregistry'
+# Maximum number of compiled regexes to keep (least recently used are discarded first):
+CACHE_SIZE = 256
+
+
+class RegexRegistry(object):
+    """
+    Compiles and caches regular expressions for config entries.
+    Use get_regex_registry(confighandler) to get the registry shared by all users of a confighandler.
+    """
+
+    def __init__(self, confighandler=None, cachesize=CACHE_SIZE):
+        self.Confighandler = confighandler
+        self.CacheSize = cachesize
+        self.Cache = OrderedDict()      # (cfgkey, pattern, flags, fmt_params) : compiled regex
+        self.Versions = Counter()       # cfgkey : number of times the entry has been invalidated.
+        self.Stats = Counter()          # hits, misses
+        self._watchedkeys = set()
+        self._lock = threading.Lock()
+
+    def get(self, cfgkey, flags=0, fmt_params=None, path=None, default=None):
+        """
+        Returns the compiled regex for the pattern in config entry <cfgkey>, or default if
+        the entry is not set. If fmt_params is given, the pattern is formatted with these before compiling.
+        path is passed to the confighandler, to use the hierarchical config for that path.
+        Raises re.error if the pattern is invalid, and KeyError/IndexError if the format parameters are not sufficient.
+        """
+        if path is None:
+            pattern = self.Confighandler.get(cfgkey)
+        else:
+            pattern = self.Confighandler.get(cfgkey, path=path)
+        if pattern is None:
+            return default
+        return self.compile(cfgkey, pattern, flags, fmt_params)
+
+    def getDict(self, cfgkey, flags=0, path=None, default=None):
+        """
+        Returns a dict with compiled regexes for config entries that are dicts of patterns
+        (e.g. local_exp_folder_regexs). Values that are not strings (e.g. already compiled) are returned as-is.
+        """
+        if path is None:
+            patterns = self.Confighandler.get(cfgkey)
+        else:
+            patterns = self.Confighandler.get(cfgkey, path=path)
+        if patterns is None:
+            return default
+        return self.compileDict(cfgkey, patterns, flags)
+
+    def compile(self, cfgkey, pattern, flags=0, fmt_params=None):
+        """
+        Returns the compiled regex for pattern (formatted with fmt_params, if given).
+        The values in fmt_params must be hashable; format the pattern before calling compile
+        if it depends on e.g. the current time.
+        cfgkey is the config entry that pattern was obtained from; it is used to invalidate the regex
+        when the config entry changes.
+        """
+        fmtkey = tuple(sorted(fmt_params.items())) if fmt_params else None
+        key = (cfgkey, pattern, flags, fmtkey)
+        with self._lock:
+            regex_prog = self.Cache.pop(key, None)
+            if regex_prog is not None:
+                self.Cache[key] = regex_prog        # most recently used is last.
+                self.Stats['hits'] += 1
+                return regex_prog
+        regex_str = pattern.format(**fmt_params) if fmt_params else pattern
+        regex_prog = re.compile(regex_str, flags)
+        logger.debug("Compiled regex for config entry '%s': %s", cfgkey, regex_str)
+        with self._lock:
+            self.Stats['misses'] += 1
+            self.Cache[key] = regex_prog
+            while len(self.Cache) > self.CacheSize:
+                self.Cache.popitem(last=False)
+        self._watch(cfgkey)
+        return regex_prog
+
+    def compileDict(self, cfgkey, patterns, flags=0):
+        """ Compiles each pattern in dict patterns, see getDict. """
+        return dict((key, self.compile(cfgkey, pattern, flags) if isinstance(pattern, string_types) else pattern)
+                    for key, pattern in patterns.items())
+
+    def _watch(self, cfgkey):
+        """ Registers a callback with the confighandler to invalidate cfgkey when the entry changes. """
+        if cfgkey in self._watchedkeys or self.Confighandler is None:
+            return
+        self._watchedkeys.add(cfgkey)
+        try:
+            self.Confighandler.registerEntryChangeCallback(cfgkey, self.invalidate, args=(cfgkey, ))
+        except AttributeError:
+            logger.debug("Confighandler %r does not support entry change callbacks.", self.Confighandler)
+
+    def invalidate(self, cfgkey=None):
+        """
+        Removes compiled regexes for config entry cfgkey (or all entries, if cfgkey is None)
+        and increments the entry's version.
+        """
+        with self._lock:
+            keys = [key for key in self.Cache if cfgkey is None or key[0] == cfgkey]
+            for key in keys:
+                del self.Cache[key]
+            for entry in set(key[0] for key in keys) if cfgkey is None else (cfgkey, ):
+                self.Versions[entry] += 1
+        logger.debug("Regex registry invalidated for config entry: %s", cfgkey if cfgkey is not None else "(all)")
+
+    def getVersion(self, cfgkey):
+        """ Returns the version of config entry cfgkey, i.e. the number of times its regexes have been invalidated. """
+        return self.Versions[cfgkey]
+
+
+def get_regex_registry(confighandler):
+    """
+    Returns the RegexRegistry for confighandler (registered as a confighandler singleton),
+    creating it if needed.
+    """
+    registry = confighandler.getSingleton(SINGLETON_KEY)
+    if registry is None:
+        registry = RegexRegistry(confighandler)
+        confighandler.setSingleton(SINGLETON_KEY, registry)
+    return registry
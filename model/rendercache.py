@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Local cache of rendered page html, keyed by (pageId, version, render options).
+
+Server-side rendering (renderContent) of a large page is one of the slowest server operations,
+and the journal viewer and exports request it repeatedly for pages that have not changed.
+WikiPage.getRenderedHTML() uses the cache shared by all objects using the same confighandler:
+
+    rendercache = get_render_cache(confighandler)
+    html = rendercache.get(pageId, version, options)
+    if html is None:
+        html = server.renderContent(pageId=pageId)
+        rendercache.put(pageId, version, html, options)
+
+The options are the render arguments other than pageId, e.g. the content to render as the
+page's body; they are hashed and included in the key.
+Rendered html is stored as files in a cache directory (one file per entry), so it survives restarts.
+When the total size exceeds <maxbytes>, the least recently used entries are removed.
+Entries for older versions of a page are removed when the page cache (see pagecache module)
+stores a newer version of the page.
+Without a cache directory, entries are only kept in memory.
+
+Config entries:
+- wiki_render_cache_dir:    cache directory (default: 'rendercache' next to the user config file).
+- wiki_render_cache_size:   maximum size of the cached html, in bytes (default 20 MB, 0 disables the cache).
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+
+from pagecache import get_page_cache
+
+# Key for the render cache in confighandler.Singletons:
+SINGLETON_KEY = 'rendercache'
+RENDER_CACHE_DIRNAME = 'rendercache'
+RENDER_CACHE_SIZE = 20*2**20
+# Cache files are named <pageId>-<version>-<options hash>.html:
+FILENAME_REGEX = re.compile(r"^(\d+)-(\d+)-(\w+)\.html$")
+
+
+def options_hash(options):
+    """ Returns a short hash of the render options (e.g. content), or 'page' if there are none. """
+    if not options:
+        return 'page'
+    if isinstance(options, unicode):
+        options = options.encode('utf-8')
+    return hashlib.sha1(options).hexdigest()[:16]
+
+
+def version_number(version):
+    """ Returns version (an int or a string, as in page structs) as an int, or None if it is not a number. """
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        return None
+
+
+class RenderCache(object):
+    """
+    Thread-safe, size-bounded LRU cache of rendered html by (pageId, version, options).
+    Use get_render_cache(confighandler) to get the cache shared by all users of a confighandler.
+    - path:     cache directory (None: entries are only kept in memory).
+    - maxbytes: maximum total size of the cached html.
+    """
+
+    def __init__(self, path=None, maxbytes=RENDER_CACHE_SIZE):
+        self.Path = path
+        self.MaxBytes = maxbytes
+        self.Entries = OrderedDict()    # (pageId, version, optionshash) : size, least recently used first.
+        self.Size = 0
+        self.Stats = Counter()          # hits, misses, stored, evicted, invalidated
+        self._memory = dict()           # (pageId, version, optionshash) : html, if self.Path is None.
+        self._lock = threading.RLock()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self.Entries)
+
+    def load(self):
+        """ Indexes the cache files in self.Path (creating the directory if needed), oldest first. """
+        try:
+            if not os.path.isdir(self.Path):
+                os.makedirs(self.Path)
+            filenames = os.listdir(self.Path)
+        except OSError as e:
+            logger.error("Could not use render cache directory '%s', using memory only: %r", self.Path, e)
+            self.Path = None
+            return
+        files = list()
+        for filename in filenames:
+            match = FILENAME_REGEX.match(filename)
+            if not match:
+                continue
+            stat = os.stat(os.path.join(self.Path, filename))
+            files.append((stat.st_mtime, match.groups(), stat.st_size))
+        with self._lock:
+            for _, (pageId, version, opthash), size in sorted(files):
+                self.Entries[(pageId, int(version), opthash)] = size
+                self.Size += size
+            self._evict()
+        logger.debug("Render cache loaded %s entries (%s bytes) from '%s'.", len(self.Entries), self.Size, self.Path)
+
+    def _filepath(self, key):
+        """ Returns the path of the cache file for key. """
+        return os.path.join(self.Path, "{}-{}-{}.html".format(*key))
+
+    def _key(self, pageId, version, options):
+        """ Returns the cache key, or None if version is not a version number. """
+        version = version_number(version)
+        if version is None:
+            return None
+        return (str(pageId), version, options_hash(options))
+
+    def get(self, pageId, version, options=None):
+        """ Returns the cached html for version <version> of page pageId rendered with options, or None. """
+        key = self._key(pageId, version, options)
+        with self._lock:
+            if key not in self.Entries:
+                self.Stats['misses'] += 1
+                return None
+            html = self._read(key)
+            if html is None:
+                self._remove(key)
+                self.Stats['misses'] += 1
+                return None
+            self.Entries[key] = self.Entries.pop(key)     # Most recently used.
+            self.Stats['hits'] += 1
+        return html
+
+    def put(self, pageId, version, html, options=None):
+        """ Stores the html rendered for version <version> of page pageId with options. """
+        key = self._key(pageId, version, options)
+        if key is None or html is None or not self.MaxBytes:
+            return
+        data = html.encode('utf-8') if isinstance(html, unicode) else html
+        if len(data) > self.MaxBytes:
+            logger.debug("Rendered html for page %s (%s bytes) is larger than the render cache.", pageId, len(data))
+            return
+        with self._lock:
+            if key in self.Entries:
+                self._remove(key)
+            if not self._write(key, data, html):
+                return
+            self.Entries[key] = len(data)
+            self.Size += len(data)
+            self.Stats['stored'] += 1
+            self._evict()
+
+    def invalidate(self, pageId, version=None):
+        """
+        Removes cached html for versions of page pageId older than version (all versions if version is None).
+        Used as page cache version callback, invoked when the page cache stores a page struct.
+        """
+        pageId, version = str(pageId), version_number(version)
+        with self._lock:
+            keys = [key for key in self.Entries if key[0] == pageId and (version is None or key[1] < version)]
+            for key in keys:
+                self._remove(key)
+            self.Stats['invalidated'] += len(keys)
+        if keys:
+            logger.debug("Render cache: removed %s entries for page %s older than version %s.", len(keys), pageId, version)
+
+    def clear(self):
+        """ Removes all entries. """
+        with self._lock:
+            for key in list(self.Entries):
+                self._remove(key)
+
+    def _evict(self):
+        """ Removes the least recently used entries until the size is at most self.MaxBytes (lock must be held). """
+        while self.Size > self.MaxBytes and self.Entries:
+            key = next(iter(self.Entries))
+            self._remove(key)
+            self.Stats['evicted'] += 1
+
+    def _remove(self, key):
+        """ Removes the entry for key and its file (lock must be held). """
+        self.Size -= self.Entries.pop(key, 0)
+        if self.Path is None:
+            self._memory.pop(key, None)
+            return
+        try:
+            os.remove(self._filepath(key))
+        except OSError as e:
+            logger.debug("Could not remove render cache file for %s: %r", key, e)
+
+    def _read(self, key):
+        """ Returns the html for key (as unicode), or None if it could not be read (lock must be held). """
+        if self.Path is None:
+            return self._memory.get(key)
+        filepath = self._filepath(key)
+        try:
+            with open(filepath, 'rb') as fd:
+                data = fd.read()
+            os.utime(filepath, None)    # The modification time orders the entries when loaded.
+        except (IOError, OSError) as e:
+            logger.warning("Could not read render cache file '%s': %r", filepath, e)
+            return None
+        return data.decode('utf-8')
+
+    def _write(self, key, data, html):
+        """
+        Writes data for key, to a temporary file which is then renamed so cache files are never half-written.
+        Returns True if successful (lock must be held).
+        """
+        if self.Path is None:
+            self._memory[key] = html
+            return True
+        filepath = self._filepath(key)
+        tmppath = filepath + '.tmp'
+        try:
+            with open(tmppath, 'wb') as fd:
+                fd.write(data)
+            if os.path.exists(filepath):
+                os.remove(filepath)     # On Windows, rename does not overwrite existing files.
+            os.rename(tmppath, filepath)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write render cache file '%s': %r", filepath, e)
+            return False
+        return True
+
+
+def get_render_cache(confighandler):
+    """
+    Returns the RenderCache for confighandler (registered as a confighandler singleton), creating it if needed.
+    The new cache is invalidated by the page cache when it stores a newer version of a page.
+    """
+    rendercache = confighandler.getSingleton(SINGLETON_KEY)
+    if rendercache is None:
+        path = confighandler.get('wiki_render_cache_dir')
+        if not path:
+            userconfig = getattr(confighandler, 'ConfigPaths', {}).get('user')
+            if userconfig and os.path.isfile(userconfig):
+                path = os.path.join(os.path.dirname(userconfig), RENDER_CACHE_DIRNAME)
+        rendercache = RenderCache(path, maxbytes=confighandler.get('wiki_render_cache_size', RENDER_CACHE_SIZE))
+        confighandler.setSingleton(SINGLETON_KEY, rendercache)
+        get_page_cache(confighandler).addVersionCallback(rendercache.invalidate)
+    return rendercache
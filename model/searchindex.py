@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable=C0103,W0212
+"""
+In-memory search index over experiments.
+
+ExperimentSearchIndex indexes expid, titles, foldername, wiki page title,
+subentry titles, dates and (already fetched) attachment names.
+It consists of:
+- an inverted index: token -> set of expids
+- a sorted vocabulary, used for prefix lookups ("RS1" matches "rs123")
+- a trigram index: trigram -> set of tokens, used for fuzzy (typo-tolerant) lookups.
+
+The index is updated incrementally: use attachManager() to have the index follow
+the manager's ExperimentsById and each experiment's Props/Subentries/Attachments,
+re-indexing only the experiments that actually changed.
+"""
+
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+TOKEN_REGEX = re.compile(r"\w+", re.UNICODE)
+# Experiment fields and their search weights:
+FIELD_WEIGHTS = {'expid': 4.0, 'title': 2.0, 'subentry': 1.5, 'date': 1.0, 'attachment': 1.0}
+
+
+def tokenize(text):
+    """ Returns a list of lower-case word tokens in text. """
+    if not text:
+        return list()
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def trigrams(token):
+    """ Returns the set of trigrams for token, padded so short tokens and word starts are represented. """
+    padded = "  " + token + " "
+    return set(padded[i:i+3] for i in range(len(padded) - 2))
+
+
+def normalize_date(date):
+    """ Returns a date as a yyyymmdd token; accepts datetime/date objects and date strings. """
+    if not date:
+        return None
+    if hasattr(date, 'strftime'):
+        return date.strftime("%Y%m%d")
+    digits = "".join(c for c in unicode(date) if c.isdigit())
+    return digits or None
+
+
+def experiment_fields(exp, attachments=None):
+    """
+    Returns a dict of field -> list of texts for experiment exp.
+    <attachments> is a list of attachment structs, e.g. the newvalue passed to 'Attachments' property callbacks.
+    If not given, attachments are only included if they have already been fetched; this never contacts the server.
+    """
+    props = exp.Props
+    titles = [props.get('exp_titledesc'), getattr(exp, 'Foldername', None), props.get('wiki_pagetitle')]
+    subentries = list()
+    dates = [normalize_date(props.get('date'))]
+    for subentry in props.get('exp_subentries', dict()).values():
+        subentries.append(subentry.get('subentry_titledesc'))
+        subentries.append(subentry.get('foldername'))
+        dates.append(normalize_date(subentry.get('date')))
+    if attachments is None:
+        attachments = getattr(exp, '_last_attachmentslist', None)
+    attachments = [att.get('fileName') for att in (attachments or list())]
+    return {'expid': [props.get('expid') or exp.Expid],
+            'title': titles,
+            'subentry': subentries,
+            'date': dates,
+            'attachment': attachments}
+
+
+class ExperimentSearchIndex(object):
+    """
+    Inverted + trigram index over experiment records.
+    Use search(query) to obtain a list of (expid, score) tuples, best match first.
+    """
+
+    def __init__(self, manager=None):
+        self._postings = defaultdict(dict)  # token -> {expid: weight}
+        self._tokensbyexpid = dict()        # expid -> set of tokens indexed for that experiment
+        self._signatures = dict()           # expid -> fields, used to skip re-indexing unchanged experiments
+        self._vocabulary = list()           # sorted list of tokens
+        self._trigrams = defaultdict(set)   # trigram -> set of tokens
+        self._ntrigrams = dict()            # token -> number of trigrams in token
+        self._experiments = dict()          # expid -> experiment, for experiments with registered callbacks
+        self.Manager = None
+        if manager is not None:
+            self.attachManager(manager)
+
+    def __len__(self):
+        return len(self._tokensbyexpid)
+
+    def __contains__(self, expid):
+        return expid in self._tokensbyexpid
+
+
+    ### Index maintenance ###
+
+    def _addToken(self, token, expid, weight):
+        postings = self._postings[token]
+        if not postings:
+            insort(self._vocabulary, token)
+            grams = trigrams(token)
+            self._ntrigrams[token] = len(grams)
+            for trigram in grams:
+                self._trigrams[trigram].add(token)
+        postings[expid] = max(weight, postings.get(expid, 0))
+
+    def _removeToken(self, token, expid):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.pop(expid, None)
+        if not postings:
+            del self._postings[token]
+            i = bisect_left(self._vocabulary, token)
+            if i < len(self._vocabulary) and self._vocabulary[i] == token:
+                del self._vocabulary[i]
+            del self._ntrigrams[token]
+            for trigram in trigrams(token):
+                self._trigrams[trigram].discard(token)
+                if not self._trigrams[trigram]:
+                    del self._trigrams[trigram]
+
+    def indexRecord(self, expid, fields):
+        """
+        Indexes (or re-indexes) a record given as a dict of field -> list of texts.
+        Returns False if the record was already indexed with identical fields.
+        """
+        if self._signatures.get(expid) == fields:
+            return False
+        self.removeRecord(expid)
+        tokens = set()
+        for field, texts in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for text in texts:
+                for token in tokenize(text):
+                    self._addToken(token, expid, weight)
+                    tokens.add(token)
+        self._tokensbyexpid[expid] = tokens
+        self._signatures[expid] = fields
+        return True
+
+    def removeRecord(self, expid):
+        """ Removes expid from the index. """
+        for token in self._tokensbyexpid.pop(expid, ()):
+            self._removeToken(token, expid)
+        self._signatures.pop(expid, None)
+
+    def indexExperiment(self, exp, expid=None, attachments=None):
+        """
+        Indexes experiment <exp>; returns True if the index was changed.
+        <attachments> is the experiment's newly fetched attachments list, if any (see experiment_fields).
+        """
+        fields = experiment_fields(exp, attachments)
+        expid = expid or fields['expid'][0]
+        if not expid:
+            logger.debug("Experiment %s has no expid, not indexing.", exp)
+            return False
+        return self.indexRecord(expid, fields)
+
+    def update(self, experimentsbyid):
+        """
+        Brings the index up to date with the experimentsbyid dict,
+        re-indexing changed experiments and removing experiments no longer present.
+        Returns the number of experiments (re-)indexed.
+        """
+        changed = 0
+        for expid in [expid for expid in self._tokensbyexpid if expid not in experimentsbyid]:
+            self.removeRecord(expid)
+            self._unwatchExperiment(expid)
+        for expid, exp in experimentsbyid.items():
+            if self.indexExperiment(exp, expid):
+                changed += 1
+            self._watchExperiment(expid, exp)
+        logger.debug("Search index updated, %s experiments (re-)indexed, %s experiments in index.", changed, len(self))
+        return changed
+
+
+    ### Callbacks ###
+
+    def attachManager(self, manager):
+        """
+        Indexes the manager's experiments and registers callbacks,
+        so the index is updated when experiments are added or changed.
+        """
+        self.Manager = manager
+        manager.registerPropertyCallback('ExperimentsById', self.update)
+        if manager._experimentsbyid is not None:
+            self.update(manager._experimentsbyid)
+
+    def _watchExperiment(self, expid, exp):
+        if self._experiments.get(expid) is exp:
+            return
+        self._unwatchExperiment(expid)
+        callback = lambda newvalue, exp=exp, expid=expid: self.indexExperiment(exp, expid)
+        for propkey in ('Props', 'Subentries', 'Expid'):
+            exp.registerPropertyCallback(propkey, callback)
+        # Experiment.Attachments invokes its callbacks before updating exp._last_attachmentslist:
+        attcallback = lambda newvalue, exp=exp, expid=expid: self.indexExperiment(exp, expid, attachments=newvalue)
+        exp.registerPropertyCallback('Attachments', attcallback)
+        exp._searchindex_callbacks = (callback, attcallback)
+        self._experiments[expid] = exp
+
+    def _unwatchExperiment(self, expid):
+        exp = self._experiments.pop(expid, None)
+        for callback in getattr(exp, '_searchindex_callbacks', ()):
+            exp.unregisterPropertyCallback(function=callback)
+
+
+    ### Lookup ###
+
+    def prefixTokens(self, prefix, limit=200):
+        """ Returns up to <limit> tokens in the vocabulary starting with <prefix>. """
+        vocabulary = self._vocabulary
+        i = bisect_left(vocabulary, prefix)
+        ret = list()
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix) and len(ret) < limit:
+            ret.append(vocabulary[i])
+            i += 1
+        return ret
+
+    def fuzzyTokens(self, token, threshold=0.5, limit=50):
+        """
+        Returns list of (token, similarity) for vocabulary tokens similar to <token>,
+        using the Dice coefficient of their trigram sets.
+        """
+        querygrams = trigrams(token)
+        counts = defaultdict(int)
+        for trigram in querygrams:
+            for candidate in self._trigrams.get(trigram, ()):
+                counts[candidate] += 1
+        ret = list()
+        for candidate, shared in counts.items():
+            similarity = 2.0 * shared / (len(querygrams) + self._ntrigrams[candidate])
+            if similarity >= threshold:
+                ret.append((candidate, similarity))
+        ret.sort(key=lambda tup: tup[1], reverse=True)
+        return ret[:limit]
+
+    @staticmethod
+    def _mergePostings(scores, postings, factor):
+        """ Updates scores[expid] with max(scores[expid], weight*factor) for each expid, weight in postings. """
+        if not scores and factor == 1.0:
+            scores.update(postings)
+            return
+        for expid, weight in postings.items():
+            weight *= factor
+            if weight > scores.get(expid, 0):
+                scores[expid] = weight
+
+    def search(self, query, limit=50, fuzzy=True):
+        """
+        Returns a list of (expid, score) tuples for experiments matching all words in query,
+        best match first. Each query word may match exactly or as a prefix; if a word has no such
+        matches and fuzzy is True, approximate matches are used. Exact matches score higher than
+        prefix matches, which score higher than fuzzy matches.
+        """
+        querytokens = tokenize(query)
+        if not querytokens:
+            return list()
+        scores = None
+        for querytoken in querytokens:
+            tokenscores = dict()
+            for token in self.prefixTokens(querytoken):
+                factor = 1.0 if token == querytoken else 0.8 * len(querytoken) / len(token)
+                self._mergePostings(tokenscores, self._postings[token], factor)
+            if fuzzy and not tokenscores and len(querytoken) >= 3:
+                for token, similarity in self.fuzzyTokens(querytoken):
+                    self._mergePostings(tokenscores, self._postings[token], similarity * 0.5)
+            if scores is None:
+                scores = tokenscores
+            else:
+                # All query words must match:
+                if len(tokenscores) < len(scores):
+                    scores, tokenscores = tokenscores, scores
+                scores = dict((expid, score + tokenscores[expid]) for expid, score in scores.items() if expid in tokenscores)
+            if not scores:
+                return list()
+        ret = sorted(scores.items(), key=lambda tup: (-tup[1], tup[0]))
+        return ret[:limit] if limit else ret
+
+    def searchExpids(self, query, limit=50, fuzzy=True):
+        """ Like search(), but returns only the expids. """
+        return [expid for expid, _ in self.search(query, limit=limit, fuzzy=fuzzy)]
@@ -32,6 +32,6 @@ logger = logging.getLogger(__name__)
 from abstract_clients import AbstractClient, AbstractXmlRpcClient
 
 
-from xmlrpcserverproxies import ConfluenceXmlRpcServerProxy
+from confluence_xmlrpc import ConfluenceXmlRpcClient, ConfluenceXmlRpcServerProxy
 ConfluenceXmlRpcServer = ConfluenceXmlRpcServerProxy
 
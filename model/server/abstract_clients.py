@@ -32,12 +32,17 @@ try:
 except ImportError:
     izip = zip
 import string
+import time
+import threading
 from Crypto.Cipher import AES
 from Crypto.Random import random as crypt_random
 import logging
 logger = logging.getLogger(__name__)
 
 # Labfluence modules and classes:
+from ratelimit import get_request_scheduler
+from circuitbreaker import CircuitBreaker, CLOSED, THRESHOLD, PROBE_DELAY, MAX_PROBE_DELAY
+from tokenstate import TokenStateCache, TOKEN_TRUST_TTL
 
 def display_message(message):
     """Simply prints a message to the user, making sure to properly format it."""
@@ -45,9 +50,7 @@ def display_message(message):
 
 
 # Decorators:
-#from ..decorators.cache_decorator import cached_property
-from .. import decorators
-cached_property = decorators.cached_decorator.cached_property
+from ..decorators.cache_decorator import cached_property
 
 __version__ = "0.1-dev"
 VERBOSE = 0
@@ -76,6 +79,12 @@ class AbstractClient(object):
         if not hasattr(self, 'CONFIG_FORMAT'):
             self.CONFIG_FORMAT = 'server_{}'
         self._raiseerrors = None # For temporary overwrite.
+        self._scheduler = None
+        self._breaker = None
+        self._tokenstates = None
+        self._loginthread = None
+        self.LoginPending = False           # True while autologinAsync() runs (read-only mode).
+        self.LoginPromptRequired = False    # True if autologinAsync() found no valid credentials.
 
     # Properties
     @property
@@ -226,9 +235,70 @@ class AbstractClient(object):
         else:
             return None
 
+    @property
+    def Scheduler(self):
+        """
+        The RequestScheduler limiting the rate of requests to the server, shared by all
+        clients using the same confighandler. Configured by the server params rate_limit,
+        rate_limit_burst and method_rate_limits (see ratelimit module).
+        """
+        if self._scheduler is None:
+            self._scheduler = get_request_scheduler(self.Confighandler, self.Serverparams)
+        return self._scheduler
+    @Scheduler.setter
+    def Scheduler(self, scheduler):
+        """ Sets the RequestScheduler used by this client. """
+        self._scheduler = scheduler
+
+    @property
+    def Breaker(self):
+        """
+        The CircuitBreaker that makes requests fail fast while the server is unreachable.
+        Configured by the server params breaker_threshold, breaker_probe_delay and
+        breaker_max_probe_delay (see circuitbreaker module).
+        """
+        if self._breaker is None:
+            self._breaker = CircuitBreaker(probe=self.ping, onchange=self.onBreakerStateChange,
+                                           threshold=self.getServerParam('breaker_threshold', THRESHOLD),
+                                           delay=self.getServerParam('breaker_probe_delay', PROBE_DELAY),
+                                           maxdelay=self.getServerParam('breaker_max_probe_delay', MAX_PROBE_DELAY))
+        return self._breaker
+
+    def onBreakerStateChange(self, state):
+        """ Invoked by self.Breaker when it opens or closes; updates the connection status. """
+        if state == CLOSED:
+            self.setok()
+        else:
+            self.notok()
+
+    def ping(self):
+        """
+        Returns True if the server can be reached (regardless of login), used as health check by self.Breaker.
+        Should be overridden by child classes with a request that does not require a valid login.
+        """
+        return self.test_connection()
+
+    @property
+    def TokenStates(self):
+        """
+        The TokenStateCache remembering when login tokens were last confirmed valid,
+        persisted in the config entry <CONFIG_FORMAT>logintoken_confirmed (see tokenstate module).
+        Tokens are trusted for the 'token_trust_ttl' server param seconds.
+        """
+        if self._tokenstates is None:
+            self._tokenstates = TokenStateCache(self.Confighandler, self.CONFIG_FORMAT.format('logintoken_confirmed'),
+                                                ttl=self.getServerParam('token_trust_ttl', TOKEN_TRUST_TTL))
+        return self._tokenstates
+
     @cached_property(ttl=30)
     def CachedConnectStatus(self):
-        """ Cached connection status, returning result of self.test_connection. """
+        """
+        Cached connection status, returning result of self.test_connection.
+        Is False without contacting the server while the circuit breaker is open,
+        and is updated when the connection status changes (setok/notok).
+        """
+        if self.Breaker.IsOpen:
+            return False
         return self.test_connection()
 
     @property
@@ -252,8 +322,10 @@ class AbstractClient(object):
 
     def setok(self):
         """ Invoke to indicate that the serverproxy is properly connected. """
+        self.Breaker.recordSuccess()
         if not self._connectionok:
             self._connectionok = True
+            self.CachedConnectStatus = True
             if self.Confighandler:
                 logger.debug("Invoking confighandler entry change callbacks for 'wiki_server_status'")
                 self.Confighandler.invokeEntryChangeCallback('wiki_server_status')
@@ -264,6 +336,7 @@ class AbstractClient(object):
         logger.debug("server.notok() invoked, earlier value of self._connectionok is: %s", self._connectionok)
         if self._connectionok is not False:
             self._connectionok = False
+            self.CachedConnectStatus = False
             if self.Confighandler:
                 # If you implement a per-object callback system (instead of having it all in the confighandler),
                 # This is a suitable candidate for a callback property.
@@ -293,6 +366,89 @@ class AbstractClient(object):
         """
         logger.warning("autologin called, but not implemented for class %s", self.__class__.__name__)
 
+    def autologinAsync(self, notify=True):
+        """
+        Logs in (using a stored token or credentials, never prompting) in a background thread,
+        so the UI can come up while the token is validated. Returns the thread.
+        While the login is pending, self.LoginPending is True and the client is in read-only mode:
+        writes are added to the outbound queue (see outboundqueue.is_offline), and requests
+        without a token wait for the login instead of starting their own.
+        A trusted token (see self.TokenStates) is used for requests right away.
+        When the login completes, the 'wiki_server_status' callbacks are invoked (switching to full mode),
+        and if no valid credentials were found while the server could be reached,
+        self.LoginPromptRequired is set; the UI should then call autologin() to prompt the user.
+        If notify is False, the callbacks are not invoked from the login thread when it completes;
+        the caller must then invoke them, e.g. from the UI main loop (see labfluence.finish_background_login).
+        """
+        if self.LoginPending:
+            return self._loginthread
+        token = self.Logintoken or self.storedToken()
+        if token and self.TokenStates.isTrusted(token):
+            logger.info("Using trusted login token (last confirmed %.0f s ago) while validating it.",
+                        time.time() - self.TokenStates.lastConfirmed(token))
+            self.useToken(token)
+        self.LoginPending = True
+        self.LoginPromptRequired = False
+        self._loginthread = threading.Thread(target=self._backgroundLogin, args=(notify, ), name="BackgroundLogin")
+        self._loginthread.daemon = True
+        self._loginthread.start()
+        if self.Confighandler:
+            self.Confighandler.invokeEntryChangeCallback('wiki_server_status')
+        return self._loginthread
+
+    def _backgroundLogin(self, notify=True):
+        """
+        Runs self.autologin(prompt='never') and ends the read-only mode (in the background login thread).
+        If notify is True, the 'wiki_server_status' callbacks are invoked when done.
+        """
+        token = None
+        try:
+            token = self.autologin(prompt='never')
+        except Exception as e:     # pylint: disable=W0703
+            logger.warning("%r raised during background login.", e)
+        finally:
+            self.LoginPromptRequired = not token and self.Breaker.Failures == 0
+            self.LoginPending = False
+            logger.info("Background login completed, logged in: %s", bool(token))
+            if notify and self.Confighandler:
+                self.Confighandler.invokeEntryChangeCallback('wiki_server_status')
+
+    def waitForLogin(self, timeout=None):
+        """
+        Waits for a pending background login to complete (unless called from the login thread).
+        Returns True if no login is pending anymore.
+        """
+        thread = self._loginthread
+        if self.LoginPending and thread is not None and thread is not threading.current_thread():
+            logger.debug("Waiting for background login to complete...")
+            thread.join(timeout)
+        return not self.LoginPending
+
+    def keepTrustedToken(self):
+        """
+        Invoked when the login token could not be validated because the server could not be reached.
+        Keeps a trusted token (see self.TokenStates), so it is used when the server is back,
+        instead of prompting the user. Returns the token, or None if no trusted token is available.
+        """
+        token = self.Logintoken or self.storedToken()
+        if token and self.TokenStates.isTrusted(token):
+            logger.info("Server could not be reached, keeping trusted login token.")
+            self.useToken(token)
+            return token
+        return None
+
+    def useToken(self, token):
+        """ Uses token for subsequent requests (without validating it). """
+        self.Logintoken = token
+
+    def storedToken(self):
+        """ Returns the login token stored in the config (decrypted), or None. Does not contact the server. """
+        try:
+            return self.getToken()
+        except (TypeError, ValueError, AttributeError) as e:
+            logger.debug("Could not get stored token: %r", e)
+            return None
+
     def getToken(self, token_crypt=None):
         """
         Get encrypted token from the confighandler and decrypt it.
@@ -429,8 +585,8 @@ class AbstractXmlRpcClient(AbstractClient):
         Using a lot of hasattr checks to make sure not to override in case this is set by class descendants.
         However, this could also be simplified using getattr...
         """
-        AbstractClient.__init__(serverparams=serverparams, username=username, password=password, logintoken=logintoken,
-                                url=url, confighandler=confighandler, autologin=autologin, VERBOSE=VERBOSE)
+        AbstractClient.__init__(self, serverparams=serverparams, username=username, password=password, logintoken=logintoken,
+                                confighandler=confighandler, autologin=autologin)
         logger.debug("AbstractXmlRpcClient init started.")
         #dict(host=None, url=None, port=None, protocol=None, urlpostfix=None)
         self._defaultparams = dict(host="localhost", port='80', protocol='http',
@@ -38,7 +38,10 @@ from abstract_clients import AbstractClient
 
 
 class RESTError(Exception):
-    """Any error"""
+    """Any error. StatusCode is the HTTP status code of the response (if available)."""
+    def __init__(self, message, status_code=None):
+        super(RESTError, self).__init__(message)
+        self.StatusCode = status_code
 
 
 class AbstractRestClient(AbstractClient):
@@ -95,6 +98,18 @@ class AbstractRestClient(AbstractClient):
             self.autologin()
         logger.debug("%s initialized.", self.__class__.__name__)
 
+    def ping(self):
+        """
+        Returns True if the server responds (any response below HTTP 500, authenticated or not);
+        used by self.Breaker to check if the server is back.
+        """
+        try:
+            r = self.Session.head(self._apiurl, timeout=self.getServerParam('timeout', 10))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.debug("%s, ping failed: %r", self.__class__.__name__, e)
+            return False
+        return r.status_code < 500
+
     def get(self, params=None, data=None, files=None):
         """
         Make a standard REST API HTTP GET request.
@@ -114,7 +129,7 @@ class AbstractRestClient(AbstractClient):
         Does brief processing of request, saving cookies and raising errors if needed.
         """
         if not request.ok:
-            raise RESTError(request.text)
+            raise RESTError(request.text, request.status_code)
         #self.Cookies.update(request.cookies) # Session handles cookies.
         return request
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Circuit breaker for server connectivity.
+
+When the server is down, every request waits for the socket timeout before failing.
+The client's CircuitBreaker counts consecutive connection failures, and after <threshold>
+failures it opens: requests then fail immediately (without contacting the server) while
+a single background health check (probe) is made on an exponential schedule,
+<delay>, 2 x <delay>, 4 x <delay>, ... (at most <maxdelay> seconds apart).
+When a probe succeeds, the breaker closes and requests are made as usual again.
+
+    closed  --(threshold consecutive failures)-->  open  --(probe)-->  half-open
+      ^                                             ^                     |
+      |                                             +------(failed)-------+
+      +---------------------------(succeeded)-----------------------------+
+
+The client is notified of state changes (it invokes setok()/notok(), which update its
+CachedConnectStatus and invoke the 'wiki_server_status' callbacks, e.g. the UI's server status).
+Note that a state change made by a probe is notified from the probe's timer thread, so callbacks
+touching Tk widgets must be registered through the UI's main loop dispatcher
+(see tkui.views.shared_ui_utils.MainLoopDispatcher).
+
+Server params (e.g. in the config entry 'wiki_serverparams'):
+- breaker_threshold:        consecutive connection failures before the breaker opens (default 2).
+- breaker_probe_delay:      seconds before the first probe (default 2).
+- breaker_max_probe_delay:  maximum seconds between probes (default 60).
+"""
+
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+THRESHOLD = 2
+PROBE_DELAY = 2.0
+MAX_PROBE_DELAY = 60.0
+
+
+class CircuitBreaker(object):
+    """
+    Opens after <threshold> consecutive failures, then probes with probe() in a background thread
+    until it returns True. onchange(state) is invoked (without holding the lock) when the state
+    changes between closed and open.
+    """
+
+    def __init__(self, probe, onchange=None, threshold=THRESHOLD, delay=PROBE_DELAY, maxdelay=MAX_PROBE_DELAY):
+        self.Probe = probe
+        self.OnChange = onchange
+        self.Threshold = threshold
+        self.Delay = delay
+        self.MaxDelay = maxdelay
+        self.State = CLOSED
+        self.Failures = 0       # Consecutive failures.
+        self.Probes = 0         # Probes made since the breaker opened.
+        self.Rejected = 0       # Requests rejected while open.
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @property
+    def IsOpen(self):
+        """ True if requests should not be made (the breaker is open or half-open). """
+        return self.State != CLOSED
+
+    @property
+    def NextDelay(self):
+        """ Seconds until the next probe. """
+        return min(self.Delay * 2**self.Probes, self.MaxDelay)
+
+    def allow(self):
+        """ Returns True if a request may be made, False (fail fast) if the breaker is open. """
+        if self.State == CLOSED:
+            return True
+        with self._lock:
+            self.Rejected += 1
+        return False
+
+    def recordSuccess(self):
+        """ Records a successful request, closing the breaker if it was open. """
+        with self._lock:
+            self.Failures = 0
+            if self.State == CLOSED:
+                return
+            self._close()
+        self._notify(CLOSED)
+
+    def recordFailure(self):
+        """ Records a connection failure, opening the breaker after <threshold> consecutive failures. """
+        with self._lock:
+            self.Failures += 1
+            if self.State != CLOSED or self.Failures < self.Threshold:
+                return
+            logger.info("Circuit breaker opened after %s consecutive connection failures; probing in %s s.",
+                        self.Failures, self.Delay)
+            self.State = OPEN
+            self.Probes = 0
+            self._schedule()
+        self._notify(OPEN)
+
+    def retry(self):
+        """
+        Lets the next request through even if the breaker is open (e.g. when the user asks to reconnect).
+        If that request fails, the breaker opens again and the probe schedule restarts.
+        """
+        with self._lock:
+            self._close()
+            self.Failures = max(self.Threshold - 1, 0)
+
+    def reset(self):
+        """ Closes the breaker and cancels the probe (e.g. before the client is discarded). """
+        with self._lock:
+            self.Failures = 0
+            self._close()
+
+    def _close(self):
+        """ Closes the breaker (the lock must be held). """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.State = CLOSED
+        self.Probes = 0
+
+    def _schedule(self):
+        """ Schedules the next probe (the lock must be held). """
+        self._timer = threading.Timer(self.NextDelay, self._probe)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _probe(self):
+        """ Makes a health check (in the timer thread), closing the breaker or scheduling the next probe. """
+        with self._lock:
+            if self.State != OPEN:
+                return
+            self.State = HALF_OPEN
+            self.Probes += 1
+        try:
+            ok = self.Probe()
+        except Exception as e:     # pylint: disable=W0703
+            logger.debug("Circuit breaker probe raised %r", e)
+            ok = False
+        with self._lock:
+            if self.State != HALF_OPEN:
+                return      # Closed by a successful request (or reset) during the probe.
+            if not ok:
+                self.State = OPEN
+                logger.debug("Circuit breaker probe %s failed, next probe in %s s.", self.Probes, self.NextDelay)
+                self._schedule()
+                return
+            logger.info("Circuit breaker probe succeeded, closing.")
+            self.Failures = 0
+            self._close()
+        self._notify(CLOSED)
+
+    def _notify(self, state):
+        """ Invokes self.OnChange(state). """
+        if self.OnChange is not None:
+            try:
+                self.OnChange(state)
+            except Exception as e:     # pylint: disable=W0703
+                logger.warning("%r raised by circuit breaker state change callback.", e)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Coalescing of identical in-flight read requests.
+
+Different views and model objects often request the same thing at the same time,
+e.g. several experiments and the file manager all calling getAttachments for a page,
+or the experiment manager and an experiment both calling getChildren for the root page.
+With a RequestCoalescer, the first of several identical calls (same method and arguments)
+makes the request, and calls made while it is in flight wait for it and share its result:
+
+    coalescer = RequestCoalescer()
+    result = coalescer.call(('getAttachments', pageId), server_function, pageId)
+
+Each waiting caller gets its own (deep) copy of the result, so callers can modify their
+structs without affecting each other. Errors raised by the request are raised in all callers.
+Calls with unhashable arguments are made without coalescing.
+
+Stats counts 'requests' (made) and 'coalesced' (calls that shared a request, i.e. saved round trips);
+Saved counts the coalesced calls by method.
+"""
+
+import sys
+import copy
+import threading
+from collections import Counter
+from six import reraise
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class InFlightCall(object):
+    """ A request in flight; Done is set when Result (or Error) is available. """
+
+    def __init__(self):
+        self.Done = threading.Event()
+        self.Result = None
+        self.Error = None   # exc_info tuple
+        self.Waiting = 0    # Number of identical calls waiting for the result.
+
+
+class RequestCoalescer(object):
+    """
+    Shares the result of an in-flight request between identical calls, identified by key
+    (a hashable tuple starting with the method name).
+    """
+
+    def __init__(self):
+        self.Stats = Counter()
+        self.Saved = Counter()
+        self._inflight = dict()
+        self._lock = threading.Lock()
+
+    def call(self, key, function, *args):
+        """
+        Returns function(*args), or (a copy of) the result of the identical in-flight call with key.
+        """
+        try:
+            hash(key)
+        except TypeError:
+            return function(*args)
+        with self._lock:
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = InFlightCall()
+                self.Stats['requests'] += 1
+            else:
+                inflight.Waiting += 1
+                self.Stats['coalesced'] += 1
+                self.Saved[key[0]] += 1
+        if not leader:
+            logger.debug("Waiting for in-flight request %s", key)
+            inflight.Done.wait()
+            if inflight.Error is not None:
+                reraise(*inflight.Error)
+            return copy.deepcopy(inflight.Result)
+        try:
+            inflight.Result = result = function(*args)
+        except Exception:
+            inflight.Error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                shared = inflight.Waiting > 0
+            inflight.Done.set()
+        # The waiting callers copy inflight.Result, so the caller making the request also gets a copy:
+        return copy.deepcopy(result) if shared else result
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,W0201
+"""
+Asynchronous client for the Confluence XML-RPC API.
+
+ConfluenceXmlRpcClient makes blocking requests, one at a time per thread. The AsyncConfluenceClient
+instead sends requests over a small pool of persistent HTTP(S) connections, with all I/O handled
+by an event loop on the calling thread, so hundreds of requests can be in flight without a thread per request.
+(The asyncore event loop from the standard library is used, since labfluence runs on python 2.)
+
+The client mirrors the method surface of ConfluenceXmlRpcClient (getPage, getChildren, getAttachments,
+storePage, addAttachment, search, ...), but the methods return AsyncCall objects immediately.
+The requests are performed when the event loop runs, i.e. by gather(), run() or AsyncCall.result():
+
+    aclient = AsyncConfluenceClient(client, connections=4)
+    calls = [aclient.getPage(pageId) for pageId in pageIds]     # returns immediately
+    structs = aclient.gather(calls)                             # runs the event loop until all calls are done
+
+The login token, logins (if the token has expired) and the server connection status (setok/notok)
+are managed by the ConfluenceXmlRpcClient given as <client>.
+Each request acquires a token from the client's RequestScheduler (see the ratelimit module) without
+blocking the event loop: calls that are not allowed yet stay pending until the rate limit allows them.
+Like ConfluenceXmlRpcClient.execute(), gather() returns None for calls that failed;
+the exception is available as call.Error, and AsyncCall.result() raises it.
+
+The client is not thread safe; use it from a single thread.
+"""
+
+from __future__ import print_function, division
+try:
+    import xmlrpclib # pylint: disable=E0611,F0401
+except ImportError:
+    import xmlrpc.client as xmlrpclib
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+import asyncore
+import errno
+import socket
+import ssl
+import sys
+import time
+from collections import deque, Counter
+
+import logging
+logger = logging.getLogger(__name__)
+
+CONNECTIONS = 4
+TIMEOUT = 60
+
+
+class AsyncCall(object):
+    """
+    The result of an asynchronous call (a simple future).
+    Callbacks added with addCallback(func) are invoked as func(call) when the call is done.
+    """
+
+    def __init__(self, client, method, args):
+        self.Client = client
+        self.Method = method
+        self.Args = args
+        self.Value = None
+        self.Error = None
+        self.Done = False
+        self.Attempts = 0
+        self.Started = None
+        self.Callbacks = list()
+
+    def __repr__(self):
+        return "<AsyncCall {}{} {}>".format(self.Method, self.Args, "done" if self.Done else "pending")
+
+    def addCallback(self, func):
+        """ Adds func, invoked as func(call) when the call is done (immediately if it already is). """
+        if self.Done:
+            func(self)
+        else:
+            self.Callbacks.append(func)
+
+    def result(self, timeout=None):
+        """
+        Runs the event loop until the call is done and returns the value.
+        Raises the call's error if it failed, or socket.timeout if it is not done within timeout seconds.
+        """
+        self.Client.run(until=[self], timeout=timeout)
+        if not self.Done:
+            raise socket.timeout("{} not done after {} seconds".format(self, timeout))
+        if self.Error is not None:
+            raise self.Error
+        return self.Value
+
+    def finish(self, value=None, error=None):
+        """ Marks the call as done with value or error and invokes the callbacks. """
+        self.Value, self.Error, self.Done = value, error, True
+        for func in self.Callbacks:
+            try:
+                func(self)
+            except Exception as e:     # pylint: disable=W0703
+                logger.warning("%r raised by callback %s for %s", e, func, self)
+
+
+class XmlRpcConnection(asyncore.dispatcher):
+    """
+    A persistent HTTP(S) connection to the XML-RPC server, performing one request at a time.
+    Connections are created and closed by the AsyncConfluenceClient.
+    """
+
+    def __init__(self, client):
+        asyncore.dispatcher.__init__(self, map=client.SocketMap)
+        self.Client = client
+        self.Call = None
+        self.Requests = 0           # Number of requests sent on this connection.
+        self._outbuf = b''
+        self._inbuf = b''
+        self._handshaking = False
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((client.Host, client.Port))
+
+    def send(self, data):
+        try:
+            return asyncore.dispatcher.send(self, data)
+        except ssl.SSLError as e:
+            if e.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE):
+                return 0
+            raise
+
+    def recv(self, buffer_size):
+        try:
+            return asyncore.dispatcher.recv(self, buffer_size)
+        except ssl.SSLError as e:
+            if e.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE):
+                return b''
+            raise
+
+    def startRequest(self, call, request):
+        """ Sends the HTTP request (bytes) for call. """
+        self.Call = call
+        self.Requests += 1
+        self._outbuf = request
+        self._inbuf = b''
+        self._headers = None
+
+    def handle_connect(self):
+        if self.Client.UseSSL:
+            self.socket = self.Client.SSLContext.wrap_socket(self.socket, server_hostname=self.Client.Host,
+                                                             do_handshake_on_connect=False)
+            self._handshaking = True
+            self._doHandshake()
+
+    def _doHandshake(self):
+        try:
+            self.socket.do_handshake()
+        except ssl.SSLError as e:
+            if e.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE):
+                return
+            raise
+        self._handshaking = False
+
+    def readable(self):
+        return self._handshaking or self.Call is not None or not self.connected
+
+    def writable(self):
+        return not self.connected or self._handshaking or bool(self._outbuf)
+
+    def handle_write(self):
+        if self._handshaking:
+            self._doHandshake()
+            return
+        sent = self.send(self._outbuf)
+        self._outbuf = self._outbuf[sent:]
+
+    def handle_read(self):
+        if self._handshaking:
+            self._doHandshake()
+            return
+        data = self.recv(65536)
+        if not data:
+            return
+        if self.Call is None:
+            logger.debug("Unexpected data received on idle connection, closing connection.")
+            self.close()
+            return
+        self._inbuf += data
+        self._parseResponse()
+
+    def _parseResponse(self, closed=False):
+        """ Completes the current call if the complete response has been received. """
+        if self._headers is None:
+            end = self._inbuf.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            lines = self._inbuf[:end].decode('latin-1').split('\r\n')
+            self._inbuf = self._inbuf[end+4:]
+            version, _, status = lines[0].partition(' ')
+            self._status = status
+            self._headers = dict((key.strip().lower(), value.strip())
+                                 for key, _, value in (line.partition(':') for line in lines[1:]))
+            self._keepalive = version != 'HTTP/1.0' and self._headers.get('connection', '').lower() != 'close'
+        if self._headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = self._dechunk()
+        elif 'content-length' in self._headers:
+            length = int(self._headers['content-length'])
+            body = self._inbuf[:length] if len(self._inbuf) >= length else None
+        else:
+            # Body is terminated by closing the connection:
+            self._keepalive = False
+            body = self._inbuf if closed else None
+        if body is None:
+            return
+        call, self.Call = self.Call, None
+        if not self._keepalive:
+            self.close()
+        self.Client.handleResponse(self, call, self._status, self._headers, body)
+
+    def _dechunk(self):
+        """ Returns the body of a chunked response, or None if it is not complete. """
+        body, pos = [], 0
+        while True:
+            end = self._inbuf.find(b'\r\n', pos)
+            if end < 0:
+                return None
+            size = int(self._inbuf[pos:end].split(b';')[0], 16)
+            if size == 0:
+                return b''.join(body)
+            if len(self._inbuf) < end + 2 + size + 2:
+                return None
+            body.append(self._inbuf[end+2:end+2+size])
+            pos = end + 2 + size + 2
+
+    def handle_close(self):
+        if self.Call is not None and self._headers is not None:
+            # Response terminated by closing the connection:
+            self._parseResponse(closed=True)
+        self.close()
+
+    def handle_error(self):
+        e = sys.exc_info()[1]
+        logger.debug("%r on connection to %s:%s", e, self.Client.Host, self.Client.Port)
+        self._error = e
+        self.close()
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self.Client.connectionClosed(self, getattr(self, '_error', None))
+
+
+class AsyncConfluenceClient(object):
+    """
+    Asynchronous Confluence XML-RPC client using a pool of persistent connections, see module docstring.
+    - client:       ConfluenceXmlRpcClient providing the AppUrl, login token, logins and connection status.
+    - connections:  maximum number of concurrent connections (and requests in flight).
+    - timeout:      seconds before a request is aborted.
+    - sslcontext:   ssl.SSLContext used for https connections (default: ssl.create_default_context()).
+    """
+
+    def __init__(self, client, connections=CONNECTIONS, timeout=TIMEOUT, sslcontext=None):
+        self.Client = client
+        self.MaxConnections = connections
+        self.Timeout = timeout
+        url = urlparse(client.AppUrl)
+        self.UseSSL = url.scheme == 'https'
+        self.Host = url.hostname
+        self.Port = url.port or (443 if self.UseSSL else 80)
+        self.Path = url.path + ('?' + url.query if url.query else '')
+        self.HostHeader = url.netloc.rpartition('@')[2]
+        if self.UseSSL and sslcontext is None:
+            sslcontext = ssl.create_default_context()
+        self.SSLContext = sslcontext
+        self.SocketMap = dict()         # asyncore socket map used by this client's connections.
+        self.Connections = list()
+        self.Pending = deque()          # Calls waiting for a free connection.
+        self.Stats = Counter()          # calls, requests, connections, retries, failed
+
+    def close(self):
+        """ Closes all connections. """
+        for connection in list(self.Connections):
+            connection.close()
+
+    def call(self, method, *args):
+        """
+        Starts an asynchronous call of the confluence2.<method> API method with args (without the token).
+        Returns an AsyncCall.
+        """
+        call = AsyncCall(self, method, args)
+        self.Stats['calls'] += 1
+        self.Pending.append(call)
+        self._dispatch()
+        return call
+
+    def _dispatch(self):
+        """
+        Sends pending calls on idle connections, opening new connections as needed.
+        Calls not allowed by the client's rate limits (self.Client.Scheduler) are left pending.
+        """
+        while self.Pending:
+            connection = next((connection for connection in self.Connections if connection.Call is None), None)
+            if connection is None and len(self.Connections) >= self.MaxConnections:
+                return
+            if self.Client.Scheduler.acquire(self.Pending[0].Method, timeout=0) is None:
+                self.Stats['ratelimited'] += 1
+                return
+            if connection is None:
+                connection = XmlRpcConnection(self)
+                self.Connections.append(connection)
+                self.Stats['connections'] += 1
+            call = self.Pending.popleft()
+            token = self.Client.Logintoken
+            if not token and self.Client.AutologinEnabled:
+                token = self.Client.autologin()
+            if not token:
+                call.finish(error=socket.error("No login token available for {}".format(call.Method)))
+                continue
+            try:
+                body = xmlrpclib.dumps((token, ) + call.Args, 'confluence2.' + call.Method)
+            except (TypeError, ValueError) as e:
+                call.finish(error=e)
+                continue
+            if not isinstance(body, bytes):
+                body = body.encode('utf-8')
+            request = ("POST {} HTTP/1.1\r\nHost: {}\r\nUser-Agent: labfluence\r\nContent-Type: text/xml\r\n"
+                       "Content-Length: {}\r\n\r\n").format(self.Path, self.HostHeader, len(body)).encode('latin-1') + body
+            call.Attempts += 1
+            call.Started = time.time()
+            connection.startRequest(call, request)
+            self.Stats['requests'] += 1
+
+    def handleResponse(self, connection, call, status, headers, body):
+        """ Invoked by connection when the response for call has been received. """
+        if not status.startswith('200'):
+            code, _, reason = status.partition(' ')
+            self._fail(call, xmlrpclib.ProtocolError(self.Client.AppUrl, int(code), reason, headers))
+            return
+        try:
+            value = xmlrpclib.loads(body, use_datetime=True)[0][0]
+        except xmlrpclib.Fault as e:
+            self.Client.setok()
+            cause = self.Client.determineFaultCause(e)
+            if cause == 'TokenExpired' and call.Attempts < 2 and self.Client.AutologinEnabled:
+                logger.info("Login token expired, logging in and retrying %s", call)
+                self.Client.Logintoken = None
+                self._retry(call)
+            else:
+                self._fail(call, e)
+            return
+        except Exception as e:     # pylint: disable=W0703
+            self._fail(call, e)
+            return
+        self.Client.setok()
+        call.finish(value)
+        self._dispatch()
+
+    def connectionClosed(self, connection, error=None):
+        """ Invoked when connection is closed; retries or fails the call in progress (if any). """
+        if connection in self.Connections:
+            self.Connections.remove(connection)
+        call, connection.Call = connection.Call, None
+        if call is not None:
+            if connection.Requests > 1 and call.Attempts < 2:
+                # A reused (keep-alive) connection may have been closed by the server before the request was received.
+                self._retry(call)
+            else:
+                self.Client.notok()
+                self._fail(call, error or socket.error(errno.ECONNRESET, "Connection closed before response was received"))
+        self._dispatch()
+
+    def _retry(self, call):
+        self.Stats['retries'] += 1
+        self.Pending.appendleft(call)
+        self._dispatch()
+
+    def _fail(self, call, error):
+        logger.info("%s failed: %r", call, error)
+        self.Stats['failed'] += 1
+        call.finish(error=error)
+        self._dispatch()
+
+    def _checkTimeouts(self):
+        """ Aborts calls that have been in progress for more than self.Timeout seconds. """
+        now = time.time()
+        for connection in list(self.Connections):
+            call = connection.Call
+            if call is not None and now - call.Started > self.Timeout:
+                connection.Call = None
+                connection.close()
+                self.Client.notok()
+                self._fail(call, socket.timeout("{} timed out after {} seconds".format(call, self.Timeout)))
+
+    def run(self, until=None, timeout=None):
+        """
+        Runs the event loop until the calls in <until> are done (default: until all calls are done),
+        or at most <timeout> seconds.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            if until is not None:
+                if all(call.Done for call in until):
+                    return
+            elif not self.Pending and not any(connection.Call for connection in self.Connections):
+                return
+            if deadline is not None and time.time() > deadline:
+                return
+            self._dispatch()
+            if self.SocketMap:
+                asyncore.loop(timeout=0.05, map=self.SocketMap, count=1)
+            else:
+                time.sleep(0.01)    # No connections, calls are waiting for the rate limit.
+            self._checkTimeouts()
+
+    def gather(self, calls, timeout=None):
+        """
+        Runs the event loop until all calls are done and returns a list with their values
+        (None for calls that failed or are not done within timeout seconds).
+        """
+        calls = list(calls)
+        self.run(until=calls, timeout=timeout)
+        return [call.Value if call.Done and call.Error is None else None for call in calls]
+
+    def map(self, method, argslist, timeout=None):
+        """ Calls method concurrently for each tuple of args in argslist; returns the list of values (see gather). """
+        return self.gather([self.call(method, *args) for args in argslist], timeout=timeout)
+
+
+    ##########################################
+    #### Methods mirroring the sync client ###
+    ##########################################
+
+    def getServerInfo(self):
+        """ Returns the server info struct (AsyncCall). """
+        return self.call('getServerInfo')
+
+    def getPage(self, pageId=None, spaceKey=None, pageTitle=None):
+        """ Returns a page struct, by pageId or by spaceKey and pageTitle (AsyncCall). """
+        if pageId:
+            return self.call('getPage', str(pageId))
+        elif spaceKey and pageTitle:
+            return self.call('getPage', spaceKey, pageTitle)
+        raise ValueError("Must specify either pageId or spaceKey/pageTitle.")
+
+    def getChildren(self, pageId):
+        """ Returns the direct children of a page as PageSummary structs (AsyncCall). """
+        return self.call('getChildren', str(pageId))
+
+    def getDescendents(self, pageId):
+        """ Returns all descendents of a page as PageSummary structs (AsyncCall). """
+        return self.call('getDescendents', str(pageId))
+
+    def getAttachments(self, pageId):
+        """ Returns the attachments of a page (AsyncCall). """
+        return self.call('getAttachments', str(pageId))
+
+    def addAttachment(self, contentId, attachment_struct, attachmentData):
+        """ Adds an attachment to a page, see ConfluenceXmlRpcClient.addAttachment (AsyncCall). """
+        return self.call('addAttachment', contentId, attachment_struct, attachmentData)
+
+    def storePage(self, page_struct):
+        """ Adds or updates a page (AsyncCall). """
+        return self.call('storePage', page_struct)
+
+    def updatePage(self, page_struct, pageUpdateOptions):
+        """ Updates a page (AsyncCall). """
+        return self.call('updatePage', page_struct, pageUpdateOptions)
+
+    def search(self, query, maxResults, parameters=None):
+        """ Searches for pages and other content (AsyncCall). """
+        if parameters:
+            return self.call('search', query, parameters, maxResults)
+        return self.call('search', query, maxResults)
@@ -16,26 +16,98 @@
 ##
 # pylint: disable=C0103,C0301,W0142,R0902,R0904,R0913,R0201,R0912
 """
-Abstract REST client module. Provides Abstract REST client base classes.
+Confluence REST client module.
 
-Abstract clients serves two purposes:
-1) Define a standard "client" interface, specifying what methods and
-properties a server is expected to implement.
-2) Define some of the basic client functionality which is common
-to all implemented server proxies, e.g. properties, etc.
+ConfluenceRestClient talks to the REST API of a Confluence server (/rest/api) using a requests.Session,
+which keeps the HTTP connection (and the login session cookie) alive between requests.
 
+The client implements the same 'labfluence server' interface as ConfluenceXmlRpcClient and returns
+data in the same format as Confluence's xml-rpc API (page structs, page summaries, attachment structs
+and search results, with string ids and versions), so it can be used as a drop-in alternative
+(set config entry 'wiki_server_api' to 'rest').
+
+Collections in the REST API are paginated; the client follows the '_links.next' link of each
+response until all results have been received. The 'expand' parameter is used to get related
+data in the same request, e.g. getChildPages() gets the child pages of a page with their
+bodies, versions and attachment metadata in a single request per <limit> pages,
+where the XML-RPC API requires a getPage and a getAttachments call for every child page.
+
+Authentication is either HTTP basic auth (username/password), or a personal access token
+(Confluence 7.9+) given as logintoken or in config entry 'wiki_personal_access_token'.
+
+Like ConfluenceXmlRpcClient.execute(), request() catches connection errors (invoking self.notok()
+and returning None); HTTP errors are raised as RESTError, with the HTTP status as StatusCode.
 """
 
 
 from __future__ import print_function, division
+import base64
+from datetime import datetime
+try:
+    import xmlrpclib # pylint: disable=E0611,F0401
+except ImportError:
+    import xmlrpc.client as xmlrpclib
+import requests
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-from abstract_rest_client import AbstractRestClient
+from serverutils import login_prompt
+from abstract_rest_client import AbstractRestClient, RESTError
+from pagesearch import SearchCoordinator, SearchStrategy, filter_rank
+
+
+# Expansions used to get complete pages and page summaries:
+PAGE_EXPAND = 'space,version,body.storage,ancestors,history'
+SUMMARY_EXPAND = 'space,ancestors'
+# Expansions used by getChildPages; the parent is known, so ancestors are not needed:
+CHILDPAGE_EXPAND = 'space,version,body.storage,history,children.attachment.version'
+PAGE_LIMIT = 100    # Results requested per request; the server may return fewer.
+# xml-rpc search parameter 'modified' values as CQL date functions:
+CQL_MODIFIED = dict(TODAY='startOfDay()', YESTERDAY='startOfDay("-1d")',
+                    LASTWEEK='startOfWeek("-1w")', LASTMONTH='startOfMonth("-1M")')
+MOVE_POSITIONS = dict(above='before', below='after', append='append')
+
+
+def parse_datetime(value):
+    """
+    Returns a datetime for an ISO 8601 timestamp from the REST API, e.g. "2014-05-14T12:01:02.000+02:00".
+    The time zone is ignored, i.e. the datetime is in the server's local time (like datetimes from xml-rpc).
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        logger.debug("Could not parse timestamp %r", value)
+        return None
 
 
+def cql_quote(value):
+    """ Returns value as a quoted CQL string. """
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def search_cql(query, parameters=None):
+    """
+    Converts an xml-rpc search query and parameters (spaceKey, type, modified, contributor)
+    to a CQL query for the REST API's content search.
+    """
+    clauses = ['text ~ {}'.format(cql_quote(query))] if query else []
+    for key, value in sorted((parameters or {}).items()):
+        if key == 'spaceKey':
+            clauses.append('space = {}'.format(cql_quote(value)))
+        elif key == 'type':
+            clauses.append('type = {}'.format(cql_quote(value)))
+        elif key == 'contributor':
+            clauses.append('contributor = {}'.format(cql_quote(value)))
+        elif key == 'modified' and value in CQL_MODIFIED:
+            clauses.append('lastmodified >= {}'.format(CQL_MODIFIED[value]))
+        else:
+            logger.warning("Search parameter %s=%r is not supported by the REST client, ignoring.", key, value)
+    return " and ".join(clauses)
+
 
 class ConfluenceRestClient(AbstractRestClient):
     """
@@ -44,56 +116,757 @@ class ConfluenceRestClient(AbstractRestClient):
     Introduced summer 2014.
 
     These methods are part of the standard 'labfluence server' API,
-    defined by AbstractServerProxy (asterix marks platform-dependent methods):
+    and return data in the same format as ConfluenceXmlRpcClient:
     - login
     - logout
     - getServerInfo
-    - getSpaces (if applicable)
+    - getSpaces
     - getUser
-    - createUser
-    - getGroups*
-    - getGroup*
     - getPages
     - getPage
     - movePage
     - removePage
-    - getChildren*
-    - getDescendents*
-    - getComments*
-    - getComment*
-    - addComment*
-    - editComment*
-    - removeComment*
-    - getPageAttachments
+    - getAncestors
+    - getChildren
+    - getDescendents
+    - getComments
+    - getComment
+    - addComment
+    - editComment
+    - removeComment
+    - getAttachments
     - getAttachment
     - getAttachmentData
     - addAttachment
-    - moveAttachment
     - removeAttachment
-    - storePage (or should I have add/save/updatePage methods?)
-    - addPage
-    - savePage
+    - storePage
     - updatePage
+    - convertWikiToStorageFormat
+    - renderContent
+    - search
+    - searchForWikiPage
+
+    Additionally, getChildPages() returns the full child pages of a page (with attachments),
+    and getPaginated() / request() can be used for generic queries to the REST API.
 
-    Addotionally, RESTful serverproxies should provide generic query methods
-    to the REST API. (This will usually be the case anyways...)
-
-    One thing I might consider: Implement REST API via an extremely SIMPLE
-    ServerProxy which SIMULATES the XML-RPC format.
-    Then consume this through ConfluenceXmlRpcServerProxy,
-    specifying self.RpcServer as this simulating server.
-    Then I would't have to change a thing in the rest of the
-    labfluence code, it would "just work".
-    On the other hand: Since logging in and error/exception handling
-    is so different - and since that is mostly what this feature would
-    utilize, this is probably a poor strategy.
-    It is probably better to implement the REST api from scratch,
-    keeping things as simple as possible.
-    Methods could take a
-       dataformat="confluencexmlrpc"
-    parameter, which would ensure that the returned data format is compatible
-    with the data returned by Confluence's old xml-rpc api.
+    Example usage:
+    >>> client = ConfluenceRestClient({'baseurl': "https://example.com"}, username='jdoe', password='miss/gi')
+    >>> client.getPage(spaceKey='~jdoe', pageTitle='RS102 Some experiment')['version']
 
     """
-    pass
+    def __init__(self, serverparams=None, username=None, password=None, logintoken=None,
+                 confighandler=None, autologin=True):
+        """
+        Use serverparams dict to specify API parameters, which may include entries:
+        * resturl : url of the REST API, e.g. https://example.com/rest/api
+        * appurl : <baseurl>:<urlpostfix>   - main API entry point; an xml-rpc url (ending with /rpc/xmlrpc)
+                   is converted to the REST API url of the same server.
+        * baseurl : <protocol>:<hostname>[:port]
+        * urlpostfix : path to the API, default '/rest/api'
+        * hostname : e.g "localhost", "127.0.0.1" or wiki.cdna.au.dk
+        * post : e.g. 80, 443, 8080, etc.
+        * protocol : e.g. 'http', 'https'.
+        * timeout : seconds to wait for a response (default 10).
+        If e.g. appurl is not explicitly specified, it is generated from the noted sub-components.
+        """
+        logger.debug("New %s initializing...", self.__class__.__name__)
+        self.CONFIG_FORMAT = 'wiki_{}'
+        super(ConfluenceRestClient, self).__init__(serverparams=serverparams, username=username,
+                                                   password=password, logintoken=logintoken,
+                                                   confighandler=confighandler, autologin=autologin)
+        self._defaultparams = dict(port='8090', urlpostfix='/rest/api', protocol='https')
+        self._contexturl = None
+        self._searchcoordinator = None
+        self.setup_rest_api()
+
+    def setup_rest_api(self):
+        """ Sets up the requests session (see AbstractRestClient.setup_rest_api). """
+        apiurl = self.AppUrl
+        if apiurl:
+            self._contexturl = apiurl[:-len('/rest/api')] if apiurl.endswith('/rest/api') else apiurl
+        super(ConfluenceRestClient, self).setup_rest_api()
+
+    @property
+    def AppUrl(self):
+        """
+        Returns the url of the REST API, from serverparams 'resturl' or 'appurl' (converting
+        an xml-rpc url to the REST url on the same server) or <baseurl>/rest/api.
+        """
+        url = self.getServerParam('resturl') or super(ConfluenceRestClient, self).AppUrl
+        if not url:
+            return url
+        url = url.rstrip('/')
+        if url.endswith('/rpc/xmlrpc'):
+            url = url[:-len('/rpc/xmlrpc')] + '/rest/api'
+        return url
+
+    @property
+    def Timeout(self):
+        """ Seconds to wait for the server to respond (serverparams 'timeout'). """
+        return self.getServerParam('timeout', 10)
+
+
+    ##############################
+    #### Login and requests ######
+    ##############################
+
+    @staticmethod
+    def authorizationHeader(username=None, password=None, token=None):
+        """ Returns the Authorization header for a personal access token or basic auth with username and password. """
+        if token:
+            return 'Bearer ' + token
+        userpass = u'{}:{}'.format(username, password).encode('utf-8')
+        return 'Basic ' + base64.b64encode(userpass).decode('ascii')
+
+    def _testConnection(self, authorization=None):
+        """
+        Requests the current user, using the Authorization header <authorization> (default: the session's).
+        Returns the user dict if authenticated and None otherwise.
+        Does not catch connection errors.
+        """
+        headers = {'Authorization': authorization} if authorization else None
+        r = self.Session.get(self._apiurl + '/user/current', headers=headers, timeout=self.Timeout)
+        if r.status_code in (401, 403):
+            return None
+        user = self.process_request(r).json()
+        if user.get('type') == 'anonymous':
+            return None
+        return user
+
+    def test_connection(self):
+        """ Returns True if the server can be reached and the session is authenticated. """
+        try:
+            return bool(self._testConnection())
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.info("%s, connection error while testing connection: %s", self.__class__.__name__, e)
+            return False
+
+    def test_token(self, logintoken=None, doset=True):
+        """
+        Test a personal access token. If token=None, will test self.Logintoken.
+        If doset=True (default), and the token proves valid, the token is used for subsequent requests.
+        Returns True if the token is valid, False if not, and None if no token was provided.
+        The result is recorded in self.TokenStates.
+        """
+        if logintoken is None:
+            logintoken = self.Logintoken
+        if not logintoken:
+            logger.info("%s.test_token() :: No token provided, aborting...", self.__class__.__name__)
+            return None
+        authorization = self.authorizationHeader(token=logintoken)
+        if not self._testConnection(authorization):
+            logger.debug("%s.test_token() : tested token of length %s did not work.", self.__class__.__name__, len(logintoken))
+            self.TokenStates.reject(logintoken)
+            return False
+        self.TokenStates.confirm(logintoken)
+        if doset:
+            self.Logintoken = logintoken
+            self.Session.headers['Authorization'] = authorization
+            self.setok()
+        return True
+
+    def promptForUserPass(self, username=None, msg=None):
+        """
+        Prompts for user credentials, using either the registrered UI,
+        if it has an attribute login_prompt, or else using standard
+        terminal prompt.
+        """
+        if self.UI and hasattr(self.UI, 'login_prompt'):
+            promptfun = self.UI.login_prompt
+        else:
+            promptfun = login_prompt
+        return promptfun(username=username, msg=msg, options=self.Loginpromptoptions)
+
+    def login(self, username=None, password=None, doset=True,
+              prompt=False, retry=3, dopersist=True, msg=None):
+        """
+        Attempt server login with username and password (HTTP basic auth).
+        If prompt is True, then username and password will be obtained by prompting the user.
+        If doset is True, the credentials are used for subsequent requests.
+        Returns True if the login succeeded and None otherwise.
+        dopersist is accepted for compatibility with ConfluenceXmlRpcClient.login;
+        basic auth does not produce a token, and passwords are never persisted.
+        Like ConfluenceXmlRpcClient.login, this does not catch connection errors.
+        """
+        logger.debug("server.login invoked, retry=%s, prompt=%s, msg=%s", retry, prompt, msg)
+        if retry < 0:
+            return None
+        username = username or self.Username
+        password = password or self.Password
+        if prompt is True:
+            username, password = self.promptForUserPass(username=username, msg=msg)
+        if not (username and password):
+            logger.info("%s :: Username or password is boolean False.", self.__class__.__name__)
+            if password is None or not prompt:
+                return None
+            return self.login(username, doset=doset, prompt=prompt, retry=retry-1,
+                              msg="Empty username or password; please try again. Use Ctrl+C (or cancel) to cancel.")
+        authorization = self.authorizationHeader(username, password)
+        if not self._testConnection(authorization):
+            err_msg = "Login failed for user '%s' - incorrect username/password combination?" % username
+            logger.info(err_msg)
+            if not prompt and self._password:
+                # Make sure automatic login attempts will not try to use the password again.
+                self._password = None
+            if prompt and int(retry) > 0:
+                return self.login(username, doset=doset, prompt=prompt, retry=retry-1, msg=err_msg)
+            return None
+        if doset:
+            self.Session.headers['Authorization'] = authorization
+            self.setok()
+            if self.Loginpromptoptions.get('save_username_inmemory', True):
+                self._username = username
+            if self.Loginpromptoptions.get('save_password_inmemory', True):
+                self._password = password
+        logger.info("Logged in as '%s' (REST API, basic auth)", username)
+        return True
+
+    def autologin(self, prompt='auto'):
+        """
+        Logs in using (in order) a personal access token (self.Logintoken or config entry
+        'wiki_personal_access_token'), the username and password, or a login prompt.
+        prompt is 'never', 'auto' or 'force', see ConfluenceXmlRpcClient.autologin.
+        Invokes self.setok/notok and returns True if logged in.
+        """
+        logger.debug("%s.autologin(prompt='%s') invoked.", self.__class__.__name__, prompt)
+        ok = None
+        unreachable = False
+        try:
+            if prompt in ('force', ):
+                ok = self.login(prompt=True)
+            else:
+                token = self._logintoken or self.storedToken()
+                if token and self.test_token(token, doset=True):
+                    ok = True
+                elif self.Username and self.Password and self.login(doset=True):
+                    ok = True
+                elif prompt in ('auto', ):
+                    ok = self.login(prompt=True)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning("%s - connection error prevented login: %s", self.__class__.__name__, e)
+            self.Breaker.recordFailure()
+            unreachable = True
+            self.keepTrustedToken()
+        if ok and not unreachable:
+            self.setok()
+        else:
+            self.notok()
+        return ok
+
+    def useToken(self, token):
+        """ Uses the personal access token for subsequent requests (without validating it). """
+        self.Logintoken = token
+        self.Session.headers['Authorization'] = self.authorizationHeader(token=token)
+
+    def storedToken(self):
+        """ Returns the personal access token from the config entry <CONFIG_FORMAT>personal_access_token, or None. """
+        return self.Confighandler.get(self.CONFIG_FORMAT.format('personal_access_token')) if self.Confighandler else None
+
+    def logout(self):
+        """ Forgets the credentials and the login session. """
+        self.Session.headers.pop('Authorization', None)
+        self.Session.cookies.clear()
+        self._password = None
+        self.Logintoken = None
+        return True
+
+    def linkUrl(self, link, data=None):
+        """ Returns the absolute url of a (relative) link in the '_links' of REST API data. """
+        if link.startswith('http://') or link.startswith('https://'):
+            return link
+        base = (data or {}).get('_links', {}).get('base') or self._contexturl
+        return base.rstrip('/') + link
+
+    def request(self, method, path=None, params=None, json=None, data=None, files=None,
+                headers=None, url=None, raw=False, retry=True):
+        """
+        Makes a request to the REST API at <path> (relative to the API url), or to <url>.
+        Returns the decoded json response (or the response body if raw is True).
+        - Connection errors are caught: self.notok() is invoked and None is returned.
+          While self.Breaker is open (after repeated connection errors), None is returned immediately.
+        - If the request is not authorized (HTTP 401), autologin is attempted (or a pending background login
+          waited for) and the request repeated once.
+        - Other HTTP errors are raised as RESTError (with StatusCode), e.g. 404 for missing pages.
+        """
+        url = url or self._apiurl + path
+        logger.debug("%s: %s %s, params: %s", self.__class__.__name__, method, url, params)
+        if not self.Breaker.allow():
+            logger.debug("%s: circuit breaker is open, failing fast for %s %s.", self.__class__.__name__, method, url)
+            return None
+        self.Scheduler.acquire(method)
+        try:
+            r = self.Session.request(method, url, params=params, json=json, data=data, files=files,
+                                     headers=headers, timeout=self.Timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.debug("%s, connection error during %s %s: %s", self.__class__.__name__, method, url, e)
+            self.notok()
+            self.Breaker.recordFailure()
+            return None
+        if r.status_code == 401:
+            if retry and self.LoginPending:
+                # Background login (see autologinAsync) in progress; wait for it rather than starting another.
+                self.waitForLogin(timeout=self.getServerParam('login_wait_timeout', 30))
+                if self:
+                    return self.request(method, path, params, json, data, files, headers, url, raw, retry=False)
+            if retry and self.AutologinEnabled and self.autologin():
+                return self.request(method, path, params, json, data, files, headers, url, raw, retry=False)
+            self.notok()
+            return None
+        self.process_request(r)
+        self.setok()
+        if raw:
+            return r.content
+        return r.json() if r.content else None
+
+    def getPaginated(self, path=None, params=None, limit=None, url=None):
+        """
+        Returns the results of a paginated collection, e.g. '/content/<id>/child/page',
+        following the '_links.next' link of each response.
+        Returns at most <limit> results (default: all), or None if a request failed.
+        """
+        params = dict(params or {})
+        params.setdefault('limit', min(limit, PAGE_LIMIT) if limit else PAGE_LIMIT)
+        collection = self.request('GET', path, params=params, url=url)
+        results = list()
+        while collection is not None:
+            results.extend(collection.get('results', ()))
+            nextlink = collection.get('_links', {}).get('next')
+            if not nextlink or (limit and len(results) >= limit):
+                return results[:limit] if limit else results
+            collection = self.request('GET', url=self.linkUrl(nextlink, collection))
+        return None
+
+    def completeCollection(self, collection, path, params=None):
+        """
+        Returns all results of an expanded (nested) collection, e.g. content['children']['attachment'].
+        Expanded collections only include the first <limit> results; the rest are requested from <path>.
+        """
+        results = list(collection.get('results', ()))
+        nextlink = collection.get('_links', {}).get('next')
+        if nextlink:
+            rest = self.getPaginated(url=self.linkUrl(nextlink, collection))
+        elif collection.get('limit') and collection.get('size', 0) >= collection['limit']:
+            rest = self.getPaginated(path, params=dict(params or {}, start=len(results)))
+        else:
+            return results
+        return results + rest if rest is not None else results
+
+
+    ##############################
+    #### Struct conversion  ######
+    ##############################
+
+    def webUrl(self, content):
+        """ Returns the url to view content online. """
+        webui = content.get('_links', {}).get('webui')
+        return self.linkUrl(webui, content) if webui else None
+
+    def pageSummary(self, content, parentId=None):
+        """ Returns an xml-rpc PageSummary struct (id, space, parentId, title, url, permissions) for REST content. """
+        ancestors = content.get('ancestors')
+        if parentId is None:
+            parentId = ancestors[-1]['id'] if ancestors else '0'
+        return dict(id=str(content['id']), space=content.get('space', {}).get('key'),
+                    parentId=str(parentId), title=content.get('title'), url=self.webUrl(content),
+                    permissions='0')
+
+    def pageStruct(self, content, parentId=None):
+        """ Returns an xml-rpc Page struct for REST content (expanded with PAGE_EXPAND). """
+        page = self.pageSummary(content, parentId)
+        version = content.get('version', {})
+        history = content.get('history', {})
+        status = content.get('status', 'current')
+        page.update(version=str(version.get('number', '')),
+                    content=content.get('body', {}).get('storage', {}).get('value'),
+                    created=parse_datetime(history.get('createdDate')),
+                    creator=history.get('createdBy', {}).get('username'),
+                    modified=parse_datetime(version.get('when')),
+                    modifier=version.get('by', {}).get('username'),
+                    homePage='false', contentStatus=status,
+                    current='true' if status == 'current' else 'false')
+        return page
+
+    def attachmentStruct(self, attachment, pageId=None):
+        """ Returns an xml-rpc Attachment struct for a REST attachment (expanded with version). """
+        extensions = attachment.get('extensions', {})
+        version = attachment.get('version', {})
+        if pageId is None:
+            pageId = attachment.get('container', {}).get('id')
+        download = attachment.get('_links', {}).get('download')
+        return dict(id=str(attachment['id']), pageId=str(pageId), title=attachment.get('title'),
+                    fileName=attachment.get('title'), fileSize=str(extensions.get('fileSize', '')),
+                    contentType=extensions.get('mediaType'), comment=extensions.get('comment', ''),
+                    created=parse_datetime(version.get('when')), creator=version.get('by', {}).get('username'),
+                    url=self.linkUrl(download, attachment) if download else None)
+
+    def commentStruct(self, comment, pageId=None):
+        """ Returns an xml-rpc Comment struct for a REST comment. """
+        history = comment.get('history', {})
+        if pageId is None:
+            pageId = comment.get('container', {}).get('id')
+        return dict(id=str(comment['id']), pageId=str(pageId), title=comment.get('title'),
+                    content=comment.get('body', {}).get('storage', {}).get('value'), url=self.webUrl(comment),
+                    created=parse_datetime(history.get('createdDate')),
+                    creator=history.get('createdBy', {}).get('username'))
+
+    def searchResult(self, content):
+        """ Returns an xml-rpc SearchResult struct (title, url, excerpt, type, id) for REST content. """
+        return dict(id=str(content['id']), title=content.get('title'), type=content.get('type'),
+                    url=self.webUrl(content), excerpt=content.get('excerpt', ''))
+
+
+    ################################
+    #### SERVER-level methods ######
+    ################################
+
+    def getServerInfo(self):
+        """
+        Returns a dict with server information.
+        The REST API does not provide version information, so only baseUrl and the user are included.
+        """
+        user = self.request('GET', '/user/current')
+        if user is None:
+            return None
+        return dict(baseUrl=self._contexturl, restUrl=self._apiurl, username=user.get('username'))
+
+    def getSpaces(self):
+        """ Returns a list of space summaries (key, name, type, url) for the spaces that the user can see. """
+        spaces = self.getPaginated('/space')
+        if spaces is None:
+            return None
+        return [dict(key=space['key'], name=space.get('name'), type=space.get('type'), url=self.webUrl(space))
+                for space in spaces]
+
+    def getUser(self, username):
+        """ Returns a user struct (name, fullname, url) for username. """
+        user = self.request('GET', '/user', params={'username': username})
+        if user is None:
+            return None
+        return dict(name=user.get('username'), fullname=user.get('displayName'), url=self.webUrl(user))
+
+
+    ################################
+    #### PAGE-level methods ########
+    ################################
+
+    def getPages(self, spaceKey):
+        """ Returns all the page summaries in the space. """
+        pages = self.getPaginated('/content', params=dict(spaceKey=spaceKey, type='page', expand=SUMMARY_EXPAND))
+        if pages is None:
+            return None
+        return [self.pageSummary(content) for content in pages]
+
+    def getPage(self, pageId=None, spaceKey=None, pageTitle=None):
+        """
+        Returns a page struct (see ConfluenceXmlRpcClient.getPage) for the page with pageId,
+        or with pageTitle in space spaceKey.
+        Raises RESTError (StatusCode 404) if the page does not exist.
+        """
+        if pageId:
+            content = self.request('GET', '/content/{}'.format(pageId), params={'expand': PAGE_EXPAND})
+        elif spaceKey and pageTitle:
+            results = self.getPaginated('/content', params=dict(spaceKey=spaceKey, title=pageTitle, type='page',
+                                                                expand=PAGE_EXPAND), limit=1)
+            if results is None:
+                return None
+            if not results:
+                raise RESTError("No page with title '{}' in space '{}'".format(pageTitle, spaceKey), 404)
+            content = results[0]
+        else:
+            raise ValueError("Must specify either pageId or spaceKey/pageTitle.")
+        return self.pageStruct(content) if content is not None else None
+
+    def removePage(self, pageId):
+        """ Removes (trashes) a page. """
+        self.request('DELETE', '/content/{}'.format(pageId))
+
+    def movePage(self, sourcePageId, targetPageId, position='append'):
+        """
+        Moves a page's position in the hierarchy, position is "above", "below" or "append",
+        see ConfluenceXmlRpcClient.movePage. (Requires Confluence 7.x REST API.)
+        """
+        return self.request('PUT', '/content/{}/move/{}/{}'.format(sourcePageId, MOVE_POSITIONS[position], targetPageId))
+
+    def getAncestors(self, pageId):
+        """ Returns the page summaries of the ancestors of the page, root first. """
+        content = self.request('GET', '/content/{}'.format(pageId), params={'expand': 'ancestors.space'})
+        if content is None:
+            return None
+        ancestors = content.get('ancestors', [])
+        return [self.pageSummary(ancestor, ancestors[i-1]['id'] if i else '0')
+                for i, ancestor in enumerate(ancestors)]
+
+    def getChildren(self, pageId):
+        """ Returns the page summaries of the direct children of the page. """
+        children = self.getPaginated('/content/{}/child/page'.format(pageId), params={'expand': 'space'})
+        if children is None:
+            return None
+        return [self.pageSummary(content, parentId=pageId) for content in children]
+
+    def getDescendents(self, pageId):
+        """ Returns the page summaries of all descendants of the page (children, children's children etc). """
+        descendants = self.getPaginated('/content/{}/descendant/page'.format(pageId), params={'expand': SUMMARY_EXPAND})
+        if descendants is None:
+            return None
+        return [self.pageSummary(content) for content in descendants]
+
+    def getChildPages(self, pageId, attachments=True):
+        """
+        Returns the direct children of the page as complete page structs (with content and version).
+        If attachments is True, each page struct also has an 'attachments' list of attachment structs.
+        Uses expansion, so the pages, bodies, versions and attachment metadata are obtained
+        in a single request per PAGE_LIMIT child pages (plus requests for pages with many attachments).
+        """
+        expand = CHILDPAGE_EXPAND if attachments else CHILDPAGE_EXPAND.replace(',children.attachment.version', '')
+        children = self.getPaginated('/content/{}/child/page'.format(pageId), params={'expand': expand})
+        if children is None:
+            return None
+        pages = list()
+        for content in children:
+            page = self.pageStruct(content, parentId=pageId)
+            if attachments:
+                collection = content.get('children', {}).get('attachment', {})
+                page['attachments'] = [
+                    self.attachmentStruct(attachment, page['id']) for attachment in self.completeCollection(
+                        collection, '/content/{}/child/attachment'.format(page['id']), params={'expand': 'version'})]
+            pages.append(page)
+        return pages
+
+
+    ##############################
+    #### Comment  methods   ######
+    ##############################
+
+    def getComments(self, pageId):
+        """ Returns all the comments for this page. """
+        comments = self.getPaginated('/content/{}/child/comment'.format(pageId), params={'expand': 'body.storage,history'})
+        if comments is None:
+            return None
+        return [self.commentStruct(comment, pageId) for comment in comments]
+
+    def getComment(self, commentId):
+        """ Returns an individual comment. """
+        comment = self.request('GET', '/content/{}'.format(commentId), params={'expand': 'body.storage,history,container'})
+        return self.commentStruct(comment) if comment is not None else None
+
+    def removeComment(self, commentId):
+        """ Removes an individual comment. """
+        self.request('DELETE', '/content/{}'.format(commentId))
+        return True
+
+    def addComment(self, comment_struct):
+        """ Adds a comment (struct with pageId and content) to the page. """
+        body = dict(type='comment', container=dict(id=str(comment_struct['pageId']), type='page'),
+                    body=dict(storage=dict(value=comment_struct['content'], representation='storage')))
+        comment = self.request('POST', '/content', json=body)
+        return self.commentStruct(comment, comment_struct['pageId']) if comment is not None else None
+
+    def editComment(self, comment_struct):
+        """ Updates an existing comment (struct with id and content). """
+        current = self.request('GET', '/content/{}'.format(comment_struct['id']), params={'expand': 'version,container'})
+        if current is None:
+            return None
+        body = dict(type='comment', version=dict(number=current['version']['number'] + 1),
+                    body=dict(storage=dict(value=comment_struct['content'], representation='storage')))
+        comment = self.request('PUT', '/content/{}'.format(comment_struct['id']), json=body)
+        return self.commentStruct(comment, current.get('container', {}).get('id')) if comment is not None else None
+
+
+    ######################################
+    #### Attachment-level methods   ######
+    ######################################
+
+    def getAttachments(self, pageId):
+        """ Returns list of page attachments (attachment structs). """
+        attachments = self.getPaginated('/content/{}/child/attachment'.format(pageId), params={'expand': 'version'})
+        if attachments is None:
+            return None
+        return [self.attachmentStruct(attachment, pageId) for attachment in attachments]
+
+    def _getAttachmentContent(self, pageId, fileName):
+        """ Returns the REST content for the attachment with fileName on page pageId (or None). """
+        results = self.getPaginated('/content/{}/child/attachment'.format(pageId),
+                                    params={'filename': fileName, 'expand': 'version'}, limit=1)
+        return results[0] if results else None
+
+    def getAttachment(self, pageId, fileName, versionNumber=0):
+        """ Returns information (attachment struct) about the current version of an attachment. """
+        attachment = self._getAttachmentContent(pageId, fileName)
+        return self.attachmentStruct(attachment, pageId) if attachment is not None else None
+
+    def getAttachmentData(self, pageId, fileName, versionNumber=0):
+        """
+        Returns the contents of an attachment, as xmlrpclib.Binary (like the xml-rpc API).
+        versionNumber=0 is the current version.
+        """
+        attachment = self._getAttachmentContent(pageId, fileName)
+        if attachment is None:
+            return None
+        params = {'version': versionNumber} if int(versionNumber) else None
+        data = self.request('GET', url=self.linkUrl(attachment['_links']['download'], attachment), params=params, raw=True)
+        return xmlrpclib.Binary(data) if data is not None else None
+
+    def addAttachment(self, contentId, attachment_struct, attachmentData):
+        """
+        Add a new attachment to a page; attachment_struct has fileName, contentType and (optionally) comment,
+        attachmentData is bytes or xmlrpclib.Binary, as returned by utils.attachmentTupFromFilepath().
+        Returns the attachment struct of the new attachment.
+        """
+        filedata = getattr(attachmentData, 'data', attachmentData)
+        files = {'file': (attachment_struct['fileName'], filedata,
+                          attachment_struct.get('contentType') or 'application/octet-stream')}
+        data = {'comment': attachment_struct['comment']} if attachment_struct.get('comment') else None
+        collection = self.request('POST', '/content/{}/child/attachment'.format(contentId), files=files, data=data,
+                                  headers={'X-Atlassian-Token': 'nocheck'})
+        if not collection:
+            return None
+        return self.attachmentStruct(collection.get('results', [collection])[0], contentId)
+
+    def removeAttachment(self, contentId, fileName):
+        """ Remove an attachment from a page. """
+        attachment = self._getAttachmentContent(contentId, fileName)
+        if attachment is None:
+            return False
+        self.request('DELETE', '/content/{}'.format(attachment['id']))
+        return True
+
+
+    ####################################
+    #### Content-level methods   #######
+    ####################################
+
+    def storePage(self, page_struct):
+        """
+        Adds or updates a page, see ConfluenceXmlRpcClient.storePage.
+        For adding, page_struct should have space, title and content fields (and optionally parentId).
+        For updating, page_struct should have id, space, title, content and (current) version fields.
+        Returns the page struct of the stored page.
+        """
+        if page_struct.get('id'):
+            return self.updatePage(page_struct, {})
+        body = dict(type='page', title=page_struct['title'], space=dict(key=page_struct['space']),
+                    body=dict(storage=dict(value=page_struct['content'], representation='storage')))
+        if page_struct.get('parentId') and str(page_struct['parentId']) != '0':
+            body['ancestors'] = [dict(id=str(page_struct['parentId']))]
+        content = self.request('POST', '/content', json=body, params={'expand': PAGE_EXPAND})
+        return self._storedPage(content, page_struct)
+
+    def updatePage(self, page_struct, pageUpdateOptions):
+        """
+        Updates a page. page_struct should have id, space, title, content and version fields,
+        pageUpdateOptions can have versionComment and minorEdit.
+        Raises RESTError (StatusCode 409) if the page has been updated on the server (version conflict).
+        """
+        pageUpdateOptions = pageUpdateOptions or {}
+        version = dict(number=int(page_struct['version']) + 1, minorEdit=bool(pageUpdateOptions.get('minorEdit')))
+        if pageUpdateOptions.get('versionComment'):
+            version['message'] = pageUpdateOptions['versionComment']
+        body = dict(type='page', title=page_struct['title'], version=version,
+                    body=dict(storage=dict(value=page_struct['content'], representation='storage')))
+        if page_struct.get('parentId') and str(page_struct['parentId']) != '0':
+            body['ancestors'] = [dict(id=str(page_struct['parentId']))]
+        content = self.request('PUT', '/content/{}'.format(page_struct['id']), json=body, params={'expand': PAGE_EXPAND})
+        return self._storedPage(content, page_struct)
+
+    def _storedPage(self, content, page_struct):
+        """ Returns the page struct for content returned when storing page_struct. """
+        if content is None:
+            return None
+        page = self.pageStruct(content, parentId=page_struct.get('parentId'))
+        if page['content'] is None:
+            page['content'] = page_struct['content']
+        return page
+
+    def storePageContent(self, pageId, spaceKey, newContent, contentformat='xml'):
+        """ Convenience method to replace the content of a page, see ConfluenceXmlRpcClient.storePageContent. """
+        page_struct = self.getPage(pageId)
+        if contentformat == 'wiki':
+            newContent = self.convertWikiToStorageFormat(newContent)
+        page_struct['content'] = newContent
+        return self.storePage(page_struct)
+
+    def _convert(self, value, representation, to, params=None):
+        """ Converts value from representation to format <to> using the server's content body converter. """
+        body = self.request('POST', '/contentbody/convert/{}'.format(to), params=params,
+                            json=dict(value=value, representation=representation))
+        return body.get('value') if body else None
+
+    def convertWikiToStorageFormat(self, wikitext):
+        """ Input wiki format, returns xhtml. """
+        return self._convert(wikitext, 'wiki', 'storage')
+
+    def renderContent(self, spaceKey=None, pageId=None, content=None):
+        """
+        Returns the HTML rendered content for a page (if only pageId is given),
+        or of content rendered as if it were on the page pageId or in space spaceKey.
+        """
+        if pageId and not content:
+            page = self.request('GET', '/content/{}'.format(pageId), params={'expand': 'body.view'})
+            return page.get('body', {}).get('view', {}).get('value') if page else None
+        elif content and (pageId or spaceKey):
+            params = {'contentIdContext': pageId} if pageId else {'spaceKeyContext': spaceKey}
+            return self._convert(content, 'storage', 'view', params=params)
+        logger.warning("server.renderContent() :: Error, must pass either pageId (with optional content) or spaceKey and content.")
+        return None
+
+
+    ##############################
+    #### Search methods      #####
+    ##############################
+
+    def search(self, query, maxResults, parameters=None):
+        """
+        Search for page or other content, returning at most maxResults search result structs.
+        The query and parameters (spaceKey, type, modified, contributor) are converted to a CQL query,
+        see ConfluenceXmlRpcClient.search.
+        """
+        results = self.getPaginated('/content/search', params={'cql': search_cql(query, parameters)}, limit=maxResults)
+        if results is None:
+            return None
+        return [self.searchResult(content) for content in results]
+
+    @property
+    def SearchCoordinator(self):
+        """ The SearchCoordinator used by searchForWikiPage, see ConfluenceXmlRpcClient.SearchCoordinator. """
+        if self._searchcoordinator is None:
+            wins = self.Confighandler.get('wiki_search_strategy_wins') if self.Confighandler else None
+            self._searchcoordinator = SearchCoordinator(wins=wins)
+        return self._searchcoordinator
+
+    def searchForWikiPage(self, spaceKey, pageTitle, required=None, optional=None, searchlevel=1, strategies=None):
+        """
+        Returns a single page matching pageTitle, using the same search strategies
+        as ConfluenceXmlRpcClient.searchForWikiPage (which see).
+        """
+        user = self.Confighandler.get('wiki_username') or self.Confighandler.get('username')
+        optional = dict(optional or {})
+        optional['title'] = list(optional.get('title', ())) + pageTitle.split()
+
+        def exact_search():
+            """ Find a wiki page with an exactly matching pageTitle. """
+            try:
+                return self.getPage(spaceKey=spaceKey, pageTitle=pageTitle)
+            except RESTError:
+                logger.info("No exact match found for '%s' in space '%s'", pageTitle, spaceKey)
+                return None
+
+        def query_search(params):
+            """ Returns a function searching for pageTitle with params. """
+            return lambda: self.search(pageTitle, 30, params)
+
+        strategies = list(strategies or ())
+        strategies.append(SearchStrategy('exact-title', exact_search, True))
+        if searchlevel >= 1:
+            strategies.append(SearchStrategy('space-contributor', query_search(dict(spaceKey=spaceKey, contributor=user, type='page')), False))
+        if searchlevel >= 2:
+            strategies.append(SearchStrategy('contributor', query_search(dict(contributor=user, type='page')), False))
+            strategies.append(SearchStrategy('space', query_search(dict(spaceKey=spaceKey, type='page')), False))
+        coordinator = self.SearchCoordinator
+        pagestruct = coordinator.run(strategies, required=required, optional=optional)
+        if self.Confighandler:
+            coordinator.saveWins(self.Confighandler, 'wiki_search_strategy_wins')
+        return pagestruct
 
+    def search_filter_rank(self, query, parameters, required=None, optional=None):
+        """ Searches with query and parameters, then filters and ranks the results (see pagesearch.filter_rank). """
+        return filter_rank(self.search(query, 30, parameters), required, optional)
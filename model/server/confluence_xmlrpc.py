@@ -28,19 +28,21 @@ This module will similarly be slowly deprechated in favor of the REST equivalent
 """
 
 from __future__ import print_function, division
-from six import string_types
 try:
     import xmlrpclib # pylint: disable=E0611,F0401
 except ImportError:
     import xmlrpc.client as xmlrpclib
 import socket
-import inspect
+import threading
 import logging
 logger = logging.getLogger(__name__)
 
 # Labfluence modules and classes:
 from serverutils import login_prompt
 from abstract_clients import AbstractXmlRpcClient
+from pagesearch import SearchCoordinator, SearchStrategy, filter_rank
+from coalescing import RequestCoalescer
+from transport import TransferStats, make_transport, GZIP_THRESHOLD
 
 
 # Module constants:
@@ -48,6 +50,15 @@ defaultsockettimeout = 3.0  # pylint: disable=C0103
 VERBOSE = 0     # Setting this to a non-zero value may print confidential info to log. Take care.
 
 
+def rpc_method_name(function):
+    """
+    Returns the name of the server method function, which is usually a xmlrpclib._Method,
+    e.g. 'getPage' for RpcServer.confluence2.getPage.
+    """
+    name = getattr(function, '_Method__name', None) or getattr(function, '__name__', '')
+    return name.rpartition('.')[2]
+
+
 
 
 class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
@@ -66,6 +77,12 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
     server = ConfluenceXmlRpcServerProxy(serverparams, token='12de4a837b')
 
     """
+    # Read methods whose identical in-flight calls share a single request:
+    COALESCED_METHODS = frozenset(('getServerInfo', 'getSpaces', 'getUser', 'getPage', 'getPages', 'getChildren',
+                                   'getDescendents', 'getAncestors', 'getAttachments', 'getAttachment',
+                                   'getAttachmentData', 'getComments', 'getComment', 'getPageHistory',
+                                   'search', 'renderContent'))
+
     def __init__(self, serverparams=None, username=None, password=None, logintoken=None, confighandler=None, autologin=True):
         """
         Argument <url> is now deprecated.
@@ -83,6 +100,10 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
         """
         logger.debug("New %s initializing...", self.__class__.__name__)
         self.CONFIG_FORMAT = 'wiki_{}'
+        self._threadlocal = threading.local() # Holds the RpcServer proxy for each thread.
+        self._sharedrpcserver = None          # RpcServer proxy set explicitly, used by all threads.
+        self.Coalescer = RequestCoalescer()   # Shares in-flight read requests, see execute().
+        self.TransferStats = TransferStats()  # Bytes sent and received by the proxies of all threads.
         super(ConfluenceXmlRpcClient, self).__init__(serverparams=serverparams, username=username,
                                                      password=password, logintoken=logintoken,
                                                      confighandler=confighandler, autologin=autologin)
@@ -92,11 +113,45 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
             logger.warning("WARNING: Server's AppUrl is '%s', ABORTING init!", appurl)
             return None
         logger.info("%s - Making server with url: %s", self.__class__.__name__, appurl)
-        self.RpcServer = xmlrpclib.ServerProxy(appurl, use_datetime=True) # Note: xmlrpclib line 1613: Server = ServerProxy # for compatability.
+        self._threadlocal.RpcServer = self.makeRpcServer()
         if self.AutologinEnabled:
             self.autologin()
         logger.debug("%s initialized.", self.__class__.__name__)
 
+    @property
+    def RpcServer(self):
+        """
+        The xmlrpclib.ServerProxy used to make requests.
+        ServerProxy instances (and their HTTP connections) are not thread safe,
+        so each thread gets its own proxy, created on first use.
+        A proxy set with the RpcServer setter (e.g. a test double) is used by all threads.
+        """
+        if self._sharedrpcserver is not None:
+            return self._sharedrpcserver
+        try:
+            return self._threadlocal.RpcServer
+        except AttributeError:
+            logger.debug("Creating new RpcServer proxy for thread %s", threading.current_thread().name)
+            rpcserver = self._threadlocal.RpcServer = self.makeRpcServer()
+            return rpcserver
+    @RpcServer.setter
+    def RpcServer(self, rpcserver):
+        """ Sets the RpcServer proxy used by all threads (None reverts to per-thread proxies). """
+        self._sharedrpcserver = rpcserver
+
+    def makeRpcServer(self):
+        """
+        Returns a new xmlrpclib.ServerProxy for self.AppUrl, using a gzip compressed transport
+        which counts the bytes transferred in self.TransferStats.
+        Requests are compressed if larger than the 'gzip_threshold' server param,
+        only if the 'gzip_requests' server param is True (see the transport module).
+        """
+        threshold = self.getServerParam('gzip_threshold', GZIP_THRESHOLD) \
+            if self.getServerParam('gzip_requests', False) else None
+        transport = make_transport(self.AppUrl, self.TransferStats, threshold=threshold, use_datetime=True)
+        # Note: xmlrpclib line 1613: Server = ServerProxy # for compatability.
+        return xmlrpclib.ServerProxy(self.AppUrl, transport=transport)
+
     def autologin(self, prompt='auto'):
         """
         I intend to do something like if prompt='never'/'auto'/'force'
@@ -116,6 +171,7 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
         # it is only this autologin() and the execute() method that does that.
         #self._raiseerrors = True # Ensure that e.g. timeout errors are raised.
         token = None
+        unreachable = False
         logger.debug("%s.autologin(prompt='%s') invoked.", self.__class__.__name__, prompt)
         try:
             #
@@ -143,10 +199,13 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
                     logger.info("Uhm... what?")
         except socket.error as e:
             logger.warning("%s - socket error prevented login, probably timeout, error is: %s", self.__class__.__name__, e)
+            self.Breaker.recordFailure()
+            unreachable = True
+            token = self.keepTrustedToken()
         #self._raiseerrors = oldflag
         except xmlrpclib.ProtocolError as err:
             logger.warning("ProtocolError raised; This is probably because XML-RPC is not enabled for your Confluence instance under general configuration. Error: %s", err)
-        if self.Logintoken:
+        if self.Logintoken and not unreachable:
             self.setok()
         else:
             self.notok()
@@ -174,11 +233,26 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
         """
         return bool(self.test_token(doset=False))
 
+    def ping(self):
+        """
+        Returns True if the server responds; used by self.Breaker to check if the server is back.
+        A Fault (e.g. for an expired token) also means that the server can be reached.
+        """
+        try:
+            self._testConnection(self.Logintoken or '')
+        except xmlrpclib.Fault:
+            pass
+        except (socket.error, xmlrpclib.ProtocolError) as e:
+            logger.debug("%s, ping failed: %r", self.__class__.__name__, e)
+            return False
+        return True
+
     def test_token(self, logintoken=None, doset=True):
         """
         Test a login token; must be decrypted.
         If token=None, will test self.Logintoken
         If doset=True (default), and the token proves valid, this method will store the token in self.
+        The result is recorded in self.TokenStates.
         Returns:
         - True if token is valid.
         - False if token is not valid (or if otherwise failed to connect to server <-- should be fixed...)
@@ -195,6 +269,7 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
             logger.debug("Successfully obtained serverinfo from server (version %s.%s.%s, build %s) via _testConnection using token of type %s",
                          serverinfo['majorVersion'], serverinfo['minorVersion'], serverinfo['patchLevel'], serverinfo['buildId'],
                          type(logintoken))
+            self.TokenStates.confirm(logintoken)
             if doset:
                 self.Logintoken = logintoken
                 self.setok()
@@ -202,6 +277,7 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
         except xmlrpclib.Fault as err:
             logger.debug("ConfluenceXmlRpcServer.test_token() : tested token of length %s did not work; %s: %s",
                          len(logintoken), err.faultCode, err.faultString)
+            self.TokenStates.reject(logintoken)
             return False
 
     def promptForUserPass(self, username=None, msg=None):
@@ -365,6 +441,17 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
 
 
     def execute(self, function, *args):
+        """
+        Executes the server method function with args, see _execute().
+        Read methods (COALESCED_METHODS) called with the same args as a request that is already
+        in flight (e.g. made by another thread) wait for that request and share its result.
+        """
+        methodname = rpc_method_name(function)
+        if methodname in self.COALESCED_METHODS:
+            return self.Coalescer.call((methodname, ) + args, self._execute, function, *args)
+        return self._execute(function, *args)
+
+    def _execute(self, function, *args):
         """
         For XmlRpc servers we encapsulate the xmlrpc function call like this to catch missing
         or expired logintokens. These can then be obtained via a new login and the call repeated.
@@ -380,11 +467,24 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
         It does not appy to e.g. xmlrpclib.Fault, which is raised from e.g. an erroneous token
         and can be corrected by providing a correct token or logging in anew.
 
+        Each request waits for self.Scheduler to allow it within the configured rate limits;
+        requests made from the UI (main) thread go before queued background requests.
+        Socket errors are recorded by self.Breaker; while it is open (the server is unreachable),
+        this returns None immediately instead of waiting for a timeout.
+
         Edit: changed policy, execute() and autologin() will always catch socket errors;
         test_token() and login() are allowed to catch xmlrpclib.Fault exceptions,
         while all other methods should not catch any exceptions.
         """
+        methodname = rpc_method_name(function) or None
+        if not self.Breaker.allow():
+            logger.debug("%s: circuit breaker is open, failing fast for %s().", self.__class__.__name__, methodname)
+            return None
         token = self.Logintoken
+        if not token and self.LoginPending:
+            # Background login (see autologinAsync) in progress; wait for it rather than starting another.
+            self.waitForLogin(timeout=self.getServerParam('login_wait_timeout', 30))
+            token = self.Logintoken
         if not token:
             logger.info("%s, self.Logintoken is '%s', will try to obtain anew..", self.__class__.__name__, token)
             if self.AutologinEnabled:
@@ -403,15 +503,17 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
             # If function is a method, name will be available as .__name__ and .im_func.func_name
             # Edit: Do not try to log function.__name__, that does not work for xmlrpclib.
             #logger.debug("%s, trying to execute for function '%s()' with args: %s", self.__class__.__name__, function.__name__, [type(arg) for arg in args])
-            logger.debug("%s: trying to execute for function '%s()' with args: %s", self.__class__.__name__, inspect.stack()[1][3], [type(arg) for arg in args])
+            logger.debug("%s: trying to execute for function '%s()' with args: %s", self.__class__.__name__, methodname, [type(arg) for arg in args])
+            self.Scheduler.acquire(methodname)
             ret = function(token, *args)
             self.setok()
             logger.debug("server request completed, returned value is type: %s", type(ret))
             return ret
         except socket.error as e:
             #logger.debug("%s, socket error during execution of function '%s()': %s", self.__class__.__name__, function.__name__, e)
-            logger.debug("%s, socket error during execution of function '%s()': %s", self.__class__.__name__, inspect.stack()[1][3], e)
+            logger.debug("%s, socket error during execution of function '%s()': %s", self.__class__.__name__, methodname, e)
             self.notok()
+            self.Breaker.recordFailure()
             logger.debug("Probably a network issue, no reason to try again, invoking self.notok().")
             #if raiseerrors is None:
             #raiseerrors = self._raiseerrors
@@ -420,7 +522,7 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
             #if raiseerrors:
             #    raise e
         except xmlrpclib.Fault as e:
-            logger.debug("%s: xmlrpclib.Fault exception raised during execution of function %s: %s", self.__class__.__name__, inspect.stack()[1][3], e)
+            logger.debug("%s: xmlrpclib.Fault exception raised during execution of function %s: %s", self.__class__.__name__, methodname, e)
             cause = self.determineFaultCause(e)
             # causes: PageNotAvailable, IncorrectUserPassword, TooManyFailedLogins, TokenExpired
             logger.debug("Cause of xmlrpclib.Fault determined to be: '%s'", cause)
@@ -432,10 +534,11 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
                     if self._connectionok:
                         # try once more:
                         #try:
-                        logger.debug("%s, attempting once more to invoke %s with args %s", self.__class__.__name__, inspect.stack()[1][3], args)
+                        logger.debug("%s, attempting once more to invoke %s with args %s", self.__class__.__name__, methodname, args)
+                        self.Scheduler.acquire(methodname)
                         ret = function(token, *args)
                         self.setok()
-                        logger.debug("%s, %s returned %s (returning)", self.__class__.__name__, inspect.stack()[1][3], ret)
+                        logger.debug("%s, %s returned %s (returning)", self.__class__.__name__, methodname, ret)
                         return ret
                 else:
                     self.notok()
@@ -444,10 +547,10 @@ class ConfluenceXmlRpcClient(AbstractXmlRpcClient):
                 self.display_message("Server ERROR, too many failed logins. Determined from exception: %r" % e)
                 logger.warning("%s: Server ERROR, too many failed logins. Determined from exception: %s", self.__class__.__name__, e)
             elif cause == 'PageNotAvailable':
-                logger.info("PageNotAvailable: %s called with args %s. Re-raising the xmlrpclib.Fault exception.", inspect.stack()[1][3], args)
+                logger.info("PageNotAvailable: %s called with args %s. Re-raising the xmlrpclib.Fault exception.", methodname, args)
                 raise e
             else:
-                logger.info("Unknown Fault excepted after calling %s with args %s. Re-raising the xmlrpclib.Fault exception.", inspect.stack()[1][3], args)
+                logger.info("Unknown Fault excepted after calling %s with args %s. Re-raising the xmlrpclib.Fault exception.", methodname, args)
                 raise e
         logger.debug("end of execute method reached. This should not happen.")
         return None # Default if... But consider raising an exception instead.
@@ -776,13 +879,10 @@ current       Boolean whether the page is current and not deleted
         takes pageId as string.
         """
         if pageId:
-            pageId = str(pageId)
-            if content:
-                return self.execute(self.RpcServer.confluence2.renderContent, pageId, content)
-            else:
-                return self.execute(self.RpcServer.confluence2.renderContent, pageId)
+            # The API signature is renderContent(token, spaceKey, pageId, content), all arguments are required:
+            return self.execute(self.RpcServer.confluence2.renderContent, '', str(pageId), content or '')
         elif spaceKey and content:
-            return self.execute(self.RpcServer.confluence2.renderContent, spaceKey, content)
+            return self.execute(self.RpcServer.confluence2.renderContent, spaceKey, '', content)
         logger.warning("server.renderContent() :: Error, must pass either pageId (with optional content) or spaceKey and content.")
         return None
 
@@ -823,85 +923,81 @@ contributor:
             return self.execute(self.RpcServer.confluence2.search, query, maxResults)
 
 
-    def searchForWikiPage(self, spaceKey, pageTitle, required=None, optional=None, searchlevel=1):
+    @property
+    def SearchCoordinator(self):
+        """
+        The SearchCoordinator used by searchForWikiPage to run search strategies concurrently.
+        Strategy win counts are persisted in config entry 'wiki_search_strategy_wins'
+        (the config file is written at most every pagesearch.WINS_SAVE_INTERVAL seconds).
+        """
+        if getattr(self, '_searchcoordinator', None) is None:
+            wins = self.Confighandler.get('wiki_search_strategy_wins') if self.Confighandler else None
+            self._searchcoordinator = SearchCoordinator(wins=wins)
+        return self._searchcoordinator
+
+    def searchForWikiPage(self, spaceKey, pageTitle, required=None, optional=None, searchlevel=1, strategies=None):
         """
-        Will only return a single match. Increasing <extended> will produce matches of decreasing
+        Will only return a single match. Increasing <searchlevel> will produce matches of decreasing
         confidence.
         Arguments:
-            <extended> is used to control how much search you want to do.
+            <searchlevel> is used to control how much search you want to do.
             <required> dict of lists used to filter results. Any matching result must pass all criteria,
                 so if required={'title': ('RS123',), 'creator': ('scholer',)}
                 then the page MUST have RS123 in the title and 'scholer' as creator.
             <optional> dict of optional elements. Will contribute to the final score.
+            <strategies> list of additional SearchStrategy tuples, e.g. a lookup in a local cache.
         Note that required elements can be either a string (matched by if elem in field)
         or a compiled regex.
         Optional elements are scored by len(elem)/len(field)/sqrt(<number of elem for field>);
         a matching regex scores 1/sqrt(<number of elem for field>).
-        Search strategy:
+        Search strategies:
         1) Find page on wiki in space <spaceKey> with pageTitle matching pagetitle (exactly).
-        (if extended >= 1:)
-        2) Find pages in space with user as contributor and expid in title.
-           # If multiple results are returned, filter pages by parentId matching wiki_exp_root_pageId? No, would be found by #2.
-        4) Find pages in all spaces with user as contributor and ...?
-        5) Find pages in user's space without user as contributor and expid in title?
+        (if searchlevel >= 1:)
+        2) Find pages in space with user as contributor and pageTitle words in title.
+        (if searchlevel >= 2:)
+        3) Find pages in all spaces with user as contributor.
+        4) Find pages in space without user as contributor.
+        The strategies are run concurrently by self.SearchCoordinator, which returns the first definitive hit
+        (a page found by exact title, or a search with a single result passing the <required> criteria);
+        a page found by exact title is preferred over a search hit.
+        If there is no definitive hit, the merged search results are filtered and ranked; returns
+        the page if a single page remains, False if several pages remain, and None if no page was found.
         """
-
-        # Simple search by matching pagetitle and spacekey:
-        logger.info("Performing exact spacekey+pagetitle search on server...")
-        try:
-            # First try to find a wiki page with an exactly matching pageTitle.
-            pagestruct = self.getPage(spaceKey=spaceKey, pageTitle=pageTitle)
-            logger.debug("self.getPage returned pagestruct of type '%s'", type(pagestruct))
-            if pagestruct:
-                logger.info("Exact match in space '%s' found for page '%s'", spaceKey, pageTitle)
-                return pagestruct
-            else:
-                logger.debug(" pagestruct is empty: '%s'", pagestruct)
-        except xmlrpclib.Fault:
-            # Although execute() catches xmlrpclib.Fault exceptions, it will currently re-raise
-            # the exception if it is caused by a PageNotAvailable error.
-            logger.info("xmlrpclib.Fault raised, indicating that no exact match found for '%s' in space '%s', searching by query...", pageTitle, spaceKey)
-
         user = self.Confighandler.get('wiki_username') or self.Confighandler.get('username')
-        def search_argument_generator(spaceKey, pageTitle, optional, required):
-            """ Yields a range of search arguments for search_filter_rank() """
-            params = dict(spaceKey=spaceKey, contributor=user, type='page')
-            searchlevel = 1
-            if optional:
-                if 'title' in optional:
-                    optional['title'] = list(optional['title']) + pageTitle.split()
-                else:
-                    optional['title'] = pageTitle.split()
-            else:
-                optional = dict(title=pageTitle.split())
-            yield (pageTitle, params, required, optional, searchlevel)
-            searchlevel = 2
-            params = dict(contributor=user, type='page')
-            yield (pageTitle, params, required, optional, searchlevel)
-            params = dict(spaceKey=spaceKey, type='page')
-            yield (pageTitle, params, required, optional, searchlevel)
-
-        # Perform various searches on the wiki:
-        for query, params, required, optional, arglevel in search_argument_generator(spaceKey, pageTitle, optional, required):
-            if arglevel > searchlevel:
+        if optional:
+            optional = dict(optional)
+            optional['title'] = list(optional.get('title', ())) + pageTitle.split()
+        else:
+            optional = dict(title=pageTitle.split())
+
+        def exact_search():
+            """ Find a wiki page with an exactly matching pageTitle. """
+            try:
+                return self.getPage(spaceKey=spaceKey, pageTitle=pageTitle)
+            except xmlrpclib.Fault:
+                # Although execute() catches xmlrpclib.Fault exceptions, it will currently re-raise
+                # the exception if it is caused by a PageNotAvailable error.
+                logger.info("xmlrpclib.Fault raised, indicating that no exact match found for '%s' in space '%s'", pageTitle, spaceKey)
                 return None
-            logger.info("Performing slightly more extended search_filter_rank with query=%s, params=%s, required=%s, optional=%s",
-                        pageTitle, params, required, optional)
-            results = self.search_filter_rank(query, parameters=params, required=required, optional=optional)
-            logger.debug("len(results)=%s returned from search_filter_rank()", len(results))
-            if len(results) == 1:
-                pagestruct = results[0]
-                logger.info("pagestruct keys: %s", pagestruct.keys())
-                # pagestruct keys returned for a server search is: 'id', 'title', 'type', 'url', 'excerpt'
-                logger.info("Experiment.searchForWikiPageWithQuery() :: A single hit found : '%s: %s: %s'",
-                            pagestruct['space'], pagestruct['id'], pagestruct['title'])
-                return pagestruct
-            elif len(results) > 1:
-                logger.info("Many hits found, but only allowed to return a single match: %s",
-                            [u"{} ({})".format(page['title'], page['id']) for page in results])
-                return False
-        logger.debug("Unable to locate wiki page. Returning None...")
-        return None
+
+        def query_search(params):
+            """ Returns a function searching for pageTitle with params. """
+            return lambda: self.search(pageTitle, 30, params)
+
+        strategies = list(strategies or ())
+        strategies.append(SearchStrategy('exact-title', exact_search, True))
+        if searchlevel >= 1:
+            strategies.append(SearchStrategy('space-contributor', query_search(dict(spaceKey=spaceKey, contributor=user, type='page')), False))
+        if searchlevel >= 2:
+            strategies.append(SearchStrategy('contributor', query_search(dict(contributor=user, type='page')), False))
+            strategies.append(SearchStrategy('space', query_search(dict(spaceKey=spaceKey, type='page')), False))
+        logger.info("Searching for page '%s' in space '%s' using strategies %s", pageTitle, spaceKey,
+                    [strategy.name for strategy in strategies])
+        coordinator = self.SearchCoordinator
+        pagestruct = coordinator.run(strategies, required=required, optional=optional)
+        if self.Confighandler:
+            coordinator.saveWins(self.Confighandler, 'wiki_search_strategy_wins')
+        return pagestruct
 
 
     def search_filter_rank(self, query, parameters, required=None, optional=None):
@@ -922,47 +1018,12 @@ contributor:
         # UNFORTUNATELY, server results only contains: title, url, excerpt, type, id.
 
         Note that tuple elements in <required> and <optional> can be either strings
-        or compiled regex programs.
+        or compiled regex programs (see pagesearch.filter_rank).
         Note that this method may return a list with 0, 1 or more elements.
         """
-        # pylint: disable-msg=C0111,W0613
-        def evaluate_criteria(criteria, value):
-            if isinstance(criteria, string_types):
-                if criteria in value:
-                    return len(criteria)/len(value)
-                else:
-                    #logger.debug("Criteria '%s' not in value '%s'", criteria, value)
-                    return 0
-            else:
-                # compiled regex prog:
-                return 1 if criteria.match(value) else 0
-        if not optional:
-            def score_result(result):
-                return 0
-        else:
-            def score_result(result):
-                return sum(evaluate_criteria(criteria, result[key])
-                           for key, criterias in optional.items()
-                           for criteria in criterias)
-        if not required:
-            def result_passes_required(result):
-                return True
-        else:
-            logger.debug("Required filter: %s", required)
-            def result_passes_required(result):
-                return all(evaluate_criteria(criteria, result[key])
-                           for key, criterias in required.items()
-                           for criteria in criterias)
-
         results = self.search(query, 30, parameters)
-        logger.debug("Query and parameters returned %s results, filtering and ranking...", len(results))
-        if results:
-            if required:
-                if any(isinstance(value, string_types) for value in required.values()):
-                    logger.warning("Basestrings found directly in required dict and not as list/tuples as they should be! required = %s", required)
-                results = [page for page in results if result_passes_required(page)]
-            return sorted(results, key=score_result, reverse=True)
-        return results
+        logger.debug("Query and parameters returned %s results, filtering and ranking...", len(results) if results else results)
+        return filter_rank(results, required, optional)
 
 
 
@@ -23,18 +23,77 @@ Some parts of this is inspired/derived/taken from the projects:
     * Riamse/ceterach (copyright Andrew Wang <andrewwang43@gmail.com>)
 All of this has been released to the public domain.
 
+Bulk access:
+The MediaWiki API can return data for many pages in a single request, either for a list of
+titles (titles=A|B|C, at most 50 per request for normal users) or for the pages produced by a
+generator (e.g. generator=allpages, generator=search or generator=images). The client splits long
+title lists into batches of <titles_per_request> titles and follows the 'continue' protocol
+(https://www.mediawiki.org/wiki/API:Query#Continuing_queries) until all results have been received;
+the results of the continued requests are merged per page.
+
+All requests include maxlag=<maxlag> (serverparams 'maxlag', default 5 seconds), so the client backs off
+when the wiki's database replication is lagging: maxlag errors are retried after the Retry-After period.
+The requests.Session keeps the connection alive and requests gzip-compressed responses.
+Each request acquires a token from the client's RequestScheduler (see the ratelimit module);
+the API action (e.g. 'query' or 'edit') is used as method name for per-method rate limits.
 """
 
 
 from __future__ import print_function, division
+import time
+from datetime import datetime
+from collections import OrderedDict, Counter
+import requests
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-from abstract_rest_client import AbstractRestClient
+from abstract_rest_client import AbstractRestClient, RESTError
 
 
+MAXLAG = 5                  # Seconds of database lag at which the server should refuse requests.
+MAXLAG_RETRIES = 5
+TITLES_PER_REQUEST = 50     # API limit for multi-title queries (500 for bots).
+
+
+def chunks(seq, size):
+    """ Yields successive chunks of seq with (at most) size elements. """
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i+size]
+
+
+def parse_timestamp(value):
+    """ Returns a datetime for a MediaWiki timestamp, e.g. "2014-05-14T12:01:02Z". """
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_pages(batches):
+    """
+    Merges the pages of the 'query' results of a continued query, returning a list of pages in the order
+    they were first seen. When the continuation is for a page property (e.g. rvcontinue or iicontinue),
+    the same page is returned in several batches and its list properties (revisions, imageinfo, images)
+    are concatenated.
+    """
+    pages = OrderedDict()
+    for batch in batches:
+        for page in batch.get('pages', ()):
+            key = page.get('pageid') or page['title']
+            if key not in pages:
+                pages[key] = dict(page)
+                continue
+            merged = pages[key]
+            for prop, value in page.items():
+                if isinstance(value, list) and isinstance(merged.get(prop), list):
+                    merged[prop].extend(value)
+                else:
+                    merged.setdefault(prop, value)
+    return list(pages.values())
+
 
 class MediawikiRestClient(AbstractRestClient):
     """
@@ -42,6 +101,17 @@ class MediawikiRestClient(AbstractRestClient):
     Server interface to the REST API of a MediaWiki instance.
     Introduced summer 2014.
 
+    Returns data in the same format as the Confluence clients (page structs, page summaries,
+    attachment structs and search results), where namespaces play the role of spaces and
+    files used on a page play the role of attachments.
+
+    Bulk methods, fetching data for many pages with few requests:
+    - getPagesByTitle(titles)   - latest revision (with content) of many pages.
+    - getFileInfo(filenames)    - file info (url, size, mime type, uploader) of many files.
+    - getPages(spaceKey)        - all pages in a namespace (generator=allpages).
+    - getRevisions(pageTitle)   - the revision history of a page.
+    Generic queries: query(params) returns the results of a continued query,
+    queryPages(params, titles) the merged pages of a (batched) multi-title query.
 
     """
     def __init__(self, serverparams=None, username=None, password=None, logintoken=None,
@@ -55,18 +125,358 @@ class MediawikiRestClient(AbstractRestClient):
         * post : e.g. 80, 443, 8080, etc.
         * protocol : e.g. 'http', 'https'.
         * raisetimeouterrors : bool (whether to raise timeout errors during run).
+        * maxlag : maximum database lag (seconds) accepted, default 5.
+        * titles_per_request : titles per multi-title query, default 50 (use 500 for bot accounts).
+        * timeout : seconds to wait for a response (default 10).
         If e.g. appurl is not explicitly specified, it is generated from the noted sub-components.
         Note that some primitives (e.g. urlpostfix) will vary depending on the server
         implementation (XML-RPC vs REST). These defaults are usually specified in self._defaultparams.
         """
 
         logger.debug("New %s initializing...", self.__class__.__name__)
+        self.CONFIG_FORMAT = 'mediawiki_{}'
         super(MediawikiRestClient, self).__init__(serverparams=serverparams, username=username,
                                                   password=password, logintoken=logintoken,
                                                   confighandler=confighandler, autologin=autologin)
         self._defaultparams = dict(port='80', urlpostfix='/w/api.php', protocol='http')
+        self._csrftoken = None
+        self.Stats = Counter()     # requests, maxlag (retries)
         self.setup_rest_api()
 
+    @property
+    def Maxlag(self):
+        """ The maxlag parameter sent with every request (None disables maxlag). """
+        return self.getServerParam('maxlag', MAXLAG)
+
+    @property
+    def TitlesPerRequest(self):
+        """ Maximum number of titles per multi-title query. """
+        return int(self.getServerParam('titles_per_request', TITLES_PER_REQUEST))
+
+    @property
+    def Timeout(self):
+        """ Seconds to wait for the server to respond (serverparams 'timeout'). """
+        return self.getServerParam('timeout', 10)
+
+
+    ##############################
+    #### Requests           ######
+    ##############################
+
+    def api(self, params, post=False, retries=MAXLAG_RETRIES):
+        """
+        Makes a single API request with params (POST if post is True) and returns the decoded response.
+        - Connection errors are caught: self.notok() is invoked and None is returned.
+          While self.Breaker is open (after repeated connection errors), None is returned immediately.
+        - maxlag errors are retried (at most <retries> times) after the server's Retry-After period.
+        - Other API and HTTP errors are raised as RESTError.
+        """
+        if not self.Breaker.allow():
+            logger.debug("%s: circuit breaker is open, failing fast.", self.__class__.__name__)
+            return None
+        params = dict(params, format='json', formatversion=2)
+        if self.Maxlag is not None:
+            params.setdefault('maxlag', self.Maxlag)
+        for _ in range(retries + 1):
+            self.Scheduler.acquire(params.get('action'))
+            try:
+                if post:
+                    r = self.Session.post(self._apiurl, data=params, timeout=self.Timeout)
+                else:
+                    r = self.Session.get(self._apiurl, params=params, timeout=self.Timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.debug("%s, connection error during API request: %s", self.__class__.__name__, e)
+                self.notok()
+                self.Breaker.recordFailure()
+                return None
+            self.Stats['requests'] += 1
+            try:
+                result = r.json()
+            except ValueError:
+                self.process_request(r)     # Raises RESTError for HTTP errors.
+                raise RESTError("Could not decode API response: {}".format(r.text[:200]), r.status_code)
+            error = result.get('error') or {}
+            if error.get('code') == 'maxlag':
+                wait = float(r.headers.get('Retry-After', MAXLAG))
+                logger.info("Server is lagging (%s), retrying in %s seconds.", error.get('info'), wait)
+                self.Stats['maxlag'] += 1
+                time.sleep(wait)
+                continue
+            self.process_request(r)
+            if error:
+                raise RESTError("{}: {}".format(error.get('code'), error.get('info')), r.status_code)
+            self.setok()
+            return result
+        raise RESTError("Server is lagging, gave up after {} retries.".format(retries))
+
+    def query(self, params):
+        """
+        Makes an action=query request with params, following the 'continue' protocol.
+        Returns a list with the 'query' part of each response, or None if a request failed.
+        """
+        base = dict(params, action='query')
+        base['continue'] = ''
+        params = base
+        batches = list()
+        while True:
+            result = self.api(params)
+            if result is None:
+                return None
+            if 'query' in result:
+                batches.append(result['query'])
+            if 'continue' not in result:
+                return batches
+            # Only the continue keys of the last response are sent (keys from earlier responses may be obsolete):
+            params = dict(base, **result['continue'])
+
+    def queryPages(self, params, titles=None):
+        """
+        Returns the merged pages of a (continued) query with params.
+        If titles is given, the titles are queried in batches of self.TitlesPerRequest titles.
+        Returns None if a request failed.
+        """
+        if titles is None:
+            batches = self.query(params)
+            return merge_pages(batches) if batches is not None else None
+        batches = list()
+        for chunk in chunks(titles, self.TitlesPerRequest):
+            chunkbatches = self.query(dict(params, titles='|'.join(chunk)))
+            if chunkbatches is None:
+                return None
+            batches.extend(chunkbatches)
+        return merge_pages(batches)
+
+
+    ##############################
+    #### Login              ######
+    ##############################
+
+    def test_connection(self):
+        """ Returns True if the API can be reached. """
+        try:
+            return self.getServerInfo() is not None
+        except RESTError as e:
+            logger.info("%s, error while testing connection: %s", self.__class__.__name__, e)
+            return False
+
+    def login(self, username=None, password=None, doset=True, **kwargs):
+        """
+        Logs in with username and password (use a bot password, see Special:BotPasswords).
+        The login session is kept in the session cookies. Returns True if the login succeeded.
+        """
+        username = username or self.Username
+        password = password or self.Password
+        if not (username and password):
+            return None
+        batches = self.query(dict(meta='tokens', type='login'))
+        if not batches:
+            return None
+        token = batches[0]['tokens']['logintoken']
+        result = self.api(dict(action='login', lgname=username, lgpassword=password, lgtoken=token), post=True)
+        if not result or result.get('login', {}).get('result') != 'Success':
+            logger.info("Login failed for user '%s': %s", username, result and result.get('login'))
+            return None
+        self._csrftoken = None
+        if doset:
+            self._username = username
+            self.setok()
+        logger.info("Logged in as '%s'", username)
+        return True
+
+    def autologin(self, prompt=None):
+        """
+        Logs in if a username and password is available; otherwise the API is used anonymously
+        (most wikis allow anonymous reads). Invokes self.setok/notok and returns True if connected.
+        """
+        if self.Username and self.Password:
+            ok = self.login()
+        else:
+            ok = self.test_connection()
+        if ok:
+            self.setok()
+        else:
+            self.notok()
+        return ok
+
+    @property
+    def CsrfToken(self):
+        """ The token required for edits, obtained from the server on first use. """
+        if self._csrftoken is None:
+            batches = self.query(dict(meta='tokens', type='csrf'))
+            if batches:
+                self._csrftoken = batches[0]['tokens']['csrftoken']
+        return self._csrftoken
+
+
+    ##############################
+    #### Struct conversion  ######
+    ##############################
+
+    @staticmethod
+    def revisionContent(revision):
+        """ Returns the content of a revision (with or without rvslots). """
+        if 'slots' in revision:
+            return revision['slots'].get('main', {}).get('content')
+        return revision.get('content')
+
+    def pageSummary(self, page):
+        """ Returns a PageSummary struct (id, space, parentId, title, url, permissions) for an API page. """
+        return dict(id=str(page.get('pageid', '')), space=str(page.get('ns', 0)), parentId='0',
+                    title=page['title'], url=page.get('fullurl'), permissions='0')
+
+    def pageStruct(self, page):
+        """ Returns a Page struct for an API page with the latest revision (including content). """
+        struct = self.pageSummary(page)
+        revision = (page.get('revisions') or [{}])[0]
+        struct.update(version=str(revision.get('revid', '')), content=self.revisionContent(revision),
+                      modified=parse_timestamp(revision.get('timestamp')), modifier=revision.get('user'),
+                      contentStatus='current', current='true', homePage='false')
+        return struct
+
+    def revisionStruct(self, revision):
+        """ Returns a page history struct (version, modified, modifier, versionComment) for a revision. """
+        return dict(id=str(revision.get('revid')), version=str(revision.get('revid')),
+                    modified=parse_timestamp(revision.get('timestamp')), modifier=revision.get('user'),
+                    versionComment=revision.get('comment', ''))
+
+    def fileStruct(self, page):
+        """ Returns an Attachment struct for an API file page with imageinfo. """
+        info = (page.get('imageinfo') or [{}])[0]
+        filename = page['title'].partition(':')[2]
+        return dict(id=str(page.get('pageid', '')), title=filename, fileName=filename,
+                    fileSize=str(info.get('size', '')), contentType=info.get('mime'), url=info.get('url'),
+                    created=parse_timestamp(info.get('timestamp')), creator=info.get('user'),
+                    comment=info.get('comment', ''), sha1=info.get('sha1'))
+
+
+    ################################
+    #### Server and page methods ###
+    ################################
+
+    def getServerInfo(self):
+        """ Returns the general site info (sitename, generator (MediaWiki version), base, etc). """
+        batches = self.query(dict(meta='siteinfo', siprop='general'))
+        return batches[0]['general'] if batches else None
+
+    def getPages(self, spaceKey=0):
+        """ Returns the page summaries of all pages in namespace spaceKey (generator=allpages). """
+        pages = self.queryPages(dict(generator='allpages', gapnamespace=spaceKey, gaplimit='max', prop='info', inprop='url'))
+        return [self.pageSummary(page) for page in pages] if pages is not None else None
+
+    def getPagesByTitle(self, titles):
+        """
+        Returns page structs with the latest revision (and content) of each of the pages with titles,
+        using one request per TitlesPerRequest titles (plus continuations for large pages).
+        Missing pages are not included.
+        """
+        params = dict(prop='revisions|info', rvprop='ids|timestamp|user|content', rvslots='main', inprop='url')
+        pages = self.queryPages(params, titles=titles)
+        if pages is None:
+            return None
+        return [self.pageStruct(page) for page in pages if not page.get('missing') and not page.get('invalid')]
+
+    def getPage(self, pageId=None, spaceKey=None, pageTitle=None):
+        """
+        Returns the page struct of the page with pageId or pageTitle (spaceKey is ignored; the namespace
+        is part of the title). Raises RESTError if the page does not exist.
+        """
+        params = dict(prop='revisions|info', rvprop='ids|timestamp|user|content', rvslots='main', inprop='url')
+        if pageId:
+            params['pageids'] = str(pageId)
+        elif pageTitle:
+            params['titles'] = pageTitle
+        else:
+            raise ValueError("Must specify either pageId or pageTitle.")
+        pages = self.queryPages(params)
+        if pages is None:
+            return None
+        if not pages or pages[0].get('missing') or pages[0].get('invalid'):
+            raise RESTError("Page {} does not exist.".format(pageId or pageTitle), 404)
+        return self.pageStruct(pages[0])
+
+    def getChildren(self, pageTitle):
+        """ Returns the page summaries of the subpages of the page (titles starting with '<pageTitle>/'). """
+        pages = self.queryPages(dict(titles=pageTitle))
+        if not pages:
+            return None
+        namespace = pages[0].get('ns', 0)
+        # The allpages prefix excludes the namespace, e.g. 'Page/' for 'Help:Page/Sub':
+        prefix = pages[0]['title'].split(':', 1)[1] if namespace else pages[0]['title']
+        children = self.queryPages(dict(generator='allpages', gapprefix=prefix + '/', gapnamespace=namespace,
+                                        gaplimit='max', prop='info', inprop='url'))
+        return [self.pageSummary(child) for child in children] if children is not None else None
+
+    def getRevisions(self, pageTitle, limit=None):
+        """ Returns the revision history of the page (newest first), at most <limit> revisions (default: all). """
+        params = dict(titles=pageTitle, prop='revisions', rvprop='ids|timestamp|user|comment', rvlimit='max')
+        pages = self.queryPages(params)
+        if not pages:
+            return None
+        revisions = [self.revisionStruct(revision) for revision in pages[0].get('revisions', ())]
+        return revisions[:limit] if limit else revisions
+
+    getPageHistory = getRevisions
+
+    def getFileInfo(self, filenames):
+        """
+        Returns attachment structs (url, size, mime type, uploader, sha1) for the files with filenames
+        ('File:' prefix optional), using one request per TitlesPerRequest files.
+        """
+        titles = [name if name.startswith('File:') else 'File:' + name for name in filenames]
+        pages = self.queryPages(dict(prop='imageinfo', iiprop='url|size|mime|timestamp|user|sha1|comment'), titles=titles)
+        if pages is None:
+            return None
+        return [self.fileStruct(page) for page in pages if page.get('imageinfo')]
+
+    def getAttachments(self, pageTitle):
+        """ Returns attachment structs for the files used on the page (generator=images, single request). """
+        pages = self.queryPages(dict(titles=pageTitle, generator='images', gimlimit='max', prop='imageinfo',
+                                     iiprop='url|size|mime|timestamp|user|sha1|comment'))
+        if pages is None:
+            return None
+        return [self.fileStruct(page) for page in pages if page.get('imageinfo')]
+
+    def search(self, query, maxResults, parameters=None):
+        """
+        Full text search (generator=search), returning at most maxResults search result structs.
+        parameters may include 'spaceKey' (namespace number).
+        """
+        params = dict(generator='search', gsrsearch=query, gsrlimit=min(int(maxResults), 50), prop='info', inprop='url')
+        if parameters and 'spaceKey' in parameters:
+            params['gsrnamespace'] = parameters['spaceKey']
+        results = list()
+        base = dict(params, action='query')
+        base['continue'] = ''
+        params = base
+        while len(results) < maxResults:
+            result = self.api(params)
+            if result is None:
+                return None
+            pages = sorted(result.get('query', {}).get('pages', ()), key=lambda page: page.get('index', 0))
+            results.extend(dict(id=str(page['pageid']), title=page['title'], url=page.get('fullurl'),
+                                type='page', excerpt='') for page in pages)
+            if 'continue' not in result:
+                break
+            params = dict(base, **result['continue'])
+        return results[:maxResults]
+
+    def storePage(self, page_struct):
+        """
+        Creates or edits the page with page_struct['title'] and page_struct['content'].
+        If page_struct has a version (revision id), the edit is rejected (RESTError 'editconflict')
+        if the page has been edited since that revision. Returns the page struct of the stored page.
+        """
+        params = dict(action='edit', title=page_struct['title'], text=page_struct['content'],
+                      summary=page_struct.get('versionComment', ''), token=self.CsrfToken)
+        if page_struct.get('version'):
+            params['baserevid'] = page_struct['version']
+        else:
+            params['createonly'] = 1
+        result = self.api(params, post=True)
+        if result is None:
+            return None
+        return self.getPage(pageTitle=page_struct['title'])
+
 """
 
 === MediaWiki API libs: ===
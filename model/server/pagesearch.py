@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Concurrent multi-strategy page search.
+
+Finding the wiki page of an experiment can take several searches, e.g. an exact title lookup,
+a search in the experiment space with the user as contributor, and searches in all spaces.
+Instead of performing these one after another, the SearchCoordinator runs the search strategies
+concurrently and returns the first definitive hit; the remaining searches are ignored
+(strategies that have not started yet are skipped). A hit from an exact strategy (e.g. the page
+with the exact title) is preferred: if another strategy gives a definitive hit first, the coordinator
+waits for the exact strategies that are still running, and only returns the other hit if they find nothing.
+
+A strategy is a SearchStrategy(name, function, exact):
+- function() returns a list of page structs or search results (or a single struct, or None).
+- If exact is True, any result is a definitive hit (e.g. a page found by its exact title).
+- Otherwise, the results are filtered and ranked with filter_rank(results, required, optional),
+  and the result is a definitive hit if exactly one result passes the required criteria.
+
+If no strategy gives a definitive hit, the results of all strategies are merged and filtered/ranked:
+a single result is returned as the hit, while several results are ambiguous (run() returns False).
+
+The coordinator counts the wins of each strategy and starts the strategies with most wins first.
+The win counts can be stored in the config with saveWins(); to avoid writing the config file
+on every search, the file is written at most every WINS_SAVE_INTERVAL seconds.
+"""
+
+from __future__ import division
+from six import string_types
+import time
+import threading
+from collections import namedtuple, Counter, OrderedDict
+from multiprocessing.pool import ThreadPool
+from multiprocessing import TimeoutError
+
+from ratelimit import priority, current_priority
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+SearchStrategy = namedtuple('SearchStrategy', 'name function exact')
+WINS_SAVE_INTERVAL = 600
+
+
+def evaluate_criteria(criteria, value):
+    """
+    Returns the score of value for criteria, which can be a string (scored by len(criteria)/len(value)
+    if criteria is in value) or a compiled regex (scored 1 if it matches value).
+    """
+    if isinstance(criteria, string_types):
+        if criteria in value:
+            return len(criteria)/len(value)
+        return 0
+    # compiled regex prog:
+    return 1 if criteria.match(value) else 0
+
+
+def filter_rank(results, required=None, optional=None):
+    """
+    Filters results (list of page structs or search results) by required criteria and
+    ranks them by optional criteria (best first).
+    <required> and <optional> are dicts with tuples of strings or compiled regex programs, e.g.
+        required = {'title': ('RS123', ), 'creator': ('scholer', )}
+    """
+    if not results:
+        return results
+    if required:
+        if any(isinstance(value, string_types) for value in required.values()):
+            logger.warning("Basestrings found directly in required dict and not as list/tuples as they should be! required = %s", required)
+        results = [result for result in results
+                   if all(evaluate_criteria(criteria, result[key])
+                          for key, criterias in required.items()
+                          for criteria in criterias)]
+    if optional:
+        def score_result(result):
+            return sum(evaluate_criteria(criteria, result[key])
+                       for key, criterias in optional.items()
+                       for criteria in criterias)
+        results = sorted(results, key=score_result, reverse=True)
+    return results
+
+
+class SearchCoordinator(object):
+    """
+    Runs search strategies concurrently and returns the first definitive hit, see module docstring.
+    - workers:  maximum number of strategies running at the same time (default: all).
+    - timeout:  maximum time (in seconds) to wait for the strategies (default: no limit).
+    - wins:     dict with initial win counts by strategy name (e.g. persisted from a previous session).
+    """
+
+    def __init__(self, workers=None, timeout=None, wins=None):
+        self.Workers = workers
+        self.Timeout = timeout
+        self.Wins = Counter(wins or {})
+        self._lock = threading.Lock()
+        self._savedwins = dict(self.Wins)   # Win counts last written to the config file,
+        self._savedtime = 0                 # and when.
+
+    def orderStrategies(self, strategies):
+        """ Returns strategies sorted by number of wins (most first), otherwise keeping the given order. """
+        with self._lock:
+            wins = dict(self.Wins)
+        return sorted(strategies, key=lambda strategy: -wins.get(strategy.name, 0))
+
+    def recordWin(self, name):
+        """ Records that strategy <name> gave the hit. """
+        with self._lock:
+            self.Wins[name] += 1
+
+    def saveWins(self, confighandler, configkey='wiki_search_strategy_wins', interval=WINS_SAVE_INTERVAL):
+        """
+        Stores the win counts in config entry <configkey>. The config file is only written if it was last
+        written by this method more than <interval> seconds ago; until then, the counts are only updated
+        in memory (and written whenever the config is saved).
+        """
+        with self._lock:
+            wins = dict(self.Wins)
+        if wins == self._savedwins:
+            return
+        cfgtype = confighandler.setkey(configkey, wins, autosave=False)
+        if not cfgtype or time.time() - self._savedtime < interval:
+            return
+        self._savedwins, self._savedtime = wins, time.time()
+        try:
+            confighandler.saveConfigs([cfgtype])
+        except (IOError, OSError) as e:
+            logger.warning("Could not save search strategy win counts to config: %r", e)
+
+    def run(self, strategies, required=None, optional=None):
+        """
+        Runs strategies concurrently. Returns the first definitive hit (a page struct or search result),
+        preferring hits from exact strategies, False if the merged results are ambiguous (several results),
+        or None if nothing was found.
+        """
+        if not strategies:
+            return None
+        strategies = self.orderStrategies(strategies)
+        finished = threading.Event()
+        exactonly = threading.Event()   # Set when waiting for exact strategies only.
+        level = current_priority()  # Requests made by the strategies have the priority of the caller.
+
+        def run_strategy(strategy):
+            """ Returns (strategy, results); runs in a worker thread. """
+            if finished.is_set() or (exactonly.is_set() and not strategy.exact):
+                return strategy, None
+            try:
+                with priority(level):
+                    results = strategy.function()
+            except Exception as e:     # pylint: disable=W0703
+                logger.warning("%r raised by search strategy '%s'", e, strategy.name)
+                results = None
+            if isinstance(results, dict):
+                results = [results]
+            return strategy, results or []
+
+        resultsbystrategy = OrderedDict((strategy.name, []) for strategy in strategies)
+        pending_exact = set(strategy.name for strategy in strategies if strategy.exact)
+        hit = winner = None
+        otherhit = otherwinner = None   # Definitive hit from a strategy that is not exact.
+        if len(strategies) == 1:
+            outcomes = iter([run_strategy(strategies[0])])
+            pool = None
+        else:
+            pool = ThreadPool(min(self.Workers or len(strategies), len(strategies)))
+            outcomes = pool.imap_unordered(run_strategy, strategies, chunksize=1)
+            pool.close()    # Worker threads exit when the remaining strategies complete; their results are ignored.
+        try:
+            for _ in strategies:
+                strategy, results = outcomes.next(self.Timeout) if pool else next(outcomes)
+                logger.debug("Search strategy '%s' returned %s results.", strategy.name, len(results or []))
+                pending_exact.discard(strategy.name)
+                if results:
+                    resultsbystrategy[strategy.name] = results
+                    candidates = results if strategy.exact else filter_rank(results, required, optional)
+                    if strategy.exact and candidates:
+                        hit, winner = candidates[0], strategy.name
+                        break
+                    if len(candidates) == 1 and otherhit is None:
+                        otherhit, otherwinner = candidates[0], strategy.name
+                        exactonly.set()
+                if otherhit is not None and not pending_exact:
+                    break
+        except TimeoutError:
+            logger.info("Search timed out after %s seconds, using the results obtained so far.", self.Timeout)
+        finally:
+            finished.set()
+        if hit is None and otherhit is not None:
+            hit, winner = otherhit, otherwinner
+        if hit is not None:
+            logger.info("Search strategy '%s' found page '%s'", winner, hit.get('title'))
+            self.recordWin(winner)
+            return hit
+        # No definitive hit; merge the results of all strategies (in order) and filter/rank the merged results:
+        merged = OrderedDict()
+        for results in resultsbystrategy.values():
+            for result in results:
+                merged.setdefault(result.get('id'), result)
+        candidates = filter_rank(list(merged.values()), required, optional)
+        if len(candidates) == 1:
+            return candidates[0]
+        elif candidates:
+            logger.info("Many hits found, but only allowed to return a single match: %s",
+                        [u"{} ({})".format(page.get('title'), page.get('id')) for page in candidates])
+            return False
+        logger.debug("Unable to locate wiki page. Returning None...")
+        return None
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Client-side rate limiting and prioritisation of server requests.
+
+Prefetching, outbound queue replays and bulk command line runs can make many requests
+in a short time. To keep the load on a shared wiki within a budget, each client request
+first acquires a token from a RequestScheduler:
+
+    scheduler = RequestScheduler(rate=10, burst=20, methodrates={'storePage': 1})
+    scheduler.acquire('getPage')     # blocks until the request is allowed.
+
+The scheduler has a global token bucket (rate requests per second, bursts of up to burst requests)
+and optional per-method buckets. Requests that have to wait are served in order of priority class:
+
+    INTERACTIVE (0)  -  requests made in the main (UI) thread, by default.
+    BACKGROUND  (1)  -  requests made in other threads, e.g. prefetching and outbound queue replays.
+    BULK        (2)  -  bulk operations, e.g. labfluence_cmd --jobs.
+
+and in arrival order within a class; i.e. UI-triggered requests always go before queued background work.
+The priority of the requests made by a thread can be changed with the priority() context manager:
+
+    with priority(BULK):
+        server.getAttachments(pageId)
+
+Server clients get the scheduler shared by all clients with the same confighandler via
+get_request_scheduler(); the budget is configured with the server params
+(e.g. in the config entry 'wiki_serverparams'):
+- rate_limit:           requests per second (default: no limit).
+- rate_limit_burst:     number of requests that can be made at once (default: 2 x rate_limit).
+- method_rate_limits:   dict with requests per second for specific methods, e.g. {storePage: 1}.
+                        Methods are XML-RPC method names, HTTP methods (e.g. PUT) for the REST client,
+                        or API actions (e.g. edit) for the MediaWiki client.
+"""
+
+import time
+import heapq
+import threading
+import itertools
+from contextlib import contextmanager
+from collections import Counter
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Priority classes:
+INTERACTIVE, BACKGROUND, BULK = 0, 1, 2
+PRIORITY_NAMES = ('interactive', 'background', 'bulk')
+
+# Key for the request scheduler in confighandler.Singletons:
+SINGLETON_KEY = 'requestscheduler'
+
+_threadlocal = threading.local()
+
+
+def priority_level(level):
+    """ Returns the priority level for level, which may be a level number or a name, e.g. 'bulk'. """
+    if level in PRIORITY_NAMES:
+        return PRIORITY_NAMES.index(level)
+    return int(level)
+
+
+def current_priority():
+    """
+    Returns the priority class of requests made by the current thread:
+    as set with priority(), otherwise INTERACTIVE for the main thread and BACKGROUND for other threads.
+    """
+    level = getattr(_threadlocal, 'priority', None)
+    if level is None:
+        level = INTERACTIVE if isinstance(threading.current_thread(), threading._MainThread) else BACKGROUND # pylint: disable=W0212
+    return level
+
+
+@contextmanager
+def priority(level):
+    """ Context manager; requests made by the current thread within the context have priority <level>. """
+    previous = getattr(_threadlocal, 'priority', None)
+    _threadlocal.priority = priority_level(level)
+    try:
+        yield
+    finally:
+        _threadlocal.priority = previous
+
+
+class TokenBucket(object):
+    """
+    Token bucket with <rate> tokens per second and room for <burst> tokens.
+    Not thread safe; RequestScheduler uses its buckets while holding its lock.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.Rate = float(rate)
+        self.Burst = float(burst or max(2*self.Rate, 1))
+        self._tokens = self.Burst
+        self._last = time.time()
+
+    def _refill(self, now):
+        """ Adds the tokens accumulated since the last refill. """
+        self._tokens = min(self.Burst, self._tokens + (now - self._last) * self.Rate)
+        self._last = now
+
+    def delay(self, now=None, tokens=1):
+        """ Returns the number of seconds until <tokens> tokens are available (0 if available now). """
+        self._refill(now or time.time())
+        return max(0.0, (tokens - self._tokens) / self.Rate)
+
+    def consume(self, now=None, tokens=1):
+        """ Removes <tokens> tokens from the bucket. """
+        self._refill(now or time.time())
+        self._tokens -= tokens
+
+
+class RequestScheduler(object):
+    """
+    Limits the rate of requests with a global token bucket and per-method token buckets,
+    letting waiting requests through in order of priority class.
+    - rate:         requests per second (None: no global limit).
+    - burst:        size of the global bucket (default: 2 x rate).
+    - methodrates:  dict with requests per second by method name.
+    Stats counts the requests of each priority class and the number of requests that were delayed;
+    Waited has the total number of seconds waited by each priority class.
+    """
+
+    def __init__(self, rate=None, burst=None, methodrates=None):
+        self.Bucket = TokenBucket(rate, burst) if rate else None
+        self.MethodBuckets = dict((method, TokenBucket(methodrate))
+                                  for method, methodrate in (methodrates or {}).items() if methodrate)
+        self.Stats = Counter()
+        self.Waited = Counter()
+        self._cond = threading.Condition()
+        self._waiting = list()      # heap of (priority, ticket number)
+        self._tickets = itertools.count()
+
+    def acquire(self, method=None, level=None, timeout=None):
+        """
+        Waits until a request to <method> with priority <level> (default: current_priority()) is allowed
+        within the rate limits. Returns the number of seconds waited, or None if timeout (seconds)
+        was reached before the request was allowed.
+        """
+        level = current_priority() if level is None else priority_level(level)
+        buckets = [bucket for bucket in (self.Bucket, self.MethodBuckets.get(method)) if bucket is not None]
+        name = PRIORITY_NAMES[min(level, len(PRIORITY_NAMES)-1)]
+        if not buckets:
+            self.Stats[name] += 1
+            return 0.0
+        t0 = time.time()
+        with self._cond:
+            ticket = (level, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    delay = None    # Requests behind the first in line wait to be notified.
+                    if self._waiting[0] == ticket:
+                        delay = max(bucket.delay(now) for bucket in buckets)
+                        if delay <= 0:
+                            for bucket in buckets:
+                                bucket.consume(now)
+                            break
+                    if timeout is not None:
+                        remaining = t0 + timeout - now
+                        if remaining <= 0:
+                            logger.info("Request to %s (%s) was not allowed within %s seconds.", method, name, timeout)
+                            return None
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._cond.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            waited = time.time() - t0
+            self.Stats[name] += 1
+            if waited > 0.001:
+                self.Stats['delayed'] += 1
+                self.Waited[name] += waited
+                logger.debug("Request to %s (%s) delayed %.3f s by rate limit.", method, name, waited)
+        return waited
+
+
+def get_request_scheduler(confighandler, serverparams=None):
+    """
+    Returns the RequestScheduler shared by all server clients using confighandler (registered
+    as a confighandler singleton), creating it from the rate limits in serverparams if needed.
+    If confighandler does not support singletons, a new scheduler is returned.
+    """
+    getsingleton = getattr(confighandler, 'getSingleton', None)
+    scheduler = getsingleton(SINGLETON_KEY) if getsingleton else None
+    if scheduler is None:
+        serverparams = serverparams or {}
+        scheduler = RequestScheduler(rate=serverparams.get('rate_limit'),
+                                     burst=serverparams.get('rate_limit_burst'),
+                                     methodrates=serverparams.get('method_rate_limits'))
+        if getsingleton:
+            confighandler.setSingleton(SINGLETON_KEY, scheduler)
+    return scheduler
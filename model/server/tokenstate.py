@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Cache of login token states: when each token was last confirmed valid by the server.
+
+At startup, the stored login token must be validated with a round trip before it is known whether
+the user needs to log in. With a TokenStateCache, a client knows whether its token was confirmed
+valid recently (within <ttl> seconds), i.e. whether it is trusted:
+- A trusted token is used right away, while it is validated in the background
+  (see AbstractClient.autologinAsync); reads do not have to wait for the validation.
+- If the validation of a trusted token fails because the server cannot be reached
+  (e.g. a network glitch), the token is kept and the user is not prompted for credentials.
+
+Tokens are identified by a fingerprint (a hash); the tokens themselves are not stored.
+The confirmation times are persisted in the config entry <configkey> (in the 'user' config,
+like the encrypted token), so they are remembered between sessions. To avoid writing the config
+file on every request, a confirmation is only persisted if the persisted time is older than
+PERSIST_INTERVAL seconds.
+
+Server params (e.g. in the config entry 'wiki_serverparams'):
+- token_trust_ttl:  seconds a confirmed token is trusted (default 8 hours).
+"""
+
+import time
+import hashlib
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+TOKEN_TRUST_TTL = 8*3600
+PERSIST_INTERVAL = 600
+MAX_TOKENS = 4      # Confirmation times are remembered for this many tokens.
+
+
+def token_fingerprint(token):
+    """ Returns a fingerprint (truncated sha1 hash) identifying token. """
+    if isinstance(token, unicode):
+        token = token.encode('utf-8')
+    return hashlib.sha1(token).hexdigest()[:16]
+
+
+class TokenStateCache(object):
+    """
+    Thread-safe record of when login tokens were last confirmed valid, see module docstring.
+    - confighandler, configkey: where the confirmation times are persisted (None: memory only).
+    - ttl:  seconds a confirmed token is trusted.
+    """
+
+    def __init__(self, confighandler=None, configkey=None, ttl=TOKEN_TRUST_TTL):
+        self.Confighandler = confighandler
+        self.ConfigKey = configkey
+        self.TTL = ttl
+        self.Confirmed = dict()     # token fingerprint : time last confirmed valid.
+        self._persisted = dict()    # token fingerprint : time last persisted.
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """ Reads persisted confirmation times from the config. """
+        if self.Confighandler is None or not self.ConfigKey:
+            return
+        confirmed = self.Confighandler.get(self.ConfigKey) or dict()
+        if not isinstance(confirmed, dict):
+            logger.warning("Config entry %s is not a dict (is %s), ignoring it.", self.ConfigKey, type(confirmed))
+            return
+        with self._lock:
+            self.Confirmed.update(confirmed)
+            self._persisted = dict(confirmed)
+
+    def save(self):
+        """ Writes the confirmation times to the config (and saves the config). """
+        if self.Confighandler is None or not self.ConfigKey:
+            return
+        with self._lock:
+            confirmed = dict(self.Confirmed)
+            self._persisted = dict(confirmed)
+        try:
+            cfgtype = self.Confighandler.setkey(self.ConfigKey, confirmed, 'user', autosave=False)
+            self.Confighandler.saveConfigs([cfgtype])
+        except (IOError, OSError) as e:
+            logger.warning("Could not save token states to config: %r", e)
+
+    def lastConfirmed(self, token):
+        """ Returns the time token was last confirmed valid, or None. """
+        if not token:
+            return None
+        with self._lock:
+            return self.Confirmed.get(token_fingerprint(token))
+
+    def isTrusted(self, token):
+        """ Returns True if token was confirmed valid within the last self.TTL seconds. """
+        confirmed = self.lastConfirmed(token)
+        return confirmed is not None and time.time() - confirmed < self.TTL
+
+    def confirm(self, token):
+        """ Records that token was confirmed valid (now). """
+        if not token:
+            return
+        fingerprint, now = token_fingerprint(token), time.time()
+        with self._lock:
+            self.Confirmed[fingerprint] = now
+            for old in sorted(self.Confirmed, key=self.Confirmed.get)[:-MAX_TOKENS]:
+                del self.Confirmed[old]
+            persist = now - self._persisted.get(fingerprint, 0) > PERSIST_INTERVAL
+        if persist:
+            self.save()
+
+    def reject(self, token):
+        """ Records that token is not valid (forgetting when it was confirmed). """
+        if not token:
+            return
+        with self._lock:
+            found = self.Confirmed.pop(token_fingerprint(token), None) is not None
+        if found:
+            logger.debug("Token state cache: token rejected by server, no longer trusted.")
+            self.save()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,W0201
+"""
+Gzip compressed XML-RPC transport with transfer instrumentation.
+
+Experiment pages with years of journal entries and LIMS pages with thousands of rows are
+large XML-RPC payloads, which compress very well. The transports in this module:
+- ask for gzip compressed responses (Accept-Encoding: gzip), and
+- gzip compress requests larger than <threshold> bytes (Content-Encoding: gzip), if enabled.
+  If the server does not accept compressed requests (HTTP 400, 411, 415 or 501), the request is
+  sent again uncompressed and requests are no longer compressed.
+  Request compression is opt-in: Confluence's XML-RPC servlet (behind Tomcat) does not decompress
+  request bodies, and answers compressed requests with a Fault or HTTP 500, which cannot be told
+  apart from other server errors. Only enable it for servers known to accept compressed requests.
+
+Bytes transferred, compressed (on the wire) and uncompressed, are counted in a TransferStats object,
+which is shared by the transports of all threads of a client:
+
+    stats = TransferStats()
+    proxy = xmlrpclib.ServerProxy(url, transport=make_transport(url, stats), allow_none=True)
+    ...
+    stats.Counts    # requests, request_bytes, request_bytes_sent, response_bytes, response_bytes_received,
+                    # gzip_requests, gzip_responses
+    stats.summary() # e.g. "requests: 12, sent 80.1 kB (412.5 kB uncompressed), received ..."
+
+Server params (e.g. in the config entry 'wiki_serverparams'):
+- gzip_requests:    compress requests (default False, see above).
+- gzip_threshold:   minimum size in bytes of compressed requests (default 1400).
+"""
+
+import gzip
+import threading
+import xmlrpclib
+from io import BytesIO
+from collections import Counter
+
+import logging
+logger = logging.getLogger(__name__)
+
+GZIP_THRESHOLD = 1400     # Requests smaller than this are not worth compressing (fits in a single packet).
+REJECTED_ENCODING_ERRCODES = (400, 411, 415, 501)
+
+
+class TransferStats(object):
+    """
+    Thread-safe byte counts of a client's XML-RPC transports, and whether the server
+    accepts compressed requests (RequestCompression: None=untested, True or False).
+    """
+
+    def __init__(self):
+        self.Counts = Counter()
+        self.RequestCompression = None
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        """ Adds counts, e.g. add(requests=1, request_bytes=1234). """
+        with self._lock:
+            self.Counts.update(counts)
+
+    def ratio(self, direction='response'):
+        """ Returns the uncompressed/compressed size ratio of requests or responses (1.0 if none). """
+        sent = self.Counts[direction + '_bytes_sent'] or self.Counts[direction + '_bytes_received']
+        return float(self.Counts[direction + '_bytes']) / sent if sent else 1.0
+
+    def summary(self):
+        """ Returns a one-line summary of the bytes transferred. """
+        counts = self.Counts
+        return ("requests: {}, sent {:.1f} kB ({:.1f} kB uncompressed), "
+                "received {:.1f} kB ({:.1f} kB uncompressed)").format(
+                    counts['requests'], counts['request_bytes_sent']/1024., counts['request_bytes']/1024.,
+                    counts['response_bytes_received']/1024., counts['response_bytes']/1024.)
+
+
+class GzipTransportMixin(object):
+    """
+    Overrides xmlrpclib.Transport methods to compress requests, accept compressed responses,
+    and count the bytes transferred in self.Stats.
+    """
+    accept_gzip_encoding = True
+
+    def init_gzip(self, stats=None, threshold=GZIP_THRESHOLD):
+        """ Sets up compression; call from __init__. threshold=None disables request compression. """
+        self.Stats = stats if stats is not None else TransferStats()
+        self.Threshold = threshold
+
+    def compressRequest(self, request_body):
+        """ Returns True if request_body should be compressed. """
+        return self.Threshold is not None and self.Stats.RequestCompression is not False \
+            and len(request_body) > self.Threshold
+
+    def request(self, host, handler, request_body, verbose=0):
+        """ Makes the request; if a compressed request is rejected, it is sent again uncompressed. """
+        compressed = self.compressRequest(request_body)
+        try:
+            result = self._request(host, handler, request_body, verbose)
+        except xmlrpclib.ProtocolError as e:
+            if not compressed or e.errcode not in REJECTED_ENCODING_ERRCODES:
+                raise
+            logger.info("Server rejected gzip compressed request (%s %s), sending requests uncompressed.",
+                        e.errcode, e.errmsg)
+            self.Stats.RequestCompression = False
+            self.close()
+            return self._request(host, handler, request_body, verbose)
+        if compressed and not self.Stats.RequestCompression:
+            self.Stats.RequestCompression = True
+        return result
+
+    def send_content(self, connection, request_body):
+        """ Sends the request body, compressed if larger than self.Threshold. """
+        connection.putheader("Content-Type", "text/xml")
+        size = len(request_body)
+        if self.compressRequest(request_body):
+            connection.putheader("Content-Encoding", "gzip")
+            request_body = xmlrpclib.gzip_encode(request_body)
+            self.Stats.add(gzip_requests=1)
+        self.Stats.add(requests=1, request_bytes=size, request_bytes_sent=len(request_body))
+        if size > 100*1024:
+            logger.debug("Sending request of %s bytes as %s bytes.", size, len(request_body))
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        """ Reads and parses the (possibly compressed) response, counting compressed and uncompressed bytes. """
+        body = response.read()
+        received = len(body)
+        if response.getheader("Content-Encoding", "") == "gzip":
+            body = gzip.GzipFile(mode="rb", fileobj=BytesIO(body)).read()
+            self.Stats.add(gzip_responses=1)
+        self.Stats.add(response_bytes=len(body), response_bytes_received=received)
+        if len(body) > 100*1024:
+            logger.debug("Received response of %s bytes as %s bytes.", len(body), received)
+        if self.verbose:
+            logger.debug("body: %r", body)
+        parser, unmarshaller = self.getparser()
+        parser.feed(body)
+        parser.close()
+        return unmarshaller.close()
+
+
+class GzipTransport(GzipTransportMixin, xmlrpclib.Transport):
+    """ HTTP transport with gzip compression of requests and responses. """
+
+    def __init__(self, use_datetime=0, stats=None, threshold=GZIP_THRESHOLD):
+        xmlrpclib.Transport.__init__(self, use_datetime=use_datetime)
+        self.init_gzip(stats, threshold)
+
+    def _request(self, host, handler, request_body, verbose=0):
+        return xmlrpclib.Transport.request(self, host, handler, request_body, verbose)
+
+
+class SafeGzipTransport(GzipTransportMixin, xmlrpclib.SafeTransport):
+    """ HTTPS transport with gzip compression of requests and responses. """
+
+    def __init__(self, use_datetime=0, stats=None, threshold=GZIP_THRESHOLD):
+        xmlrpclib.SafeTransport.__init__(self, use_datetime=use_datetime)
+        self.init_gzip(stats, threshold)
+
+    def _request(self, host, handler, request_body, verbose=0):
+        return xmlrpclib.SafeTransport.request(self, host, handler, request_body, verbose)
+
+
+def make_transport(url, stats=None, threshold=GZIP_THRESHOLD, use_datetime=True):
+    """ Returns a GzipTransport or SafeGzipTransport (for https urls) counting transfers in stats. """
+    cls = SafeGzipTransport if url.lower().startswith('https') else GzipTransport
+    return cls(use_datetime=use_datetime, stats=stats, threshold=threshold)
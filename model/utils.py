@@ -41,20 +41,17 @@ except ImportError:
 logging.addLevelName(4, 'SPAM') # Will convert LEVEL to 'SPAM' when printing logs for lvl 4, logger.log(4, msg, *args)
 logger = logging.getLogger(__name__)
 
-try:
-    import magic        # pylint: disable=F0401
-    MAGIC_AVAILABLE = True
-except ImportError:
-    MAGIC_AVAILABLE = False
+from lazyimport import lazy_import, module_available
+
+# Optional modules are imported on first use, so they do not slow down application startup:
+magic = lazy_import('magic')
+MAGIC_AVAILABLE = module_available('magic')
+if not MAGIC_AVAILABLE:
     logger.info("Notice: magic module is not available; mimetypes will be based on file extensions. See http://pypi.python.org/pypi/python-magic/ for info on installing the filemagic python module.")
-    import mimetypes
+import mimetypes
 
-try:
-    # ASCII large-font print driver:
-    import pyfiglet
-    from pyfiglet import Figlet
-except ImportError:
-    Figlet = None
+# ASCII large-font print driver:
+pyfiglet = lazy_import('pyfiglet')
 
 
 def print_figlet(text, **kwargs):
@@ -62,7 +59,7 @@ def print_figlet(text, **kwargs):
     Print text with figlet font.
     There is also
     """
-    if Figlet is None:
+    if not pyfiglet:
         logger.warning("pyfiglet module not available.")
         print(text)
         return
@@ -82,11 +79,11 @@ def figlet_header(text, font='colossal', smushMode=None):
     * Roman
     * Univers
     """
-    if Figlet is None:
+    if not pyfiglet:
         logger.warning("pyfiglet module not available.")
         return
     ## TODO: Add labfluence settings option to change font, etc.
-    f = Figlet(font=font)
+    f = pyfiglet.Figlet(font=font)
     if smushMode is not None:
         # pyfiglet default smushMode is calculated by pyfiglet.FigletFont.loadFont()
         # For some, e.g. colossal, the resulting smushMode of 128 smushes the characters a bit too much.
@@ -105,7 +102,7 @@ def getmimetype(filepath):
     Returns the mime type of a file, using the best
     methods available on the current installation.
     """
-    if MAGIC_AVAILABLE:
+    if MAGIC_AVAILABLE and magic:
         if hasattr(magic, 'MAGIC_MIME_TYPE'):
             # Old magic module:
             with magic.Magic(flags=magic.MAGIC_MIME_TYPE) as mimeprober:
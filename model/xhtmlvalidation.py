@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103
+"""
+Fast validation of xhtml in confluence storage format, using the expat parser from the standard library.
+
+Page content is not a complete xml document: it has no single root element, uses the
+ac: and ri: namespace prefixes without declaring them, and may use HTML entities such as &nbsp;.
+The content is therefore parsed inside a wrapper root element, with a DOCTYPE that declares the HTML entities.
+(Namespace processing is not enabled, so undeclared prefixes are accepted.)
+
+    error = find_xhtml_error(xhtml)     # None if xhtml is well-formed, otherwise an XhtmlError
+    if error:
+        print("Error at line {0.line}, column {0.column}: {0.message}".format(error))
+
+Results are cached by content hash (see CACHE_SIZE), so repeated validation
+of the same content (e.g. before page updates and journal flushes) is practically free.
+"""
+
+import hashlib
+import threading
+from collections import namedtuple, OrderedDict
+from xml.parsers import expat
+try:
+    from htmlentitydefs import name2codepoint
+except ImportError:
+    from html.entities import name2codepoint
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# The five predefined xml entities must not be re-declared:
+_ENTITIES = "".join('<!ENTITY {} "&#{};">'.format(name, codepoint) for name, codepoint in sorted(name2codepoint.items())
+                    if name not in ('amp', 'lt', 'gt', 'quot', 'apos'))
+ROOT_ELEMENT = "labfluence-xhtml"
+# Both prefix and suffix are on a single line, so line numbers in the content are unchanged:
+PREFIX = '<!DOCTYPE {root} [{entities}]><{root}>'.format(root=ROOT_ELEMENT, entities=_ENTITIES).encode('ascii')
+SUFFIX = '</{}>'.format(ROOT_ELEMENT).encode('ascii')
+
+# Number of validation results to cache:
+CACHE_SIZE = 64
+
+
+class XhtmlError(namedtuple('XhtmlError', 'message line column offset')):
+    """
+    Describes the first error found in an xhtml string:
+    - message: expat's error message, with the offending tag for unclosed/mismatched tags.
+    - line, column: line number (starting at 1) and column (starting at 0) in the xhtml.
+    - offset: character index of the error in the xhtml.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return "{} (line {}, column {})".format(self.message, self.line, self.column)
+
+
+class _CharPosition(object):
+    """ Converts byte positions reported by expat to (line, column, offset) in the (unicode) xhtml. """
+
+    def __init__(self, data):
+        self.Data = data
+
+    def __call__(self, byteindex):
+        byteindex = min(max(0, byteindex - len(PREFIX)), len(self.Data))
+        head = self.Data[:byteindex].decode('utf-8', 'replace')
+        line = head.count(u'\n') + 1
+        column = len(head) - (head.rfind(u'\n') + 1)
+        return line, column, len(head)
+
+
+def _parse(data, track_elements=False):
+    """
+    Parses utf-8 encoded data with expat. Returns None if data is well-formed, else an XhtmlError.
+    If track_elements is True, element start positions are recorded, so the error message can
+    include the unclosed element (this is slower and only used once an error has been found).
+    """
+    parser = expat.ParserCreate('utf-8')
+    stack = list()
+    if track_elements:
+        def start(name, attrs):
+            stack.append((name, parser.CurrentByteIndex))
+        def end(name):
+            stack.pop()
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+    try:
+        parser.Parse(PREFIX, False)
+        parser.Parse(data, False)
+        parser.Parse(SUFFIX, True)
+    except expat.ExpatError as e:
+        position = _CharPosition(data)
+        line, column, offset = position(parser.ErrorByteIndex)
+        message = expat.ErrorString(e.code)
+        if stack and stack[-1][0] != ROOT_ELEMENT and message == expat.errors.XML_ERROR_TAG_MISMATCH:
+            name, byteindex = stack[-1]
+            openline, opencolumn, _ = position(byteindex)
+            message = "{}: <{}> opened at line {}, column {} is not closed".format(message, name, openline, opencolumn)
+        return XhtmlError(message, line, column, offset)
+    return None
+
+
+_cache = OrderedDict()
+_cachelock = threading.Lock()
+
+
+def find_xhtml_error(xhtml):
+    """
+    Returns None if xhtml (str or unicode) is well-formed, otherwise an XhtmlError describing the first error.
+    """
+    data = xhtml.encode('utf-8') if isinstance(xhtml, type(u'')) else xhtml
+    key = hashlib.sha1(data).digest()
+    with _cachelock:
+        if key in _cache:
+            result = _cache.pop(key)
+            _cache[key] = result     # most recently used is last.
+            return result
+    result = _parse(data)
+    if result is not None:
+        result = _parse(data, track_elements=True)
+    with _cachelock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def validate_xhtml(xhtml):
+    """ Returns True if xhtml is well-formed, False otherwise. """
+    return find_xhtml_error(xhtml) is None
+
+
+def clear_cache():
+    """ Clears the validation results cache. """
+    with _cachelock:
+        _cache.clear()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable=C0103,W0212,W0603
+
+"""
+Startup tracing: measures import time per module and time per init phase.
+
+Usage (this module must be imported before the modules you want to trace):
+    import startuptrace
+    startuptrace.enable()           # install import hook
+    ...imports...
+    with startuptrace.tracer.phase("Init confighandler"):
+        ...
+    startuptrace.tracer.mark("First window shown")
+    print(startuptrace.tracer.report())
+
+Phases are always recorded (this is cheap); the import hook is only
+installed when enable() is called, e.g. by labfluence.py --profile-startup
+or when the LABFLUENCE_PROFILE_STARTUP environment variable is set.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+from contextlib import contextmanager
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Best available wall-clock timer:
+timer = time.clock if sys.platform == 'win32' else time.time
+
+
+class StartupTracer(object):
+    """
+    Records import times and init phase times.
+    - Imports: list of (modulename, cumulative seconds, self seconds, depth) for each import
+      that loaded new modules. Self time excludes the time spent importing nested modules.
+    - Phases: list of (phasename, start offset in seconds, duration in seconds).
+    """
+
+    def __init__(self):
+        self.T0 = timer()
+        self.Imports = list()
+        self.Phases = list()
+        self._stack = list()    # accumulated child import time for each import in progress
+        self._phasestack = list()   # (name, start) for each phase in progress
+        self._original_import = None
+
+    @property
+    def Enabled(self):
+        """ Whether the import hook is installed. """
+        return self._original_import is not None
+
+    def elapsed(self):
+        """ Seconds since the tracer was created (i.e. approximately since startup). """
+        return timer() - self.T0
+
+    def installImportHook(self):
+        """ Replaces the builtin __import__ with a timing wrapper. """
+        if self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def removeImportHook(self):
+        """ Restores the original builtin __import__. """
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        self._original_import = None
+
+    def _import(self, name, *args, **kwargs):
+        nmodules = len(sys.modules)
+        self._stack.append(0.0)
+        t0 = timer()
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            elapsed = timer() - t0
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            if len(sys.modules) > nmodules:
+                # Implicit relative imports (python 2) are ambiguous, so include the importing module:
+                importer = (args[0] if args else kwargs.get('globals')) or {}
+                if importer.get('__name__') not in (None, '__main__'):
+                    name = "{} (from {})".format(name, importer['__name__'])
+                self.Imports.append((name, elapsed, elapsed - children, len(self._stack)))
+
+    def begin(self, name):
+        """ Starts phase <name>; the phase is recorded when end() is called. """
+        self._phasestack.append((name, self.elapsed()))
+
+    def end(self):
+        """ Ends the most recently started phase. """
+        name, start = self._phasestack.pop()
+        self.Phases.append((name, start, self.elapsed() - start))
+        logger.debug("Startup phase '%s' completed in %.3f s", name, self.Phases[-1][2])
+
+    @contextmanager
+    def phase(self, name):
+        """ Context manager, records the time spent in the with-block as phase <name>. """
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def mark(self, name):
+        """ Records a point in time (a zero-duration phase), e.g. 'First window shown'. """
+        self.Phases.append((name, self.elapsed(), 0.0))
+
+    def report(self, top=20):
+        """ Returns a human readable report of phase and import times. """
+        lines = ["Startup trace ({:.3f} s since start):".format(self.elapsed()), "",
+                 "Phases:"]
+        for name, start, duration in self.Phases:
+            lines.append("  {:>8.1f} ms  {:>8.1f} ms  {}".format(start*1000, duration*1000, name))
+        if self.Imports:
+            lines += ["", "Slowest imports (self time, cumulative time):"]
+            for name, cumulative, selftime, depth in sorted(self.Imports, key=lambda tup: tup[2], reverse=True)[:top]:
+                lines.append("  {:>8.1f} ms  {:>8.1f} ms  {}{}".format(selftime*1000, cumulative*1000, "  "*depth, name))
+            toplevel = sum(cumulative for name, cumulative, selftime, depth in self.Imports if depth == 0)
+            lines.append("  Total import time (top-level imports): {:.1f} ms".format(toplevel*1000))
+        return "\n".join(lines)
+
+
+tracer = StartupTracer()
+
+
+def enable():
+    """ Enables import tracing for the global tracer. """
+    tracer.installImportHook()
+    return tracer
+
+
+def requested(argv=None):
+    """ Returns True if startup profiling is requested by command line argument or environment. """
+    argv = sys.argv if argv is None else argv
+    return '--profile-startup' in argv or bool(os.environ.get('LABFLUENCE_PROFILE_STARTUP'))
@@ -95,3 +95,75 @@ def test_getPageXhtml(monkeypatch, fakeconfighandler, testpagestruct):
     #524308
     xhtml = labfluence_cmd.getPageXhtml('524308')
     assert xhtml == testpagestruct['content']
+
+
+def test_getpagestruct_jobs(monkeypatch, fakeconfighandler, testpagestruct, capsys):
+    monkeypatch.setattr('labfluence_cmd.confighandler', fakeconfighandler)
+    args = labfluence_cmd.parse_args(['--jobs', '4', '--outputformat', 'json', 'getpagestruct', '524308', '524308', '1'])
+    exitcode = args.func(args)
+    out, err = capsys.readouterr()
+    # pageId 1 does not exist:
+    assert exitcode == 1
+    assert [item for item, error in args.failures] == [1]
+    assert "1 of 3 items failed" in err
+    assert out.count('"id": "524308"') == 2
+
+def test_run_items_order(monkeypatch):
+    import time
+    args = labfluence_cmd.parse_args(['--jobs', '3', '--order', 'completed', 'getpagestruct', '1'])
+    def slow(item):
+        time.sleep(item*0.05)
+        return item
+    items = [3, 1, 2]
+    assert [item for item, result, error in labfluence_cmd.run_items(slow, items, args)] == [1, 2, 3]
+    args.order = 'input'
+    assert [result for item, result, error in labfluence_cmd.run_items(slow, items, args)] == [3, 1, 2]
+    args.jobs = 1
+    assert [result for item, result, error in labfluence_cmd.run_items(slow, items, args)] == [3, 1, 2]
+    assert args.failures == []
+
+def test_getpagestruct_ndjson(monkeypatch, fakeconfighandler, testpagestruct, capsys):
+    import json
+    monkeypatch.setattr('labfluence_cmd.confighandler', fakeconfighandler)
+    args = labfluence_cmd.parse_args(['--jobs', '2', '--outputformat', 'ndjson', 'getpagestruct', '524308', '1', '524308'])
+    exitcode = args.func(args)
+    out, err = capsys.readouterr()
+    assert exitcode == 1
+    lines = out.splitlines()
+    assert len(lines) == 3
+    # The failed page is written as an error record, in input order (--order input):
+    assert [json.loads(line) for line in lines] == [testpagestruct, {'pageId': 1, 'error': 'no result'}, testpagestruct]
+
+def test_getpagexhtml_ndjson(monkeypatch, fakeconfighandler, testpagestruct, capsys):
+    import json
+    monkeypatch.setattr('labfluence_cmd.confighandler', fakeconfighandler)
+    args = labfluence_cmd.parse_args(['--outputformat', 'ndjson', 'getpagexhtml', '1', '524308'])
+    assert args.func(args) == 1
+    out, err = capsys.readouterr()
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {'pageId': 1, 'error': 'no result'}, {'pageId': 524308, 'content': testpagestruct['content']}]
+
+def test_outputrecord(capsys):
+    import json
+    from datetime import datetime
+    labfluence_cmd.outputres([{'created': datetime(2014, 1, 6, 12, 0)}, {'id': 2}], 'NDJSON')
+    out, err = capsys.readouterr()
+    assert [json.loads(line) for line in out.splitlines()] == [{'created': '2014-01-06T12:00:00'}, {'id': 2}]
+
+def test_getattachments_failed_pages(monkeypatch, fakeconfighandler, capsys):
+    import json
+    monkeypatch.setattr('labfluence_cmd.confighandler', fakeconfighandler)
+    args = labfluence_cmd.parse_args(['--jobs', '2', '--outputformat', 'json', 'getattachments', '917518', '1'])
+    exitcode = args.func(args)
+    out, err = capsys.readouterr()
+    # pageId 1 does not exist; the output is keyed by pageId, so the failed page is not silently omitted:
+    assert exitcode == 1 and "1 of 2 items failed" in err
+    res = json.loads(out)
+    assert sorted(res) == ['1', '917518']
+    assert res['1'] is None and len(res['917518']) > 0
+    args = labfluence_cmd.parse_args(['--outputformat', 'ndjson', 'getattachments', '1', '917518'])
+    assert args.func(args) == 1
+    out, err = capsys.readouterr()
+    records = [json.loads(line) for line in out.splitlines()]
+    assert records[0] == {'pageId': 1, 'error': 'no result'}
+    assert all(record['pageId'] == '917518' for record in records[1:]) and len(records) > 1
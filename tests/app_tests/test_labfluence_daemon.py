@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=W0621,C0111
+"""
+Tests for the labfluence_daemon.py module.
+
+"""
+
+import os
+import json
+import socket
+import tempfile
+import threading
+from StringIO import StringIO
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+import labfluence_cmd
+import labfluence_daemon
+
+## Test doubles:
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_server import FakeConfluenceServer
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="UNIX sockets not available")
+
+
+@pytest.fixture
+def fakeconfighandler():
+    ch = FakeConfighandler(pathscheme='test1')
+    server = FakeConfluenceServer(autologin=True, ui=None, confighandler=ch)
+    ch.Singletons['server'] = server
+    return ch
+
+@pytest.fixture
+def daemon(request, fakeconfighandler):
+    socketpath = os.path.join(tempfile.mkdtemp(), "labfluence.sock")
+    daemon = labfluence_daemon.LabfluenceDaemon(socketpath, fakeconfighandler)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def fin():
+        daemon.shutdown()
+        daemon.server_close()
+    request.addfinalizer(fin)
+    return daemon
+
+
+def test_no_daemon():
+    socketpath = os.path.join(tempfile.mkdtemp(), "labfluence.sock")
+    assert labfluence_daemon.run_in_daemon(['getserverinfo'], socketpath) is None
+
+def test_run_in_daemon(daemon):
+    out, err = StringIO(), StringIO()
+    exitcode = labfluence_daemon.run_in_daemon(['--outputformat', 'ndjson', 'getpagestruct', '524308', '1'],
+                                               daemon.Socketpath, stdout=out, stderr=err)
+    assert exitcode == 1
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert records[0]['id'] == '524308' and records[1] == {'pageId': 1, 'error': 'no result'}
+    assert "1 of 2 items failed" in err.getvalue()
+    # The daemon keeps serving:
+    exitcode = labfluence_daemon.run_in_daemon(['--outputformat', 'json', 'getpagestruct', '524308'],
+                                               daemon.Socketpath, stdout=out, stderr=err)
+    assert exitcode == 0
+    assert daemon.Commandcount == 2
+
+def test_relative_paths_use_client_cwd(daemon):
+    clientdir = tempfile.mkdtemp()
+    with open(os.path.join(clientdir, 'notes.txt'), 'w') as fd:
+        fd.write("Journal notes")
+    argsns = labfluence_cmd.parse_args(['addattachments', '524308', 'notes.txt'])
+    labfluence_daemon.resolve_paths(argsns, clientdir, ['files', 'nonexisting'])
+    assert argsns.files == [os.path.join(clientdir, 'notes.txt')]
+    # The file is found although it is not in the daemon's working directory:
+    out, err = StringIO(), StringIO()
+    exitcode = labfluence_daemon.run_in_daemon(['--outputformat', 'ndjson', 'addattachments', '524308', 'notes.txt'],
+                                               daemon.Socketpath, stdout=out, stderr=err, cwd=clientdir)
+    assert exitcode == 0, err.getvalue()
+    assert json.loads(out.getvalue())['fileName'] == 'notes.txt'
+
+def test_invalid_args(daemon):
+    out, err = StringIO(), StringIO()
+    exitcode = labfluence_daemon.run_in_daemon(['nonexistingcommand'], daemon.Socketpath, stdout=out, stderr=err)
+    assert exitcode == 2
+    assert "invalid choice" in err.getvalue()
+
+def test_stale_socket(daemon):
+    # A second daemon cannot take over the socket of a running daemon:
+    with pytest.raises(RuntimeError):
+        labfluence_daemon.remove_stale_socket(daemon.Socketpath)
+
+def test_socketdir_is_private(monkeypatch):
+    monkeypatch.delenv('LABFLUENCE_SOCKET', raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', tempfile.mkdtemp())
+    socketpath = labfluence_daemon.get_socketpath('test1')
+    socketdir = os.path.dirname(socketpath)
+    assert socketdir == os.path.join(tempfile.tempdir, "labfluence-{}".format(os.getuid()))
+    labfluence_daemon.make_socketdir(socketdir)
+    assert os.stat(socketdir).st_mode & 0o777 == 0o700
+    # A directory other users can access is not used:
+    os.chmod(socketdir, 0o777)
+    with pytest.raises(RuntimeError):
+        labfluence_daemon.make_socketdir(socketdir)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', socketdir)
+    assert labfluence_daemon.get_socketpath('test1') == os.path.join(socketdir, "labfluence-test1.sock")
+
+def test_socket_owned_by_other_user(monkeypatch, daemon):
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(daemon.Socketpath).st_uid + 1)
+    # The client does not connect to, and the daemon does not remove, another user's socket:
+    assert labfluence_daemon.run_in_daemon(['getserverinfo'], daemon.Socketpath) is None
+    with pytest.raises(RuntimeError):
+        labfluence_daemon.remove_stale_socket(daemon.Socketpath)
+    assert os.path.exists(daemon.Socketpath)
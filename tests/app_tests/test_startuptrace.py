@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=W0621,C0111
+"""
+Tests for the startuptrace.py module.
+
+"""
+
+import sys
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+from startuptrace import StartupTracer, requested
+
+
+def test_phases():
+    tracer = StartupTracer()
+    with tracer.phase("outer"):
+        tracer.begin("inner")
+        time.sleep(0.01)
+        tracer.end()
+    tracer.mark("done")
+    assert [name for name, start, duration in tracer.Phases] == ["inner", "outer", "done"]
+    assert tracer.Phases[1][2] >= tracer.Phases[0][2] >= 0.005
+    assert "outer" in tracer.report()
+
+def test_import_hook():
+    tracer = StartupTracer()
+    sys.modules.pop('colorsys', None)
+    tracer.installImportHook()
+    try:
+        import colorsys     # pylint: disable=W0612
+        import os           # already imported, not recorded.    pylint: disable=W0612
+    finally:
+        tracer.removeImportHook()
+    assert not tracer.Enabled
+    assert [name for name, cumulative, selftime, depth in tracer.Imports] == ['colorsys (from {})'.format(__name__)]
+    assert "colorsys" in tracer.report()
+
+def test_requested(monkeypatch):
+    monkeypatch.delenv('LABFLUENCE_PROFILE_STARTUP', raising=False)
+    assert requested(['labfluence.py', '--profile-startup'])
+    assert not requested(['labfluence.py'])
+    monkeypatch.setenv('LABFLUENCE_PROFILE_STARTUP', '1')
+    assert requested(['labfluence.py'])
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+"""
+Benchmarks.
+
+Benchmark scripts are named bench_<something>.py, so they are not collected by py.test.
+Run them as modules from the project root directory, e.g.:
+: python -m tests.benchmarks.bench_listboxes
+
+Each benchmark prints a table of timings; use benchutils.timeit to time a callable.
+Benchmarks can save their results as a baseline (in baselines/) with benchutils.save_baseline,
+and flag regressions against it with benchutils.compare_baseline.
+exptreegen.py generates synthetic experiment directory trees of any size,
+and pagegen.py generates large experiment and LIMS wiki pages.
+bench_xmlrpc.py runs the real XML-RPC client against the local confluence stand-in
+(model/model_testdoubles/fake_xmlrpcserver.py) with simulated latency and faults.
+"""
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Filesystem benchmarks: parsing of large local experiment trees.
+
+A synthetic tree (see exptreegen.py) is generated in a temporary directory and the following are timed:
+- dirtreeparsing.genPathmatchTupsByPathscheme (experiments and subentries)
+- ExperimentManager.mergeLocalExperiments (one year folder)
+- ExperimentManager.getDuplicates (experiments and subentries)
+- SatelliteLocation.getSubentryfoldersByExpidSubidx
+- Filemanager.getLocalFilelist (for a sample of experiments)
+
+Results are compared with the saved baseline (baselines/bench_filesystem.json), and timings more than
+--tolerance times slower than the baseline are reported as regressions (exit code 1).
+Baselines are only comparable on the same machine with the same parameters;
+save a new baseline with --save-baseline.
+
+Run with:
+: python -m tests.benchmarks.bench_filesystem [--experiments 2000] [--subentries 5] [--files 2] [--save-baseline]
+Use e.g. --experiments 20000 for a 100k folder tree.
+"""
+
+from __future__ import print_function
+import re
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.experimentmanager import ExperimentManager
+from model.satellite_location import SatelliteFileLocation
+from model.dirtreeparsing import genPathmatchTupsByPathscheme
+
+from tests.benchmarks.benchutils import timeit, load_baseline, save_baseline, compare_baseline
+from tests.benchmarks.exptreegen import generate_experiment_tree, CONFIG, REGEXS
+
+logger = logging.getLogger(__name__)
+
+BENCHNAME = 'bench_filesystem'
+
+
+def make_confighandler(rootdir, subdir):
+    """ Returns a confighandler configured for the generated tree. """
+    ch = FakeConfighandler(pathscheme='test1')
+    for key, value in CONFIG.items():
+        ch.setkey(key, value, 'exp')
+    ch.setkey('local_exp_rootDir', rootdir, 'exp')
+    ch.setkey('local_exp_subDir', subdir, 'exp')
+    return ch
+
+
+def make_satellitelocation(rootdir):
+    """ Returns a satellite location for the generated tree. """
+    sl = SatelliteFileLocation(dict(protocol='file', uri=rootdir, rootdir='.',
+                                    folderscheme='./year/experiment/subentry/'))
+    sl.Regexs = REGEXS
+    return sl
+
+
+def run_benchmarks(rootdir, stats, nfileexps=200):
+    """ Runs the benchmarks on the tree in rootdir. Returns list of (description, seconds) tuples. """
+    results = list()
+    regexs = dict((key, re.compile(regex)) for key, regex in REGEXS.items())
+    for rightmost in ('experiment', 'subentry'):
+        t, n = timeit(lambda: sum(1 for _ in genPathmatchTupsByPathscheme(rootdir, './year/experiment/subentry',
+                                                                          regexs, rightmost=rightmost)))
+        results.append(("genPathmatchTupsByPathscheme, {} folders".format(rightmost), t))
+        logger.info("genPathmatchTupsByPathscheme found %s %s folders", n, rightmost)
+
+    subdir = stats['yeardirs'][len(stats['yeardirs'])//2]
+    def merge():
+        manager = ExperimentManager(confighandler=make_confighandler(rootdir, subdir), autoinit=())
+        manager.mergeLocalExperiments()
+        return manager
+    t, manager = timeit(merge)
+    results.append(("mergeLocalExperiments (one year folder)", t))
+    logger.info("mergeLocalExperiments loaded %s experiments", len(manager.ExperimentsById))
+
+    t, duplicates = timeit(manager.getDuplicates)
+    results.append(("getDuplicates, experiments", t))
+    logger.info("getDuplicates found %s duplicate experiments (generated: %s)", len(duplicates), stats['duplicates'])
+    results.append(("getDuplicates, subentries", timeit(manager.getDuplicates, subentries=True)[0]))
+
+    sl = make_satellitelocation(rootdir)
+    t, folders = timeit(sl.getSubentryfoldersByExpidSubidx)
+    results.append(("SatelliteLocation.getSubentryfoldersByExpidSubidx", t))
+    logger.info("getSubentryfoldersByExpidSubidx found subentries for %s experiments", len(folders))
+
+    experiments = list(manager.ExperimentsById.values())[:nfileexps]
+    t, nfiles = timeit(lambda: sum(len(exp.Filemanager.getLocalFilelist()) for exp in experiments))
+    results.append(("Filemanager.getLocalFilelist, {} experiments".format(len(experiments)), t))
+    logger.info("getLocalFilelist found %s files", nfiles)
+    return results
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks parsing of large local experiment trees.")
+    parser.add_argument('--experiments', type=int, default=2000, help="Number of experiments to generate.")
+    parser.add_argument('--subentries', type=int, default=5, help="Average number of subentries per experiment.")
+    parser.add_argument('--files', type=int, default=2, help="Average number of files per subentry.")
+    parser.add_argument('--noise', type=float, default=0.05, help="Fraction of folder names with naming noise.")
+    parser.add_argument('--save-baseline', action='store_true', help="Save the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="Report timings slower than baseline by more than this factor as regressions.")
+    parser.add_argument('--keep', action='store_true', help="Do not delete the generated tree.")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Log tree and result sizes.")
+    return parser
+
+
+def main(argv=None):
+    argsns = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if argsns.verbose:
+        logger.setLevel(logging.INFO)
+    params = dict(experiments=argsns.experiments, subentries=argsns.subentries, files=argsns.files, noise=argsns.noise)
+    rootdir = tempfile.mkdtemp(prefix="labfluence_bench_")
+    try:
+        t, stats = timeit(generate_experiment_tree, rootdir, nexperiments=argsns.experiments,
+                          nsubentries=argsns.subentries, nfiles=argsns.files, noise=argsns.noise, repeat=1)
+        print("Generated {experiments} experiment folders, {subentries} subentry folders and {files} files "
+              "in {t:.1f} s ({rootdir})".format(t=t, rootdir=rootdir, **stats))
+        results = run_benchmarks(rootdir, stats)
+    finally:
+        if not argsns.keep:
+            shutil.rmtree(rootdir)
+    if argsns.save_baseline:
+        save_baseline(BENCHNAME, results, params)
+    regressions = compare_baseline("Filesystem benchmarks (best of 3)", results, load_baseline(BENCHNAME),
+                                   tolerance=argsns.tolerance, params=params)
+    if regressions:
+        print("\n{} regression(s) compared to baseline: {}".format(len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Benchmarks the experiment/file listboxes with 10k and 100k rows.
+
+Compares the old approach (repr() every experiment, then delete and re-insert all rows)
+with the VirtualListbox approach (diff the model, render only the visible rows).
+The ListModel part does not require a display; the Tk part is skipped if Tk cannot initialize.
+
+Run with:
+: python -m tests.benchmarks.bench_listboxes
+"""
+
+from __future__ import print_function
+import random
+
+try:
+    import tkinter as tk
+except ImportError:
+    import Tkinter as tk
+
+from tkui.views.virtuallistbox import ListModel, VirtualListbox
+from tests.benchmarks.benchutils import timeit, printresults
+
+
+class BenchExp(object):
+    """ Mimics an Experiment, whose repr is comparatively expensive. """
+    def __init__(self, expid):
+        self.Expid = expid
+        self.Props = dict(expid=expid, exp_titledesc="Benchmark experiment {}".format(expid))
+    def __repr__(self):
+        return "<Experiment '{expid} {exp_titledesc}'>".format(**self.Props)
+
+
+def make_tuples(n):
+    """ Returns n (None, expid, exp) tuples. """
+    return [(None, "RS{:06}".format(i), BenchExp("RS{:06}".format(i))) for i in range(n)]
+
+
+def old_updatelist(listbox, exps):
+    """ The approach used before VirtualListbox: repr everything, clear, insert everything. """
+    tuples = [(repr(exp), exp.Expid, exp) for exp in exps]
+    listbox.delete(0, tk.END)
+    listbox.insert(tk.END, *[tup[0] for tup in tuples])
+    return tuples
+
+
+def bench_model(n):
+    """ Benchmarks ListModel operations for n rows. """
+    results = list()
+    tuples = make_tuples(n)
+    exps = [tup[2] for tup in tuples]
+    results.append(("repr() all {} rows (old display)".format(n), timeit(lambda: [repr(e) for e in exps])[0]))
+    model = ListModel()
+    results.append(("ListModel.setItems initial", timeit(model.setItems, tuples, repeat=1)[0]))
+    results.append(("ListModel.setItems unchanged", timeit(model.setItems, tuples)[0]))
+    changed = list(tuples)
+    for _ in range(10):
+        changed.pop(random.randrange(len(changed)))
+    changed.extend(make_tuples(5))
+    results.append(("ListModel.setItems, 10 removed/5 added", timeit(model.setItems, changed, repeat=1)[0]))
+    results.append(("ListModel.getDisplays 30 visible rows", timeit(model.getDisplays, n//2, n//2+30)[0]))
+    return results
+
+
+def bench_tk(root, n):
+    """ Benchmarks old tk.Listbox updates against VirtualListbox updates for n rows. """
+    results = list()
+    tuples = make_tuples(n)
+    exps = [tup[2] for tup in tuples]
+    old = tk.Listbox(root, height=30)
+    results.append(("tk.Listbox full update (old)", timeit(old_updatelist, old, exps)[0]))
+    vlb = VirtualListbox(root, height=30)
+    results.append(("VirtualListbox.setItems initial", timeit(vlb.setItems, tuples, repeat=1)[0]))
+    results.append(("VirtualListbox.setItems unchanged", timeit(vlb.setItems, tuples)[0]))
+    results.append(("VirtualListbox scroll one page", timeit(vlb.yview, tk.SCROLL, 1, tk.PAGES)[0]))
+    results.append(("VirtualListbox moveto 0.5", timeit(vlb.yview, tk.MOVETO, 0.5)[0]))
+    old.destroy()
+    vlb.destroy()
+    return results
+
+
+def main():
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print("Tk could not initialize (no display?), skipping Tk benchmarks:", e)
+        root = None
+    for n in (10000, 100000):
+        printresults("ListModel, {} rows".format(n), bench_model(n))
+        if root is not None:
+            printresults("Tk listboxes, {} rows".format(n), bench_tk(root, n))
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == '__main__':
+    main()
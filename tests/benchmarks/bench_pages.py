@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Page-operation benchmarks: page handling on large experiment and LIMS pages.
+
+Synthetic pages (see pagegen.py) of increasing size are stored on the fake server, and the following are timed:
+- WikiPage.validate_xhtml
+- WikiPage.insertAtRegex (inserting a journal entry in the last subentry, without server update)
+- SectionIndex (building the index) and WikiPage.insertAt using the index (same insertion as above)
+- Experiment.getWikiSubentryXhtml (last subentry on the page)
+- Experiment.parseSubentriesFromWikipage
+- WikiLimsPage.getTableHeaders, addEntry (without server update) and parsing of all table rows
+
+For each operation, the timings at each page size are printed together with the scaling exponent,
+i.e. the slope of log(time) vs log(size) between the smallest and largest page;
+1 is linear scaling, 2 is quadratic.
+Results are compared with the saved baseline (baselines/bench_pages.json), see bench_filesystem.py.
+
+Run with:
+: python -m tests.benchmarks.bench_pages [--sizes 100000,1000000,10000000] [--rows 100,1000,10000] [--save-baseline]
+"""
+
+from __future__ import print_function
+import sys
+import math
+import logging
+import argparse
+from collections import OrderedDict
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_server import FakeConfluenceServer
+from model.page import WikiPage
+from model.limspage import WikiLimsPage
+from model.experiment import Experiment
+from model.pagesections import SectionIndex, get_section_layout, get_subentry_header
+
+from tests.benchmarks.benchutils import timeit, load_baseline, save_baseline, compare_baseline
+from tests.benchmarks.pagegen import generate_experiment_page, generate_lims_page, subentry_idx, CONFIG
+
+logger = logging.getLogger(__name__)
+
+BENCHNAME = 'bench_pages'
+EXPID = 'RS123'
+
+
+def store_page(server, title, content):
+    """ Stores a new page with content on the (fake) server and returns the page struct. """
+    return server.storePage(dict(space='~scholer', title=title, content=content))
+
+
+def make_confighandler():
+    ch = FakeConfighandler(pathscheme='test1')
+    for key, value in CONFIG.items():
+        ch.setkey(key, value, 'exp')
+    return ch
+
+
+def subentries_for_size(size):
+    """ Number of subentries for an experiment page of <size> characters (hundreds for the largest pages). """
+    return max(10, min(500, size // 20000))
+
+
+def bench_experiment_page(server, ch, size, repeat):
+    """ Returns list of (operation, seconds) for an experiment page of the given size. """
+    nsubentries = subentries_for_size(size)
+    xhtml = generate_experiment_page(EXPID, nsubentries=nsubentries, size=size)
+    struct = store_page(server, "{} Benchmark page ({} chars)".format(EXPID, size), xhtml)
+    page = WikiPage(struct['id'], server=server, confighandler=ch, pagestruct=struct)
+    experiment = Experiment(props=dict(expid=EXPID, exp_titledesc="Benchmark page"), server=server,
+                            confighandler=ch, wikipage=page, doparseLocaldirSubentries=False,
+                            autoattachwikipage=False, savepropsonchange=False)
+    results = list()
+    results.append(("validate_xhtml", timeit(page.validate_xhtml, xhtml, repeat=repeat)[0]))
+
+    # Journal entries are inserted at the end of the (last) subentry:
+    fmt_params = experiment.makeFormattingParams(subentry_idx=subentry_idx(nsubentries-1))
+    regex = ch.get('wiki_journal_entry_insert_regex_fmt').format(**fmt_params)
+    journal_entry = u"<p>[20140601 12:00:00] New journal entry.</p>"
+    def insert():
+        page.Content = xhtml
+        return page.insertAtRegex(journal_entry, regex, updateFromServer=False, persistToServer=False)
+    t, ret = timeit(insert, repeat=repeat)
+    assert ret, "insertAtRegex failed"
+    results.append(("insertAtRegex", t))
+    page.Content = xhtml
+
+    t, index = timeit(SectionIndex, xhtml, repeat=repeat)
+    results.append(("SectionIndex (build)", t))
+    layout = get_section_layout(ch.get('wiki_subentry_parse_regex_fmt'))
+    def insert_indexed():
+        page.Content = xhtml
+        header = get_subentry_header(page.SectionIndex, EXPID, subentry_idx(nsubentries-1), layout)
+        return page.insertAt(journal_entry, header.end, persistToServer=False)
+    t, ret = timeit(insert_indexed, repeat=repeat)
+    assert ret, "insertAt failed"
+    results.append(("insertAt (section index)", t))
+    page.Content = xhtml
+
+    t, ret = timeit(experiment.getWikiSubentryXhtml, subentry_idx(nsubentries-1), repeat=repeat)
+    assert ret, "getWikiSubentryXhtml failed"
+    results.append(("getWikiSubentryXhtml", t))
+
+    t, ret = timeit(experiment.parseSubentriesFromWikipage, page, repeat=repeat)
+    assert ret and len(ret) == nsubentries, "parseSubentriesFromWikipage failed"
+    results.append(("parseSubentriesFromWikipage", t))
+    logger.info("Experiment page: %s chars, %s subentries", len(xhtml), nsubentries)
+    return results
+
+
+def bench_lims_page(server, ch, nrows, repeat):
+    """ Returns list of (operation, seconds) for a LIMS page with nrows table rows. """
+    xhtml = generate_lims_page(nrows)
+    struct = store_page(server, "LIMS benchmark page ({} rows)".format(nrows), xhtml)
+    page = WikiLimsPage(struct['id'], server=server, confighandler=ch, pagestruct=struct)
+    results = list()
+    t, headers = timeit(page.getTableHeaders, repeat=repeat)
+    assert headers, "getTableHeaders failed"
+    results.append(("getTableHeaders", t))
+
+    entry = dict((header, "value") for header in headers)
+    def add():
+        page.Content = xhtml
+        return page.addEntry(entry, persistToServer=False)
+    results.append(("addEntry", timeit(add, repeat=repeat)[0]))
+    page.Content = xhtml
+
+    def parse_rows():
+        match = page.LimstableRegexProg.match(page.Content)
+        return [page.findCellsInTablerow(row) for row in page.TableRowRegexProg.findall(match.group('tablerows'))]
+    t, rows = timeit(parse_rows, repeat=repeat)
+    assert len(rows) == nrows, "Table row parsing failed"
+    results.append(("parse table rows", t))
+    logger.info("LIMS page: %s chars, %s rows", len(xhtml), nrows)
+    return results
+
+
+def scaling_exponent(sizes, times):
+    """ Returns the slope of log(time) vs log(size) between the first and last point (None if undefined). """
+    if len(sizes) < 2 or not times[0] or not times[-1]:
+        return None
+    return math.log(times[-1]/times[0]) / math.log(float(sizes[-1])/sizes[0])
+
+
+def print_scaling(title, sizes, sizelabel, timings):
+    """ Prints a table of timings (ms) for each operation and page size, with the scaling exponent. """
+    print("\n" + title)
+    print("-" * len(title))
+    width = max(len(op) for op in timings)
+    print("{:<{width}}  {}  {:>8}".format("", "  ".join("{:>14}".format("{} {}".format(size, sizelabel)) for size in sizes),
+                                          "exponent", width=width))
+    for op, times in timings.items():
+        exponent = scaling_exponent(sizes, times)
+        print("{:<{width}}  {}  {:>8}".format(op, "  ".join("{:>11.2f} ms".format(t*1000) for t in times),
+                                              "{:.2f}".format(exponent) if exponent is not None else "-", width=width))
+
+
+def collect(benchfunc, server, ch, sizes, repeat):
+    """
+    Runs benchfunc for each size. Returns (timings, results), where timings is an OrderedDict
+    with a list of times (one for each size) for each operation, and results is a list of (description, seconds).
+    """
+    timings, results = OrderedDict(), list()
+    for size in sizes:
+        for op, t in benchfunc(server, ch, size, repeat):
+            timings.setdefault(op, list()).append(t)
+            results.append(("{} @ {}".format(op, size), t))
+    return timings, results
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks page operations on large experiment and LIMS pages.")
+    parser.add_argument('--sizes', default="100000,1000000,10000000",
+                        help="Comma-separated experiment page sizes in characters.")
+    parser.add_argument('--rows', default="100,1000,10000", help="Comma-separated LIMS table sizes in rows.")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of repeats (the best time is used).")
+    parser.add_argument('--save-baseline', action='store_true', help="Save the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="Report timings slower than baseline by more than this factor as regressions.")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Log page sizes.")
+    return parser
+
+
+def main(argv=None):
+    argsns = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if argsns.verbose:
+        logger.setLevel(logging.INFO)
+    sizes = [int(size) for size in argsns.sizes.split(',')]
+    rows = [int(nrows) for nrows in argsns.rows.split(',')]
+    params = dict(sizes=sizes, rows=rows)
+    server = FakeConfluenceServer()
+    ch = make_confighandler()
+
+    exptimings, expresults = collect(bench_experiment_page, server, ch, sizes, argsns.repeat)
+    print_scaling("Experiment page operations (best of {})".format(argsns.repeat), sizes, "chars", exptimings)
+    limstimings, limsresults = collect(bench_lims_page, server, ch, rows, argsns.repeat)
+    print_scaling("LIMS page operations (best of {})".format(argsns.repeat), rows, "rows", limstimings)
+
+    results = expresults + limsresults
+    if argsns.save_baseline:
+        save_baseline(BENCHNAME, results, params)
+    regressions = compare_baseline("Page operations, compared to baseline", results, load_baseline(BENCHNAME),
+                                   tolerance=argsns.tolerance, params=params)
+    if regressions:
+        print("\n{} regression(s) compared to baseline: {}".format(len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Benchmarks the experiment search index with a decade worth of experiments
+(5000 experiments with 10 subentries each).
+
+Run with:
+: python -m tests.benchmarks.bench_searchindex
+"""
+
+from __future__ import print_function
+import random
+
+from model.searchindex import ExperimentSearchIndex
+from tests.benchmarks.benchutils import timeit, printresults
+
+WORDS = ("origami folding gel agarose purification streptavidin biotin afm imaging tem staining "
+         "annealing buffer magnesium ligation pcr assay kinetics fluorescence dimer tile lattice").split()
+
+
+def make_records(n, nsubentries=10):
+    """ Returns list of (expid, fields) records. """
+    rnd = random.Random(0)
+    # Lab notebooks have a fairly large vocabulary; add some made-up words to the common ones:
+    words = WORDS + ["".join(rnd.choice("abcdefghiklmnoprstu") for _ in range(rnd.randint(4, 10))) for _ in range(2000)]
+    records = list()
+    for i in range(n):
+        expid = "RS{:04}".format(i)
+        title = " ".join(rnd.sample(WORDS, 1) + rnd.sample(words, 3))
+        subentries = [" ".join(rnd.sample(words, 3)) for _ in range(nsubentries)]
+        dates = ["2{:03}{:02}{:02}".format(4 + i//500, 1 + i % 12, 1 + j) for j in range(nsubentries)]
+        attachments = ["{}_{}_{}.png".format(expid, rnd.choice(words), j) for j in range(3)]
+        records.append((expid, dict(expid=[expid], title=[title], subentry=subentries, date=dates, attachment=attachments)))
+    return records
+
+
+def build(records):
+    index = ExperimentSearchIndex()
+    for expid, fields in records:
+        index.indexRecord(expid, fields)
+    return index
+
+
+def main():
+    records = make_records(5000)
+    results = list()
+    t, index = timeit(build, records, repeat=1)
+    results.append(("Build index, 5000 experiments", t))
+    expid, fields = records[2500]
+    changed = dict(fields, title=["new title for this experiment"])
+    results.append(("Re-index one changed experiment", timeit(index.indexRecord, expid, changed, repeat=1)[0]))
+    results.append(("Re-index one unchanged experiment", timeit(index.indexRecord, expid, changed)[0]))
+    for query in ("RS2500", "rs25", "origami", "origami gel 2008", "orgami", "fluorescense kinetcs"):
+        results.append(("search '{}'".format(query), timeit(index.search, query, repeat=20)[0]))
+    printresults("ExperimentSearchIndex", results)
+
+
+if __name__ == '__main__':
+    main()
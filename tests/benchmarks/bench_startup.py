@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Startup benchmark: time-to-first-window for labfluence.py (in testing mode),
+plus import times of the main modules, each measured in a fresh interpreter.
+
+Time-to-first-window requires a display; without one only the import times are measured.
+
+Run from the labfluence directory with:
+    python -m tests.benchmarks.bench_startup [--report]
+--report prints the full startup trace (phases and slowest imports).
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import subprocess
+
+from tests.benchmarks.benchutils import printresults
+
+APPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def run(args, repeat=3):
+    """
+    Runs the python interpreter with args in APPDIR <repeat> times.
+    Returns (best wall time in seconds, output of the last run), or (None, output) if the process failed.
+    """
+    best, output = None, ""
+    for _ in range(repeat):
+        t0 = time.time()
+        proc = subprocess.Popen([sys.executable] + args, cwd=APPDIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0].decode('utf-8', 'replace')
+        dt = time.time() - t0
+        if proc.returncode != 0:
+            return None, output
+        best = dt if best is None else min(best, dt)
+    return best, output
+
+
+def bench_imports():
+    results = list()
+    for module in ('model.confighandler', 'model.experimentmanager', 'model.server', 'tkui.labfluence_tkapp'):
+        dt, _ = run(['-c', 'import {}'.format(module)])
+        results.append(("import {}".format(module), dt or float('nan')))
+    dt, _ = run(['-c', 'pass'])
+    results.append(("(bare interpreter startup)", dt))
+    printresults("Import times (fresh interpreter, best of 3)", results)
+
+
+def bench_first_window(report=False):
+    dt, output = run(['labfluence.py', '--testing', '--profile-startup', '--exit-after-startup'])
+    if dt is None:
+        print("\nTime-to-first-window could not be measured (no display available?):")
+        print(output.strip().splitlines()[-1] if output.strip() else "(no output)")
+        return
+    printresults("Time to first window, labfluence.py --testing (best of 3)", [("labfluence.py", dt)])
+    if report:
+        print(output[output.find("Startup trace"):])
+
+
+if __name__ == '__main__':
+    bench_imports()
+    bench_first_window(report='--report' in sys.argv)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+End-to-end XML-RPC benchmark and soak test.
+
+Runs the real ConfluenceXmlRpcClient against the local confluence stand-in
+(model/model_testdoubles/fake_xmlrpcserver.py) with simulated latency, jitter,
+bandwidth and fault injection, from a number of threads.
+Prints per-method call times (median and 95th percentile), throughput, the number of errors
+and the bytes transferred by the client (compressed and uncompressed).
+
+Run with:
+: python -m tests.benchmarks.bench_xmlrpc [--latency 0.05] [--jitter 0.02] [--threads 4] [--calls 50]
+For a soak test, use e.g. --calls 10000 --fault-rate 0.01 --error-rate 0.01.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import socket
+import argparse
+import threading
+import xmlrpclib
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_xmlrpcserver import start_server
+from model.server.confluence_xmlrpc import ConfluenceXmlRpcClient
+
+from tests.benchmarks.benchutils import printresults
+
+# (description, client method, args):
+OPERATIONS = (
+    ("getServerInfo", 'getServerInfo', ()),
+    ("getPage", 'getPage', ('524296',)),
+    ("getChildren", 'getChildren', ('524308',)),
+    ("getAttachments", 'getAttachments', ('524296',)),
+)
+
+
+def percentile(values, fraction):
+    """ Returns the value at <fraction> of the sorted values (0 if values is empty). """
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values)-1, int(fraction*len(values)))]
+
+
+def worker(client, ncalls, timings, errors, lock):
+    """ Calls the operations in OPERATIONS round-robin, ncalls in total, recording timings and errors. """
+    for callno in range(ncalls):
+        desc, methodname, args = OPERATIONS[callno % len(OPERATIONS)]
+        t0 = time.time()
+        try:
+            getattr(client, methodname)(*args)
+        except (xmlrpclib.Fault, xmlrpclib.ProtocolError, socket.error) as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        dt = time.time() - t0
+        with lock:
+            timings.setdefault(desc, list()).append(dt)
+
+
+def run(server, nthreads, ncalls):
+    """ Runs nthreads workers, each making ncalls. Returns (timings dict, errors dict, wall time, client). """
+    client = ConfluenceXmlRpcClient(serverparams={'appurl': server.AppUrl}, username='fakeuser',
+                                    password='fakepassword', confighandler=FakeConfighandler())
+    timings, errors, lock = dict(), dict(), threading.Lock()
+    threads = [threading.Thread(target=worker, args=(client, ncalls, timings, errors, lock))
+               for _ in range(nthreads)]
+    t0 = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors, time.time() - t0, client
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="End-to-end XML-RPC benchmark against the local confluence stand-in.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every call.")
+    parser.add_argument('--jitter', type=float, default=0.01, help="Random +/- variation of the latency.")
+    parser.add_argument('--bandwidth', type=int, help="Bytes per second (default: unlimited).")
+    parser.add_argument('--fault-rate', type=float, default=0, help="Fraction of calls answered with xmlrpclib.Fault.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of calls answered with HTTP 500.")
+    parser.add_argument('--threads', type=int, default=4, help="Number of client threads.")
+    parser.add_argument('--calls', type=int, default=50, help="Number of calls per thread.")
+    return parser
+
+
+def main(argv=None):
+    argsns = get_parser().parse_args(argv)
+    server = start_server(latency=argsns.latency, jitter=argsns.jitter, bandwidth=argsns.bandwidth,
+                          fault_rate=argsns.fault_rate, error_rate=argsns.error_rate, seed=0)
+    try:
+        timings, errors, walltime, client = run(server, argsns.threads, argsns.calls)
+    finally:
+        server.stop()
+    title = "XML-RPC calls, latency {} s +/- {} s, {} threads".format(argsns.latency, argsns.jitter, argsns.threads)
+    results = list()
+    for desc, values in sorted(timings.items()):
+        results.append(("{} (median)".format(desc), percentile(values, 0.5)))
+        results.append(("{} (95th percentile)".format(desc), percentile(values, 0.95)))
+    printresults(title, results)
+    ncalls = sum(len(values) for values in timings.values())
+    print("\n{} successful calls in {:.2f} s ({:.1f} calls/s), errors: {}".format(
+        ncalls, walltime, ncalls/walltime if walltime else 0, errors or "none"))
+    print("Server stats: {}".format(dict(server.Stats)))
+    print("Client transfers: {}".format(client.TransferStats.summary()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Small helpers shared by the benchmark scripts.
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import platform
+
+BASELINEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def timeit(func, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) <repeat> times (default 3) and
+    returns (best time in seconds, return value of the last call).
+    """
+    repeat = kwargs.pop('repeat', 3)
+    best, ret = None, None
+    for _ in range(repeat):
+        t0 = time.time()
+        ret = func(*args, **kwargs)
+        dt = time.time() - t0
+        best = dt if best is None else min(best, dt)
+    return best, ret
+
+
+def printresults(title, results):
+    """
+    Prints a table of benchmark results.
+    <results> is a list of (description, seconds) tuples.
+    """
+    print("\n" + title)
+    print("-" * len(title))
+    width = max(len(desc) for desc, _ in results) if results else 0
+    for desc, seconds in results:
+        print("{desc:<{width}}  {ms:>10.2f} ms".format(desc=desc, width=width, ms=seconds*1000))
+
+
+def baselinepath(name):
+    """ Returns the path of the baseline file for benchmark <name>. """
+    return os.path.join(BASELINEDIR, name + '.json')
+
+
+def load_baseline(name):
+    """ Returns the saved baseline dict for benchmark <name>, or None if there is no baseline. """
+    try:
+        with open(baselinepath(name)) as fd:
+            return json.load(fd)
+    except IOError:
+        return None
+
+
+def save_baseline(name, results, params=None):
+    """
+    Saves results (list of (description, seconds) tuples) as the baseline for benchmark <name>,
+    together with the benchmark parameters and a description of the machine.
+    """
+    if not os.path.isdir(BASELINEDIR):
+        os.makedirs(BASELINEDIR)
+    baseline = dict(results=dict(results), params=params or dict(),
+                    machine=dict(platform=platform.platform(), python=platform.python_version()))
+    with open(baselinepath(name), 'w') as fd:
+        json.dump(baseline, fd, indent=2, sort_keys=True)
+    print("Baseline saved to", baselinepath(name))
+
+
+def compare_baseline(title, results, baseline, tolerance=1.5, params=None):
+    """
+    Prints results next to the baseline timings.
+    Results more than <tolerance> times slower than the baseline are flagged as regressions.
+    Returns the list of descriptions of regressed results.
+    Timings are only comparable for the same parameters on the same machine;
+    a warning is printed if the parameters differ.
+    """
+    if baseline is None:
+        printresults(title, results)
+        print("(No baseline saved; use --save-baseline to save these results as baseline.)")
+        return list()
+    if params is not None and baseline.get('params') != params:
+        print("WARNING: Benchmark parameters differ from the baseline parameters:", baseline.get('params'))
+    basetimes = baseline['results']
+    regressions = list()
+    print("\n" + title)
+    print("-" * len(title))
+    width = max(len(desc) for desc, _ in results) if results else 0
+    for desc, seconds in results:
+        base = basetimes.get(desc)
+        if base:
+            ratio = seconds / base
+            flag = "  REGRESSION" if ratio > tolerance else ""
+            if flag:
+                regressions.append(desc)
+            print("{desc:<{width}}  {ms:>10.2f} ms  (baseline {base:>10.2f} ms, x{ratio:.2f}){flag}".format(
+                desc=desc, width=width, ms=seconds*1000, base=base*1000, ratio=ratio, flag=flag))
+        else:
+            print("{desc:<{width}}  {ms:>10.2f} ms  (no baseline)".format(desc=desc, width=width, ms=seconds*1000))
+    return regressions
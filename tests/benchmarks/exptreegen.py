@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Generator for synthetic, realistic experiment directory trees, used by the benchmarks.
+
+The generated tree follows the './year/experiment/subentry' folderscheme:
+
+    2013_Aarhus/
+        RS00001 Origami folding test/
+            RS00001a Agarose gel (20130105)/
+                RS00001a_gel_001.tif
+            RS00001b_AFM imaging/
+        RS00002_Streptavidin binding/
+        ...
+    2014_Harvard/
+        ...
+
+Naming noise (controlled by the noise argument) adds the variations seen in real
+experiment folders: underscore separators, date prefixes and suffixes, dashes between
+expid and subentry index, and stray folders/files that do not match the regexs.
+A fraction of the expids (controlled by duplicates) is used for two experiment folders,
+e.g. when an experiment was continued in a new year folder.
+
+EXPID_DIGITS is 5, so the standard regexs (RS[0-9]{3}) must be replaced by the ones
+in REGEXS / CONFIG to parse trees with more than 1000 experiments.
+"""
+
+from __future__ import print_function
+import os
+import random
+from datetime import date, timedelta
+
+
+EXPID_FMT = "RS{:05d}"
+
+# Regexs (and config entries) matching the generated trees:
+REGEXS = {
+    'year': r'(?P<year>[0-9]{4}).*',
+    'experiment': r'(?P<expid>RS[0-9]{3,5})[_ ]+(?P<exp_titledesc>.+)',
+    'subentry': r'(?P<date1>[0-9]{8})?[_ ]*(?P<expid>RS[0-9]{3,5})-?(?P<subentry_idx>[^_ ])[_ ]+(?P<subentry_titledesc>.+?)\s*(\((?P<date2>[0-9]{8})\))?$',
+}
+CONFIG = {
+    'exp_series_regex': REGEXS['experiment'],
+    'exp_subentry_regex': REGEXS['subentry'],
+    'local_exp_folderscheme': './year/experiment/subentry',
+    'local_exp_folder_regexs': REGEXS,
+    'local_exp_ignoreDirs': [],
+}
+
+WORDS = ("Origami folding test AFM imaging agarose gel purification streptavidin binding "
+         "TEM grid staining DNA ligation PCR amplification nanodrop quantification buffer "
+         "exchange annealing ramp tile assembly FRET measurement kinetics titration").split()
+FILEEXTS = (".tif", ".jpg", ".txt", ".csv", ".xlsx", ".gel", ".spm")
+STRAY_FOLDERS = ("old stuff", "tmp", "misc", "_backup", "Protocols")
+
+
+def make_title(rng, nwords=(1, 4)):
+    """ Returns a random title of a few words. """
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(*nwords))).capitalize()
+
+
+def experiment_foldername(rng, expid, noise):
+    """ Returns an experiment folder name, e.g. 'RS00123 Origami folding'. """
+    sep = "_" if rng.random() < noise else " "
+    return "{}{}{}".format(expid, sep, make_title(rng))
+
+
+def subentry_foldername(rng, expid, idx, day, noise):
+    """ Returns a subentry folder name, e.g. 'RS00123a AFM imaging (20140105)'. """
+    datestr = day.strftime("%Y%m%d")
+    variant = rng.random()
+    if variant < noise:
+        return "{} {}{} {}".format(datestr, expid, idx, make_title(rng))      # date prefix
+    elif variant < 2*noise:
+        return "{}-{}_{}".format(expid, idx, make_title(rng).replace(" ", "_"))     # dash and underscores
+    elif variant < 3*noise:
+        return "{}{} {}".format(expid, idx, make_title(rng))      # no date
+    return "{}{} {} ({})".format(expid, idx, make_title(rng), datestr)
+
+
+def generate_experiment_tree(rootdir, nexperiments=2000, nsubentries=5, nfiles=2,
+                             years=('2012_Aarhus', '2013_Aarhus', '2014_Harvard'),
+                             noise=0.05, duplicates=0.01, seed=0):
+    """
+    Creates a synthetic experiment tree in rootdir (which is created if it does not exist).
+    Args:
+        :nexperiments:  Number of experiments, spread evenly across the year folders.
+        :nsubentries:   Average number of subentries per experiment (actual number varies from 0 to 2x).
+        :nfiles:        Average number of (empty) files per subentry folder.
+        :years:         Names of the year folders.
+        :noise:         Fraction of names with naming variations and of experiments with stray files/folders.
+        :duplicates:    Fraction of expids that are used for two experiment folders.
+        :seed:          Random seed; the same arguments always produce the same tree.
+    Returns a dict with counts of the generated folders and files, and the year folder paths.
+    """
+    rng = random.Random(seed)
+    stats = dict(experiments=0, subentries=0, files=0, stray=0, duplicates=0, yeardirs=list())
+    yeardirs = [os.path.join(rootdir, year) for year in years]
+    for yeardir in yeardirs:
+        os.makedirs(yeardir)
+        stats['yeardirs'].append(yeardir)
+    startday = date(2012, 1, 1)
+
+    def makefiles(folder, prefix, n):
+        for fileno in range(n):
+            with open(os.path.join(folder, "{}_{:03}{}".format(prefix, fileno, rng.choice(FILEEXTS))), 'w'):
+                pass
+        stats['files'] += n
+
+    for expno in range(1, nexperiments+1):
+        expid = EXPID_FMT.format(expno)
+        yearidx = (expno - 1) * len(yeardirs) // nexperiments
+        copies = 2 if rng.random() < duplicates and yearidx + 1 < len(yeardirs) else 1
+        for copy in range(copies):
+            expdir = os.path.join(yeardirs[yearidx + copy], experiment_foldername(rng, expid, noise))
+            os.mkdir(expdir)
+            stats['experiments'] += 1
+            stats['duplicates'] += copy
+            day = startday + timedelta(days=expno * 1000 // nexperiments)
+            for subno in range(rng.randint(0, 2*nsubentries)):
+                idx = "abcdefghijklmnopqrstuvwxyz"[subno % 26]
+                subdir = os.path.join(expdir, subentry_foldername(rng, expid, idx, day + timedelta(days=subno), noise))
+                if os.path.exists(subdir):
+                    continue
+                os.mkdir(subdir)
+                stats['subentries'] += 1
+                makefiles(subdir, expid + idx, rng.randint(0, 2*nfiles))
+            if rng.random() < noise:
+                # Stray folder and files directly in the experiment folder:
+                os.mkdir(os.path.join(expdir, rng.choice(STRAY_FOLDERS)))
+                makefiles(expdir, "notes", 1)
+                stats['stray'] += 1
+    for yeardir in yeardirs:
+        os.mkdir(os.path.join(yeardir, rng.choice(STRAY_FOLDERS)))
+        stats['stray'] += 1
+    return stats
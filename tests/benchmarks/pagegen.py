@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+"""
+Generator for synthetic, large wiki pages (xhtml in confluence storage format), used by the benchmarks.
+
+generate_experiment_page() makes an experiment page with the standard sections
+(About, Experimental section with <h4> subentries, Results and discussion, Attachments),
+where each subentry has journal entries (paragraphs, tables and lists) up to the requested page size.
+
+generate_lims_page() makes a LIMS page with a single inventory table of the requested number of rows.
+
+CONFIG holds the config entries required to parse the experiment pages with
+Experiment.parseSubentriesFromWikipage (not set in FakeConfighandler).
+"""
+
+from __future__ import print_function
+import random
+from datetime import date, timedelta
+
+from tests.benchmarks.exptreegen import make_title
+
+
+CONFIG = {
+    'wiki_experiment_section': r'(?P<experiment_info>.*?)(?P<exp_section_header><h2>Experimental section</h2>)(?P<exp_section_body>.*?)(?=<h[1-2]>.+?</h[1-2]>|\Z)',
+    'wiki_subentry_regex_fmt': r'(<h4>{expid}[_-]*{subentry_idx}\s+(?P<subentry_titledesc>.+?)\s*(\((?P<subentry_date_string>\d{{8}})\))?</h4>)(?P<subentry_xhtml>.*?)(?=<h[1-4]>.+?</h[1-4]>|\Z)',
+}
+
+LIMS_HEADERS = ('Date (yyyymmdd)', 'Compound name', 'Amount', 'Price (dkk)', 'Ordered by',
+                'Manufacturer / distributor', 'Comments')
+
+PAGE_HEADER = (u"<h3>About</h3><p><strong>Purpose:</strong></p><p><strong>Summary:</strong></p>"
+               u"<p><strong>Project(s):</strong></p><p><strong>Overview/outline:&nbsp;</strong></p>"
+               u"<h2>Experimental section</h2>\n")
+PAGE_FOOTER = (u"<h2>Results and discussion</h2><h6>Gallery</h6><h6>Observations</h6><h6>Conclusion</h6>"
+               u"<h2>Attachments</h2><p>Attachments will be listed here.</p>\n")
+
+
+def subentry_idx(number):
+    """ Returns the subentry index for number, i.e. 0 -> 'a', 25 -> 'z', 26 -> 'aa', 27 -> 'ab', ... """
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    idx = ""
+    number += 1
+    while number > 0:
+        number, rem = divmod(number - 1, 26)
+        idx = letters[rem] + idx
+    return idx
+
+
+def make_journal_entry(rng, day):
+    """ Returns xhtml for a single journal entry (a paragraph, a small table or a list). """
+    variant = rng.random()
+    timestamp = "[{:%Y%m%d} {:02d}:{:02d}:00]".format(day, rng.randint(8, 20), rng.randint(0, 59))
+    if variant < 0.1:
+        rows = "".join(u"<tr><td><p>{}</p></td><td><p>{} ul</p></td></tr>".format(make_title(rng), rng.randint(1, 500))
+                       for _ in range(rng.randint(2, 8)))
+        return u"<p>{} Mixing scheme:</p><table><tbody><tr><th><p>Reagent</p></th><th><p>Volume</p></th></tr>{}</tbody></table>\n".format(timestamp, rows)
+    elif variant < 0.2:
+        items = "".join(u"<li>{}</li>".format(make_title(rng, (2, 8))) for _ in range(rng.randint(2, 6)))
+        return u"<p>{} Steps:</p><ul>{}</ul>\n".format(timestamp, items)
+    return u"<p>{} {}.</p>\n".format(timestamp, make_title(rng, (5, 25)))
+
+
+def generate_experiment_page(expid="RS123", nsubentries=100, size=100000, seed=0):
+    """
+    Returns xhtml for an experiment page with nsubentries subentries and
+    journal entries (distributed evenly between the subentries) until the page is approximately <size> characters.
+    """
+    rng = random.Random(seed)
+    startday = date(2014, 1, 1)
+    headers = list()
+    for number in range(nsubentries):
+        day = startday + timedelta(days=number)
+        headers.append((u"<h4>{}{} {} ({:%Y%m%d})</h4><h6>Plan, setup, mixing schemes, etc</h6><h6>Journal, {:%Y%m%d}</h6>\n"
+                        .format(expid, subentry_idx(number), make_title(rng), day, day), day))
+    budget = size - len(PAGE_HEADER) - len(PAGE_FOOTER) - sum(len(header) for header, _ in headers)
+    per_subentry = max(0, budget // max(1, nsubentries))
+    parts = [PAGE_HEADER]
+    for header, day in headers:
+        parts.append(header)
+        written = 0
+        while written < per_subentry:
+            entry = make_journal_entry(rng, day)
+            parts.append(entry)
+            written += len(entry)
+    parts.append(PAGE_FOOTER)
+    return u"".join(parts)
+
+
+def generate_lims_page(nrows=1000, seed=0):
+    """ Returns xhtml for a LIMS page with a table of nrows entries (plus the header row). """
+    rng = random.Random(seed)
+    startday = date(2010, 1, 1)
+    headerrow = u"<tr>\n{}\n</tr>\n".format("\n".join(u"<th><p>{}</p></th>".format(header) for header in LIMS_HEADERS))
+    rows = list()
+    for rowno in range(nrows):
+        values = ("{:%Y%m%d}".format(startday + timedelta(days=rowno // 3)), make_title(rng),
+                  "{} {}".format(rng.randint(1, 1000), rng.choice(("mL", "L", "g", "mg", "stk"))),
+                  str(rng.randint(10, 5000)), rng.choice(("scholer", "jdoe", "ajensen")),
+                  rng.choice(("Sigma", "VWR", "IDT", "Fisher")), make_title(rng, (0, 6)) or "&nbsp;")
+        rows.append(u"<tr>{}</tr>".format("".join(u"<td><p>{}</p></td>".format(value) for value in values)))
+    return (u"<p>This page is used to keep track of things that we have bought (inventory management).</p>\n"
+            u"<table><tbody>\n{}{}\n</tbody></table>\n".format(headerrow, "\n".join(rows)))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Fixtures and helpers shared by the model tests using the fake XML-RPC server:
+
+    from tests.model_pytest.conftest import make_client
+
+    def test_something(fakexmlrpcserver):
+        client = make_client(fakexmlrpcserver)
+"""
+
+import pytest
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_xmlrpcserver import start_server
+from model.server.confluence_xmlrpc import ConfluenceXmlRpcClient
+
+
+@pytest.fixture
+def fakexmlrpcserver(request):
+    """ A fake confluence XML-RPC server, with a fixed random seed so jitter and fault injection are reproducible. """
+    server = start_server(seed=0)
+    request.addfinalizer(server.stop)
+    return server
+
+
+def make_client(server, confighandler=None, serverparams=None, login=True, **kwargs):
+    """
+    Returns a ConfluenceXmlRpcClient for the fake server, with serverparams (in addition to the appurl)
+    and other client kwargs (e.g. logintoken).
+    If login is True, the client logs in as the fake server's user; otherwise autologin is disabled
+    and the client has no credentials.
+    """
+    serverparams = dict(serverparams or {}, appurl=server.AppUrl)
+    if confighandler is None:
+        confighandler = FakeConfighandler()
+    if login:
+        kwargs.update(username='fakeuser', password='fakepassword')
+    else:
+        kwargs.update(autologin=False)
+    return ConfluenceXmlRpcClient(serverparams=serverparams, confighandler=confighandler, **kwargs)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the server connectivity circuit breaker.
+"""
+
+import time
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_xmlrpcserver import start_server
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.circuitbreaker import CircuitBreaker, CLOSED, OPEN
+
+
+def wait_for(condition, timeout=5):
+    t0 = time.time()
+    while not condition() and time.time() - t0 < timeout:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_breaker_probes_on_exponential_schedule():
+    results = [False, False, True]
+    probetimes, changes = [], []
+    def probe():
+        probetimes.append(time.time())
+        return results.pop(0)
+    breaker = CircuitBreaker(probe, onchange=changes.append, threshold=3, delay=0.05)
+    breaker.recordFailure()
+    breaker.recordSuccess()     # Failures must be consecutive.
+    breaker.recordFailure()
+    breaker.recordFailure()
+    assert breaker.allow()
+    t0 = time.time()
+    breaker.recordFailure()
+    assert breaker.State == OPEN and changes == [OPEN]
+    assert not breaker.allow() and breaker.Rejected == 1
+    assert wait_for(lambda: breaker.State == CLOSED)
+    assert changes == [OPEN, CLOSED] and breaker.allow()
+    # Probes after 0.05, 0.1 and 0.2 seconds:
+    intervals = [b - a for a, b in zip([t0] + probetimes, probetimes)]
+    assert all(0.8*expected < interval < expected + 0.1 for interval, expected in zip(intervals, [0.05, 0.1, 0.2]))
+
+
+def test_client_fails_fast_while_server_is_down():
+    server = start_server()
+    port = server.server_address[1]
+    confighandler = FakeConfighandler()
+    client = make_client(server, confighandler, serverparams=dict(breaker_probe_delay=0.05))
+    statuschanges = []
+    confighandler.registerEntryChangeCallback('wiki_server_status', lambda: statuschanges.append(client._connectionok))
+    assert client.CachedConnectStatus is True
+    server.stop()
+    assert client.getPage('524313') is None
+    assert client._connectionok is False and not client.Breaker.IsOpen
+    assert client.getPage('524313') is None
+    assert client.Breaker.IsOpen
+    # Requests fail fast, and the connection status is known without contacting the server:
+    assert client.getChildren('524296') is None and client.Breaker.Rejected == 1
+    assert client.CachedConnectStatus is False
+    assert statuschanges == [False]
+    # When the server is back, a probe closes the breaker and the status callbacks are invoked:
+    server = start_server(port=port)
+    try:
+        assert wait_for(lambda: not client.Breaker.IsOpen)
+        assert statuschanges == [False, True]
+        assert client.CachedConnectStatus is True
+        assert client.getPage('524313')['id'] == '524313'
+    finally:
+        server.stop()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for coalescing of identical in-flight requests.
+"""
+
+import time
+import threading
+import xmlrpclib
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.coalescing import RequestCoalescer
+
+
+def run_concurrently(function, argslist):
+    results = [None] * len(argslist)
+    def run(i, args):
+        try:
+            results[i] = function(*args)
+        except Exception as e:     # pylint: disable=W0703
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(argslist)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_coalescer():
+    coalescer = RequestCoalescer()
+    calls = []
+    def slow(pageId):
+        calls.append(pageId)
+        time.sleep(0.1)
+        if pageId == 'bad':
+            raise ValueError(pageId)
+        return [dict(id=pageId)]
+    results = run_concurrently(lambda pageId: coalescer.call(('getPage', pageId), slow, pageId),
+                               [('1', )] * 4 + [('2', )])
+    assert sorted(calls) == ['1', '2']
+    assert results[:4] == [[dict(id='1')]] * 4
+    # Each caller has its own copy:
+    assert len(set(id(result[0]) for result in results[:4])) == 4
+    assert coalescer.Stats['requests'] == 2 and coalescer.Stats['coalesced'] == 3
+    assert coalescer.Saved['getPage'] == 3
+    # Errors are raised in all callers:
+    results = run_concurrently(lambda: coalescer.call(('getPage', 'bad'), slow, 'bad'), [()] * 3)
+    assert all(isinstance(result, ValueError) for result in results)
+    # Later calls make a new request, and unhashable args are not coalesced:
+    assert coalescer.call(('getPage', '1'), slow, '1') == [dict(id='1')]
+    assert coalescer.call(('search', {'type': 'page'}), slow, '3') == [dict(id='3')]
+    assert calls.count('1') == 2 and coalescer.Stats['requests'] == 4
+
+
+def test_client_coalesces_inflight_reads(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    fakexmlrpcserver.Latency = 0.2
+    results = run_concurrently(client.getAttachments, [('917518', )] * 4 + [('524313', )])
+    assert all(isinstance(result, list) for result in results[:4])
+    assert results[0] == results[3] and results[0] is not results[3]
+    assert fakexmlrpcserver.Callcounts['confluence2.getAttachments'] == 2
+    assert client.Coalescer.Saved['getAttachments'] == 3
+    # Faults are shared too:
+    results = run_concurrently(client.getPage, [('nonexisting', )] * 2)
+    assert all(isinstance(result, xmlrpclib.Fault) for result in results)
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == 1
+    # Writes are never coalesced:
+    page = client.getPage('524313')
+    run_concurrently(client.storePage, [(page, )] * 2)
+    assert fakexmlrpcserver.Callcounts['confluence2.storePage'] == 2
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the asynchronous (event loop based) Confluence XML-RPC client.
+"""
+
+import time
+import xmlrpclib
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_xmlrpcserver import FakeXmlRpcRequestHandler
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.confluence_async import AsyncConfluenceClient
+
+# Experiment pages below the experiment root page (524296) in the fake server's test data:
+EXPERIMENT_PAGEIDS = dict(RS102='524313', RS103='917510', RS105='524314', RS134='917511', RS135='917518', RS145='917514')
+
+
+def test_concurrent_calls(fakexmlrpcserver):
+    aclient = AsyncConfluenceClient(make_client(fakexmlrpcserver), connections=4)
+    fakexmlrpcserver.Latency = 0.2
+    pageids = list(EXPERIMENT_PAGEIDS.values()) * 2
+    t0 = time.time()
+    calls = [aclient.getPage(pageid) for pageid in pageids]
+    assert time.time() - t0 < 0.1      # Calls return immediately.
+    assert len(aclient.Connections) == 4
+    structs = aclient.gather(calls)
+    elapsed = time.time() - t0
+    assert [struct['id'] for struct in structs] == pageids
+    # 12 calls over 4 connections take 3 round trips rather than 12:
+    assert elapsed < 0.2 * len(pageids) / 2
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == len(pageids)
+    children = aclient.getChildren('524296').result()
+    assert set(EXPERIMENT_PAGEIDS.values()) <= set(child['id'] for child in children)
+
+
+def test_calls_are_rate_limited(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver, serverparams=dict(rate_limit=20, rate_limit_burst=2))
+    aclient = AsyncConfluenceClient(client, connections=4)
+    requests = client.Scheduler.Stats['interactive']
+    t0 = time.time()
+    structs = aclient.map('getPage', [(pageid, ) for pageid in EXPERIMENT_PAGEIDS.values()])
+    assert all(structs)
+    # 6 requests with 20 requests per second (after a burst of 2 tokens, which may have been used by the login):
+    assert time.time() - t0 > 0.15
+    assert client.Scheduler.Stats['interactive'] - requests == len(EXPERIMENT_PAGEIDS)
+    assert aclient.Stats['ratelimited'] > 0
+
+
+def test_faults_and_callbacks(fakexmlrpcserver):
+    aclient = AsyncConfluenceClient(make_client(fakexmlrpcserver))
+    done = []
+    call = aclient.getPage('nonexisting')
+    call.addCallback(done.append)
+    other = aclient.getPage(spaceKey='~scholer', pageTitle='RS102 Strep-col11 TR annealed with biotin')
+    assert aclient.gather([call, other])[0] is None
+    assert done == [call]
+    assert isinstance(call.Error, xmlrpclib.Fault)
+    with pytest.raises(xmlrpclib.Fault):
+        call.result()
+    assert other.result()['id'] == EXPERIMENT_PAGEIDS['RS102']
+
+
+def test_keepalive_connections_are_reused(fakexmlrpcserver, monkeypatch):
+    monkeypatch.setattr(FakeXmlRpcRequestHandler, 'protocol_version', 'HTTP/1.1')
+    aclient = AsyncConfluenceClient(make_client(fakexmlrpcserver), connections=2)
+    assert all(aclient.map('getPage', [(pageid, ) for pageid in EXPERIMENT_PAGEIDS.values()]))
+    assert aclient.Stats['requests'] == len(EXPERIMENT_PAGEIDS)
+    assert aclient.Stats['connections'] == 2
+    aclient.close()
+    assert not aclient.Connections
+
+
+def test_unreachable_server(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    aclient = AsyncConfluenceClient(client)
+    fakexmlrpcserver.stop()
+    call = aclient.getAttachments(EXPERIMENT_PAGEIDS['RS102'])
+    assert aclient.gather([call], timeout=5) == [None]
+    assert call.Done and call.Error is not None
+    assert client._connectionok is False
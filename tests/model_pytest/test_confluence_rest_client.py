@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the Confluence REST client, using the fake REST server.
+"""
+
+import xmlrpclib
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+pytest.importorskip('requests')
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_restserver import start_server
+
+#### SUT ####
+from model.server.confluence_rest_client import ConfluenceRestClient, search_cql
+from model.server.abstract_rest_client import RESTError
+
+EXPERIMENT_PAGEIDS = dict(RS102='524313', RS103='917510', RS105='524314', RS134='917511', RS135='917518', RS145='917514')
+RS102_TITLE = 'RS102 Strep-col11 TR annealed with biotin'
+
+
+@pytest.fixture
+def fakerestserver(request):
+    server = start_server(maxlimit=4)
+    request.addfinalizer(server.stop)
+    return server
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault('username', 'fakeuser')
+    kwargs.setdefault('password', 'fakepassword')
+    return ConfluenceRestClient(serverparams={'resturl': server.RestUrl}, confighandler=FakeConfighandler(), **kwargs)
+
+
+def test_login(fakerestserver):
+    client = make_client(fakerestserver)
+    assert client._connectionok is True
+    assert client.getServerInfo()['username'] == 'fakeuser'
+    client = make_client(fakerestserver, password='wrong', autologin=False)
+    assert client.autologin(prompt='never') is None
+    assert client._connectionok is False
+    client = make_client(fakerestserver, username=None, password=None, logintoken='fake_personal_token')
+    assert client._connectionok is True
+    # An xml-rpc appurl is converted to the REST API url of the same server:
+    client = ConfluenceRestClient(serverparams={'appurl': fakerestserver.BaseUrl + '/rpc/xmlrpc/'}, autologin=False,
+                                  confighandler=FakeConfighandler())
+    assert client.AppUrl == fakerestserver.RestUrl
+
+
+def test_pages_in_xmlrpc_format(fakerestserver):
+    client = make_client(fakerestserver)
+    page = client.getPage(EXPERIMENT_PAGEIDS['RS102'])
+    assert page['title'] == RS102_TITLE
+    assert page['version'] == '28' and page['parentId'] == '524296' and page['space'] == '~scholer'
+    assert page['creator'] == 'scholer' and page['created'].year == 2013
+    assert client.getPage(spaceKey='~scholer', pageTitle=RS102_TITLE)['id'] == EXPERIMENT_PAGEIDS['RS102']
+    with pytest.raises(RESTError):
+        client.getPage(spaceKey='~scholer', pageTitle='RS999 No such page')
+    # Child listings are paginated (4 results per response):
+    children = client.getChildren('524296')
+    assert set(EXPERIMENT_PAGEIDS.values()) <= set(child['id'] for child in children)
+    assert fakerestserver.Callcounts['getChildren'] == (len(children) + 3) // 4
+    assert [ancestor['id'] for ancestor in client.getAncestors(EXPERIMENT_PAGEIDS['RS102'])] == ['524293', '524296']
+    assert client.searchForWikiPage('~scholer', RS102_TITLE)['id'] == EXPERIMENT_PAGEIDS['RS102']
+
+
+def test_child_pages_with_expansion(fakerestserver):
+    client = make_client(fakerestserver)
+    pageId = EXPERIMENT_PAGEIDS['RS135']
+    for i in range(6):
+        assert client.addAttachment(pageId, dict(fileName='file{}.txt'.format(i), contentType='text/plain'),
+                                    xmlrpclib.Binary('data {}'.format(i)))
+    fakerestserver.Callcounts.clear()
+    pages = client.getChildPages('524296')
+    # One request per 4 child pages, plus one for the attachments of the page with more than 4 attachments:
+    assert fakerestserver.Callcounts['getChildren'] == (len(pages) + 3) // 4 + 1
+    xmlrpcpages = dict((page['id'], page) for page in pages)
+    assert set(EXPERIMENT_PAGEIDS.values()) <= set(xmlrpcpages)
+    assert xmlrpcpages[pageId]['content'] == client.getPage(pageId)['content']
+    assert xmlrpcpages[pageId]['version'] == client.getPage(pageId)['version']
+    assert len(xmlrpcpages[pageId]['attachments']) == 7
+    assert xmlrpcpages[pageId]['attachments'] == client.getAttachments(pageId)
+    assert client.getAttachmentData(pageId, 'file5.txt').data == 'data 5'
+
+
+def test_store_update_and_search(fakerestserver):
+    client = make_client(fakerestserver)
+    page = client.storePage(dict(space='~scholer', title='RS199 REST page', content='<p>New page</p>', parentId='524296'))
+    assert page['version'] == '1' and page['parentId'] == '524296'
+    page['content'] += '<p>More</p>'
+    updated = client.updatePage(page, dict(versionComment='Added more'))
+    assert updated['version'] == '2' and updated['content'] == '<p>New page</p><p>More</p>'
+    # Updating an old version is a conflict:
+    with pytest.raises(RESTError) as excinfo:
+        client.storePage(page)
+    assert excinfo.value.StatusCode == 409
+    results = client.search('REST page', 10, dict(spaceKey='~scholer', type='page'))
+    assert [result['id'] for result in results] == [page['id']]
+    assert search_cql('a "b"', dict(contributor='scholer', modified='TODAY')) == \
+        'text ~ "a \\"b\\"" and contributor = "scholer" and lastmodified >= startOfDay()'
+
+
+def test_unreachable_server(fakerestserver):
+    client = make_client(fakerestserver)
+    fakerestserver.stop()
+    assert client.getPage(EXPERIMENT_PAGEIDS['RS102']) is None
+    assert client._connectionok is False
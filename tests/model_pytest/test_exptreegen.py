@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests the synthetic experiment tree generator used by the benchmarks,
+in particular that the generated trees are parsed as expected.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.dirtreeparsing import genPathmatchTupsByPathscheme, getFoldersWithSameProperty
+
+#### SUT ####
+from tests.benchmarks.exptreegen import generate_experiment_tree, REGEXS
+
+
+@pytest.fixture
+def treedir(request):
+    rootdir = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(rootdir))
+    return rootdir
+
+
+def test_generate_tree(treedir):
+    stats = generate_experiment_tree(treedir, nexperiments=60, nsubentries=3, nfiles=1, noise=0.2, duplicates=0.2)
+    regexs = dict((key, re.compile(regex)) for key, regex in REGEXS.items())
+    exps = list(genPathmatchTupsByPathscheme(treedir, './year/experiment/subentry', regexs, rightmost='experiment'))
+    subentries = list(genPathmatchTupsByPathscheme(treedir, './year/experiment/subentry', regexs))
+    # All generated experiments and subentries are parsed, stray folders are not:
+    assert len(exps) == stats['experiments'] > 60
+    assert len(subentries) == stats['subentries']
+    duplicates = getFoldersWithSameProperty('expid', treedir, './year/experiment/subentry', regexs,
+                                            rightmost='experiment', countlim=2)
+    assert len(duplicates) == stats['duplicates']
+    # Same seed, same tree:
+    otherdir = os.path.join(treedir, 'other')
+    assert generate_experiment_tree(otherdir, nexperiments=60, nsubentries=3, nfiles=1, noise=0.2,
+                                    duplicates=0.2)['subentries'] == stats['subentries']
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,C0111,W0621
+"""
+Tests for the local confluence stand-in server, using the real ConfluenceXmlRpcClient.
+"""
+
+import time
+import xmlrpclib
+import pytest
+
+import logging
+logger = logging.getLogger(__name__)
+
+from tests.model_pytest.conftest import make_client
+
+
+def test_client_login_and_getpage(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    assert client.Logintoken == 'very_random_token'
+    page = client.getPage('524296')
+    assert page['id'] == '524296'
+    assert page['creator'] == 'scholer'
+    assert fakexmlrpcserver.Callcounts['confluence2.login'] == 1
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == 1
+    assert fakexmlrpcserver.Stats['bytes_sent'] > 0
+
+
+def test_latency(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    fakexmlrpcserver.Latency = 0.2
+    t0 = time.time()
+    client.getServerInfo()
+    assert time.time() - t0 >= 0.2
+
+
+def test_bandwidth(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    fakexmlrpcserver.Bandwidth = 10000      # bytes/s, the response is about 1 kB.
+    t0 = time.time()
+    client.getPage('524296')
+    assert time.time() - t0 >= 0.1
+
+
+def test_fault_injection(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    fakexmlrpcserver.Rates['fault_rate'] = 1
+    with pytest.raises(xmlrpclib.Fault):
+        client.getPage('524296')
+    assert fakexmlrpcserver.Stats['injected_faults'] == 1
+
+
+def test_error_injection(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    fakexmlrpcserver.Rates['error_rate'] = 1
+    with pytest.raises(xmlrpclib.ProtocolError):
+        client.getPage('524296')
+    # The connection is still usable afterwards:
+    fakexmlrpcserver.Rates['error_rate'] = 0
+    assert client.getPage('524296')['id'] == '524296'
+
+
+def test_unknown_method(fakexmlrpcserver):
+    proxy = xmlrpclib.ServerProxy(fakexmlrpcserver.AppUrl)
+    with pytest.raises(xmlrpclib.Fault):
+        proxy.confluence2.noSuchMethod('token')
+    with pytest.raises(xmlrpclib.Fault):
+        proxy.confluence2._loaded_data()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+
+import sys
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+
+#### SUT ####
+from model.lazyimport import lazy_import, module_available, LazyModule
+
+
+def test_lazy_import():
+    sys.modules.pop('wave', None)
+    wave = lazy_import('wave')
+    assert isinstance(wave, LazyModule)
+    assert not wave.Loaded
+    assert 'wave' not in sys.modules
+    assert wave.WAVE_FORMAT_PCM == 1
+    assert wave.Loaded
+    # Already imported modules are returned directly:
+    assert lazy_import('os') is sys.modules['os']
+
+def test_missing_module():
+    missing = lazy_import('nonexisting_module_xyz')
+    assert not missing
+    with pytest.raises(ImportError):
+        missing.somefunction()
+    assert not module_available('nonexisting_module_xyz')
+    assert module_available('json')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the MediaWiki API client, using the fake MediaWiki API adapter.
+"""
+
+import time
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+pytest.importorskip('requests')
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_mediawikiapi import FakeMediawikiAdapter
+
+#### SUT ####
+from model.server.mediawiki_client import MediawikiRestClient, merge_pages
+from model.server.abstract_rest_client import RESTError
+
+
+@pytest.fixture
+def adapter():
+    return FakeMediawikiAdapter()
+
+
+def make_client(adapter, **serverparams):
+    serverparams['appurl'] = adapter.AppUrl
+    client = MediawikiRestClient(serverparams=serverparams, confighandler=FakeConfighandler(), autologin=False)
+    client.Session.mount(adapter.AppUrl, adapter)
+    return client
+
+
+def test_login_and_gzip(adapter):
+    client = make_client(adapter)
+    assert client.login('fakeuser', 'wrong') is None
+    assert client.login('fakeuser', 'fakepassword') is True
+    assert adapter.Api.LoggedIn == 'fakeuser' and client._connectionok is True
+    assert client.getServerInfo()['sitename'] == 'Fake lab wiki'
+    # All responses were gzip-compressed and transparently decoded:
+    assert adapter.Stats['gzipped'] == adapter.Stats['requests'] == client.Stats['requests']
+
+
+def test_multi_title_queries(adapter):
+    client = make_client(adapter, titles_per_request=3)
+    titles = ['Experiments/RS10{}'.format(i) for i in range(1, 8)] + ['main_Page', 'No such page']
+    pages = client.getPagesByTitle(titles)
+    # 9 titles in batches of 3; missing pages are left out and titles are normalized:
+    assert adapter.Api.TitleCounts == [3, 3, 3]
+    assert [page['title'] for page in pages] == titles[:7] + ['Main Page']
+    assert pages[2]['content'] == 'Experiment RS103, revision 2.'
+    assert pages[2]['version'] == str(adapter.Api.Pages['Experiments/RS103']['revisions'][-1]['revid'])
+    assert pages[2]['modified'].day == 3
+    # File info for many files:
+    filenames = ['RS107-gel{}.png'.format(j) for j in range(7)]
+    files = client.getFileInfo(filenames)
+    assert [attachment['fileName'] for attachment in files] == filenames
+    assert files[0]['fileSize'] == '7000' and files[0]['contentType'] == 'image/png'
+    assert adapter.Api.TitleCounts[3:] == [3, 3, 1]
+
+
+def test_continuation(adapter):
+    client = make_client(adapter)
+    # Results are limited to 3 per response:
+    requests = adapter.Api.Callcounts['query']
+    children = client.getChildren('Experiments')
+    assert len(children) == 7
+    assert adapter.Api.Callcounts['query'] - requests == 1 + 3      # 1 for the page, 3 for the subpages.
+    revisions = client.getRevisions('Experiments/RS107')
+    assert len(revisions) == 7
+    assert [revision['versionComment'] for revision in revisions] == [''] * 7
+    assert revisions[0]['modified'] > revisions[-1]['modified']
+    assert len(client.getRevisions('Experiments/RS107', limit=2)) == 2
+    attachments = client.getAttachments('Experiments/RS105')
+    assert sorted(attachment['fileName'] for attachment in attachments) == \
+        ['RS105-gel{}.png'.format(j) for j in range(5)]
+    assert len(client.getPages(6)) == sum(range(1, 8))
+    results = client.search('experiment revision', 5)
+    assert len(results) == 5 and results[0]['title'] == 'Experiments/RS101'
+    # Property continuation (e.g. rvcontinue) returns the same page again, which is merged:
+    assert merge_pages([dict(pages=[dict(pageid=1, title='A', revisions=[1])]),
+                        dict(pages=[dict(pageid=1, title='A', revisions=[2])])]) == \
+        [dict(pageid=1, title='A', revisions=[1, 2])]
+
+
+def test_continue_keys_are_not_accumulated(adapter):
+    client = make_client(adapter)
+    sent = []
+    responses = [{'continue': {'gapcontinue': 'RS104', 'continue': 'gapcontinue||'}, 'query': {}},
+                 {'continue': {'rvcontinue': '7|1', 'continue': '||'}, 'query': {}},
+                 {'query': {}}]
+    def api(params):
+        sent.append(dict(params))
+        return responses[len(sent) - 1]
+    client.api = api
+    assert len(client.query(dict(generator='allpages'))) == 3
+    # Each request only has the continue keys of the previous response:
+    assert sent[0]['continue'] == '' and 'gapcontinue' not in sent[0]
+    assert sent[1]['gapcontinue'] == 'RS104' and sent[1]['continue'] == 'gapcontinue||'
+    assert sent[2]['rvcontinue'] == '7|1' and 'gapcontinue' not in sent[2]
+    assert all(params['generator'] == 'allpages' for params in sent)
+
+
+def test_requests_are_scheduled(adapter):
+    client = make_client(adapter, rate_limit=20, rate_limit_burst=1)
+    t0 = time.time()
+    for title in ('Experiments/RS101', 'Experiments/RS102', 'Experiments/RS103'):
+        assert client.getPage(pageTitle=title)
+    assert time.time() - t0 > 0.08
+    assert client.Scheduler.Stats['interactive'] == adapter.Stats['requests']
+
+
+def test_maxlag_and_edits(adapter):
+    client = make_client(adapter)
+    assert client.login('fakeuser', 'fakepassword')
+    adapter.Api.LaggedRequests = 2
+    page = client.getPage(pageTitle='Experiments/RS101')
+    assert client.Stats['maxlag'] == 2
+    page['content'] = 'Updated'
+    updated = client.storePage(page)
+    assert updated['content'] == 'Updated' and int(updated['version']) > int(page['version'])
+    # Storing the old revision again is an edit conflict:
+    with pytest.raises(RESTError):
+        client.storePage(page)
+    new = client.storePage(dict(title='Experiments/RS108', content='New experiment'))
+    assert new['modifier'] == 'fakeuser'
+    with pytest.raises(RESTError):
+        client.getPage(pageTitle='No such page')
+    adapter.Api.LaggedRequests = 10
+    with pytest.raises(RESTError):
+        client.getServerInfo()
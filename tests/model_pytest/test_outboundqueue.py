@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the outbound operation queue used while the server is offline.
+"""
+
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from tests.model_pytest.conftest import make_client
+from model.page import WikiPage, replay_page_create
+import model.journalassistant   # pylint: disable=W0611  (registers the 'journal-entries' handler)
+
+#### SUT ####
+from model.outboundqueue import OutboundQueue, get_outbound_queue, register_operation_handler, get_operation_handler
+
+
+class StubServer(object):
+    def __init__(self, connectionok=True):
+        self._connectionok = connectionok
+
+
+@pytest.fixture
+def replayed():
+    """ Registers test operation handlers; returns the list of replayed values. """
+    calls = []
+    def record(server, confighandler, value):
+        calls.append(value)
+        return True
+    def fail(server, confighandler, value):
+        calls.append(value)
+        raise ValueError("Replay failed")
+    register_operation_handler('test-record', record)
+    register_operation_handler('test-obsolete', lambda server, confighandler, value: None)
+    register_operation_handler('test-fail', fail)
+    return calls
+
+
+def test_persisted_and_replayed_in_order(tmpdir, replayed):
+    path = str(tmpdir.join('queue.yml'))
+    outboundqueue = OutboundQueue(path)
+    for value in (1, 2):
+        outboundqueue.enqueue('test-record', value=value)
+    outboundqueue.enqueue('test-obsolete', value=3)
+    outboundqueue.enqueue('test-record', value=u'fire')
+    # Pending operations survive a restart:
+    outboundqueue = OutboundQueue(path)
+    assert [op['params']['value'] for op in outboundqueue.Operations] == [1, 2, 3, u'fire']
+    assert outboundqueue.shouldQueue(StubServer(True))
+    assert outboundqueue.replay(StubServer(False)) == 0
+    assert outboundqueue.replay(StubServer(True)) == 4
+    assert replayed == [1, 2, u'fire']
+    assert outboundqueue.Stats['obsolete'] == 1
+    assert not OutboundQueue(path).Operations
+    assert not outboundqueue.shouldQueue(StubServer(True))
+    assert outboundqueue.shouldQueue(StubServer(False))
+    assert not outboundqueue.shouldQueue(StubServer(None))
+
+
+def test_failing_operation_is_given_up(replayed):
+    outboundqueue = OutboundQueue(maxattempts=2)
+    outboundqueue.enqueue('test-fail', value='a')
+    outboundqueue.enqueue('test-record', value='b')
+    # Replay stops at the failing operation, so the order is preserved:
+    assert outboundqueue.replay(StubServer()) == 0
+    assert outboundqueue.Operations[0]['attempts'] == 1
+    assert outboundqueue.replay(StubServer()) == 1
+    assert replayed == ['a', 'a', 'b']
+    assert [op['params']['value'] for op in outboundqueue.Failed] == ['a']
+    assert outboundqueue.Depth == 0
+
+
+def test_operations_without_handler_are_kept(replayed):
+    outboundqueue = OutboundQueue()
+    outboundqueue.enqueue('test-unknown', value='a')
+    outboundqueue.enqueue('test-record', value='b')
+    assert outboundqueue.replay(StubServer()) == 0
+    assert outboundqueue.Depth == 2 and not outboundqueue.Failed and replayed == []
+    # Handlers registered by modules that have not been imported are found:
+    for optype in ('lims-entries', 'page-create', 'journal-entries', 'attachment'):
+        assert callable(get_operation_handler(optype))
+
+
+def test_replay_on_reconnect(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    client = make_client(fakexmlrpcserver, ch)
+    ch.Singletons['server'] = client
+    depths = []
+    ch.registerEntryChangeCallback('wiki_outbound_queue_depth', lambda depth: depths.append(depth), pass_newvalue_as='depth')
+    outboundqueue = get_outbound_queue(ch)
+    assert get_outbound_queue(ch) is outboundqueue
+    client.notok()
+    struct = dict(space='~scholer', title='RS199 Created while offline', content='<p>New page</p>', version='1')
+    outboundqueue.enqueue('page-create', struct=struct)
+    xhtml = '<p>Journal entry written while offline</p>'
+    outboundqueue.enqueue('journal-entries', pageId='524313', xhtml=xhtml, expid='RS102', subentry_idx='a',
+                          insertion_regex=r'(?P<before_insert>NO MATCH)(?P<after_insert>)', versionComment='Offline journal')
+    assert depths == [1, 2]
+    assert fakexmlrpcserver.Callcounts['confluence2.storePage'] == 0
+    # When the connection comes back, the operations are replayed in a background thread:
+    client.setok()
+    outboundqueue._replaythread.join(5)
+    assert outboundqueue.Depth == 0
+    assert depths[-1] == 0
+    assert client.getPage(spaceKey='~scholer', pageTitle=struct['title'])
+    assert xhtml in WikiPage('524313', client, confighandler=ch).Content
+    # Conflict resolution: the page now exists, so creating it again is obsolete:
+    assert replay_page_create(client, ch, struct) is None
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the page cache and concurrent page prefetching.
+"""
+
+import time
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.page import WikiPage
+from model.experimentmanager import ExperimentManager
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_server import FakeConfluenceServer
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.pagecache import PageCache, get_page_cache
+
+# Experiment pages below the experiment root page (524296) in the fake server's test data:
+EXPERIMENT_PAGEIDS = dict(RS102='524313', RS103='917510', RS105='524314', RS134='917511', RS135='917518', RS145='917514')
+
+
+def test_put_get_copies():
+    pagecache = PageCache()
+    struct = dict(id='1', title='Page', content='<p>Hello</p>')
+    pagecache.put(struct)
+    struct['content'] = '<p>Changed</p>'
+    cached = pagecache.get(1)
+    assert cached['content'] == '<p>Hello</p>'
+    cached['content'] = '<p>Changed again</p>'
+    assert pagecache.get('1')['content'] == '<p>Hello</p>'
+    # Page summaries are not cached:
+    pagecache.put(dict(id='2', title='Summary'))
+    assert '2' not in pagecache
+    pagecache.discard('1')
+    assert pagecache.get('1') is None
+
+
+def test_ttl():
+    pagecache = PageCache(ttl=0.05)
+    pagecache.put(dict(id='1', title='Page', content=''))
+    assert '1' in pagecache
+    time.sleep(0.06)
+    assert '1' not in pagecache
+    assert pagecache.get('1') is None
+
+
+def test_prefetch_blocking():
+    pagecache = PageCache()
+    server = FakeConfluenceServer()
+    pageids = pagecache.prefetch(server, ['524313', 524314, '524313', 'nonexisting'], block=True)
+    assert pageids == ['524313', '524314', 'nonexisting']
+    assert pagecache.get('524313')['title'].startswith('RS102')
+    assert pagecache.Stats['prefetched'] == 2
+    assert pagecache.Stats['failed'] == 1
+    # Cached pages are not fetched again:
+    assert pagecache.prefetch(server, ['524313', '524314']) == []
+
+
+def test_prefetch_concurrent(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    client = make_client(fakexmlrpcserver, ch)
+    fakexmlrpcserver.Latency = 0.2
+    pagecache = get_page_cache(ch)
+    t0 = time.time()
+    pagecache.prefetch(client, EXPERIMENT_PAGEIDS.values())
+    structs = [pagecache.get(pageid) for pageid in EXPERIMENT_PAGEIDS.values()]
+    elapsed = time.time() - t0
+    assert all(struct and 'content' in struct for struct in structs)
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == len(EXPERIMENT_PAGEIDS)
+    # Fetched concurrently, i.e. about a single round trip rather than one per page:
+    assert elapsed < 0.2 * len(EXPERIMENT_PAGEIDS) / 2
+
+
+def test_experimentmanager_prefetches_active_experiments(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    client = make_client(fakexmlrpcserver, ch)
+    ch.setkey('app_active_experiments', ['RS102', 'RS105'])
+    ch.setkey('app_recent_experiments', ['RS134'])
+    em = ExperimentManager(confighandler=ch, server=client, autoinit=False, experimentsources=())
+    wiki_pages = em.getExpRootWikiPages()
+    assert wiki_pages
+    pagecache = em.PageCache
+    for expid in ('RS102', 'RS105', 'RS134'):
+        assert pagecache.get(EXPERIMENT_PAGEIDS[expid])
+    assert '917510' not in pagecache        # RS103 is neither active nor recent.
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == 3
+    # A WikiPage created with a page summary loads the full struct from the cache:
+    summary = next(page for page in wiki_pages if page['id'] == EXPERIMENT_PAGEIDS['RS102'])
+    wikipage = WikiPage(summary['id'], server=client, confighandler=ch, pagestruct=summary)
+    assert wikipage.Content
+    assert fakexmlrpcserver.Callcounts['confluence2.getPage'] == 3
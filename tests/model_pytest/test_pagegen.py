@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests the synthetic wiki page generator used by the benchmarks,
+in particular that the generated pages are parsed as expected.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+from model.experiment import Experiment
+from model.limspage import WikiLimsPage
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+
+#### SUT ####
+from tests.benchmarks.pagegen import generate_experiment_page, generate_lims_page, subentry_idx, LIMS_HEADERS, CONFIG
+
+
+def test_subentry_idx():
+    assert [subentry_idx(i) for i in (0, 1, 25, 26, 27, 51, 52)] == ['a', 'b', 'z', 'aa', 'ab', 'az', 'ba']
+
+
+def test_generate_experiment_page():
+    xhtml = generate_experiment_page("RS123", nsubentries=40, size=50000)
+    assert 50000 <= len(xhtml) < 60000
+    ch = FakeConfighandler(pathscheme='test1')
+    for key, value in CONFIG.items():
+        ch.setkey(key, value, 'exp')
+    experiment = Experiment(props=dict(expid="RS123", exp_titledesc="Test"), confighandler=ch,
+                            doparseLocaldirSubentries=False, autoattachwikipage=False, savepropsonchange=False)
+    subentries = experiment.parseSubentriesFromWikipage(xhtml=xhtml)
+    assert list(subentries.keys()) == [subentry_idx(i) for i in range(40)]
+    # Same seed, same page:
+    assert generate_experiment_page("RS123", nsubentries=40, size=50000) == xhtml
+
+
+def test_generate_lims_page():
+    xhtml = generate_lims_page(50)
+    page = WikiLimsPage('1', confighandler=FakeConfighandler(), pagestruct=dict(content=xhtml))
+    assert page.getTableHeaders() == list(LIMS_HEADERS)
+    match = page.LimstableRegexProg.match(xhtml)
+    assert len(page.TableRowRegexProg.findall(match.group('tablerows'))) == 50
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the concurrent multi-strategy page search.
+"""
+
+import re
+import time
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.pagesearch import SearchCoordinator, SearchStrategy, filter_rank
+
+
+PAGES = [dict(id='1', title='RS101 First experiment', creator='scholer'),
+         dict(id='2', title='RS102 Second experiment', creator='jdoe'),
+         dict(id='3', title='RS103 Third experiment', creator='scholer')]
+
+
+def delayed(results, delay):
+    def search():
+        time.sleep(delay)
+        return results
+    return search
+
+
+def test_filter_rank():
+    assert [page['id'] for page in filter_rank(PAGES, required={'creator': ('scholer', )})] == ['1', '3']
+    assert [page['id'] for page in filter_rank(PAGES, required={'title': (re.compile('RS10[23]'), )},
+                                               optional={'title': ('Third', )})] == ['3', '2']
+    assert filter_rank([], required={'creator': ('scholer', )}) == []
+
+
+def test_first_definitive_hit():
+    coordinator = SearchCoordinator()
+    strategies = [SearchStrategy('exact', delayed(None, 0.1), True),
+                  SearchStrategy('fast-search', delayed(PAGES, 0.05), False),
+                  SearchStrategy('slow-search', delayed(PAGES, 0.5), False)]
+    t0 = time.time()
+    hit = coordinator.run(strategies, required={'title': ('RS102', )})
+    assert time.time() - t0 < 0.4
+    assert hit['id'] == '2'
+    assert coordinator.Wins == {'fast-search': 1}
+
+
+def test_exact_hit_preferred():
+    coordinator = SearchCoordinator()
+    strategies = [SearchStrategy('slow-exact', delayed(PAGES[0], 0.3), True),
+                  SearchStrategy('fast-search', delayed(PAGES, 0.05), False)]
+    # The search hit comes first, but the page found by exact title is returned:
+    assert coordinator.run(strategies, required={'title': ('RS102', )})['id'] == '1'
+    assert coordinator.Wins == {'slow-exact': 1}
+
+
+def test_wins_are_saved_rarely():
+    ch = FakeConfighandler()
+    saved = []
+    ch.saveConfigs = lambda cfgtypes=None: saved.append(dict(ch.get('wiki_search_strategy_wins')))
+    coordinator = SearchCoordinator()
+    strategies = [SearchStrategy('exact', delayed(PAGES[0], 0), True)]
+    for _ in range(3):
+        coordinator.run(strategies)
+        coordinator.saveWins(ch)
+    # The counts are kept up to date in memory, but the config file is only written once:
+    assert ch.get('wiki_search_strategy_wins') == {'exact': 3}
+    assert saved == [{'exact': 1}]
+    coordinator.saveWins(ch, interval=0)
+    assert saved[-1] == {'exact': 3}
+
+
+def test_merged_results():
+    coordinator = SearchCoordinator()
+    strategies = [SearchStrategy('a', delayed(PAGES[:2], 0), False),
+                  SearchStrategy('b', delayed(PAGES[1:], 0), False),
+                  SearchStrategy('failing', delayed(None, 0), False)]
+    # Each strategy has two results passing the criteria, so the merged results are ambiguous:
+    assert coordinator.run(strategies, required={'title': ('experiment', )}) is False
+    assert coordinator.run(strategies, required={'title': ('RS999', )}) is None
+    assert not coordinator.Wins
+    # A single result passing the criteria is a definitive hit:
+    assert coordinator.run(strategies, required={'title': ('RS10', ), 'creator': ('jdoe', )})['id'] == '2'
+    assert sum(coordinator.Wins.values()) == 1
+
+
+def test_strategy_exceptions_are_ignored():
+    def failing():
+        raise ValueError("Search failed")
+    coordinator = SearchCoordinator()
+    strategies = [SearchStrategy('failing', failing, True), SearchStrategy('exact', delayed(PAGES[2], 0.05), True)]
+    assert coordinator.run(strategies)['id'] == '3'
+
+
+def test_winning_strategies_first():
+    coordinator = SearchCoordinator(workers=1, wins={'b': 2})
+    strategies = [SearchStrategy('a', delayed(PAGES[0], 0), True), SearchStrategy('b', delayed(PAGES[1], 0), True)]
+    assert [strategy.name for strategy in coordinator.orderStrategies(strategies)] == ['b', 'a']
+    # With a single worker, the first strategy gives the hit and the remaining strategy is skipped:
+    assert coordinator.run(strategies)['id'] == '2'
+    assert coordinator.Wins['b'] == 3
+
+
+def test_searchforwikipage_concurrent(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    client = make_client(fakexmlrpcserver, ch)
+    title = "RS102 Strep-col11 TR annealed with biotin"
+    page = client.searchForWikiPage('~scholer', title, searchlevel=2)
+    assert page['title'] == title
+    assert ch.get('wiki_search_strategy_wins')
+    # A miss runs all four strategies concurrently, in about one round trip:
+    fakexmlrpcserver.Latency = 0.2
+    t0 = time.time()
+    assert client.searchForWikiPage('~scholer', "RS999 No such page", searchlevel=2) is None
+    assert time.time() - t0 < 0.2 * 4 / 2
+    assert fakexmlrpcserver.Callcounts['confluence2.search'] >= 3
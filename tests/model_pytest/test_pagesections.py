@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the page section index.
+"""
+
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.page import WikiPage
+from model.experiment import Experiment
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_server import FakeConfluenceServer
+
+#### SUT ####
+from model.pagesections import SectionIndex, SectionLayout, get_section_layout, get_experiment_section, \
+    get_subentry_headers, get_subentry_header, get_new_subentry_position
+
+
+PAGE = u"""<h3>About</h3><p>Purpose</p><h2>Experimental section</h2>
+<h4>RS189a Pipetting <em>staples</em></h4><h6>Journal, 20140109</h6><p>RS189a journal</p>
+<h4 class="x">RS189-b Second (20140108)</h4><p>RS189b journal</p>
+<h4>RS189_d Fourth</h4><h6>Journal</h6><p>RS189d journal</p>
+<h2>Results and discussion</h2><h6>Gallery</h6><h2>Attachments</h2><p>Hello</p>
+"""
+
+
+LAYOUT = SectionLayout("Experimental section", 2, 4)
+
+
+@pytest.fixture
+def index():
+    return SectionIndex(PAGE)
+
+
+def test_sectionindex(index):
+    assert [header.title for header in index.Headers] == [
+        "About", "Experimental section", "RS189a Pipetting staples", "Journal, 20140109", "RS189-b Second (20140108)",
+        "RS189_d Fourth", "Journal", "Results and discussion", "Gallery", "Attachments"]
+    expsection = index.findHeader(level=2, title="Experimental section")
+    assert index.getXhtml(expsection).startswith(u"<h2>Experimental section</h2>")
+    assert index.getXhtml(expsection).endswith(u"RS189d journal</p>\n")
+    assert [header.title for header in index.subHeaders(expsection, level=4)][1:] == ["RS189-b Second (20140108)", "RS189_d Fourth"]
+    attachments = index.findHeader(title="Attachments")
+    assert index.getXhtml(attachments, include_header=False) == u"<p>Hello</p>\n"
+
+
+def test_section_layout_from_config():
+    regex_fmt = FakeConfighandler().get('wiki_subentry_parse_regex_fmt')
+    assert get_section_layout(regex_fmt) == LAYOUT
+    regex_fmt = regex_fmt.replace("<h2>Experimental section</h2>", "<h1>Experiments</h1>").replace("h4>", "h3>")
+    assert get_section_layout(regex_fmt) == SectionLayout("Experiments", 1, 3)
+    # Section titles that are not literal text cannot be used with the section index:
+    assert get_section_layout(regex_fmt.replace("Experiments", "Experiment(al section|s)")) is None
+    assert get_section_layout(None) is None
+
+
+def test_subentry_headers(index):
+    assert get_experiment_section(index, LAYOUT).title == "Experimental section"
+    assert list(get_subentry_headers(index, "RS189", LAYOUT).keys()) == ['a', 'b', 'd']
+    header = get_subentry_header(index, "RS189", 'a', LAYOUT)
+    assert PAGE[header.bodystart:header.end] == u"<h6>Journal, 20140109</h6><p>RS189a journal</p>\n"
+    assert get_subentry_header(index, "RS189", 'c', LAYOUT) is None
+    assert get_subentry_header(SectionIndex(u"<h2>Other</h2>"), "RS189", 'a', LAYOUT) is None
+    # The configured layout is used, e.g. with subentries as <h6> headers there are none:
+    assert get_subentry_headers(index, "RS189", LAYOUT._replace(subentry_level=6)) == {}
+    assert get_subentry_header(index, "RS189", 'a', None) is None
+
+
+def test_new_subentry_position(index):
+    assert PAGE[get_new_subentry_position(index, "RS189", 'c', LAYOUT):].startswith(u"<h4>RS189_d")
+    assert PAGE[get_new_subentry_position(index, "RS189", 'e', LAYOUT):].startswith(u"<h2>Results")
+    assert get_new_subentry_position(SectionIndex(u"<p>no sections</p>"), "RS189", 'a', LAYOUT) is None
+    assert get_new_subentry_position(index, "RS189", 'e', None) is None
+
+
+def test_wikipage_sectionindex_and_insertAt():
+    server = FakeConfluenceServer()
+    struct = server.storePage(dict(space='~scholer', title='RS189 Section index test', content=PAGE))
+    page = WikiPage(struct['id'], server=server, confighandler=FakeConfighandler(), pagestruct=struct)
+    index = page.SectionIndex
+    assert page.SectionIndex is index       # Not rebuilt when the content is unchanged.
+    header = get_subentry_header(index, "RS189", 'a', LAYOUT)
+    assert page.insertAt(u"<p>new entry</p>", header.end, persistToServer=False)
+    assert page.SectionIndex is not index
+    assert page.Content[:page.Content.index(u"<h4 class")].endswith(u"RS189a journal</p>\n\n<p>new entry</p>\n")
+
+
+def test_experiment_uses_sectionindex():
+    server = FakeConfluenceServer()
+    struct = server.storePage(dict(space='~scholer', title='RS189 Section index test 2', content=PAGE))
+    ch = FakeConfighandler()
+    page = WikiPage(struct['id'], server=server, confighandler=ch, pagestruct=struct)
+    experiment = Experiment(props=dict(expid="RS189", exp_titledesc="Test"), confighandler=ch, server=server,
+                            wikipage=page, doparseLocaldirSubentries=False, autoattachwikipage=False,
+                            savepropsonchange=False)
+    assert experiment.getWikiSubentryXhtml('b') == u'<h4 class="x">RS189-b Second (20140108)</h4>\n<p>RS189b journal</p>\n'
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for client-side rate limiting and request prioritisation.
+"""
+
+import time
+import threading
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.ratelimit import RequestScheduler, priority, current_priority, \
+    INTERACTIVE, BACKGROUND, BULK
+
+
+def test_rate_limit():
+    scheduler = RequestScheduler(rate=20, burst=2)
+    t0 = time.time()
+    for _ in range(10):
+        scheduler.acquire('getPage')
+    # The first 2 requests are a burst, the remaining 8 are limited to 20 per second:
+    assert 0.35 < time.time() - t0 < 0.8
+    assert scheduler.Stats['interactive'] == 10
+    assert scheduler.Stats['delayed'] >= 7
+    # Only the method with a limit is delayed:
+    scheduler = RequestScheduler(methodrates={'storePage': 10})
+    t0 = time.time()
+    for _ in range(25):
+        scheduler.acquire('getPage')
+    assert time.time() - t0 < 0.1
+    # Method buckets allow bursts of 2 x rate:
+    assert all(scheduler.acquire('storePage', timeout=1) < 0.01 for _ in range(20))
+    assert scheduler.acquire('storePage', timeout=0.01) is None
+
+
+def test_priority_classes():
+    assert current_priority() == INTERACTIVE
+    with priority('bulk'):
+        assert current_priority() == BULK
+    levels = []
+    threading.Thread(target=lambda: levels.append(current_priority())).start()
+    time.sleep(0.05)
+    assert levels == [BACKGROUND]
+
+    scheduler = RequestScheduler(rate=10, burst=1)
+    scheduler.acquire()
+    order = []
+    def request(level):
+        scheduler.acquire(level=level)
+        order.append(level)
+    threads = [threading.Thread(target=request, args=(level, )) for level in (BULK, BULK, BACKGROUND, BULK)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    request(INTERACTIVE)    # Arrives last, but goes first.
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, BACKGROUND, BULK, BULK, BULK]
+    assert scheduler.Stats['bulk'] == 3 and scheduler.Waited['bulk'] > scheduler.Waited['interactive']
+
+
+def test_client_requests_are_scheduled(fakexmlrpcserver):
+    confighandler = FakeConfighandler()
+    client = make_client(fakexmlrpcserver, confighandler, serverparams=dict(rate_limit=50))
+    assert client.Scheduler.Bucket.Rate == 50
+    # The scheduler (and the budget) is shared by the clients using the same confighandler:
+    other = make_client(fakexmlrpcserver, confighandler)
+    assert other.Scheduler is client.Scheduler
+    assert client.getPage('524313')['id'] == '524313'
+    thread = threading.Thread(target=other.getChildren, args=('524296', ))
+    thread.start()
+    thread.join()
+    assert client.Scheduler.Stats['interactive'] == 1 and client.Scheduler.Stats['background'] == 1
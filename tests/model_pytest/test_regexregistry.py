@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the regex registry.
+"""
+
+import re
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.experimentmanager import ExperimentManager
+
+#### SUT ####
+from model.regexregistry import RegexRegistry, get_regex_registry
+
+
+@pytest.fixture
+def confighandler():
+    ch = FakeConfighandler(pathscheme='test1')
+    ch.setkey('wiki_subentry_regex_fmt', r'<h4>{expid}[_-]*{subentry_idx}\s+(?P<subentry_titledesc>.+?)</h4>', 'exp')
+    return ch
+
+
+def test_get_compiles_once(confighandler):
+    registry = RegexRegistry(confighandler)
+    regex_prog = registry.get('expid_regex')
+    assert regex_prog.pattern == confighandler.get('expid_regex')
+    assert registry.get('expid_regex') is regex_prog
+    assert registry.Stats['misses'] == 1
+    assert registry.Stats['hits'] == 1
+    assert registry.get('no_such_entry', default=False) is False
+
+
+def test_format_params_and_flags(confighandler):
+    registry = RegexRegistry(confighandler)
+    fmt_params = dict(expid='RS123', subentry_idx=r'(?P<subentry_idx>[a-zA-Z]+)')
+    regex_prog = registry.get('wiki_subentry_regex_fmt', flags=re.DOTALL, fmt_params=fmt_params)
+    assert regex_prog.flags & re.DOTALL
+    assert regex_prog.match('<h4>RS123b Hello</h4>').group('subentry_idx') == 'b'
+    assert registry.get('wiki_subentry_regex_fmt', flags=re.DOTALL, fmt_params=dict(fmt_params)) is regex_prog
+    assert registry.get('wiki_subentry_regex_fmt', fmt_params=fmt_params) is not regex_prog
+    other = registry.get('wiki_subentry_regex_fmt', flags=re.DOTALL, fmt_params=dict(fmt_params, expid='RS124'))
+    assert other.match('<h4>RS124a Hello</h4>')
+
+
+def test_changed_config_entry(confighandler):
+    registry = get_regex_registry(confighandler)
+    assert get_regex_registry(confighandler) is registry
+    regex_prog = registry.get('expid_regex')
+    version = registry.getVersion('expid_regex')
+    # A changed value is never served stale, even before the change callbacks are invoked:
+    confighandler.setkey('expid_regex', r'(?:XY)([0-9]{3})')
+    new_regex_prog = registry.get('expid_regex')
+    assert new_regex_prog is not regex_prog
+    assert new_regex_prog.match('XY042').group(1) == '042'
+    # Invoking the change callbacks removes the cached regexes for the entry:
+    confighandler.invokeEntryChangeCallback('expid_regex')
+    assert registry.getVersion('expid_regex') == version + 1
+    assert not [key for key in registry.Cache if key[0] == 'expid_regex']
+
+
+def test_cache_size():
+    registry = RegexRegistry(cachesize=2)
+    for i in range(3):
+        registry.compile('test', 'a{}'.format(i))
+    assert len(registry.Cache) == 2
+    assert ('test', 'a0', 0, None) not in registry.Cache
+
+
+def test_experimentmanager_uses_registry(confighandler):
+    em = ExperimentManager(confighandler=confighandler, autoinit=False, experimentsources=())
+    indices = em.getExperimentsIndices(dict(RS101=None, RS103=None))
+    assert indices == [101, 103]
+    assert em.RegexRegistry is get_regex_registry(confighandler)
+    assert ('expid_regex', confighandler.get('expid_regex'), 0, None) in em.RegexRegistry.Cache
+    confighandler.setkey('local_exp_folder_regexs', dict(experiment=r'(?P<expid>RS[0-9]{3})[_ ]+(?P<exp_titledesc>.+)',
+                                                         subentry=r'(?P<expid>RS[0-9]{3})-?(?P<subentry_idx>[^_ ])[_ ]+(?P<subentry_titledesc>.+)'))
+    regexs = em.Regexs
+    assert sorted(regexs) == ['experiment', 'subentry']
+    assert em.Regexs['experiment'] is regexs['experiment']
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the cache of rendered page html.
+"""
+
+import os
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.page import WikiPage
+from model.pagecache import PageCache
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.rendercache import RenderCache, get_render_cache
+
+
+def test_lru_eviction_on_disk(tmpdir):
+    path = str(tmpdir.join('rendercache'))
+    rendercache = RenderCache(path, maxbytes=350)
+    rendercache.put('1', '3', u"<p>Page 1 – version 3</p>" + "x"*80)
+    rendercache.put('2', 1, "<p>Page 2</p>" + "x"*80)
+    rendercache.put('1', 3, "<p>Page 1, other content</p>" + "x"*80, options="<p>Other content</p>")
+    assert len(os.listdir(path)) == 3
+    assert rendercache.get('1', 3).startswith(u"<p>Page 1 – version 3</p>")
+    assert rendercache.get('1', 4) is None
+    assert rendercache.get('1', 3, options="<p>Other content</p>").startswith("<p>Page 1, other")
+    # Page 2 is least recently used and is evicted:
+    rendercache.put('3', 1, "<p>Page 3</p>" + "x"*80)
+    assert rendercache.get('2', 1) is None
+    assert rendercache.Stats['evicted'] == 1 and rendercache.Size <= 350
+    assert len(os.listdir(path)) == 3
+    # Entries survive restarts, in least recently used order:
+    rendercache = RenderCache(path, maxbytes=350)
+    assert len(rendercache) == 3
+    assert rendercache.get('3', 1) == "<p>Page 3</p>" + "x"*80
+    # Structs without a version are not cached:
+    rendercache.put('4', None, "<p>Page 4</p>")
+    assert len(rendercache) == 3
+
+
+def test_page_cache_invalidates_older_versions():
+    pagecache = PageCache()
+    rendercache = RenderCache()
+    pagecache.addVersionCallback(rendercache.invalidate)
+    rendercache.put('1', 2, "<p>v2</p>")
+    rendercache.put('1', 3, "<p>v3</p>")
+    rendercache.put('2', 1, "<p>Page 2</p>")
+    pagecache.put(dict(id='1', version='3', content="<p>v3</p>"))
+    assert rendercache.get('1', 2) is None
+    assert rendercache.get('1', 3) == "<p>v3</p>"
+    assert rendercache.get('2', 1) == "<p>Page 2</p>"
+    assert rendercache.Stats['invalidated'] == 1
+
+
+def test_wikipage_rendered_html_is_cached(fakexmlrpcserver, tmpdir):
+    ch = FakeConfighandler()
+    ch.setkey('wiki_render_cache_dir', str(tmpdir.join('rendercache')))
+    client = make_client(fakexmlrpcserver, ch)
+    page = WikiPage('524313', server=client, confighandler=ch)
+    html = page.getRenderedHTML()
+    assert page.Content in html
+    assert page.getRenderedHTML() == html
+    assert fakexmlrpcserver.Callcounts['confluence2.renderContent'] == 1
+    assert page.getRenderedHTML(content="<p>Preview</p>") == '<div class="wiki-content"><p>Preview</p></div>'
+    assert fakexmlrpcserver.Callcounts['confluence2.renderContent'] == 2
+    # Updating the page stores the new version in the page cache, invalidating the old rendered html:
+    rendercache = get_render_cache(ch)
+    assert len(rendercache) == 2
+    page.updatePage(content=page.Content + "<p>New journal entry</p>")
+    assert len(rendercache) == 0
+    assert "New journal entry" in page.getRenderedHTML()
+    assert fakexmlrpcserver.Callcounts['confluence2.renderContent'] == 3
+    # Content rendered as a new page in a space (all four API arguments are passed):
+    assert client.renderContent(spaceKey='~fakeuser', content="<p>New</p>") == '<div class="wiki-content"><p>New</p></div>'
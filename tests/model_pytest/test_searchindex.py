@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621,W0212
+
+import pytest
+from datetime import datetime
+from collections import OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+#### SUT ####
+from model.searchindex import ExperimentSearchIndex, tokenize, normalize_date
+
+from model.mixin.simplecallbacksystem import SimpleCallbackSystem
+from model.experiment import Experiment
+
+
+class FakeExperiment(SimpleCallbackSystem):
+    def __init__(self, expid, titledesc, subentries=None, date=None):
+        SimpleCallbackSystem.__init__(self)
+        self.Props = dict(expid=expid, exp_titledesc=titledesc, date=date,
+                          exp_subentries=OrderedDict(subentries or ()))
+        self.Foldername = "{} {}".format(expid, titledesc)
+        self._last_attachmentslist = None
+        self._cache = dict()
+        self.AttachmentsOnServer = list()
+    # The real property, which invokes the 'Attachments' callbacks when a new list is fetched:
+    Attachments = Experiment.__dict__['Attachments']
+    def listAttachments(self):
+        return list(self.AttachmentsOnServer)
+    @property
+    def Expid(self):
+        return self.Props['expid']
+
+
+class FakeManager(SimpleCallbackSystem):
+    def __init__(self, experiments):
+        SimpleCallbackSystem.__init__(self)
+        self._experimentsbyid = OrderedDict((exp.Expid, exp) for exp in experiments)
+
+
+@pytest.fixture
+def manager():
+    exps = [FakeExperiment("RS101", "Origami folding test", date="20140105",
+                           subentries=[('a', dict(subentry_titledesc="Agarose gel", date=datetime(2014, 1, 6)))]),
+            FakeExperiment("RS102", "Streptavidin binding", date="20140210",
+                           subentries=[('a', dict(subentry_titledesc="Gel purification", date="20140211"))]),
+            FakeExperiment("RS201", "Origami AFM imaging", date="2014-03-15")]
+    return FakeManager(exps)
+
+@pytest.fixture
+def index(manager):
+    return ExperimentSearchIndex(manager)
+
+
+
+def test_tokenize():
+    assert tokenize(u"RS123a Origami-folding, test") == [u"rs123a", u"origami", u"folding", u"test"]
+    assert tokenize(None) == []
+    assert normalize_date(datetime(2014, 1, 6)) == "20140106"
+    assert normalize_date("2014-03-15") == u"20140315"
+
+def test_search(index):
+    assert len(index) == 3
+    assert index.searchExpids("origami") == ["RS101", "RS201"]
+    assert index.searchExpids("rs101") == ["RS101"]
+    # Prefix:
+    assert set(index.searchExpids("rs1")) == set(["RS101", "RS102"])
+    assert index.searchExpids("strept") == ["RS102"]
+    # All words must match:
+    assert index.searchExpids("origami afm") == ["RS201"]
+    # Subentries and dates:
+    assert index.searchExpids("agarose") == ["RS101"]
+    assert index.searchExpids("201402") == ["RS102"]
+    assert index.searchExpids("20140106") == ["RS101"]
+    # Fuzzy:
+    assert index.searchExpids("origani") == index.searchExpids("origami")
+    assert index.searchExpids("origani", fuzzy=False) == []
+    assert index.searchExpids("") == []
+    assert index.searchExpids("xyzzy") == []
+
+def test_ranking(index):
+    # Exact matches rank above prefix matches:
+    index.indexRecord("RS999", dict(expid=["RS999"], title=["Gelatin"]))
+    assert index.searchExpids("gel") == ["RS101", "RS102", "RS999"]
+    assert index.searchExpids("gela") == ["RS999"]
+
+def test_incremental_update(manager, index):
+    exp = manager._experimentsbyid["RS102"]
+    exp.Props['exp_titledesc'] = "Biotin binding"
+    exp.Foldername = "RS102 Biotin binding"
+    assert index.searchExpids("biotin") == []
+    # Experiments notify their callbacks when changed:
+    exp.invokePropertyCallbacks('Props', exp.Props)
+    assert index.searchExpids("biotin") == ["RS102"]
+    assert index.searchExpids("streptavidin") == []
+    assert "streptavidin" not in index._vocabulary
+    # New and removed experiments:
+    manager._experimentsbyid["RS300"] = FakeExperiment("RS300", "Biotin again")
+    del manager._experimentsbyid["RS101"]
+    manager.invokePropertyCallbacks('ExperimentsById', manager._experimentsbyid)
+    assert set(index.searchExpids("biotin")) == set(["RS102", "RS300"])
+    assert index.searchExpids("agarose") == []
+    assert "RS101" not in index
+    # Unchanged experiments are not re-indexed:
+    assert index.update(manager._experimentsbyid) == 0
+
+def test_attachments(manager, index):
+    exp = manager._experimentsbyid["RS201"]
+    exp.AttachmentsOnServer = [dict(fileName="afm_scan_001.png")]
+    assert exp.Attachments == exp.AttachmentsOnServer
+    assert index.searchExpids("afm_scan_001") == ["RS201"]
+    # A re-fetched list replaces the previously indexed attachments:
+    exp.AttachmentsOnServer = [dict(fileName="tem_grid_002.tif")]
+    del exp.Attachments
+    assert exp.Attachments == exp.AttachmentsOnServer
+    assert index.searchExpids("tem_grid_002") == ["RS201"]
+    assert index.searchExpids("afm_scan_001") == []
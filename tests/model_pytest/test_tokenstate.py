@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the login token state cache and background login.
+"""
+
+import time
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from model.outboundqueue import is_offline
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+from model.model_testdoubles.fake_xmlrpcserver import start_server
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.tokenstate import TokenStateCache, MAX_TOKENS
+
+TOKEN = 'very_random_token'     # The token returned by the fake confluence2 API.
+
+
+def test_token_state_cache():
+    ch = FakeConfighandler()
+    tokenstates = TokenStateCache(ch, 'wiki_logintoken_confirmed', ttl=0.1)
+    assert not tokenstates.isTrusted(TOKEN) and tokenstates.lastConfirmed(TOKEN) is None
+    tokenstates.confirm(TOKEN)
+    assert tokenstates.isTrusted(TOKEN)
+    # Confirmations are persisted in the config, without the token itself:
+    persisted = ch.get('wiki_logintoken_confirmed')
+    assert len(persisted) == 1 and TOKEN not in str(persisted)
+    assert TokenStateCache(ch, 'wiki_logintoken_confirmed', ttl=0.1).isTrusted(TOKEN)
+    time.sleep(0.11)
+    assert not tokenstates.isTrusted(TOKEN)
+    tokenstates.confirm(TOKEN)
+    tokenstates.reject(TOKEN)
+    assert not tokenstates.isTrusted(TOKEN)
+    assert not TokenStateCache(ch, 'wiki_logintoken_confirmed').isTrusted(TOKEN)
+    # Only the most recently confirmed tokens are remembered:
+    for i in range(MAX_TOKENS + 2):
+        tokenstates.confirm('token%s' % i)
+    assert len(tokenstates.Confirmed) == MAX_TOKENS
+    assert not tokenstates.isTrusted('token0') and tokenstates.isTrusted('token%s' % (MAX_TOKENS + 1))
+
+
+def test_background_login_with_trusted_token(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    statuschanges = []
+    client = make_client(fakexmlrpcserver, ch, login=False, logintoken=TOKEN)
+    client.TokenStates.confirm(TOKEN)
+    ch.registerEntryChangeCallback('wiki_server_status', lambda: statuschanges.append(client.LoginPending))
+    fakexmlrpcserver.Latency = 0.2
+    # The stored token is not validated before autologinAsync returns:
+    t0 = time.time()
+    loginthread = client.autologinAsync()
+    assert time.time() - t0 < 0.1
+    assert client.LoginPending and is_offline(client)
+    assert statuschanges == [True]
+    # Reads use the trusted token right away; writes would be queued while in read-only mode:
+    assert client.getPage('524313')['id'] == '524313'
+    loginthread.join()
+    assert not client.LoginPending and not is_offline(client)
+    assert client._connectionok and not client.LoginPromptRequired
+    assert statuschanges[-1] is False
+
+
+def test_background_login_without_notification(fakexmlrpcserver):
+    ch = FakeConfighandler()
+    statuschanges = []
+    client = make_client(fakexmlrpcserver, ch, login=False, logintoken=TOKEN)
+    ch.registerEntryChangeCallback('wiki_server_status', lambda: statuschanges.append(client.LoginPending))
+    client.autologinAsync(notify=False).join()
+    # The end of the read-only mode is not notified from the login thread:
+    assert statuschanges and False not in statuschanges
+    assert not client.LoginPending and client._connectionok
+
+
+def test_background_login_requires_prompt(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver, login=False)
+    fakexmlrpcserver.Latency = 0.1
+    client.autologinAsync()
+    # Requests without a token wait for the background login instead of starting their own:
+    assert client.getPage('524313') is None
+    assert client.waitForLogin() and client.LoginPromptRequired
+
+
+def test_unreachable_server_keeps_trusted_token():
+    server = start_server()
+    ch = FakeConfighandler()
+    client = make_client(server, ch, login=False, logintoken=TOKEN)
+    assert client.test_token(TOKEN) and client.TokenStates.isTrusted(TOKEN)
+    server.stop()
+    client.autologinAsync().join()
+    # A network glitch does not make the token invalid, and does not require a login prompt:
+    assert client.Logintoken == TOKEN and client.TokenStates.isTrusted(TOKEN)
+    assert client._connectionok is False and not client.LoginPromptRequired
+    # An untrusted token is not kept:
+    client.TokenStates.reject(TOKEN)
+    client.Logintoken = None
+    client.autologin(prompt='never')
+    assert client.Logintoken is None
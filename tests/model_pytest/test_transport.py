@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the gzip compressed XML-RPC transport.
+"""
+
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+from tests.model_pytest.conftest import make_client
+
+#### SUT ####
+from model.server.transport import GzipTransport, SafeGzipTransport, make_transport
+
+
+def store_large_page(client):
+    page = client.getPage('524313')
+    page['content'] += "<p>Journal entry: Added 10 ul of buffer to the reaction tube.</p>" * 2000
+    return client.storePage(page)
+
+
+def test_make_transport():
+    assert isinstance(make_transport("http://localhost:8090/rpc/xmlrpc"), GzipTransport)
+    assert isinstance(make_transport("https://wiki.example.org/rpc/xmlrpc"), SafeGzipTransport)
+
+
+def test_large_payloads_are_compressed(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver, serverparams=dict(gzip_requests=True))
+    stats = client.TransferStats
+    stored = store_large_page(client)
+    assert stats.Counts['gzip_requests'] == 1 and stats.RequestCompression is True
+    page = client.getPage('524313')
+    assert page['content'] == stored['content']
+    assert stats.Counts['gzip_responses'] >= 2
+    assert stats.Counts['response_bytes'] > 5 * stats.Counts['response_bytes_received']
+    assert stats.Counts['request_bytes'] > 5 * stats.Counts['request_bytes_sent']
+    # The counts match the bytes on the wire as seen by the server (which also includes the HTTP headers):
+    assert stats.Counts['request_bytes_sent'] < fakexmlrpcserver.Stats['bytes_received']
+    assert stats.Counts['response_bytes_received'] < fakexmlrpcserver.Stats['bytes_sent']
+    assert fakexmlrpcserver.Stats['bytes_sent'] < stats.Counts['response_bytes'] / 5
+    assert "requests: {}".format(stats.Counts['requests']) in stats.summary()
+
+
+def test_rejected_compressed_requests_are_resent(fakexmlrpcserver):
+    fakexmlrpcserver.AcceptGzipRequests = False
+    client = make_client(fakexmlrpcserver, serverparams=dict(gzip_requests=True))
+    stored = store_large_page(client)
+    assert fakexmlrpcserver.Stats['rejected_gzip_requests'] == 1
+    assert client.TransferStats.RequestCompression is False
+    assert client.getPage('524313')['content'] == stored['content']
+    # Later requests are not compressed:
+    store_large_page(client)
+    assert fakexmlrpcserver.Stats['rejected_gzip_requests'] == 1
+    assert client.TransferStats.Counts['gzip_requests'] == 1
+
+
+def test_request_compression_is_opt_in(fakexmlrpcserver):
+    client = make_client(fakexmlrpcserver)
+    store_large_page(client)
+    assert client.TransferStats.RequestCompression is None
+    assert client.TransferStats.Counts['gzip_requests'] == 0
+    assert client.TransferStats.Counts['gzip_responses'] > 0
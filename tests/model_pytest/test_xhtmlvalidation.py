@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111
+"""
+Tests for the expat-based xhtml validation.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+#### SUT ####
+from model import xhtmlvalidation
+from model.xhtmlvalidation import find_xhtml_error, validate_xhtml
+
+
+def test_valid_storage_format():
+    xhtml = u"""<h2>Experimental section</h2><p>Caf\xe9&nbsp;&amp; bar</p>
+<ac:link><ri:page ri:content-title="Orders and Purchases how-to" /></ac:link>
+<ac:structured-macro ac:name="code"><ac:plain-text-body><![CDATA[if a < b: pass]]></ac:plain-text-body></ac:structured-macro>
+"""
+    assert find_xhtml_error(xhtml) is None
+    assert validate_xhtml(xhtml.encode('utf-8'))
+    assert validate_xhtml(u"")
+    assert validate_xhtml(u"just text")
+
+
+def test_error_location():
+    error = find_xhtml_error(u"<p>first</p>\n<p>\xe6\xf8\xe5 & more</p>")
+    # expat reports the invalid token after the bare &:
+    assert (error.line, error.column, error.offset) == (2, 8, 21)
+    assert "not well-formed" in error.message
+
+
+def test_unclosed_tag():
+    error = find_xhtml_error(u"<p>first</p>\n  <h4>RS123a <b>bold</h4>")
+    assert "<b> opened at line 2, column 13" in error.message
+    assert (error.line, error.column) == (2, 22)
+    error = find_xhtml_error(u"<p>unclosed")
+    assert "<p> opened at line 1, column 0" in error.message
+    assert error.offset == len(u"<p>unclosed")
+
+
+def test_cache():
+    xhtmlvalidation.clear_cache()
+    xhtml = u"<p>cached</p>"
+    assert validate_xhtml(xhtml)
+    assert len(xhtmlvalidation._cache) == 1
+    assert validate_xhtml(xhtml)
+    assert len(xhtmlvalidation._cache) == 1
+    for i in range(xhtmlvalidation.CACHE_SIZE + 5):
+        validate_xhtml(u"<p>{}</p>".format(i))
+    assert len(xhtmlvalidation._cache) == xhtmlvalidation.CACHE_SIZE
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+"""
+Tests for the dispatcher running callbacks from worker threads in the Tk main loop.
+"""
+
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from model.model_testdoubles.fake_confighandler import FakeConfighandler
+
+#### SUT ####
+from tkui.views.shared_ui_utils import MainLoopDispatcher, get_mainloop_dispatcher
+
+
+class FakeRoot(object):
+    """ Records after() calls instead of running a Tk main loop (no display is needed). """
+    def __init__(self):
+        self.Scheduled = list()
+    def _root(self):
+        return self
+    def after(self, ms, func):
+        self.Scheduled.append(func)
+    def runPending(self):
+        scheduled, self.Scheduled = self.Scheduled, list()
+        for func in scheduled:
+            func()
+
+
+def test_callbacks_from_worker_threads_run_in_mainloop():
+    root = FakeRoot()
+    dispatcher = get_mainloop_dispatcher(root)
+    assert isinstance(dispatcher, MainLoopDispatcher) and get_mainloop_dispatcher(root) is dispatcher
+    calls = []
+    def outboundQueueChange(depth=None):
+        calls.append((threading.current_thread(), depth))
+    ch = FakeConfighandler()
+    ch.registerEntryChangeCallback('wiki_outbound_queue_depth', dispatcher.wrap(outboundQueueChange),
+                                   pass_newvalue_as='depth')
+    # Called directly in the main thread:
+    ch.invokeEntryChangeCallback('wiki_outbound_queue_depth', 2)
+    assert calls == [(threading.current_thread(), 2)]
+    # Deferred to the next poll from another thread:
+    worker = threading.Thread(target=ch.invokeEntryChangeCallback, args=('wiki_outbound_queue_depth', 1))
+    worker.start()
+    worker.join()
+    assert len(calls) == 1
+    root.runPending()
+    assert calls[1] == (threading.current_thread(), 1)
+    # Polling continues:
+    assert len(root.Scheduled) == 1
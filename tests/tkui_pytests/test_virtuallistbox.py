@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621,W0212
+
+
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+##############################
+#######    SUT     ###########
+##############################
+
+from tkui.views.virtuallistbox import ListModel, VirtualListbox
+
+try:
+    import tkinter as tk
+except ImportError:
+    import Tkinter as tk
+
+
+class FakeExp(object):
+    def __init__(self, expid):
+        self.Expid = expid
+        self.reprcount = 0
+    def __repr__(self):
+        self.reprcount += 1
+        return "Exp {}".format(self.Expid)
+
+
+@pytest.fixture
+def model():
+    exps = [FakeExp("RS{:03}".format(i)) for i in range(100)]
+    return ListModel([(None, exp.Expid, exp) for exp in exps])
+
+@pytest.fixture
+def tkroot():
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        logger.warning("Tk could not initialize, probably because there is no display available: %s", e)
+        return
+    return root
+
+
+
+def test_lazy_display(model):
+    assert len(model) == 100
+    # No display strings are generated until requested:
+    assert all(item[2].reprcount == 0 for item in model.Items)
+    assert model.getDisplays(10, 15) == ["Exp RS{:03}".format(i) for i in range(10, 15)]
+    assert model.getDisplay(10) == "Exp RS010"
+    assert model.Items[10][2].reprcount == 1    # cached
+    assert sum(item[2].reprcount for item in model.Items) == 5
+    assert len(model.getDisplays(95, 200)) == 5
+
+def test_explicit_display():
+    model = ListModel([("a", 1, None), ("b", 2, None)])
+    assert model.getDisplays(0, 2) == ["a", "b"]
+
+def test_setItems_diff(model):
+    items = list(model.Items)
+    # identical list -> no changes:
+    assert model.setItems(items) == []
+    # Remove one and add one:
+    newitems = items[:50] + items[51:] + [(None, "RS999", FakeExp("RS999"))]
+    opcodes = model.setItems(newitems)
+    assert [op[0] for op in opcodes] == ['delete', 'insert']
+    assert opcodes[0][1:3] == (50, 51)
+    assert len(model) == 100
+    assert model.indexOf("RS999") == 99
+    assert model.indexOf("RS050") is None
+
+def test_selection_survives_reorder(model):
+    model.Selected.update(["RS005", "RS010"])
+    assert model.getSelectedIndices() == [5, 10]
+    model.setItems(list(reversed(model.Items)))
+    assert model.getSelectedIndices() == [89, 94]
+    assert [item[1] for item in model.getSelectedItems()] == ["RS010", "RS005"]
+    # Items removed from the list are de-selected:
+    model.setItems([item for item in model.Items if item[1] != "RS005"])
+    assert model.Selected == set(["RS010"])
+
+
+def test_VirtualListbox(model, tkroot):
+    if tkroot is None:
+        logger.info("tkroot is None, aborting...")
+        return
+    lb = VirtualListbox(tkroot, height=10)
+    lb.setItems(model.Items)
+    assert lb.size() == 100
+    assert tk.Listbox.size(lb) == 10     # only the visible rows are rendered.
+    lb.see(50)
+    assert tk.Listbox.get(lb, tk.END) == "Exp RS050"
+    lb.selection_set(50)
+    assert lb.curselection() == (50, )
+    lb.yview(tk.MOVETO, 0)
+    assert lb.curselection() == (50, )
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0111,W0621
+
+
+import re
+import pytest
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+##############################
+#######    SUT     ###########
+##############################
+
+from tkui.views.xhtmlrenderer import split_sections, render_fragment, FragmentCache, IncrementalXhtmlRenderer
+
+
+class FakeText(object):
+    """
+    Minimal text widget double, supporting "1.0 + N chars" indices.
+    Tags are not tracked per character, only recorded.
+    """
+    def __init__(self):
+        self.content = u""
+        self.tags = list()
+    def __getitem__(self, key):
+        return 80
+    def _offset(self, index):
+        if index == "end":
+            return len(self.content)
+        return int(re.match(r"1\.0 \+ (\d+) chars", index).group(1)) if index != "1.0" else 0
+    def insert(self, index, chars, *tags):
+        offset = self._offset(index)
+        self.content = self.content[:offset] + chars + self.content[offset:]
+    def delete(self, start, end):
+        start, end = self._offset(start), self._offset(end)
+        self.content = self.content[:start] + self.content[end:]
+    def tag_add(self, tag, start, end):
+        self.tags.append((tag, self._offset(start), self._offset(end)))
+    def tag_config(self, tag, **kwargs):
+        pass
+
+
+def make_page(n, changed=None):
+    sections = ["<h2>RS001{} Subentry</h2><p>Entry {} text, some <b>bold</b> words.</p>".format(chr(97+i), i)
+                for i in range(n)]
+    if changed is not None:
+        sections[changed] = sections[changed].replace("text", "modified text")
+    return "<p>Page header</p>" + "".join(sections)
+
+
+def test_split_sections():
+    xhtml = make_page(3)
+    sections = split_sections(xhtml)
+    assert len(sections) == 4
+    assert "".join(sections) == xhtml
+    assert sections[1].startswith("<h2>")
+    assert split_sections("") == []
+    assert split_sections("<h1>a</h1>") == ["<h1>a</h1>"]
+
+def test_render_fragment():
+    fragment = render_fragment("<h2>Header</h2><p>Some <b>bold</b> text</p>")
+    assert "Header" in fragment.Text
+    assert "bold" in fragment.Text
+    tags = dict((tag, fragment.Text[start:end]) for tag, start, end in fragment.Tagranges)
+    assert tags.get('bold').strip() == "bold"
+
+def test_incremental_render():
+    cache = FragmentCache()
+    text = FakeText()
+    renderer = IncrementalXhtmlRenderer(text, cache=cache)
+    assert renderer.render(make_page(10)) == 11
+    full = text.content
+    assert cache.Misses == 11
+    # Re-rendering the same page does nothing:
+    assert renderer.render(make_page(10)) == 0
+    assert text.content == full
+    # Changing a single section only re-renders that section:
+    assert renderer.render(make_page(10, changed=4)) == 1
+    assert "Entry 4 modified text" in text.content
+    assert text.content == full.replace("Entry 4 text", "Entry 4 modified text")
+    # Adding a section:
+    assert renderer.render(make_page(11, changed=4)) == 1
+    # A new renderer (e.g. another view) re-uses the cached fragments:
+    misses = cache.Misses
+    text2 = FakeText()
+    IncrementalXhtmlRenderer(text2, cache=cache).render(make_page(11, changed=4))
+    assert cache.Misses == misses
+    assert text2.content == text.content
+
+def test_cache_lru():
+    cache = FragmentCache(maxsize=2)
+    for section in ("<p>a</p>", "<p>b</p>", "<p>c</p>"):
+        cache.get(section, section)
+    assert len(cache) == 2
+    cache.get("<p>a</p>", "<p>a</p>")
+    assert cache.Misses == 4
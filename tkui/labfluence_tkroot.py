@@ -72,7 +72,7 @@ class LabfluenceTkRoot(tk.Tk):
             try:
                 self.geometry(persisted_windowgeometry)
             except tk.TclError as e:
-                print e
+                print(e)
         #self.update_widgets()
 
     ### Getters and setters (old-school tk widgets does not support new-object properties)
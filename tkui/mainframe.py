@@ -40,10 +40,12 @@ from model.confighandler import ExpConfigHandler
 from model.experimentmanager import ExperimentManager
 from model.experiment import Experiment
 from model.server import ConfluenceXmlRpcServer
+from model.outboundqueue import get_outbound_queue
 
 from views.expnotebook import ExpNotebook, BackgroundFrame
 from views.experimentselectorframe import ExperimentSelectorWindow
 from views.dialogs import Dialog
+from views.shared_ui_utils import get_mainloop_dispatcher
 
 from views.expmanagerlistboxes import ActiveExpsListbox, RecentExpsListbox #LocalExpsListbox, WikiExpsListbox
 # Edit: Using the self-controlling ActiveExpsListbox and RecentExpListbox listboxes instead of having
@@ -179,7 +181,13 @@ class LabfluenceMainFrame(ttk.Frame):
 
     def init_bindings(self):
         #self.tkroot.protocol("WM_DELETE_WINDOW", self.exitApp)
-        self.Confighandler.registerEntryChangeCallback("wiki_server_status", self.serverStatusChange)
+        # The server status changes when the circuit breaker's probe (a timer thread) succeeds or fails,
+        # and the outbound queue is replayed in a worker thread; the widgets are updated from the Tk main loop:
+        dispatcher = get_mainloop_dispatcher(self)
+        self.Confighandler.registerEntryChangeCallback("wiki_server_status", dispatcher.wrap(self.serverStatusChange))
+        self.Confighandler.registerEntryChangeCallback("wiki_outbound_queue_depth",
+                                                       dispatcher.wrap(self.outboundQueueChange),
+                                                       pass_newvalue_as="depth")
         # Edit, these bindings are currently handled by the relevant controllers.
         # And if you use the controller-independent versions, they will register those
         # callbacks themselves...
@@ -206,6 +214,10 @@ class LabfluenceMainFrame(ttk.Frame):
             # (in which case serverStatusChange is not called as a confighandler ConfigEntryChange callback)
             self.serverStatusChange()
             return
+        breaker = getattr(server, 'Breaker', None)
+        if breaker is not None and breaker.IsOpen:
+            # The user asked to check the server; make a request even though it appears to be down.
+            breaker.retry()
         serverinfo = server.getServerInfo()
         logger.debug("Server status, serverinfo: %s", serverinfo)
         # Calling any server command will check whether the server's connection status change.
@@ -223,23 +235,52 @@ class LabfluenceMainFrame(ttk.Frame):
         """
         server = self.Confighandler.Singletons.get('server')
         if server is None:
-            self.serverstatus_btn.configure(background="red", text="(offline)")
+            self.serverstatus_btn.configure(background="red", text=self.serverStatusText(False))
             logger.debug( "No server available, server is: %s", server)
             return
         logger.debug( "SERVER: %s, _connectionok: %s", server, server._connectionok )
+        if getattr(server, 'LoginPending', False):
+            # Background login in progress (see labfluence.py); changes are queued until it completes.
+            self.serverstatus_btn.configure(background="yellow", text=self.serverStatusText(False, readonly=True))
+            logger.debug("Server login pending, read-only mode.")
+            return
         if server._connectionok is None:
             logger.debug("Server._connectionok is None, perhaps the server has not had a chance to connect yet... ")
             server.autologin()
         if server:
-            self.serverstatus_btn.configure(background="green", text="Online")
+            self.serverstatus_btn.configure(background="green", text=self.serverStatusText(True))
             logger.debug( "Server reported to be online :-)" )
             logger.debug( "self.Parent.ExpNotebooks: %s", self.Parent.ExpNotebooks )
             for expid,notebook in self.Parent.ExpNotebooks.items():
                 notebook.update_info()
         else:
-            self.serverstatus_btn.configure(background="red", text="(offline)")
+            self.serverstatus_btn.configure(background="red", text=self.serverStatusText(False))
             logger.debug( "Server reported to be offline, server._connectionok: %s", server._connectionok)
 
+    def serverStatusText(self, online, depth=None, readonly=False):
+        """
+        Returns the text for the server status button, including the number of
+        operations waiting in the outbound queue (if any).
+        """
+        if depth is None:
+            depth = get_outbound_queue(self.Confighandler).Depth
+        text = "(read-only, logging in)" if readonly else "Online" if online else "(offline)"
+        if depth:
+            text += " ({} queued)".format(depth)
+        return text
+
+    def outboundQueueChange(self, depth=None):
+        """
+        Invoked when the number of operations in the outbound queue changes
+        (registered as confighandler callback for 'wiki_outbound_queue_depth').
+        Only the server status button text is updated (keeping the read-only text during background login).
+        The depth changes while the queue is replayed in a worker thread, so the callback is
+        registered through the main loop dispatcher (see shared_ui_utils.MainLoopDispatcher).
+        """
+        server = self.Confighandler.Singletons.get('server')
+        readonly = getattr(server, 'LoginPending', False)
+        self.serverstatus_btn.configure(text=self.serverStatusText(bool(server), depth, readonly=readonly))
+
 
     def createNewExperiment(self, event=None):
         self.Parent.createNewExperiment()
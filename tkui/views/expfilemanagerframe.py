@@ -364,15 +364,8 @@ class FilelistFrame(ExpFrame):
         return "Local files:"
 
     def updatelist(self, filterdict=None):
-        self.listbox.updatelist()
-        if filterdict is None:
-            filterdict = dict()
-        lst = self.getlist(filterdict)
-        self.Filetuples = lst
-        self.Fileslist = zip(*lst)
-        self.listbox.delete(0, tk.END)
-        if lst:
-            self.listbox.insert(tk.END, *self.Fileslist[0])
+        # The listbox's model holds the file tuples; only changed, visible rows are re-rendered.
+        self.listbox.updatelist(filterdict)
 
     def getlist(self, filterdict):
         # override this method; must return a list of two-tuple items.
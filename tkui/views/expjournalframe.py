@@ -35,7 +35,7 @@ logger = logging.getLogger(__name__)
 
 #from subentrieslistbox import SubentriesListbox
 from explistboxes import SubentriesListbox #, FilelistListbox, LocalFilelistListbox, WikiFilelistListbox
-from shared_ui_utils import ExperimentLink, ExpFrame
+from shared_ui_utils import ExperimentLink, ExpFrame, get_mainloop_dispatcher
 from dialogs import Dialog
 from journalviewerframe import JournalViewer
 
@@ -204,7 +204,9 @@ class ExpJournalFrame(ExpFrame):
         self.journalentry_input.bind('<Return>', self.add_entry)
         #self.autoflushinterval_spinbox.bind('<Return>', self.autoflush_changed)
         self.autoflushinterval_spinbox.bind('<<Modified>>', self.autoflush_changed)
-        self.getConfighandler().registerEntryChangeCallback('wiki_server_status', self.on_serverstatus_change)
+        # May be invoked from a worker thread (e.g. the server's circuit breaker probe):
+        self.getConfighandler().registerEntryChangeCallback('wiki_server_status',
+                                                            get_mainloop_dispatcher(self).wrap(self.on_serverstatus_change))
 
     def updatewidgets(self):
         """
@@ -25,6 +25,8 @@ except ImportError:
 import logging
 logger = logging.getLogger(__name__)
 
+from virtuallistbox import VirtualListbox
+
 """
 Some general-purpose listboxes that all requires some interaction with and experiment object.
 (Yes, I refuse the C in MVC)
@@ -40,6 +42,9 @@ Some general-purpose listboxes that all requires some interaction with and exper
   |- ActiveExpsListbox:
   |- RecentExpsListbox:
 
+All listboxes are VirtualListbox instances, rendering only the visible rows.
+Use updatelist() (or setItems()) rather than insert/delete.
+
 Notice: The logic for ActiveExpsListbox and RecentExpsListbox have also been implemented using controllers.
         See controllers/listboxcontrollers.py
 
@@ -48,7 +53,7 @@ Notice: The logic for ActiveExpsListbox and RecentExpsListbox have also been imp
 
 
 
-class ExpListbox(tk.Listbox):
+class ExpListbox(VirtualListbox):
     """
     Base frame for most list widgets that has a direct control over an experiment.
     **kwargs are passed as keyword arguments to ttk.Frame super class.
@@ -67,7 +72,7 @@ class ExpListbox(tk.Listbox):
     def __init__(self, parent, experiment, **kwargs):
         #ttk.Frame.__init__(self, parent, borderwidth=10)#, relief='flat')
         self.before_init(kwargs)
-        tk.Listbox.__init__(self, parent, **kwargs)
+        VirtualListbox.__init__(self, parent, **kwargs)
         self.Experiment = experiment
         self.init_variables()
         self.init_widgets()
@@ -100,22 +105,24 @@ class FilelistListbox(ExpListbox):
     #    tk.Listbox.__init__(self, parent, **options)
     #    self.Experiment = experiment
 
-    def init_variables(self):
-        self.Filetuples = list()
-        self.Fileslist = list()
-
     # I should make a convention as to what is display and what is reference
     # in tuples used in list, e.g. (<filename-displayed>, <real-file-path>)
     # same goes for (subentry-display-format, subentry_idx)
+    @property
+    def Filetuples(self):
+        """ List of (<display>, <identifier>, <metadata>) file tuples, as returned by getlist. """
+        return self.Model.Items
+
+    @property
+    def Fileslist(self):
+        """ Transposed Filetuples, i.e. [<displays>, <identifiers>, <metadata>]. """
+        return zip(*self.Model.Items)
+
     def updatelist(self, filterdict=None):
         if filterdict is None:
             filterdict = dict()
         lst = self.getlist(filterdict)
-        self.Filetuples = lst
-        self.Fileslist = zip(*lst)
-        self.delete(0, tk.END)
-        if lst:
-            self.insert(tk.END, *self.Fileslist[0])
+        self.setItems(lst)
 
     def getlist(self, filterdict):
         # override this method; must return a list of two-tuple items.
@@ -123,8 +130,8 @@ class FilelistListbox(ExpListbox):
 
     def getSelection(self):
         # Returning the complete file tuple with metadata -- makes it more useful.
-        indices = map(int, self.curselection())
-        return [self.Filetuples[ind] for ind in indices]
+        self.curselection() # Syncs the widget's selection with the model.
+        return self.Model.getSelectedItems()
 
 
 class LocalFilelistListbox(FilelistListbox):
@@ -148,8 +155,16 @@ class SubentriesListbox(ExpListbox):
     Nah, fuck that, I just inherit from tk.Listbox directly.
     """
 
+    @property
+    def Subentrylist(self):
+        """
+        Transposed list of (<display-str>, <subentry_idx>, <subentry-dict>) tuples, i.e.
+        Subentrylist[0] is repr, while [1] is subentry_idx and [2] is the actual subentry dict properties.
+        """
+        return zip(*self.Model.Items)
+
     def init_variables(self):
-        self.Subentrylist = list() # list of (<display-str>, <subentry_idx>, <subentry-dict>)
+        pass
         #self.subentrieslistbox = tk.Listbox(self)
         #self.subentrieslistbox.grid(row=0, column=0, sticky="news")
         #self.rowconfigure(0, weight=1)
@@ -163,27 +178,24 @@ class SubentriesListbox(ExpListbox):
                                 exp_subentry_dir_fmt.format(**self.Experiment.makeFormattingParams(subentry['subentry_idx'])) )
         lst = [ (subentryrepr(subentry), idx,subentry) for idx, subentry in self.Experiment.Subentries.items()]
         #logger.debug("%s.updatelist() :: lst is: %s", self.__class__.__name__, lst)
-        self.Subentrylist = zip(*lst) # self.Subentrylist[0] is repr, while [1] is subentry_idx and [2] is the actual subentry dict properties.
         #self.subentrieslistbox.delete(0,tk.END)
         #self.subentrieslistbox.insert(tk.END, *self.Subentrylist[0])
-        self.delete(0, tk.END)
-        if lst:
-            self.insert(tk.END, *self.Subentrylist[0])
-        else:
+        self.setItems(lst)
+        if not lst:
             logger.info("%s, empty list: %s", self.__class__.__name__, lst)
         #logger.debug("%s, self.get(0, tk.END) is now: %s", self.__class__.__name__, self.get(0, last=tk.END))
 
     def clearlist(self):
         """ Clears the list of all items """
         #self.subentrieslistbox.delete(0,tk.END)
-        self.delete(0, tk.END)
+        self.clearItems()
 
     def getSelectedSubentryIdxs(self):
         """ Returns currently selected subentry indices """
-        curselection = [int(i) for i in self.curselection()]
-        return [self.Subentrylist[1][i] for i in curselection] # Subentrylist[1] is list of subentry_idxs
+        self.curselection() # Syncs the widget's selection with the model.
+        return [item[1] for item in self.Model.getSelectedItems()]
 
     def getSelectedSubentries(self):
         """ Returns currently selected subentries """
-        curselection = [int(i) for i in self.curselection()]
-        return [self.Subentrylist[2][i] for i in curselection] # Subentrylist[1] is list of subentry_idxs
+        self.curselection()
+        return [item[2] for item in self.Model.getSelectedItems()]
@@ -22,6 +22,9 @@
 
 Notice: ActiveExpsListbox and RecentExpsListbox are implemented using controllers!
 
+All listboxes are VirtualListbox instances; only the visible rows are rendered,
+and experiment display strings are generated lazily (see virtuallistbox.py).
+
 """
 
 try:
@@ -34,10 +37,11 @@ except ImportError:
 import logging
 logger = logging.getLogger(__name__)
 
+from virtuallistbox import VirtualListbox, ListModel
 
 
 
-class ExpManagerListBox(tk.Listbox):
+class ExpManagerListBox(VirtualListbox):
     """
     Listbox class for all listboxes that displays list of experiments as managed through
     an ExperimentManager object/singleton.
@@ -49,10 +53,10 @@ class ExpManagerListBox(tk.Listbox):
         self.Reversedsort = reversedsort
         # tk.MULTIPLE or tk.EXTENDED, tk.BROWSE is default tk mode
         kwargs.setdefault('selectmode', 'browse' if isSelectingCurrent else 'extended')
-        tk.Listbox.__init__(self, parent, **kwargs)
+        VirtualListbox.__init__(self, parent, model=ListModel(displayfun=repr), **kwargs)
         #self.ExperimentManager = experimentmanager # Property now...
         self.Confighandler = confighandler
-        self.TupleList = list() ## list of (<display>, <identifier>, <full object>) tuples.
+        self.Filterquery = None # Only show experiments matching this search query.
         self.init_variables()
         self.init_widgets()
         self.init_layout()
@@ -64,6 +68,14 @@ class ExpManagerListBox(tk.Listbox):
         self.init_bindings()
         self.after_init()
 
+    @property
+    def TupleList(self):
+        """
+        The list of (<display>, <identifier>, <full object>) tuples shown by the listbox.
+        <display> may be None for items whose display string has not been generated (yet).
+        """
+        return self.Model.Items
+
     @property
     def ExperimentManager(self, ):
         """
@@ -102,7 +114,7 @@ class ExpManagerListBox(tk.Listbox):
         #expids = [self.TupleList[int(i)][1] for i in self.curselection()]
         expids = self.getSelectedIds()
         logger.debug("(%s) - selected expids: %s", self.__class__.__name__, expids)
-        logger.debug("(%s) - self.TupleList is: %s", self.__class__.__name__, self.TupleList)
+        logger.debug("(%s) - self.TupleList has %s items", self.__class__.__name__, len(self.TupleList))
         logger.debug("(%s) - self.Reversedsort=%s, self.IsSelectingCurrent=%s",
                      self.__class__.__name__, self.Reversedsort, self.IsSelectingCurrent)
         if self.IsSelectingCurrent and expids:
@@ -129,7 +141,8 @@ class ExpManagerListBox(tk.Listbox):
         # self.curselection() returns tuple with selected indices.
         # This makes it easier to get the corresponding identifiers,
         # based on self.getExpByListIndices
-        return [self.TupleList[int(i)][1] for i in self.curselection()]
+        self.curselection() # Syncs the widget's selection with the model.
+        return [item[1] for item in self.Model.getSelectedItems()]
 
     def getExpIds(self, ):
         """ Hook method, invoked automatically during init, override in subclasses. """
@@ -146,50 +159,53 @@ class ExpManagerListBox(tk.Listbox):
         # Reference implementation provided here:
         # expids =  # Which experiments to show?
         expids, experiments = self.ExperimentManager.getExpsById(self.getExpIds()) # Obtain these experiments from experiment manager
-        display = [repr(exp) for exp in experiments] # Make a 'display' string representation
+        # display is None: repr(exp) is invoked by the list model, and only for the rows that are visible.
+        tuplist = [(None, expid, exp) for expid, exp in zip(expids, experiments)]
         if self.Reversedsort:
-            tuplist = list(reversed(zip(display, expids, experiments)))
-        else:
-            tuplist = zip(display, expids, experiments)
-        logger.debug("(%s) - returning tuplelist: %s", self.__class__.__name__, tuplist)
+            tuplist.reverse()
+        logger.debug("(%s) - returning tuplelist with %s items", self.__class__.__name__, len(tuplist))
         return tuplist
 
     def populatelist(self, experiments):
         """ For manual external use. And reference. This is not used internally. """
-        self.insert(tk.END, *experiments)
+        self.setItems(list(self.TupleList) + [(None, getattr(exp, 'Expid', None), exp) for exp in experiments])
 
     def clearlist(self):
         """Removes all items from the list"""
-        self.delete(0, tk.END)
+        self.clearItems()
 
     def updatelist(self, event=None):
         """
-        Updates the list by first clearing it and then
-        calling self.getTupleList()
+        Updates the list with the tuples from self.getTupleList().
+        Only the visible rows that have actually changed are re-rendered,
+        and the selection is kept for experiments that are still in the list.
         """
         tuples = list(self.getTupleList())
-        self.clearlist()
-        if tuples:
-            logger.debug("Updating %s listbox with experiment tuples: %s",
-                         self.__class__.__name__, tuples )
-            # Note: The list will get the string representation from the experiment ( __repr__ method).
-            # This is also what is returned upon querying.
-            self.TupleList = tuples # save (<display>, <identifier>, <full object>) tuple list structure
-            for tup in tuples:
-                logger.debug("(%s) Adding %s with self.insert(%s, %s)", self.__class__.__name__, tup[0], tk.END, tup[0])
-                self.insert(tk.END, tup[0])
-            #self.insert(tk.END, *[tup[0] for tup in tuples])
-        else:
+        if self.Filterquery:
+            matching = set(self.ExperimentManager.searchExperiments(self.Filterquery, limit=None))
+            tuples = [tup for tup in tuples if tup[1] in matching]
+        if not tuples:
             logger.info("getTupleList() returned a boolean false result: %s", tuples)
+        opcodes = self.setItems(tuples) # save (<display>, <identifier>, <full object>) tuple list structure
+        logger.debug("Updated %s listbox with %s experiment tuples (%s changed ranges)",
+                     self.__class__.__name__, len(tuples), len(opcodes))
 
 
+    def setFilter(self, query=None):
+        """
+        Only show experiments matching search <query> (searching expid, titles, subentries, dates, etc).
+        Use None or an empty string to show all experiments.
+        """
+        self.Filterquery = query
+        self.updatelist()
+
     def addSelectionToActiveExpsList(self, ):
         """
         Adds the current selection to the manager's active experiments list.
         """
         curselection = self.curselection() # Returns tuple of selected indices., e.g. (1, )
         #selected_items = lst.get(tk.ACTIVE) # Returns the string values of the list entries
-        expid = self.TupleList[int(curselection[0])][1]
+        expid = self.TupleList[curselection[0]][1]
         logger.info("curselection=%s, expid=%s", curselection, expid)
         self.ExperimentManager.addActiveExperiments( (expid, )) # This takes care of invoking callbacks.
 
@@ -271,18 +287,12 @@ class LocalExpsListbox(ExpManagerListBox):
         1) Simply use ExperimentManager.ExperimentsById cached object list
         2) Call ExperimentManager.genLocalExperiments(ret='expid') to get an updated list.
         """
-        logger.debug("self.ExperimentManager.ExperimentsById: %s", self.ExperimentManager.ExperimentsById)
-        expids, experiments = zip(*self.ExperimentManager.ExperimentsById.items())
-        display = (getattr(exp, 'Foldername', "") for exp in experiments)
-        displaytuples = zip(display, expids, experiments)
+        experimentsbyid = self.ExperimentManager.ExperimentsById
+        logger.debug("self.ExperimentManager.ExperimentsById has %s experiments", len(experimentsbyid))
+        displaytuples = [(getattr(exp, 'Foldername', ""), expid, exp) for expid, exp in experimentsbyid.items()]
         if self.Reversedsort:
-            # Returning an iterator does not work for tkinter... :<
-            ret = reversed(displaytuples)
-            logger.debug("Returning display tuples (reversed): %s", ret)
-            return ret
-        else:
-            logger.debug("Returning display tuples: %s", displaytuples)
-            return displaytuples
+            displaytuples.reverse()
+        return displaytuples
 
     def on_doubleclick(self, event):
         # NB: This is bound during __init__, not in init_bindings.
@@ -303,11 +313,7 @@ class WikiExpsListbox(ExpManagerListBox):
         In this case, it is more efficient to re-implement the getTupleList:
         """
         displaytuples = list(self.ExperimentManager.getCurrentWikiExperiments(ret='display-tuple'))
-        logger.info("%s displaytuples: %s", self.__class__.__name__, displaytuples )
+        logger.info("%s: %s displaytuples", self.__class__.__name__, len(displaytuples))
         if self.Reversedsort:
-            ret = reversed(displaytuples)
-            logger.debug("Returning display tuples (reversed): %s", ret)
-            return ret
-        else:
-            logger.debug("Returning display tuples: %s", displaytuples)
-            return displaytuples
+            displaytuples.reverse()
+        return displaytuples
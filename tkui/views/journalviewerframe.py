@@ -22,6 +22,8 @@ The journal viewer is attached to an experiment object, and
 uses the experiment's methods to retrieve xhtml.
 The xhtml can be displayed as raw code, or parsed and formatted
 using a primitive HTML parser.
+Parsed xhtml is rendered incrementally, section by section, with
+rendered sections being cached (see xhtmlrenderer.py).
 """
 
 try:
@@ -33,8 +35,7 @@ except ImportError:
 
 #from subentrieslistbox import SubentriesListbox
 from shared_ui_utils import ExpFrame
-import formatter
-from rspysol.rstkhtml import tkHTMLParser, tkHTMLWriter
+from xhtmlrenderer import IncrementalXhtmlRenderer
 
 import logging
 logger = logging.getLogger(__name__)
@@ -76,6 +77,7 @@ class JournalViewer(ExpFrame):
         self.text.config(yscrollcommand=self.scrollbar.set)
         self.text.config(state='disabled')
         self.scrollbar.config(command=self.text.yview)
+        self.Renderer = IncrementalXhtmlRenderer(self.text)
 
     def init_layout(self):
         self.text.grid(row=1, column=1, sticky="nesw")
@@ -133,18 +135,16 @@ class JournalViewer(ExpFrame):
 
         # prepare the text widget:
         self.text.config(state="normal")
-        self.text.delete("1.0", "end")
-        self.text.update_idletasks()
         if not xhtml:
             logger.debug("No xhtml, aborting...")
+            self.text.delete("1.0", "end")
+            self.Renderer.reset()
             self.text.config(state="disabled")
             return xhtml
-        # Write the xhtml to the text widget:
-        writer = tkHTMLWriter(self.text)
-        fmt = formatter.AbstractFormatter(writer)
-        parser = tkHTMLParser(fmt)
-        parser.feed(xhtml)
-        parser.close()
+        # Write the xhtml to the text widget; only sections that have changed since last time are re-rendered:
+        yview = self.text.yview()[0]
+        self.Renderer.render(xhtml)
+        self.text.yview_moveto(yview)
         # Finally, disable the text widget again
         self.text.config(state="disabled")
         logger.debug("(%s) text area updated with parsed/formatted html from string of length %s", self.__class__.__name__, len(xhtml) if xhtml else xhtml)
@@ -157,6 +157,7 @@ class JournalViewer(ExpFrame):
         #initial_state = self.configure()['state'][4]
         initial_state = self.text.cget('state')
         self.text.configure(state='normal')
+        self.Renderer.reset() # The text area no longer contains rendered xhtml.
         if self.text.get('1.0', tk.END):
             self.text.delete('1.0', tk.END)
         if value:
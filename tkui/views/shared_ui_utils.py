@@ -21,6 +21,8 @@ Module with various UI-related utility classes and methods.
 # python 2.7:
 import ttk
 import webbrowser
+import threading
+import Queue
 import logging
 logger = logging.getLogger(__name__)
 
@@ -172,3 +174,54 @@ class ExperimentLink(HyperLink):
         (unless self.URI is set).
         """
         return self.URI or self.Experiment.getUrl(mode=self.UrlMode)
+
+
+class MainLoopDispatcher(object):
+    """
+    Runs callbacks in the Tk main loop, also when they are invoked from another thread.
+    Tk is not thread safe, but confighandler callbacks such as 'wiki_server_status' and
+    'wiki_outbound_queue_depth' may be invoked from worker threads (outbound queue replay,
+    circuit breaker probes, background login).
+    Callbacks wrapped with wrap() are called directly in the main thread; when called from
+    another thread, they are put in a queue which is polled from the Tk main loop every
+    <interval> ms. Use get_mainloop_dispatcher(widget) to get the dispatcher of a Tk root.
+    Must be created in the main (Tk) thread.
+    """
+
+    def __init__(self, widget, interval=100):
+        self.Widget = widget
+        self.Interval = interval
+        self._queue = Queue.Queue()
+        self._mainthread = threading.current_thread()
+        self.Widget.after(self.Interval, self._poll)
+
+    def wrap(self, callback):
+        """ Returns a function that calls callback in the main thread (now or when next polled). """
+        def mainloop_callback(*args, **kwargs):
+            if threading.current_thread() is self._mainthread:
+                return callback(*args, **kwargs)
+            self._queue.put((callback, args, kwargs))
+        mainloop_callback.__name__ = getattr(callback, '__name__', 'mainloop_callback')
+        return mainloop_callback
+
+    def _poll(self):
+        """ Calls the queued callbacks, then schedules the next poll. """
+        while True:
+            try:
+                callback, args, kwargs = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:  # pylint: disable-msg=W0703
+                logger.error("Error in callback %s(*%s, **%s) from another thread: %r", callback, args, kwargs, e)
+        self.Widget.after(self.Interval, self._poll)
+
+
+def get_mainloop_dispatcher(widget):
+    """ Returns the MainLoopDispatcher of widget's Tk root, creating it if needed (in the main thread). """
+    root = widget._root()     # pylint: disable-msg=W0212
+    dispatcher = getattr(root, 'MainLoopDispatcher', None)
+    if dispatcher is None:
+        dispatcher = root.MainLoopDispatcher = MainLoopDispatcher(root)
+    return dispatcher
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,R0901,R0904,W0142
+"""
+Virtualized listbox and its backing list model.
+
+- ListModel: Holds the familiar list of (<display>, <identifier>, <full object>) tuples.
+  The display string may be None, in which case it is produced lazily with
+  the model's displayfun, and only for the rows that are actually shown.
+  setItems() diffs the new list against the old (by identifier) so the selection
+  survives re-ordering and the view knows which rows have changed.
+
+- VirtualListbox: A tk.Listbox which only holds the rows that are currently visible.
+  All index-based methods (curselection, see, size, yview) refer to indices in the
+  model, not the widget, so it can be used as a drop-in replacement for tk.Listbox
+  in the experiment and file listboxes.
+
+Note: Tk's class bindings (mouse wheel, keyboard navigation, scrollbar dragging)
+operate on the tcl widget directly, which only knows about the visible rows.
+These are therefore re-bound here to go through the python yview() method.
+"""
+
+from __future__ import division
+from difflib import SequenceMatcher
+try:
+    import tkinter as tk
+    import tkinter.font as tkfont
+except ImportError:
+    import Tkinter as tk
+    import tkFont as tkfont
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def diff_opcodes(old, new):
+    """
+    Returns the non-equal difflib opcodes (tag, i1, i2, j1, j2) transforming sequence <old> into <new>.
+    The common prefix and suffix is stripped before invoking difflib, which makes the
+    usual cases (nothing changed, or a few items added/removed) fast even for very long lists.
+    """
+    if old == new:
+        return list()
+    nmax = min(len(old), len(new))
+    start = 0
+    while start < nmax and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < nmax - start and old[-1-end] == new[-1-end]:
+        end += 1
+    oldend, newend = len(old)-end, len(new)-end
+    if start == oldend:
+        return [('insert', start, start, start, newend)]
+    if start == newend:
+        return [('delete', start, oldend, start, start)]
+    matcher = SequenceMatcher(None, old[start:oldend], new[start:newend], autojunk=False)
+    return [(tag, i1+start, i2+start, j1+start, j2+start)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+class ListModel(object):
+    """
+    Backing model for VirtualListbox.
+    Items are (<display>, <identifier>, <full object>) tuples;
+    <display> may be None to have it generated lazily by self.DisplayFun(<full object>).
+    The selection is kept as a set of identifiers, so it is independent of item order.
+    """
+
+    def __init__(self, items=None, displayfun=None):
+        self.DisplayFun = displayfun or repr
+        self._items = list()
+        self._displaycache = dict()
+        self.Selected = set()   # set of selected identifiers
+        if items:
+            self.setItems(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def Items(self):
+        """ The list of (<display>, <identifier>, <full object>) tuples. Treat as read-only. """
+        return self._items
+
+    @property
+    def Identifiers(self):
+        """ List of item identifiers, in list order. """
+        return [item[1] for item in self._items]
+
+    def setItems(self, items):
+        """
+        Replaces the model's items with <items>.
+        Returns a list of difflib opcodes (tag, i1, i2, j1, j2) describing how the
+        old list (by identifier) was transformed into the new list.
+        Selected identifiers no longer present in the list are de-selected.
+        """
+        items = list(items)
+        opcodes = diff_opcodes(self.Identifiers, [item[1] for item in items])
+        self._items = items
+        # Display strings might have changed even if the identifier did not (e.g. an experiment was renamed).
+        # The display cache only ever holds visible rows, so clearing it is cheap.
+        self._displaycache.clear()
+        if self.Selected:
+            self.Selected.intersection_update(item[1] for item in items)
+        return opcodes
+
+    def getDisplay(self, index):
+        """ Returns the display string for item at <index>, generating it if required. """
+        display = self._items[index][0]
+        if display is not None:
+            return display
+        try:
+            return self._displaycache[index]
+        except KeyError:
+            display = self._displaycache[index] = self.DisplayFun(self._items[index][2])
+            return display
+
+    def getDisplays(self, first, last):
+        """ Returns display strings for items first to last (excluding last). """
+        last = min(last, len(self._items))
+        return [self.getDisplay(index) for index in range(first, last)]
+
+    def getSelectedIndices(self):
+        """ Returns a sorted list of indices for the selected items. """
+        if not self.Selected:
+            return list()
+        return [index for index, item in enumerate(self._items) if item[1] in self.Selected]
+
+    def getSelectedItems(self):
+        """ Returns a list of the selected (<display>, <identifier>, <full object>) tuples. """
+        return [self._items[index] for index in self.getSelectedIndices()]
+
+    def indexOf(self, identifier):
+        """ Returns the index of the item with <identifier>, or None if not found. """
+        return next((index for index, item in enumerate(self._items) if item[1] == identifier), None)
+
+
+class VirtualListbox(tk.Listbox):
+    """
+    A tk.Listbox that only renders the currently visible rows of a ListModel.
+    Use setItems() to update the list; only rows whose display string has changed
+    are deleted and re-inserted in the widget.
+    Indices returned by curselection() are model indices.
+    """
+
+    def __init__(self, parent, model=None, **kwargs):
+        self._yscrollcommand = kwargs.pop('yscrollcommand', None)
+        tk.Listbox.__init__(self, parent, **kwargs)
+        self.Model = model if model is not None else ListModel()
+        self._first = 0         # Model index of the top-most row.
+        self._rendered = list() # The display strings currently in the widget.
+        self._rowheight = None
+        self.bind('<Configure>', self._on_configure, add='+')
+        self.bind('<MouseWheel>', self._on_mousewheel, add='+')
+        self.bind('<Button-4>', self._on_mousewheel, add='+')
+        self.bind('<Button-5>', self._on_mousewheel, add='+')
+        for key in ('<Up>', '<Down>', '<Prior>', '<Next>', '<Home>', '<End>'):
+            self.bind(key, self._on_navigationkey)
+
+    def configure(self, cnf=None, **kwargs):
+        """ Intercepts yscrollcommand, since the scroll fractions must be calculated from the model. """
+        if cnf and 'yscrollcommand' in cnf:
+            cnf = dict(cnf)
+            self._yscrollcommand = cnf.pop('yscrollcommand')
+        if 'yscrollcommand' in kwargs:
+            self._yscrollcommand = kwargs.pop('yscrollcommand')
+            self._update_scrollbar()
+        return tk.Listbox.configure(self, cnf, **kwargs)
+    config = configure
+
+    def VisibleRows(self):
+        """ Returns the number of rows that can be shown in the widget. """
+        height = int(self.cget('height')) or 10
+        pixels = self.winfo_height()
+        if pixels > 1:
+            if not self._rowheight:
+                font = tkfont.Font(font=self.cget('font'))
+                self._rowheight = font.metrics('linespace') + 1
+            height = max(1, pixels // self._rowheight)
+        return height
+
+    def setItems(self, items):
+        """
+        Updates the model with <items> and refreshes the visible rows.
+        Keeps the top-most item in view if it is still in the list.
+        """
+        self._sync_selection()
+        topid = self.Model.Items[self._first][1] if self._first < len(self.Model) else None
+        opcodes = self.Model.setItems(items)
+        if topid is not None:
+            newfirst = self.Model.indexOf(topid) if opcodes else self._first
+            self._first = newfirst if newfirst is not None else self._first
+        self._clamp_first()
+        self.render()
+        return opcodes
+
+    def clearItems(self):
+        """ Removes all items from the model and the widget. """
+        self.setItems(list())
+
+    def render(self):
+        """
+        Makes the widget display the rows currently in view.
+        Only rows that differ from what is already displayed are changed.
+        """
+        rows = self.VisibleRows()
+        self._clamp_first(rows)
+        displays = self.Model.getDisplays(self._first, self._first + rows)
+        # Apply the opcodes in reverse order, so the widget indices of pending opcodes remain valid.
+        for _, i1, i2, j1, j2 in reversed(diff_opcodes(self._rendered, displays)):
+            if i2 > i1:
+                tk.Listbox.delete(self, i1, i2-1)
+            if j2 > j1:
+                tk.Listbox.insert(self, i1, *displays[j1:j2])
+        self._rendered = displays
+        tk.Listbox.selection_clear(self, 0, tk.END)
+        selected = self.Model.Selected
+        for row in range(len(displays)):
+            if self.Model.Items[self._first+row][1] in selected:
+                tk.Listbox.selection_set(self, row)
+        self._update_scrollbar()
+
+    def _clamp_first(self, rows=None):
+        """ Makes sure self._first is within the range of the model. """
+        if rows is None:
+            rows = self.VisibleRows()
+        self._first = max(0, min(self._first, len(self.Model) - rows))
+
+    def _update_scrollbar(self):
+        """ Reports the visible fraction of the model to the yscrollcommand (if any). """
+        if not self._yscrollcommand:
+            return
+        total = len(self.Model)
+        if not total:
+            first, last = 0.0, 1.0
+        else:
+            first = self._first / total
+            last = min(1.0, (self._first + len(self._rendered)) / total)
+        self._yscrollcommand(first, last)
+
+    def _sync_selection(self):
+        """
+        Copies the widget's selection of the visible rows to the model.
+        The widget is authoritative for visible rows, the model for all other rows.
+        """
+        if not self._rendered:
+            return
+        rows = [int(row) for row in tk.Listbox.curselection(self)]
+        visibleids = [item[1] for item in self.Model.Items[self._first:self._first+len(self._rendered)]]
+        selected = self.Model.Selected
+        if rows and str(self.cget('selectmode')) in ('browse', 'single'):
+            selected.clear()
+        else:
+            selected.difference_update(visibleids)
+        selected.update(visibleids[row] for row in rows if row < len(visibleids))
+
+    ## tk.Listbox methods, re-implemented to use model indices:
+
+    def curselection(self):
+        """ Returns a tuple with the model indices of the selected items. """
+        self._sync_selection()
+        return tuple(self.Model.getSelectedIndices())
+
+    def size(self):
+        """ Returns the number of items in the model. """
+        return len(self.Model)
+
+    def see(self, index):
+        """ Scrolls the list so that model index <index> is visible. """
+        rows = self.VisibleRows()
+        index = len(self.Model) - 1 if index == tk.END else int(index)
+        if index < self._first:
+            self._scrollto(index)
+        elif index >= self._first + rows:
+            self._scrollto(index - rows + 1)
+
+    def selection_set(self, first, last=None):
+        """ Selects model items first to last (inclusive). """
+        self._sync_selection()
+        last = first if last is None else last
+        last = len(self.Model) - 1 if last == tk.END else int(last)
+        self.Model.Selected.update(item[1] for item in self.Model.Items[int(first):last+1])
+        self.render()
+    select_set = selection_set
+
+    def selection_clear(self, first=0, last=None):
+        """ De-selects model items first to last (inclusive). """
+        self._sync_selection()
+        last = first if last is None else last
+        last = len(self.Model) - 1 if last == tk.END else int(last)
+        self.Model.Selected.difference_update(item[1] for item in self.Model.Items[int(first):last+1])
+        self.render()
+    select_clear = selection_clear
+
+    def yview(self, *args):
+        """
+        Scrollbar protocol; with no arguments, returns the (first, last) fractions in view.
+        Otherwise handles ('moveto', fraction) and ('scroll', number, 'units'|'pages').
+        """
+        total = len(self.Model)
+        if not args:
+            if not total:
+                return (0.0, 1.0)
+            return (self._first / total, min(1.0, (self._first + len(self._rendered)) / total))
+        if args[0] == tk.MOVETO:
+            self._scrollto(int(float(args[1]) * total))
+        elif args[0] == tk.SCROLL:
+            number, what = int(args[1]), args[2]
+            if what == tk.PAGES:
+                number *= max(1, self.VisibleRows() - 1)
+            self._scrollto(self._first + number)
+        else:
+            self._scrollto(int(args[0]))
+    yview_moveto = lambda self, fraction: self.yview(tk.MOVETO, fraction)
+    yview_scroll = lambda self, number, what: self.yview(tk.SCROLL, number, what)
+
+    def _scrollto(self, first):
+        """ Sets the top-most row to model index <first> and re-renders. """
+        self._sync_selection()
+        self._first = first
+        self._clamp_first()
+        self.render()
+
+    ## Event handlers:
+
+    def _on_configure(self, event):
+        """ The widget was resized; render the rows that now fit. """
+        self.render()
+
+    def _on_mousewheel(self, event):
+        """ Scrolls the model, not the widget. (Windows/OSX uses event.delta, X11 uses button 4/5.) """
+        if event.num == 4 or event.delta > 0:
+            self.yview(tk.SCROLL, -3, tk.UNITS)
+        else:
+            self.yview(tk.SCROLL, 3, tk.UNITS)
+        return "break"
+
+    def _on_navigationkey(self, event):
+        """ Keyboard navigation in model coordinates. """
+        rows = self.VisibleRows()
+        active = self._first + int(self.index(tk.ACTIVE))
+        steps = {'Up': -1, 'Down': 1, 'Prior': -rows, 'Next': rows}
+        if event.keysym == 'Home':
+            target = 0
+        elif event.keysym == 'End':
+            target = len(self.Model) - 1
+        else:
+            target = active + steps.get(event.keysym, 0)
+        target = max(0, min(target, len(self.Model) - 1))
+        self.see(target)
+        tk.Listbox.activate(self, target - self._first)
+        if str(self.cget('selectmode')) == 'browse':
+            self.Model.Selected.clear()
+            self.Model.Selected.add(self.Model.Items[target][1])
+            self.render()
+            self.event_generate('<<ListboxSelect>>')
+        return "break"
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##    Copyright 2014 Rasmus Scholer Sorensen, rasmusscholer@gmail.com
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##
+# pylint: disable-msg=C0103,W0212
+"""
+Incremental rendering of wiki page xhtml into a tk.Text widget.
+
+The tkHTMLParser/tkHTMLWriter pipeline writes directly into a text widget,
+which makes rendering a long experiment page slow. Instead:
+- The xhtml is split into sections at each header tag. Subentry headers are
+  headers, so each subentry (and each journal date within it) becomes a section.
+- Each section is rendered once into a RenderedFragment (plain text + tag ranges),
+  using a TextRecorder in place of the text widget.
+  Fragments are cached by the md5 hash of the section's xhtml.
+- When the page changes, the new list of section hashes is diffed against
+  the sections currently shown, and only the changed sections are
+  deleted from / inserted into the text widget.
+
+- IncrementalXhtmlRenderer: Renders xhtml into a given text widget.
+- FragmentCache: LRU cache of rendered fragments (shared between renderers).
+"""
+
+import re
+import hashlib
+import formatter
+from collections import OrderedDict
+
+from rspysol.rstkhtml import tkHTMLParser, tkHTMLWriter
+from virtuallistbox import diff_opcodes
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+SECTION_SPLIT_REGEX = re.compile(r"(?=<h[1-6][\s>])", re.IGNORECASE)
+
+
+def split_sections(xhtml):
+    """
+    Splits xhtml into sections, each starting with a header tag (except possibly the first).
+    Joining the returned sections gives back the original xhtml.
+    """
+    if not xhtml:
+        return list()
+    # re.split does not split on zero-width matches in python 2, so use the match positions:
+    starts = [match.start() for match in SECTION_SPLIT_REGEX.finditer(xhtml) if match.start() > 0]
+    bounds = [0] + starts + [len(xhtml)]
+    return [xhtml[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def section_hash(section):
+    """ Returns a hash of the section's xhtml, used as cache key. """
+    if isinstance(section, unicode):
+        section = section.encode('utf-8')
+    return hashlib.md5(section).hexdigest()
+
+
+class TextRecorder(object):
+    """
+    Stand-in for a tk.Text widget, implementing the parts used by tkHTMLWriter.
+    Text is appended to a buffer and tags are recorded as (tag, start, end) character offsets,
+    so the output can be replayed into a text widget later.
+    """
+
+    def __init__(self, width=80):
+        self._chunks = list()
+        self._length = 0
+        self.Width = width
+        self.Tagranges = list()
+        self.Tagconfigs = OrderedDict()
+
+    def __getitem__(self, key):
+        if key == 'width':
+            return self.Width
+        raise KeyError(key)
+
+    def _offset(self, index):
+        return self._length if index == "insert" else int(index)
+
+    def index(self, index):
+        """ Returns <index> as a character offset. """
+        return self._offset(index)
+
+    def insert(self, index, data):
+        """ Appends data; the writer only ever inserts at the "insert" mark, i.e. the end. """
+        self._chunks.append(data)
+        self._length += len(data)
+
+    def tag_add(self, tag, start, end):
+        start, end = self._offset(start), self._offset(end)
+        if end > start:
+            self.Tagranges.append((tag, start, end))
+
+    def tag_config(self, tag, **kwargs):
+        self.Tagconfigs.setdefault(tag, dict()).update(kwargs)
+
+    def tag_bind(self, tag, sequence, func):
+        pass
+
+    def getFragment(self):
+        """ Returns the recorded output as a RenderedFragment. """
+        return RenderedFragment(u"".join(self._chunks), self.Tagranges, self.Tagconfigs)
+
+
+class RenderedFragment(object):
+    """
+    The rendered output of an xhtml section: text, tag ranges (relative to the start of the text)
+    and the tag configurations needed to display them.
+    """
+    __slots__ = ('Text', 'Tagranges', 'Tagconfigs')
+
+    def __init__(self, text, tagranges, tagconfigs):
+        self.Text = text
+        self.Tagranges = tagranges
+        self.Tagconfigs = tagconfigs
+
+    def __len__(self):
+        return len(self.Text)
+
+
+def render_fragment(xhtml, width=80):
+    """ Renders xhtml using the tkHTMLParser/tkHTMLWriter pipeline and returns a RenderedFragment. """
+    recorder = TextRecorder(width=width)
+    writer = tkHTMLWriter(recorder)
+    fmt = formatter.AbstractFormatter(writer)
+    parser = tkHTMLParser(fmt)
+    parser.feed(xhtml)
+    parser.close()
+    writer.new_font(None)   # close any open font tag range.
+    return recorder.getFragment()
+
+
+class FragmentCache(object):
+    """
+    LRU cache of RenderedFragments, keyed by section hash.
+    """
+
+    def __init__(self, maxsize=2000):
+        self.Maxsize = maxsize
+        self._fragments = OrderedDict()
+        self.Hits = 0
+        self.Misses = 0
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get(self, key, section, width=80):
+        """ Returns the fragment for <key>, rendering <section> if it is not cached. """
+        key = (key, width)  # horizontal rules are rendered to the width of the text widget.
+        try:
+            fragment = self._fragments.pop(key)
+            self.Hits += 1
+        except KeyError:
+            fragment = render_fragment(section, width)
+            self.Misses += 1
+            if len(self._fragments) >= self.Maxsize:
+                self._fragments.popitem(last=False)
+        self._fragments[key] = fragment
+        return fragment
+
+    def clear(self):
+        """ Removes all fragments from the cache. """
+        self._fragments.clear()
+
+
+# Default cache, shared by all renderers (e.g. the journal view and the wiki page view):
+fragmentcache = FragmentCache()
+
+
+class IncrementalXhtmlRenderer(object):
+    """
+    Renders xhtml into a text widget, re-rendering only the sections that have changed
+    since the last call to render().
+    If something else modifies the text widget's content, call reset() before rendering.
+    """
+
+    def __init__(self, text, cache=None):
+        self.Text = text
+        self.Cache = cache if cache is not None else fragmentcache
+        self._hashes = list()   # hashes of the sections currently in the text widget
+        self._lengths = list()  # length (in characters) of the sections currently in the text widget
+
+    def reset(self):
+        """ Forget what is currently displayed; the next render() will start from an empty widget. """
+        self._hashes = list()
+        self._lengths = list()
+
+    def render(self, xhtml):
+        """
+        Makes the text widget display the rendered xhtml.
+        Returns the number of sections that were (re-)inserted into the widget.
+        """
+        sections = split_sections(xhtml)
+        hashes = [section_hash(section) for section in sections]
+        if not self._hashes:
+            self.Text.delete("1.0", "end")
+        try:
+            width = int(self.Text["width"])
+        except (KeyError, TypeError, ValueError):
+            width = 80
+        inserted = 0
+        # Apply opcodes in reverse order, so the offsets of the pending opcodes remain valid:
+        for _, i1, i2, j1, j2 in reversed(diff_opcodes(self._hashes, hashes)):
+            offset = sum(self._lengths[:i1])
+            if i2 > i1:
+                self.Text.delete(self._index(offset), self._index(offset + sum(self._lengths[i1:i2])))
+            fragments = [self.Cache.get(hashes[j], sections[j], width) for j in range(j1, j2)]
+            pos = offset
+            for fragment in fragments:
+                self._insert_fragment(pos, fragment)
+                pos += len(fragment)
+            self._lengths[i1:i2] = [len(fragment) for fragment in fragments]
+            inserted += j2 - j1
+        self._hashes = hashes
+        logger.debug("%s: %s of %s sections re-rendered (cache: %s hits, %s misses)", self.__class__.__name__,
+                     inserted, len(hashes), self.Cache.Hits, self.Cache.Misses)
+        return inserted
+
+    def _index(self, offset):
+        """ Returns a text widget index for character <offset>. """
+        return "1.0 + {} chars".format(offset)
+
+    def _insert_fragment(self, offset, fragment):
+        """ Inserts a rendered fragment at character <offset> and applies its tags. """
+        if not fragment.Text:
+            return
+        for tag, options in fragment.Tagconfigs.items():
+            self.Text.tag_config(tag, **options)
+        # Passing an empty tag list prevents the text from inheriting tags from the adjacent text:
+        self.Text.insert(self._index(offset), fragment.Text, ())
+        for tag, start, end in fragment.Tagranges:
+            self.Text.tag_add(tag, self._index(offset + start), self._index(offset + end))